@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 import os
 import uvicorn
@@ -30,6 +30,18 @@ import asyncio
 import logging
 import traceback
 from cors_setup import setup_cors
+from fanout import get_fanout_executor, WB_SEARCH_HOST
+from image_downloader import close_image_downloaders
+from circuit_breaker import get_circuit_breakers_state, STATE_CLOSED
+from upstream_override import install_upstream_override
+from http_cassette import install_http_cassette, save_active_cassette
+from persistent_store import flush_all_stores
+from keyword_classifier import FURNITURE_CLASSIFIER, OUTFIT_FALLBACK_STYLE_CLASSIFIER
+from outfit_parser import parse_outfit_items
+from outfit_pipeline import run_outfit_pipeline, build_item_query
+from task_registry import TaskRegistry
+from progress_bus import ProgressBus, ProgressEvent, EVENT_STATUS, EVENT_PARTIAL
+from job_queue import get_job_queue, Job, JobQueueFullError, JOB_CANCELLED, JOB_EXPIRED, PRIORITY_HIGH, PRIORITY_NORMAL
 
 # Настройка логгера
 logging.basicConfig(
@@ -46,6 +58,7 @@ class SearchRequest(BaseModel):
     min_price: Optional[float] = None  # Новый параметр - минимальная цена
     max_price: Optional[float] = None  # Новый параметр - максимальная цена
     gender: Optional[str] = None  # Параметр пола для фильтрации товаров (мужской, женский, унисекс)
+    priority: Optional[int] = None  # Приоритет задачи в очереди (меньше - раньше)
 
 class SearchResponse(BaseModel):
     task_id: str
@@ -58,7 +71,7 @@ class TaskStatus(BaseModel):
     """
     task_id: str
     query: str
-    status: Literal["pending", "processing", "analyzing", "completed", "failed"]
+    status: Literal["pending", "processing", "analyzing", "completed", "failed", "cancelled"]
     progress: int = 0
     message: Optional[str] = None
     source: Literal["pinterest", "wildberries"] = "pinterest"
@@ -67,12 +80,14 @@ class TaskStatus(BaseModel):
     total_photos: Optional[int] = None
     downloaded_photos: Optional[int] = 0
     image_urls: Optional[List[str]] = None
+    folder_path: Optional[str] = None
     pinterest_results: Optional[List[Dict[str, Any]]] = None
     
     # Поля для задач Wildberries
     total_items: Optional[int] = None
     processed_items: Optional[int] = 0
     wildberries_results: Optional[List[Dict[str, Any]]] = None
+    product_details: Optional[List[Dict[str, Any]]] = None
 
 # Модели данных для API ассистента
 class AssistantRequest(BaseModel):
@@ -100,11 +115,16 @@ class PinterestSearchRequest(BaseModel):
     query: str
     gender: Optional[str] = "женский"
     num_results: Optional[int] = 3
+    # Сразу искать товары на Wildberries для предметов найденных образов (в той же задаче)
+    search_products: bool = False
+    max_products_per_item: Optional[int] = 3
+    priority: Optional[int] = None
 
 class WildberriesSearchRequest(BaseModel):
     pinterest_task_id: str
     items: Optional[List[Dict[str, Any]]] = None
     max_products_per_item: Optional[int] = 3
+    priority: Optional[int] = None
 
 class DirectProductSearchRequest(BaseModel):
     """Запрос на прямой поиск товаров в Wildberries."""
@@ -114,6 +134,10 @@ class DirectProductSearchRequest(BaseModel):
     max_price: Optional[float] = None
     gender: Optional[str] = None
 
+class CareRecommendationsRequest(BaseModel):
+    """Запрос на получение рекомендаций по уходу для товаров."""
+    products: List[Dict[str, Any]]
+
 class CosmetologistRequest(BaseModel):
     """Запрос от компонента ассистента косметолога."""
     skinType: str
@@ -143,6 +167,12 @@ class FurnitureRecommendationRequest(BaseModel):
     style: str  # modern, scandinavian, loft, classic, minimalist
     roomInfo: Dict[str, Any]  # area, budget, hasWindows
 
+# Перенаправляем запросы к внешним сервисам на локальные заглушки, если задан UPSTREAM_OVERRIDE_URL
+install_upstream_override()
+
+# Запись или воспроизведение ответов внешних сервисов, если задан HTTP_CASSETTE
+install_http_cassette()
+
 # Создаем FastAPI приложение
 app = FastAPI(
     title="Shopping Assistant API",
@@ -153,14 +183,138 @@ app = FastAPI(
 # Настраиваем CORS для работы с фронтендом
 app = setup_cors(app)
 
-# Хранилище для задач
-tasks: Dict[str, TaskStatus] = {}
+# Статусы, после которых задача больше не меняется
+FINAL_TASK_STATUSES = ("completed", "failed", "cancelled")
+
+# Хранилище для задач: свои задачи в памяти, все - в SQLite (видны всем воркерам)
+tasks = TaskRegistry(TaskStatus, FINAL_TASK_STATUSES)
+
+# Поля с результатами, которые не отдаются в списке задач без include_results
+TASK_RESULT_FIELDS = {"image_urls", "pinterest_results", "wildberries_results", "product_details"}
+
+# Шина событий о ходе задач: подписчики получают их через WebSocket и SSE вместо опроса
+progress_bus = ProgressBus(FINAL_TASK_STATUSES)
+# Интервал ping-сообщений подписчикам и опроса задач, выполняющихся другими воркерами
+PROGRESS_HEARTBEAT_INTERVAL = float(os.getenv("PROGRESS_HEARTBEAT_INTERVAL", "15"))
+REMOTE_TASK_POLL_INTERVAL = float(os.getenv("REMOTE_TASK_POLL_INTERVAL", "1"))
+
+def _task_snapshot(task_id: str) -> Optional[Dict[str, Any]]:
+    """Текущее состояние задачи для события-снимка."""
+    task = tasks.get(task_id)
+    return task.model_dump() if task is not None else None
+
+progress_bus.snapshot_provider = _task_snapshot
+
+def publish_task_status(task_id: str) -> None:
+    """
+    Публикует подписчикам текущее состояние задачи.
+    
+    Результаты передаются только в финальном событии: по ходу выполнения они
+    приходят частичными событиями (publish_task_partial).
+    
+    Args:
+        task_id: Идентификатор задачи
+    """
+    task = tasks.get(task_id)
+    if task is None:
+        return
+    exclude = None if task.status in FINAL_TASK_STATUSES else TASK_RESULT_FIELDS
+    progress_bus.publish(task_id, EVENT_STATUS, task.model_dump(exclude=exclude))
+
+def publish_task_partial(task_id: str, kind: str, data: Dict[str, Any]) -> None:
+    """
+    Публикует подписчикам частичный результат задачи.
+    
+    Args:
+        task_id: Идентификатор задачи
+        kind: Вид результата (например, "pinterest_result" или "wildberries_result")
+        data: Данные результата
+    """
+    progress_bus.publish(task_id, EVENT_PARTIAL, {"kind": kind, **data})
+
+# Сроки выполнения фоновых задач поиска в секундах (отсчитываются от постановки в очередь)
+PINTEREST_JOB_DEADLINE = float(os.getenv("PINTEREST_JOB_DEADLINE", "300"))
+WILDBERRIES_JOB_DEADLINE = float(os.getenv("WILDBERRIES_JOB_DEADLINE", "180"))
+
+def _on_job_aborted(job: Job) -> None:
+    """Отражает в статусе задачи отмену, истечение срока или необработанную ошибку в очереди."""
+    task = tasks.get(job.job_id)
+    if task is None or task.status in FINAL_TASK_STATUSES:
+        return
+    if job.state == JOB_CANCELLED:
+        task.status = "cancelled"
+        task.message = "Задача отменена"
+    elif job.state == JOB_EXPIRED:
+        task.status = "failed"
+        task.message = f"Превышено время выполнения задачи: {job.error}"
+    else:
+        task.status = "failed"
+        task.message = f"Ошибка: {job.error}"
+    publish_task_status(job.job_id)
+
+def _cancel_local_task(task_id: str) -> bool:
+    """
+    Отменяет задачу, выполняющуюся в этом процессе.
+    
+    Args:
+        task_id: Идентификатор задачи
+    
+    Returns:
+        True, если задача была в очереди и отменяется
+    """
+    if not get_job_queue().cancel(task_id):
+        return False
+    # Выполняющаяся задача прервется на ближайшей точке ожидания
+    task = tasks.get(task_id)
+    if task is not None:
+        task.status = "cancelled"
+        task.message = "Задача отменена"
+        publish_task_status(task_id)
+    return True
+
+def enqueue_task(task_id: str, factory, priority: Optional[int], default_priority: int, deadline: float) -> Dict[str, Any]:
+    """
+    Ставит обработку задачи в очередь фоновых задач.
+    
+    Args:
+        task_id: Идентификатор задачи (уже добавленной в tasks)
+        factory: Функция без аргументов, возвращающая корутину обработки
+        priority: Приоритет из запроса (None - приоритет по умолчанию)
+        default_priority: Приоритет по умолчанию для этого типа задач
+        deadline: Срок выполнения в секундах
+    
+    Returns:
+        Ответ эндпоинта: идентификатор задачи, статус и позиция в очереди
+    """
+    queue = get_job_queue()
+    try:
+        queue.submit(
+            task_id,
+            factory,
+            priority=default_priority if priority is None else priority,
+            deadline=deadline,
+            on_abort=_on_job_aborted
+        )
+    except JobQueueFullError as e:
+        tasks.pop(task_id, None)
+        logger.warning(f"Задача {task_id} отклонена: {e}")
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите запрос позже")
+    
+    tasks[task_id].message = "Задача поставлена в очередь"
+    publish_task_status(task_id)
+    return {
+        "task_id": task_id,
+        "status": tasks[task_id].status,
+        "message": tasks[task_id].message,
+        "queue_position": queue.position(task_id)
+    }
 
 # Хранилище для инстансов сервисов
 _pinterest_instance = None
 _wildberries_service_instance = None
 _assistant_instance = None
 _visual_analyzer_instance = None
+_browser_warmup_task: Optional[asyncio.Task] = None
 
 def get_pinterest() -> Optional[PinterestAPI]:
     """
@@ -273,6 +427,13 @@ def get_visual_analyzer() -> Optional[VisualAnalyzer]:
 @app.on_event("startup")
 async def startup_event():
     """Initializes the application state on startup"""
+    global _browser_warmup_task
+    # Запускаем воркеры очереди фоновых задач и синхронизацию реестра задач;
+    # запросы отмены от других воркеров выполняются здесь, в процессе-владельце
+    await get_job_queue().start()
+    tasks.on_cancel_request = _cancel_local_task
+    await tasks.start()
+    
     # Создаем необходимые директории
     os.makedirs("static", exist_ok=True)
     os.makedirs("static/uploads", exist_ok=True)
@@ -283,6 +444,19 @@ async def startup_event():
         logger.info("Визуальный анализатор успешно инициализирован")
     else:
         logger.info("Визуальный анализатор недоступен, будет использоваться OpenRouter API")
+    
+    # Прогреваем пул браузеров Pinterest в фоне, не задерживая старт приложения
+    if os.getenv("BROWSER_POOL_WARMUP", "1") == "1":
+        pinterest = get_pinterest()
+        if pinterest:
+            _browser_warmup_task = asyncio.create_task(_warm_up_pinterest(pinterest))
+
+async def _warm_up_pinterest(pinterest: PinterestAPI) -> None:
+    """Запускает браузеры пула Pinterest заранее."""
+    try:
+        await pinterest.warm_up()
+    except Exception as e:
+        logger.error(f"Не удалось прогреть пул браузеров Pinterest: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -290,28 +464,59 @@ async def shutdown_event():
     Закрываем драйверы парсеров при завершении работы
     """
     global _pinterest_instance, _wildberries_service_instance
+    if _browser_warmup_task and not _browser_warmup_task.done():
+        _browser_warmup_task.cancel()
+    # Останавливаем очередь до закрытия сервисов, которыми пользуются ее задачи,
+    # и записываем итоговые статусы задач в базу
+    await get_job_queue().close()
+    await tasks.close()
     if _pinterest_instance:
-        _pinterest_instance.close()
+        await _pinterest_instance.close()
     if _wildberries_service_instance:
-        _wildberries_service_instance.close()
+        await _wildberries_service_instance.close()
+    
+    # Сохраняем индексы изображений и закрываем сессии загрузчиков
+    await close_image_downloaders()
+    
+    # Записываем отложенные изменения кешей на диске
+    flush_all_stores()
+    
+    # Сохраняем записанные HTTP-ответы
+    save_active_cassette()
 
 @app.get("/health")
 async def health_check():
     """
-    Endpoint для проверки работоспособности API
+    Endpoint для проверки работоспособности API.
+    
+    Возвращает также состояние circuit breakers внешних хостов
+    (если хотя бы один из них не замкнут, статус сервиса — "degraded"),
+    пула браузеров Pinterest, способов получения пинов (без браузера / через браузер)
+    очереди фоновых задач (глубина очереди, время ожидания) и реестра задач.
     """
-    return {"status": "ok", "timestamp": time.time()}
+    circuit_breakers = get_circuit_breakers_state()
+    degraded = any(state["state"] != STATE_CLOSED for state in circuit_breakers.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "timestamp": time.time(),
+        "circuit_breakers": circuit_breakers,
+        "browser_pool": _pinterest_instance.browser_pool_stats() if _pinterest_instance else None,
+        "pinterest_fetch": _pinterest_instance.fetch_stats() if _pinterest_instance else None,
+        "job_queue": get_job_queue().stats(),
+        "task_registry": await tasks.stats_async(),
+        "progress_bus": progress_bus.stats()
+    }
 
 @app.post("/search")
 async def search_products_endpoint(request: SearchRequest):
     """
-    Ищет товары по запросу и возвращает результаты.
+    Ставит поиск товаров по запросу в очередь фоновых задач.
     
     Args:
         request: Параметры запроса
     
     Returns:
-        Идентификатор задачи и статус
+        Идентификатор задачи, статус и позиция в очереди
     """
     try:
         logger.info(f"Получен запрос на поиск товаров: {request.query}")
@@ -330,35 +535,18 @@ async def search_products_endpoint(request: SearchRequest):
             source=request.source
         )
         
-        # Запускаем задачу в фоне
-        background_tasks = BackgroundTasks()
-        if request.source == "pinterest":
-            background_tasks.add_task(process_pinterest_search, task_id, request)
-        else:
-            background_tasks.add_task(process_wildberries_search, task_id, request)
-        
-        # Выполняем задачу немедленно для более быстрого ответа
+        # Ставим задачу в очередь; результат клиент получает через /status/{task_id}
         if request.source == "pinterest":
-            await process_pinterest_search(task_id, request)
-        else:
-            await process_wildberries_search(task_id, request)
-        
-        # Возвращаем результат задачи, если он уже есть
-        if tasks[task_id].status == "completed":
-            logger.info(f"Задача {task_id} завершена успешно")
-            return {
-                "task_id": task_id,
-                "status": "completed",
-                "product_details": tasks[task_id].product_details if hasattr(tasks[task_id], "product_details") else [],
-                "image_urls": tasks[task_id].image_urls if hasattr(tasks[task_id], "image_urls") else []
-            }
-        else:
-            logger.info(f"Задача {task_id} в процессе выполнения или завершилась с ошибкой")
-            return {
-                "task_id": task_id,
-                "status": tasks[task_id].status,
-                "message": tasks[task_id].message
-            }
+            return enqueue_task(
+                task_id, lambda: process_pinterest_search(task_id, request),
+                request.priority, PRIORITY_NORMAL, PINTEREST_JOB_DEADLINE
+            )
+        return enqueue_task(
+            task_id, lambda: process_wildberries_product_search(task_id, request),
+            request.priority, PRIORITY_NORMAL, WILDBERRIES_JOB_DEADLINE
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при поиске товаров: {str(e)}")
         logger.error(traceback.format_exc())
@@ -367,7 +555,14 @@ async def search_products_endpoint(request: SearchRequest):
 async def process_pinterest_search(task_id: str, request: SearchRequest):
     """Обработка поиска в Pinterest"""
     try:
-        pinterest = PinterestAPI()
+        tasks[task_id].status = "processing"
+        tasks[task_id].message = "Поиск изображений в Pinterest"
+        publish_task_status(task_id)
+        
+        # Общий экземпляр: браузеры пула уже запущены и переиспользуются между запросами
+        pinterest = get_pinterest()
+        if not pinterest:
+            raise Exception("Не удалось инициализировать Pinterest")
         # Используем search_pins вместо get_images
         pins = await pinterest.search_pins(
             query=request.query,
@@ -384,16 +579,16 @@ async def process_pinterest_search(task_id: str, request: SearchRequest):
         else:
             tasks[task_id].status = "failed"
             tasks[task_id].message = f"Не найдены изображения для запроса '{request.query}'"
+        publish_task_status(task_id)
     except Exception as e:
         tasks[task_id].status = "failed"
         tasks[task_id].message = f"Ошибка при поиске: {str(e)}"
+        publish_task_status(task_id)
         logger.error(f"Ошибка при поиске в Pinterest: {str(e)}")
-    finally:
-        await pinterest.close()
 
-async def process_wildberries_search(task_id: str, request: SearchRequest):
+async def process_wildberries_product_search(task_id: str, request: SearchRequest):
     """
-    Обработка поиска в Wildberries
+    Обработка поиска в Wildberries по текстовому запросу (задача /search)
     
     Args:
         task_id: Идентификатор задачи
@@ -411,6 +606,9 @@ async def process_wildberries_search(task_id: str, request: SearchRequest):
           что может привести к пустому результату, если нет товаров, удовлетворяющих обоим условиям
     """
     try:
+        tasks[task_id].status = "processing"
+        tasks[task_id].message = "Поиск товаров на Wildberries"
+        publish_task_status(task_id)
         logger.info(f"Запуск поиска товаров в Wildberries по запросу: '{request.query}', лимит: {request.number_of_photos}, мин. цена: {request.min_price}, макс. цена: {request.max_price}, пол: {request.gender}")
         
         # Получаем экземпляр Wildberries клиента
@@ -448,11 +646,13 @@ async def process_wildberries_search(task_id: str, request: SearchRequest):
             logger.warning(f"Не найдены товары в Wildberries для запроса '{request.query}'")
             tasks[task_id].status = "failed"
             tasks[task_id].message = f"Не найдены товары для запроса '{request.query}'"
+        publish_task_status(task_id)
     except Exception as e:
         logger.error(f"Ошибка при поиске в Wildberries: {str(e)}")
         logger.error(f"Трассировка ошибки: {traceback.format_exc()}")
         tasks[task_id].status = "failed"
         tasks[task_id].message = f"Ошибка при поиске: {str(e)}"
+        publish_task_status(task_id)
     finally:
         # Закрываем соединения
         if 'wb' in locals():
@@ -463,10 +663,143 @@ async def process_wildberries_search(task_id: str, request: SearchRequest):
 async def get_task_status(task_id: str):
     """
     Получение статуса задачи по её ID
+    
+    Пока задача ждет воркера или выполняется, в ответ добавляется поле queue
+    (состояние в очереди, позиция, время ожидания).
+    """
+    task = await tasks.get_async(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    queue = get_job_queue()
+    job = queue.get(task_id)
+    if job is None:
+        return task
+    return {**task.model_dump(), "queue": {**job.info(), "position": queue.position(task_id)}}
+
+@app.delete("/status/{task_id}")
+async def cancel_task(task_id: str):
     """
-    if task_id not in tasks:
+    Отменяет задачу: ожидающая в очереди не будет запущена, выполняющаяся прерывается.
+    """
+    task = await tasks.get_async(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Задача не найдена")
-    return tasks[task_id]
+    if task.status in FINAL_TASK_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Задача уже завершена со статусом {task.status}")
+    if _cancel_local_task(task_id):
+        return {"task_id": task_id, "status": "cancelled", "message": "Задача отменена"}
+    
+    # Задача выполняется другим воркером: он отменит ее при ближайшей синхронизации реестра
+    if not tasks.is_local(task_id) and await tasks.request_cancel_async(task_id):
+        return JSONResponse(status_code=202, content={
+            "task_id": task_id,
+            "status": task.status,
+            "message": "Запрос на отмену передан обработчику задачи"
+        })
+    raise HTTPException(status_code=409, detail="Задача не выполняется в очереди")
+
+def _parse_event_id(value: Optional[str]) -> Optional[int]:
+    """Разбирает идентификатор последнего полученного клиентом события."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+async def _task_events(task_id: str, last_event_id: Optional[int]):
+    """
+    События о ходе задачи для WebSocket и SSE.
+    
+    Args:
+        task_id: Идентификатор задачи
+        last_event_id: Идентификатор последнего полученного клиентом события
+    
+    Yields:
+        События задачи; None - время отправить ping
+    """
+    task = await tasks.get_async(task_id)
+    if task is None:
+        return
+    if tasks.is_local(task_id) or task.status in FINAL_TASK_STATUSES:
+        async for event in progress_bus.subscribe(task_id, last_event_id, heartbeat=PROGRESS_HEARTBEAT_INTERVAL):
+            yield event
+        return
+    
+    # Задачу выполняет другой воркер, и его события сюда не приходят:
+    # отдаем снимок состояния из реестра при каждом изменении
+    previous = None
+    idle = 0.0
+    while True:
+        # Снимок чужой задачи читается из базы, поэтому вне event loop
+        event = await asyncio.to_thread(progress_bus.snapshot, task_id)
+        if event is None:
+            return
+        if event.data != previous:
+            previous = event.data
+            idle = 0.0
+            yield event
+            if progress_bus.is_final(event):
+                return
+        elif idle >= PROGRESS_HEARTBEAT_INTERVAL:
+            idle = 0.0
+            yield None
+        await asyncio.sleep(REMOTE_TASK_POLL_INTERVAL)
+        idle += REMOTE_TASK_POLL_INTERVAL
+
+@app.get("/events/{task_id}")
+async def stream_task_events(task_id: str, request: Request, last_event_id: Optional[str] = None):
+    """
+    Поток событий о ходе задачи в формате Server-Sent Events
+    
+    Первое событие - снимок состояния задачи (snapshot), затем status и partial
+    по мере выполнения; поток закрывается после финального статуса. При
+    переподключении браузер сам передает заголовок Last-Event-ID, и клиент
+    получает только пропущенные события.
+    
+    Args:
+        task_id: Идентификатор задачи
+        last_event_id: Идентификатор последнего полученного события (если нельзя передать заголовок)
+    """
+    if not await tasks.contains_async(task_id):
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    last_id = _parse_event_id(request.headers.get("last-event-id") or last_event_id)
+    
+    async def event_stream():
+        yield "retry: 3000\n\n"
+        async for event in _task_events(task_id, last_id):
+            yield ": ping\n\n" if event is None else event.to_sse()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/tasks/{task_id}")
+async def task_events_websocket(websocket: WebSocket, task_id: str, last_event_id: Optional[str] = None):
+    """
+    Поток событий о ходе задачи через WebSocket
+    
+    Сообщения - JSON с полями id, task_id, type, data, timestamp (как в SSE) или
+    {"type": "ping"} при простое; соединение закрывается после финального статуса.
+    
+    Args:
+        task_id: Идентификатор задачи
+        last_event_id: Идентификатор последнего полученного события для возобновления
+    """
+    if not await tasks.contains_async(task_id):
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    events = _task_events(task_id, _parse_event_id(last_event_id))
+    try:
+        async for event in events:
+            message = {"type": "ping"} if event is None else event.to_dict()
+            await websocket.send_text(json.dumps(message, ensure_ascii=False, default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.debug(f"Подписчик на события задачи {task_id} отключился")
+    finally:
+        await events.aclose()
 
 @app.post("/analyze-image")
 async def analyze_image_endpoint(file: UploadFile = File(...)):
@@ -545,7 +878,8 @@ async def analyze_image_endpoint(file: UploadFile = File(...)):
             analysis["elements"] = elements
             analysis["analysis"] = f"Автоматически определены предметы: {', '.join([item['type'] for item in elements])}"
         
-        # Обрабатываем каждый элемент
+        # Формируем поисковые запросы для каждого элемента
+        element_queries = []
         for item in elements:
             type_name = item.get("type", "Предмет одежды")
             color = item.get("color", "")
@@ -558,30 +892,34 @@ async def analyze_image_endpoint(file: UploadFile = File(...)):
                 desc_words = description.split()[:2]
                 search_query += f" {' '.join(desc_words)}"
             
-            # Ищем товары на WB
-            try:
-                wb_products = await wb_service.search_products(
-                    query=search_query,
-                    limit=3,  # 3 товара для каждого предмета
-                    gender=gender
-                )
-                
-                clothing_items.append({
-                    "type": type_name,
-                    "color": color,
-                    "description": description,
-                    "gender": gender,
-                    "wb_products": wb_products if wb_products else []
-                })
-            except Exception as e:
-                logger.error(f"Ошибка при поиске товаров на WB: {str(e)}")
-                clothing_items.append({
-                    "type": type_name,
-                    "color": color,
-                    "description": description,
-                    "gender": gender,
-                    "wb_products": []
-                })
+            element_queries.append({
+                "query": search_query,
+                "type": type_name,
+                "color": color,
+                "description": description
+            })
+        
+        async def search_element(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+            return await wb_service.search_products(
+                query=entry["query"],
+                limit=3,  # 3 товара для каждого предмета
+                gender=gender
+            )
+        
+        # Ищем товары на WB для всех элементов конкурентно
+        outcomes = await get_fanout_executor().run(element_queries, search_element, host=WB_SEARCH_HOST)
+        
+        for outcome in outcomes:
+            entry = outcome["item"]
+            if outcome["error"]:
+                logger.error(f"Ошибка при поиске товаров на WB: {outcome['error']}")
+            clothing_items.append({
+                "type": entry["type"],
+                "color": entry["color"],
+                "description": entry["description"],
+                "gender": gender,
+                "wb_products": outcome["result"] or []
+            })
         
         # Формируем ответ
         response = {
@@ -708,20 +1046,38 @@ async def chat_with_assistant(request: AssistantRequest):
         )
 
 @app.get("/tasks")
-async def get_all_tasks():
+async def get_all_tasks(offset: int = 0, limit: int = 50, status: Optional[str] = None, include_results: bool = False):
     """
-    Получение списка всех задач
-    """
-    return list(tasks.values())
+    Получение списка задач постранично, начиная с самых новых
+    
+    Args:
+        offset: Сколько задач пропустить
+        limit: Размер страницы (не больше 200)
+        status: Фильтр по статусу
+        include_results: Включать ли результаты задач (по умолчанию только состояние)
+    """
+    offset = max(0, offset)
+    limit = max(1, min(limit, 200))
+    # Чтение из SQLite выполняется вне event loop
+    page = await asyncio.to_thread(tasks.page, offset, limit, status)
+    exclude = None if include_results else TASK_RESULT_FIELDS
+    return {
+        "total": page["total"],
+        "offset": offset,
+        "limit": limit,
+        "tasks": [task.model_dump(exclude=exclude) for task in page["tasks"]]
+    }
 
 @app.post("/search-pinterest")
 async def search_pinterest_endpoint(request: PinterestSearchRequest):
     """
-    Ищет образы в Pinterest по запросу, анализирует одежду на найденных изображениях
-    и возвращает результаты анализа.
+    Ставит в очередь поиск образов в Pinterest по запросу с анализом одежды
+    на найденных изображениях (результаты - через /search-pinterest/{task_id}).
+    С search_products в той же задаче ищутся товары на Wildberries для предметов
+    каждого образа, не дожидаясь остальных образов.
     
     Args:
-        request: Параметры запроса (текстовый запрос, пол, количество результатов)
+        request: Параметры запроса (текстовый запрос, пол, количество результатов, поиск товаров)
     
     Returns:
         Идентификатор задачи и статус
@@ -743,168 +1099,235 @@ async def search_pinterest_endpoint(request: PinterestSearchRequest):
             source="pinterest"
         )
         
-        # Запускаем задачу в фоне
-        background_tasks = BackgroundTasks()
-        background_tasks.add_task(process_pinterest_outfit_search, task_id, request)
-        
-        # Запускаем задачу сразу для более быстрого ответа
-        await process_pinterest_outfit_search(task_id, request)
-        
-        # Возвращаем идентификатор задачи
-        return {
-            "task_id": task_id,
-            "status": tasks[task_id].status,
-            "message": tasks[task_id].message if hasattr(tasks[task_id], "message") else "Задача создана"
-        }
+        # Ставим задачу в очередь и сразу возвращаем ее идентификатор
+        return enqueue_task(
+            task_id, lambda: process_pinterest_outfit_search(task_id, request),
+            request.priority, PRIORITY_NORMAL, PINTEREST_JOB_DEADLINE
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при поиске образов в Pinterest: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
+def build_outfit_result(pinterest: PinterestAPI, pin: Any, request: PinterestSearchRequest) -> Dict[str, Any]:
+    """
+    Формирует образ из проанализированного пина
+    
+    Если предметы одежды на изображении не определены, используется запасной
+    набор по стилю запроса.
+    
+    Args:
+        pinterest: Экземпляр PinterestAPI
+        pin: Проанализированный пин
+        request: Параметры поиска образов
+        
+    Returns:
+        Образ: imageUrl, sourceUrl, description, clothingItems
+    """
+    # Проверяем наличие предметов одежды
+    clothing_items = []
+    
+    # Используем прямой доступ к image_analyzer, а не через атрибут api
+    if hasattr(pinterest, 'image_analyzer'):
+        # Если предметов одежды нет или их очень мало, пробуем повторно проанализировать
+        if not pin.clothing_items or len(pin.clothing_items) < 1:
+            try:
+                # Используем запасной механизм для получения предметов одежды
+                pin.clothing_items = pinterest.image_analyzer._generate_fallback_clothing_items(request.query, request.gender)
+                logger.info(f"Использован запасной механизм для получения предметов одежды: {len(pin.clothing_items)} предметов")
+            except Exception as e:
+                logger.error(f"Ошибка при повторном анализе: {e}")
+    
+    if pin.clothing_items:
+        for item in pin.clothing_items:
+            clothing_items.append({
+                "type": item.get("type", "неизвестно"),
+                "color": item.get("color", "неизвестно"),
+                "description": item.get("description", ""),
+                "gender": item.get("gender", request.gender)
+            })
+    else:
+        # Если предметов одежды не найдено, создаем случайные на основе запроса
+        gender = request.gender or "унисекс"
+        style_labels = OUTFIT_FALLBACK_STYLE_CLASSIFIER.classify(request.query)
+    
+        # Определяем стиль одежды на основе запроса
+        if "office" in style_labels:
+            if gender == "мужской":
+                clothing_items = [
+                    {"type": "костюм", "color": "темно-синий", "description": "классический", "gender": gender},
+                    {"type": "рубашка", "color": "белая", "description": "с длинным рукавом", "gender": gender},
+                    {"type": "туфли", "color": "черные", "description": "классические", "gender": gender}
+                ]
+            else:
+                clothing_items = [
+                    {"type": "пиджак", "color": "черный", "description": "классический прямой", "gender": gender},
+                    {"type": "блузка", "color": "белая", "description": "с воротником", "gender": gender},
+                    {"type": "юбка", "color": "черная", "description": "прямая до колена", "gender": gender}
+                ]
+        elif "casual" in style_labels:
+            if gender == "мужской":
+                clothing_items = [
+                    {"type": "джинсы", "color": "синие", "description": "прямые", "gender": gender},
+                    {"type": "футболка", "color": "белая", "description": "хлопковая", "gender": gender},
+                    {"type": "кроссовки", "color": "белые", "description": "спортивные", "gender": gender}
+                ]
+            else:
+                clothing_items = [
+                    {"type": "джинсы", "color": "синие", "description": "скинни", "gender": gender},
+                    {"type": "футболка", "color": "белая", "description": "базовая", "gender": gender},
+                    {"type": "кеды", "color": "белые", "description": "классические", "gender": gender}
+                ]
+        elif "sport" in style_labels:
+            clothing_items = [
+                {"type": "толстовка", "color": "серая", "description": "спортивная с капюшоном", "gender": gender},
+                {"type": "брюки", "color": "черные", "description": "спортивные", "gender": gender},
+                {"type": "кроссовки", "color": "белые", "description": "спортивные", "gender": gender}
+            ]
+        elif "evening" in style_labels:
+            if gender == "мужской":
+                clothing_items = [
+                    {"type": "костюм", "color": "черный", "description": "вечерний", "gender": gender},
+                    {"type": "рубашка", "color": "белая", "description": "классическая", "gender": gender},
+                    {"type": "туфли", "color": "черные", "description": "кожаные", "gender": gender}
+                ]
+            else:
+                clothing_items = [
+                    {"type": "платье", "color": "черное", "description": "вечернее", "gender": gender},
+                    {"type": "туфли", "color": "черные", "description": "на высоком каблуке", "gender": gender},
+                    {"type": "сумка", "color": "черная", "description": "клатч", "gender": gender}
+                ]
+        else:
+            # Базовый набор
+            if gender == "мужской":
+                clothing_items = [
+                    {"type": "рубашка", "color": "голубая", "description": "классическая", "gender": gender},
+                    {"type": "брюки", "color": "темно-синие", "description": "классические", "gender": gender},
+                    {"type": "туфли", "color": "коричневые", "description": "кожаные", "gender": gender}
+                ]
+            else:
+                clothing_items = [
+                    {"type": "блузка", "color": "белая", "description": "классическая", "gender": gender},
+                    {"type": "юбка", "color": "черная", "description": "классическая", "gender": gender},
+                    {"type": "туфли", "color": "черные", "description": "на каблуке", "gender": gender}
+                ]
+    
+    # Формируем результат для каждого пина
+    result = {
+        "imageUrl": pin.image_url,
+        "sourceUrl": pin.link or f"https://www.pinterest.com/pin/{pin.id}/",
+        "description": pin.title or pin.description or f"Образ в стиле {request.query}",
+        "clothingItems": clothing_items
+    }
+    
+    return result
+
 async def process_pinterest_outfit_search(task_id: str, request: PinterestSearchRequest):
-    """Обработка поиска образов в Pinterest"""
+    """
+    Обработка поиска образов в Pinterest
+    
+    Каждый пин анализируется сразу после загрузки, и образ публикуется подписчикам
+    по готовности. При search_products предметы одежды образа сразу ищутся на
+    Wildberries (одинаковые предметы разных образов - один раз), и товары
+    сохраняются в той же задаче.
+    """
     try:
         # Получаем экземпляр Pinterest
         pinterest = get_pinterest()
         if not pinterest:
             raise Exception("Не удалось инициализировать Pinterest")
         
+        wildberries_service = None
+        if request.search_products:
+            wildberries_service = get_wildberries_service()
+            if not wildberries_service:
+                raise Exception("Не удалось инициализировать WildberriesService")
+        
         # Обновляем статус задачи
         tasks[task_id].status = "processing"
         tasks[task_id].message = "Поиск образов в Pinterest"
+        tasks[task_id].image_urls = []
+        publish_task_status(task_id)
+        
+        # Прогресс: готовые образы и завершенные поиски товаров из всех известных на данный момент
+        counters = {"outfits": 0, "searches": 0, "searched": 0}
+        
+        def update_progress() -> None:
+            total = max(request.num_results or 0, len(tasks[task_id].image_urls)) + counters["searches"]
+            done = counters["outfits"] + counters["searched"]
+            tasks[task_id].progress = min(99, int(done / total * 100)) if total else 0
+            publish_task_status(task_id)
+        
+        async def pins_source():
+            async for pin in pinterest.iter_pins(request.query, limit=request.num_results, download=True, gender=request.gender):
+                tasks[task_id].image_urls.append(pin.image_url)
+                tasks[task_id].downloaded_photos = len(tasks[task_id].image_urls)
+                tasks[task_id].status = "analyzing"
+                tasks[task_id].message = "Анализ найденных изображений"
+                publish_task_partial(task_id, "image_url", {"image_url": pin.image_url})
+                yield pin
+        
+        async def analyze(pin: Any) -> Dict[str, Any]:
+            await pinterest.analyze_pin(pin, request.query, request.gender)
+            return build_outfit_result(pinterest, pin, request)
+        
+        async def search_item(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+            return await wildberries_service.search_products_async(
+                entry["query"],
+                gender=entry["gender"],
+                limit=request.max_products_per_item
+            )
         
-        # Ищем пины в Pinterest с анализом изображений
-        pins = await pinterest.search_pins(
-            query=request.query,
-            limit=request.num_results,
-            download=True,
-            analyze_images=True,  # Активируем анализ изображений
-            gender=request.gender  # Передаем пол для контекста
+        def on_outfit(index: int, outfit: Dict[str, Any]) -> None:
+            counters["outfits"] += 1
+            publish_task_partial(task_id, "pinterest_result", {"index": index, "total": request.num_results, "result": outfit})
+            update_progress()
+        
+        def on_search_started(entry: Dict[str, Any]) -> None:
+            counters["searches"] += 1
+            tasks[task_id].total_items = counters["searches"]
+        
+        def on_products(entry: Dict[str, Any]) -> None:
+            counters["searched"] += 1
+            tasks[task_id].processed_items = counters["searched"]
+            tasks[task_id].message = f"Поиск товаров для предмета {counters['searched']}/{counters['searches']}: {entry['query']}"
+            if entry["products"]:
+                publish_task_partial(task_id, "wildberries_result", entry)
+            update_progress()
+        
+        fanout = get_fanout_executor()
+        outcome = await run_outfit_pipeline(
+            pins_source(),
+            analyze,
+            search=search_item if wildberries_service else None,
+            on_outfit=on_outfit,
+            on_products=on_products,
+            on_search_started=on_search_started,
+            search_semaphore=fanout.host_semaphore(WB_SEARCH_HOST),
+            search_timeout=fanout.item_timeout
         )
+        results = outcome["outfits"]
         
-        if not pins:
+        if not results:
             tasks[task_id].status = "failed"
             tasks[task_id].message = "Не удалось найти образы в Pinterest"
+            publish_task_status(task_id)
             return
         
-        # Обновляем статус задачи
-        tasks[task_id].status = "analyzing"
-        tasks[task_id].message = "Анализ найденных изображений"
-        tasks[task_id].downloaded_photos = len(pins)
-        
-        # Сохраняем URL изображений для последующего использования
-        tasks[task_id].image_urls = [pin.image_url for pin in pins]
-        
-        # Преобразуем результаты в нужный формат
-        results = []
-        
-        for pin in pins:
-            # Проверяем наличие предметов одежды
-            clothing_items = []
-            
-            # Используем прямой доступ к image_analyzer, а не через атрибут api
-            if hasattr(pinterest, 'image_analyzer'):
-                # Если предметов одежды нет или их очень мало, пробуем повторно проанализировать
-                if not pin.clothing_items or len(pin.clothing_items) < 1:
-                    try:
-                        # Используем запасной механизм для получения предметов одежды
-                        pin.clothing_items = pinterest.image_analyzer._generate_fallback_clothing_items(request.query, request.gender)
-                        logger.info(f"Использован запасной механизм для получения предметов одежды: {len(pin.clothing_items)} предметов")
-                    except Exception as e:
-                        logger.error(f"Ошибка при повторном анализе: {e}")
-            
-            if pin.clothing_items:
-                for item in pin.clothing_items:
-                    clothing_items.append({
-                        "type": item.get("type", "неизвестно"),
-                        "color": item.get("color", "неизвестно"),
-                        "description": item.get("description", ""),
-                        "gender": item.get("gender", request.gender)
-                    })
-            else:
-                # Если предметов одежды не найдено, создаем случайные на основе запроса
-                gender = request.gender or "унисекс"
-                query_lower = request.query.lower()
-                
-                # Определяем стиль одежды на основе запроса
-                if "офисный" in query_lower or "деловой" in query_lower:
-                    if gender == "мужской":
-                        clothing_items = [
-                            {"type": "костюм", "color": "темно-синий", "description": "классический", "gender": gender},
-                            {"type": "рубашка", "color": "белая", "description": "с длинным рукавом", "gender": gender},
-                            {"type": "туфли", "color": "черные", "description": "классические", "gender": gender}
-                        ]
-                    else:
-                        clothing_items = [
-                            {"type": "пиджак", "color": "черный", "description": "классический прямой", "gender": gender},
-                            {"type": "блузка", "color": "белая", "description": "с воротником", "gender": gender},
-                            {"type": "юбка", "color": "черная", "description": "прямая до колена", "gender": gender}
-                        ]
-                elif "повседневный" in query_lower or "casual" in query_lower:
-                    if gender == "мужской":
-                        clothing_items = [
-                            {"type": "джинсы", "color": "синие", "description": "прямые", "gender": gender},
-                            {"type": "футболка", "color": "белая", "description": "хлопковая", "gender": gender},
-                            {"type": "кроссовки", "color": "белые", "description": "спортивные", "gender": gender}
-                        ]
-                    else:
-                        clothing_items = [
-                            {"type": "джинсы", "color": "синие", "description": "скинни", "gender": gender},
-                            {"type": "футболка", "color": "белая", "description": "базовая", "gender": gender},
-                            {"type": "кеды", "color": "белые", "description": "классические", "gender": gender}
-                        ]
-                elif "спортивный" in query_lower:
-                    clothing_items = [
-                        {"type": "толстовка", "color": "серая", "description": "спортивная с капюшоном", "gender": gender},
-                        {"type": "брюки", "color": "черные", "description": "спортивные", "gender": gender},
-                        {"type": "кроссовки", "color": "белые", "description": "спортивные", "gender": gender}
-                    ]
-                elif "вечерний" in query_lower:
-                    if gender == "мужской":
-                        clothing_items = [
-                            {"type": "костюм", "color": "черный", "description": "вечерний", "gender": gender},
-                            {"type": "рубашка", "color": "белая", "description": "классическая", "gender": gender},
-                            {"type": "туфли", "color": "черные", "description": "кожаные", "gender": gender}
-                        ]
-                    else:
-                        clothing_items = [
-                            {"type": "платье", "color": "черное", "description": "вечернее", "gender": gender},
-                            {"type": "туфли", "color": "черные", "description": "на высоком каблуке", "gender": gender},
-                            {"type": "сумка", "color": "черная", "description": "клатч", "gender": gender}
-                        ]
-                else:
-                    # Базовый набор
-                    if gender == "мужской":
-                        clothing_items = [
-                            {"type": "рубашка", "color": "голубая", "description": "классическая", "gender": gender},
-                            {"type": "брюки", "color": "темно-синие", "description": "классические", "gender": gender},
-                            {"type": "туфли", "color": "коричневые", "description": "кожаные", "gender": gender}
-                        ]
-                    else:
-                        clothing_items = [
-                            {"type": "блузка", "color": "белая", "description": "классическая", "gender": gender},
-                            {"type": "юбка", "color": "черная", "description": "классическая", "gender": gender},
-                            {"type": "туфли", "color": "черные", "description": "на каблуке", "gender": gender}
-                        ]
-            
-            # Формируем результат для каждого пина
-            result = {
-                "imageUrl": pin.image_url,
-                "sourceUrl": pin.link or f"https://www.pinterest.com/pin/{pin.id}/",
-                "description": pin.title or pin.description or f"Образ в стиле {request.query}",
-                "clothingItems": clothing_items
-            }
-            
-            results.append(result)
-        
         # Сохраняем результаты в задаче
         tasks[task_id].pinterest_results = results
         tasks[task_id].status = "completed"
         tasks[task_id].progress = 100
         tasks[task_id].message = f"Найдено {len(results)} образов"
+        if request.search_products:
+            tasks[task_id].wildberries_results = outcome["products"]
+            tasks[task_id].message += f", товары для {len(outcome['products'])} предметов"
+        publish_task_status(task_id)
         
-        logger.info(f"Задача {task_id} успешно завершена: найдено {len(results)} образов")
+        logger.info(f"Задача {task_id} успешно завершена: {tasks[task_id].message}, конвейер: {outcome['stats']}")
         
     except Exception as e:
         logger.error(f"Ошибка при поиске образов в Pinterest: {e}")
@@ -912,10 +1335,7 @@ async def process_pinterest_outfit_search(task_id: str, request: PinterestSearch
         
         tasks[task_id].status = "failed"
         tasks[task_id].message = f"Ошибка при поиске образов: {str(e)}"
-    finally:
-        # Закрываем соединения
-        if pinterest:
-            await pinterest.close()
+        publish_task_status(task_id)
 
 def parse_assistant_response(response: str, gender: str = "женский") -> List[Dict[str, str]]:
     """
@@ -929,99 +1349,10 @@ def parse_assistant_response(response: str, gender: str = "женский") -> L
         Список предметов одежды с типом, цветом и описанием
     """
     try:
-        # Попробуем извлечь структурированные данные
-        clothing_items = []
+        # Разбираем маркированный список, строки-свойства и упоминания одежды за один проход
+        clothing_items = parse_outfit_items(response, gender)
         
-        # Парсим разными способами
-        # 1. Попробуем найти маркированный список
-        lines = response.split("\n")
-        
-        # Ищем предметы одежды с помощью регулярных выражений
-        current_item = {}
-        for line in lines:
-            line = line.strip()
-            
-            # Пропускаем пустые строки
-            if not line:
-                continue
-            
-            # Проверяем, является ли строка новым элементом списка
-            if line.startswith(("- ", "• ", "* ", "1. ", "2. ", "3. ")) or re.match(r"^\d+\.", line):
-                # Если уже собрали предмет, добавляем его в список
-                if current_item and "type" in current_item:
-                    clothing_items.append(current_item)
-                    current_item = {}
-                
-                # Удаляем маркер списка
-                line = re.sub(r"^[•\-\*\d\.]+\s*", "", line)
-                
-                # Пробуем определить тип и цвет предмета
-                match_type_color = re.search(r"([а-яА-Я]+)(?:\s+|:)([а-яА-Я]+)", line, re.IGNORECASE)
-                if match_type_color:
-                    current_item = {
-                        "type": match_type_color.group(1).lower(),
-                        "color": match_type_color.group(2).lower(),
-                        "description": line.replace(f"{match_type_color.group(1)} {match_type_color.group(2)}", "").strip(),
-                        "gender": gender
-                    }
-                else:
-                    # Если не удалось определить тип и цвет, берем всю строку как описание
-                    words = line.split()
-                    if len(words) >= 2:
-                        current_item = {
-                            "type": words[0].lower(),
-                            "color": words[1].lower(),
-                            "description": " ".join(words[2:]),
-                            "gender": gender
-                        }
-                    else:
-                        current_item = {
-                            "type": line.lower(),
-                            "color": "неизвестный",
-                            "description": "",
-                            "gender": gender
-                        }
-            
-            # Если строка содержит ":" и мы уже начали собирать предмет, это может быть свойство
-            elif ":" in line and current_item:
-                key, value = line.split(":", 1)
-                key = key.lower().strip()
-                value = value.strip()
-                
-                if key in ["тип", "предмет", "вещь"]:
-                    current_item["type"] = value.lower()
-                elif key in ["цвет", "оттенок"]:
-                    current_item["color"] = value.lower()
-                elif key in ["описание", "особенности", "детали"]:
-                    current_item["description"] = value
-                elif key in ["пол"]:
-                    current_item["gender"] = value.lower()
-        
-        # Добавляем последний предмет, если он есть
-        if current_item and "type" in current_item:
-            clothing_items.append(current_item)
-        
-        # Если не удалось найти предметы, создаем простые на основе ключевых слов
-        if not clothing_items:
-            # Ищем упоминания распространенных предметов одежды
-            clothing_types = ["футболка", "рубашка", "блузка", "джинсы", "брюки", "юбка", "платье", 
-                            "куртка", "пальто", "свитер", "кофта", "жакет", "пиджак", "шорты",
-                            "кроссовки", "туфли", "ботинки", "сапоги", "кеды", "шляпа", "шапка"]
-            
-            for clothing_type in clothing_types:
-                if clothing_type in response.lower():
-                    # Ищем цвет рядом с типом одежды
-                    color_match = re.search(r"(\w+)\s+" + clothing_type, response.lower())
-                    color = color_match.group(1) if color_match else "неизвестный"
-                    
-                    clothing_items.append({
-                        "type": clothing_type,
-                        "color": color,
-                        "description": "",
-                        "gender": gender
-                    })
-        
-        # Если все еще нет предметов, создаем по умолчанию
+        # Если предметов нет, создаем по умолчанию
         if not clothing_items:
             clothing_items = [
                 {
@@ -1070,13 +1401,11 @@ async def get_pinterest_search_results(task_id: str):
         Результаты поиска и статус задачи
     """
     try:
-        # Проверяем наличие задачи
-        if task_id not in tasks:
+        # Получаем задачу (чужая задача читается из базы вне event loop)
+        task = await tasks.get_async(task_id)
+        if task is None:
             raise HTTPException(status_code=404, detail=f"Задача с идентификатором {task_id} не найдена")
         
-        # Получаем статус задачи
-        task = tasks[task_id]
-        
         # Формируем ответ
         response = {
             "task_id": task_id,
@@ -1089,6 +1418,9 @@ async def get_pinterest_search_results(task_id: str):
         # Если задача завершена, добавляем результаты
         if task.status == "completed" and hasattr(task, "pinterest_results"):
             response["results"] = task.pinterest_results
+            # Товары, найденные в той же задаче (search_products)
+            if task.wildberries_results is not None:
+                response["products"] = task.wildberries_results
         elif task.status == "analyzing" and hasattr(task, "image_urls"):
             response["image_urls"] = task.image_urls
         
@@ -1114,11 +1446,10 @@ async def search_wildberries_endpoint(request: WildberriesSearchRequest):
     """
     try:
         # Проверяем наличие задачи Pinterest
-        if request.pinterest_task_id not in tasks:
+        pinterest_task = await tasks.get_async(request.pinterest_task_id)
+        if pinterest_task is None:
             raise HTTPException(status_code=404, detail=f"Задача с идентификатором {request.pinterest_task_id} не найдена")
         
-        pinterest_task = tasks[request.pinterest_task_id]
-        
         # Проверяем статус задачи Pinterest
         if pinterest_task.status != "completed":
             raise HTTPException(status_code=400, detail=f"Задача Pinterest не завершена, текущий статус: {pinterest_task.status}")
@@ -1155,31 +1486,20 @@ async def search_wildberries_endpoint(request: WildberriesSearchRequest):
         if not search_items:
             tasks[task_id].status = "failed"
             tasks[task_id].message = "Не найдены предметы одежды для поиска"
+            publish_task_status(task_id)
             return {
                 "task_id": task_id,
                 "status": "failed",
                 "message": "Не найдены предметы одежды для поиска"
             }
         
-        # Запускаем задачу в фоне
-        background_tasks = BackgroundTasks()
-        background_tasks.add_task(
-            process_wildberries_search, 
-            task_id, 
-            search_items, 
-            request.max_products_per_item
+        # Ставим задачу в очередь с повышенным приоритетом: это продолжение уже начатого
+        # пользователем сценария, и поиск по готовому списку предметов обычно короткий
+        return enqueue_task(
+            task_id, lambda: process_wildberries_search(task_id, search_items, request.max_products_per_item),
+            request.priority, PRIORITY_HIGH, WILDBERRIES_JOB_DEADLINE
         )
         
-        # Запускаем задачу сразу для более быстрого ответа
-        await process_wildberries_search(task_id, search_items, request.max_products_per_item)
-        
-        # Возвращаем идентификатор задачи
-        return {
-            "task_id": task_id,
-            "status": tasks[task_id].status,
-            "message": tasks[task_id].message if hasattr(tasks[task_id], "message") else "Задача создана"
-        }
-        
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -1207,59 +1527,52 @@ async def process_wildberries_search(task_id: str, search_items: List[Dict[str,
         tasks[task_id].message = "Поиск товаров на Wildberries"
         tasks[task_id].total_items = len(search_items)
         tasks[task_id].processed_items = 0
+        publish_task_status(task_id)
+        
+        # Формируем поисковые запросы для предметов (предметы без типа пропускаем)
+        queries = [entry for entry in map(build_item_query, search_items) if entry is not None]
         
-        # Результаты поиска
+        tasks[task_id].total_items = len(queries)
+        
+        async def search_item(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+            return await wildberries_service.search_products_async(
+                entry["query"],
+                gender=entry["gender"],
+                limit=max_products_per_item
+            )
+        
+        def on_item_done(index: int, entry: Dict[str, Any], outcome: Dict[str, Any], completed: int, total: int):
+            # Обновляем прогресс по мере завершения каждого предмета
+            tasks[task_id].progress = int(completed / total * 100)
+            tasks[task_id].processed_items = completed
+            tasks[task_id].message = f"Поиск товаров для предмета {completed}/{total}: {entry['query']}"
+            publish_task_status(task_id)
+            if outcome["result"]:
+                publish_task_partial(task_id, "wildberries_result", {
+                    "index": index,
+                    "query": entry["query"],
+                    "item": entry["item"],
+                    "products": outcome["result"]
+                })
+        
+        # Выполняем поиск по всем предметам конкурентно с ограничением на хост
+        outcomes = await get_fanout_executor().run(queries, search_item, host=WB_SEARCH_HOST, on_item_done=on_item_done)
+        
+        # Результаты поиска в исходном порядке предметов
         search_results = []
+        timed_out = 0
+        for outcome in outcomes:
+            if outcome["timed_out"]:
+                timed_out += 1
+            if outcome["result"]:
+                search_results.append({
+                    "query": outcome["item"]["query"],
+                    "item": outcome["item"]["item"],
+                    "products": outcome["result"]
+                })
         
-        # Обрабатываем каждый предмет одежды
-        for i, item in enumerate(search_items):
-            try:
-                # Формируем запрос для поиска
-                type_name = item.get("type", "").strip()
-                color = item.get("color", "").strip()
-                description = item.get("description", "").strip()
-                gender = item.get("gender", "женский").strip()
-                
-                # Если тип пустой, пропускаем
-                if not type_name:
-                    continue
-                
-                # Формируем поисковый запрос
-                search_query = f"{type_name}"
-                if color and color != "неизвестный":
-                    search_query += f" {color}"
-                
-                # Добавляем часть описания, если есть
-                if description:
-                    # Извлекаем ключевые слова из описания
-                    keywords = re.findall(r'\b[а-яА-Я]{3,}\b', description)
-                    if keywords:
-                        search_query += f" {' '.join(keywords[:2])}"
-                
-                # Обновляем статус
-                current_item_num = i + 1
-                tasks[task_id].progress = int(current_item_num / len(search_items) * 100)
-                tasks[task_id].processed_items = current_item_num
-                tasks[task_id].message = f"Поиск товаров для предмета {current_item_num}/{len(search_items)}: {search_query}"
-                
-                # Выполняем поиск на Wildberries
-                search_results_wb = await wildberries_service.search_products_async(
-                    search_query, 
-                    gender=gender,
-                    limit=max_products_per_item
-                )
-                
-                # Если результаты найдены, добавляем в общий список
-                if search_results_wb:
-                    search_results.append({
-                        "query": search_query,
-                        "item": item,
-                        "products": search_results_wb
-                    })
-                
-            except Exception as e:
-                logger.error(f"Ошибка при поиске товаров для предмета {item.get('type', '')}: {str(e)}")
-                continue
+        if timed_out:
+            logger.warning(f"Задача {task_id}: {timed_out} предметов не успели обработаться, возвращаем частичные результаты")
         
         # Обновляем статус задачи
         if search_results:
@@ -1270,12 +1583,14 @@ async def process_wildberries_search(task_id: str, search_items: List[Dict[str,
         else:
             tasks[task_id].status = "failed"
             tasks[task_id].message = "Не найдено товаров"
+        publish_task_status(task_id)
         
     except Exception as e:
         logger.error(f"Ошибка при поиске товаров на Wildberries: {str(e)}")
         logger.error(traceback.format_exc())
         tasks[task_id].status = "failed"
         tasks[task_id].message = f"Ошибка: {str(e)}"
+        publish_task_status(task_id)
 
 @app.get("/search-wildberries/{task_id}")
 async def get_wildberries_search_results(task_id: str):
@@ -1289,13 +1604,11 @@ async def get_wildberries_search_results(task_id: str):
         Результаты поиска и статус задачи
     """
     try:
-        # Проверяем наличие задачи
-        if task_id not in tasks:
+        # Получаем задачу (чужая задача читается из базы вне event loop)
+        task = await tasks.get_async(task_id)
+        if task is None:
             raise HTTPException(status_code=404, detail=f"Задача с идентификатором {task_id} не найдена")
         
-        # Получаем статус задачи
-        task = tasks[task_id]
-        
         # Формируем ответ
         response = {
             "task_id": task_id,
@@ -1445,6 +1758,35 @@ async def search_products(
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
+@app.post("/api/care-recommendations")
+async def care_recommendations_endpoint(request: CareRecommendationsRequest):
+    """
+    Возвращает рекомендации по уходу для найденных товаров.
+    
+    Рекомендации не вычисляются при поиске товаров: клиент запрашивает их
+    отдельно, когда они действительно нужны (например, для косметики).
+    
+    Args:
+        request: Список товаров (id, name, brand, description)
+        
+    Returns:
+        Словарь {id товара: рекомендации по уходу}
+    """
+    try:
+        wb_service = get_wildberries_service()
+        if not wb_service:
+            raise HTTPException(status_code=500, detail="Не удалось инициализировать WildberriesService")
+        
+        recommendations = await wb_service.get_care_recommendations(request.products)
+        return {"recommendations": recommendations}
+    
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Ошибка при получении рекомендаций по уходу: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+
 @app.post("/api/determine_user_needs")
 async def determine_user_needs_endpoint(request: AssistantRequest):
     """
@@ -2934,33 +3276,14 @@ def generate_design_analysis(request: DesignerRequest, needs_result: Dict[str, A
 
 def categorize_furniture_products(products: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """Группирует товары мебели по категориям."""
-    # Категории мебели и соответствующие ключевые слова для поиска
-    categories = {
-        "Диваны и кресла": ["диван", "софа", "кресло", "пуф"],
-        "Столы и стулья": ["стол", "стул", "табурет", "стеллаж"],
-        "Шкафы и хранение": ["шкаф", "комод", "полка", "этажерка", "гардероб"],
-        "Кровати": ["кровать", "матрас", "изголовье"],
-        "Освещение": ["светильник", "люстра", "лампа", "бра", "торшер"],
-        "Декор": ["ковер", "подушка", "ваза", "картина", "зеркало", "часы"]
-    }
-    
-    # Инициализируем структуру категорий
-    categorized = {category: [] for category in categories}
+    # Инициализируем структуру категорий (ключевые слова - в keyword_classifier)
+    categorized = {category: [] for category in FURNITURE_CLASSIFIER.labels}
     categorized["Другое"] = []  # Категория для товаров, которые не попали в основные
     
-    # Распределяем товары по категориям
+    # Распределяем товары по категориям: при нескольких совпадениях побеждает первая категория
     for product in products:
-        name = product.get("name", "").lower()
-        assigned = False
-        
-        for category, keywords in categories.items():
-            if any(keyword in name for keyword in keywords):
-                categorized[category].append(product)
-                assigned = True
-                break
-        
-        if not assigned:
-            categorized["Другое"].append(product)
+        category = FURNITURE_CLASSIFIER.first_label(product.get("name", ""))
+        categorized[category or "Другое"].append(product)
     
     # Удаляем пустые категории
     return {k: v for k, v in categorized.items() if v}
@@ -30,6 +30,7 @@ import hashlib
 import traceback
 import random
 import zlib
+import inspect
 import platform
 import string
 
@@ -51,6 +52,13 @@ except ImportError:
     logger = logging.getLogger(__name__)
     logger.warning("Не удалось инициализировать wildberries_async. Некоторые функции будут недоступны.")
 
+# Локальный движок похожих товаров (требует scikit-learn)
+try:
+    from similarity_engine import get_similarity_engine
+    SIMILARITY_ENGINE_AVAILABLE = True
+except ImportError:
+    SIMILARITY_ENGINE_AVAILABLE = False
+
 # Инициализация модуля банковских выписок
 try:
     from bank_statement_parser import BankStatementParser
@@ -1352,6 +1360,45 @@ class ChatAssistant:
             )
         return response
     
+    def _find_similar_products_locally(
+        self,
+        query: str,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Находит товары, похожие на запрос, среди закешированных товаров Wildberries.
+
+        Args:
+            query: Текстовый запрос
+            limit: Максимальное количество товаров
+            min_price: Минимальная цена (фильтрует по основной цене)
+            max_price: Максимальная цена (фильтрует по скидочной цене)
+
+        Returns:
+            Список товаров с полем similarity
+        """
+        try:
+            # Берем кандидатов с запасом, чтобы после фильтрации по цене осталось достаточно
+            matches = get_similarity_engine().similar_to_text(query, k=limit * 3)
+        except Exception as e:
+            logger.error(f"Ошибка локального поиска похожих товаров: {str(e)}")
+            return []
+
+        products = []
+        for product, score in matches:
+            price = product.get("price") or 0
+            sale_price = product.get("sale_price") or price
+            if min_price is not None and price < min_price:
+                continue
+            if max_price is not None and sale_price > max_price:
+                continue
+            products.append({**product, "similarity": round(score, 4)})
+            if len(products) >= limit:
+                break
+        return products
+
     @async_retry(max_retries=3, initial_delay=1, backoff_factor=2)
     async def find_similar_products_wildberries_async(
         self,
@@ -1373,7 +1420,8 @@ class ChatAssistant:
             max_price: Максимальная цена (фильтрует по скидочной цене)
             limit: Максимальное количество товаров для возврата
             sort: Способ сортировки товаров (popular, priceup, pricedown, newly, rate)
-            **kwargs: Дополнительные параметры для поиска
+            **kwargs: Дополнительные параметры для поиска (не поддерживаемые search_products_async,
+                например gender, игнорируются с предупреждением в логе)
 
         Returns:
             List[Dict[str, Any]]: Список найденных товаров
@@ -1394,6 +1442,14 @@ class ChatAssistant:
         
         wildberries_api = WildberriesAsyncAPI()
         
+        # Передаем в поиск только те дополнительные параметры, которые он поддерживает
+        supported = set(inspect.signature(wildberries_api.search_products_async).parameters)
+        supported -= {"query", "limit", "min_price", "max_price", "sort"}
+        search_kwargs = {name: value for name, value in kwargs.items() if name in supported}
+        ignored = sorted(set(kwargs) - set(search_kwargs))
+        if ignored:
+            logger.warning(f"Параметры {', '.join(ignored)} не поддерживаются поиском Wildberries и будут проигнорированы")
+        
         # Если предоставлено изображение, но нет запроса, анализируем изображение для получения запроса
         if image_path and not query:
             logger.info(f"Анализ изображения {image_path} для поиска похожих товаров")
@@ -1418,30 +1474,43 @@ class ChatAssistant:
                 query = "одежда"
         
         try:
-            # Выполняем поиск товаров
-            products = await wildberries_api.search_products(
+            # Выполняем поиск товаров (результаты кешируются в общем кеше приложения)
+            products = await wildberries_api.search_products_async(
                 query=query,
                 limit=limit,
                 min_price=min_price,
                 max_price=max_price,
                 sort=sort,
-                **kwargs
+                **search_kwargs
             )
             
-            # Если не найдены товары, пробуем более общий запрос
+            # Если не найдены товары, пробуем найти похожие среди закешированных товаров
+            if not products and SIMILARITY_ENGINE_AVAILABLE:
+                products = await asyncio.to_thread(
+                    self._find_similar_products_locally, query, limit, min_price, max_price
+                )
+                # Локальный движок хранит записи индекса товаров, приводим их к формату клиента
+                products = [
+                    {**wildberries_api.format_record(product), "similarity": product["similarity"]}
+                    for product in products
+                ]
+                if products:
+                    logger.info(f"Для запроса '{query}' найдено {len(products)} похожих товаров в локальном индексе")
+
+            # Если товары все еще не найдены, пробуем более общий запрос
             if not products and image_path:
                 logger.warning(f"Не найдены товары по запросу '{query}'. Попытка с более общим запросом.")
                 
                 # Извлечем ключевое слово из запроса
                 general_query = query.split()[0] if " " in query else query
                 
-                products = await wildberries_api.search_products(
+                products = await wildberries_api.search_products_async(
                     query=general_query,
                     limit=limit,
                     min_price=min_price,
                     max_price=max_price,
                     sort=sort,
-                    **kwargs
+                    **search_kwargs
                 )
             
             logger.info(f"Найдено {len(products)} товаров по запросу '{query}'")
@@ -1449,6 +1518,8 @@ class ChatAssistant:
         except Exception as e:
             logger.error(f"Ошибка при поиске товаров на Wildberries: {str(e)}")
             raise
+        finally:
+            await wildberries_api.close()
     
     def find_similar_products_wildberries(
         self,
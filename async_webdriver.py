@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронный фасад над Selenium WebDriver.
+
+Методы Selenium блокирующие: каждый вызов - это HTTP-запрос к chromedriver, который
+может длиться десятки секунд (загрузка страницы, ожидание элементов). Если вызывать их
+прямо из async-функций, на это время останавливается весь event loop FastAPI.
+
+AsyncWebDriver держит драйвер в отдельном потоке-воркере. Команды попадают в очередь и
+выполняются по одной (WebDriver не потокобезопасен), а корутина ждет результата через
+asyncio-future, не блокируя цикл событий:
+
+    driver = AsyncWebDriver(create_chrome_driver, name="pinterest")
+    await driver.start()
+    await driver.get("https://example.com", timeout=30)
+    found = await driver.wait_for_css("div.item", timeout=10)
+    titles = await driver.call(lambda d: [e.text for e in d.find_elements(By.CSS_SELECTOR, "h2")])
+    await driver.quit()
+
+Работу с WebElement (find_element, get_attribute и т.п.) нужно выполнять внутри call():
+сами элементы привязаны к драйверу, и обращение к ним из цикла событий снова стало бы
+блокирующим.
+
+Тайм-ауты и отмена:
+- команда, еще стоящая в очереди, при отмене или тайм-ауте просто не выполняется;
+- уже запущенную команду Selenium прервать нельзя, поэтому драйвер помечается как
+  неисправный (healthy = False), а quit() при зависшем воркере принудительно
+  останавливает процесс chromedriver, что обрывает зависший вызов.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+try:
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Тайм-аут команды по умолчанию; должен быть больше page load timeout самого драйвера
+DEFAULT_COMMAND_TIMEOUT = float(os.getenv("WEBDRIVER_COMMAND_TIMEOUT", "90"))
+# Сколько ждать штатного завершения драйвера перед принудительной остановкой
+QUIT_TIMEOUT = float(os.getenv("WEBDRIVER_QUIT_TIMEOUT", "10"))
+
+_worker_ids = itertools.count(1)
+
+
+class WebDriverClosedError(RuntimeError):
+    """Команда отправлена драйверу, который уже закрыт или не был запущен."""
+
+
+class _Command:
+    """Команда для потока-воркера."""
+
+    __slots__ = ("fn", "args", "kwargs", "future")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class AsyncWebDriver:
+    """WebDriver, работающий в собственном потоке, с асинхронным интерфейсом."""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        name: str = "webdriver",
+        command_timeout: float = DEFAULT_COMMAND_TIMEOUT
+    ):
+        """
+        Инициализация фасада.
+
+        Args:
+            factory: Функция без аргументов, создающая WebDriver (вызывается в потоке-воркере)
+            name: Имя для логов и названия потока
+            command_timeout: Тайм-аут команды по умолчанию в секундах
+        """
+        self._factory = factory
+        self.name = f"{name}-{next(_worker_ids)}"
+        self.command_timeout = command_timeout
+        self._driver: Any = None
+        self._queue: "queue.Queue[Optional[_Command]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._busy = threading.Event()
+        self.healthy = True
+        self.navigations = 0
+
+    @property
+    def started(self) -> bool:
+        """Запущен ли драйвер."""
+        return self._driver is not None and not self._closed
+
+    @property
+    def raw_driver(self) -> Any:
+        """Исходный объект WebDriver (только для использования внутри call())."""
+        return self._driver
+
+    def _worker(self) -> None:
+        """Цикл потока-воркера: выполняет команды из очереди по одной."""
+        while True:
+            command = self._queue.get()
+            if command is None:
+                break
+            # Команда отменена, пока стояла в очереди
+            if not command.future.set_running_or_notify_cancel():
+                continue
+            self._busy.set()
+            try:
+                result = command.fn(*command.args, **command.kwargs)
+            except BaseException as e:
+                command.future.set_exception(e)
+            else:
+                command.future.set_result(result)
+            finally:
+                self._busy.clear()
+
+    async def _submit(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Ставит функцию в очередь воркера и ждет результата.
+
+        Args:
+            fn: Функция, выполняемая в потоке-воркере
+            *args: Позиционные аргументы функции
+            timeout: Тайм-аут в секундах (None - command_timeout)
+            **kwargs: Именованные аргументы функции
+
+        Returns:
+            Результат функции
+        """
+        if self._closed or self._thread is None:
+            raise WebDriverClosedError(f"Драйвер {self.name} не запущен")
+
+        command = _Command(fn, args, kwargs)
+        self._queue.put(command)
+        timeout = self.command_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(command.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # Команду из очереди future.cancel() снимает сам; запущенную прервать нельзя
+            if command.future.running():
+                self.healthy = False
+                reason = "тайм-аут" if isinstance(e, asyncio.TimeoutError) else "отмена"
+                logger.warning(f"Команда драйвера {self.name} не завершилась ({reason}), драйвер помечен как неисправный")
+            raise
+
+    async def start(self) -> None:
+        """Запускает поток-воркер и создает в нем WebDriver."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+        self._thread.start()
+
+        def _create() -> Any:
+            driver = self._factory()
+            # Запуск был отменен, пока браузер стартовал: не оставляем процесс висеть
+            if self._closed:
+                driver.quit()
+                raise WebDriverClosedError(f"Драйвер {self.name} закрыт во время запуска")
+            return driver
+
+        try:
+            self._driver = await self._submit(_create)
+        except BaseException:
+            await self.quit()
+            raise
+        logger.info(f"Драйвер {self.name} запущен")
+
+    async def call(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Выполняет fn(driver, *args, **kwargs) в потоке драйвера.
+
+        Args:
+            fn: Функция, первым аргументом получающая WebDriver
+            *args: Дополнительные аргументы
+            timeout: Тайм-аут в секундах
+            **kwargs: Именованные аргументы
+
+        Returns:
+            Результат функции
+        """
+        return await self._submit(lambda: fn(self._driver, *args, **kwargs), timeout=timeout)
+
+    async def get(self, url: str, timeout: Optional[float] = None) -> None:
+        """
+        Открывает страницу.
+
+        Args:
+            url: Адрес страницы
+            timeout: Тайм-аут в секундах
+        """
+        await self._submit(lambda: self._driver.get(url), timeout=timeout)
+        self.navigations += 1
+
+    async def execute_script(self, script: str, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Выполняет JavaScript на странице.
+
+        Args:
+            script: Текст скрипта
+            *args: Аргументы скрипта (доступны как arguments[i])
+            timeout: Тайм-аут в секундах
+
+        Returns:
+            Значение, возвращенное скриптом
+        """
+        return await self._submit(lambda: self._driver.execute_script(script, *args), timeout=timeout)
+
+    async def execute_async_script(self, script: str, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Выполняет асинхронный JavaScript (результат передается через последний аргумент-callback).
+
+        Args:
+            script: Текст скрипта
+            *args: Аргументы скрипта
+            timeout: Тайм-аут в секундах (script timeout самого драйвера должен быть не меньше)
+
+        Returns:
+            Значение, переданное скриптом в callback
+        """
+        return await self._submit(lambda: self._driver.execute_async_script(script, *args), timeout=timeout)
+
+    async def set_page_load_timeout(self, seconds: float) -> None:
+        """Устанавливает тайм-аут загрузки страницы в самом драйвере."""
+        await self._submit(lambda: self._driver.set_page_load_timeout(seconds))
+
+    async def wait_for_css(self, selector: str, timeout: float) -> bool:
+        """
+        Ждет появления элемента по CSS-селектору.
+
+        Args:
+            selector: CSS-селектор
+            timeout: Время ожидания в секундах
+
+        Returns:
+            True, если элемент появился, иначе False
+        """
+        def _wait() -> bool:
+            try:
+                WebDriverWait(self._driver, timeout).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+                )
+                return True
+            except TimeoutException:
+                return False
+
+        # Запас сверх времени ожидания - на сам HTTP-запрос к chromedriver
+        return await self._submit(_wait, timeout=timeout + 15)
+
+    def _kill(self) -> None:
+        """Принудительно останавливает процесс chromedriver (обрывает зависшие команды)."""
+        try:
+            service = getattr(self._driver, "service", None)
+            if service is not None:
+                service.stop()
+        except Exception as e:
+            logger.error(f"Ошибка при принудительной остановке драйвера {self.name}: {e}")
+
+    async def quit(self) -> None:
+        """Закрывает браузер и останавливает поток-воркер."""
+        if self._closed:
+            return
+        thread = self._thread
+        if thread is None:
+            self._closed = True
+            return
+
+        if self._driver is not None:
+            stuck = self._busy.is_set() and not self.healthy
+            if not stuck:
+                try:
+                    await self._submit(lambda: self._driver.quit(), timeout=QUIT_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Драйвер {self.name} не закрылся штатно: {e}")
+                    stuck = True
+            if stuck:
+                await asyncio.get_running_loop().run_in_executor(None, self._kill)
+
+        self._closed = True
+        # Оставшиеся в очереди команды больше никто не выполнит
+        while True:
+            try:
+                command = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if command is not None:
+                command.future.cancel()
+        self._queue.put(None)
+        self._driver = None
+        logger.info(f"Драйвер {self.name} закрыт")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Пул заранее запущенных headless-браузеров.
+
+Запуск Chrome (поиск chromedriver, старт процесса браузера) занимает секунды, поэтому
+браузеры запускаются один раз и переиспользуются между запросами:
+
+    pool = BrowserPool(create_chrome_driver, size=2, name="pinterest")
+    await pool.start()                      # прогрев: N браузеров запускаются заранее
+    async with pool.acquire() as driver:    # AsyncWebDriver; ждет, если все заняты
+        await driver.get(url)
+    await pool.close()
+
+Пул следит за состоянием браузеров:
+- перед выдачей браузер проверяется коротким скриптом, неисправный заменяется новым;
+- после использования страница очищается (cookies, storage, лишние вкладки, about:blank),
+  чтобы следующий запрос не видел состояния предыдущего;
+- браузер перезапускается после max_navigations переходов или при росте памяти
+  больше max_memory_growth_mb относительно состояния после запуска.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+from async_webdriver import AsyncWebDriver
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+DEFAULT_MAX_NAVIGATIONS = int(os.getenv("BROWSER_POOL_MAX_NAVIGATIONS", "50"))
+DEFAULT_MAX_MEMORY_GROWTH_MB = float(os.getenv("BROWSER_POOL_MAX_MEMORY_GROWTH_MB", "400"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "120"))
+# Тайм-ауты служебных команд: проверки здоровья и очистки страницы
+HEALTH_CHECK_TIMEOUT = 5
+RESET_TIMEOUT = 15
+
+_JS_HEAP_SCRIPT = "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : 0;"
+
+
+class BrowserPoolTimeoutError(TimeoutError):
+    """Не удалось дождаться свободного браузера."""
+
+
+def _memory_usage_mb(driver: Any) -> float:
+    """
+    Оценивает память, занятую браузером (вызывается в потоке драйвера).
+
+    С psutil считается суммарный RSS chromedriver и всех процессов Chrome,
+    без него - размер JS-кучи текущей страницы.
+
+    Args:
+        driver: Selenium WebDriver
+
+    Returns:
+        Объем памяти в мегабайтах (0, если оценить не удалось)
+    """
+    try:
+        process = getattr(getattr(driver, "service", None), "process", None)
+        if PSUTIL_AVAILABLE and process is not None:
+            root = psutil.Process(process.pid)
+            total = root.memory_info().rss
+            for child in root.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total / (1024 * 1024)
+        return (driver.execute_script(_JS_HEAP_SCRIPT) or 0) / (1024 * 1024)
+    except Exception as e:
+        logger.debug(f"Не удалось оценить память браузера: {e}")
+        return 0.0
+
+
+def _reset_page(driver: Any) -> None:
+    """
+    Очищает состояние браузера между запросами (вызывается в потоке драйвера).
+
+    Args:
+        driver: Selenium WebDriver
+    """
+    # Закрываем вкладки, открытые страницей, оставляя первую
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+
+    try:
+        driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+    except Exception:
+        pass
+    try:
+        # Очищает cookies всех доменов, а не только текущей страницы
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    except Exception:
+        driver.delete_all_cookies()
+    driver.get("about:blank")
+
+
+class BrowserPool:
+    """Пул AsyncWebDriver с прогревом, проверками здоровья и перезапуском браузеров."""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = DEFAULT_POOL_SIZE,
+        name: str = "browser",
+        max_navigations: int = DEFAULT_MAX_NAVIGATIONS,
+        max_memory_growth_mb: float = DEFAULT_MAX_MEMORY_GROWTH_MB,
+        acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT
+    ):
+        """
+        Инициализация пула.
+
+        Args:
+            factory: Блокирующая функция, создающая Selenium WebDriver
+            size: Максимальное число одновременно запущенных браузеров
+            name: Имя пула для логов
+            max_navigations: Число переходов, после которого браузер перезапускается
+            max_memory_growth_mb: Допустимый рост памяти браузера в мегабайтах
+            acquire_timeout: Сколько ждать свободный браузер, секунды
+        """
+        self._factory = factory
+        self.size = max(1, size)
+        self.name = name
+        self.max_navigations = max_navigations
+        self.max_memory_growth_mb = max_memory_growth_mb
+        self.acquire_timeout = acquire_timeout
+
+        self._slots = asyncio.Semaphore(self.size)
+        self._idle: Deque[AsyncWebDriver] = deque()
+        self._baseline_memory: Dict[str, float] = {}
+        self._closed = False
+        self._waiting = 0
+        self._in_use = 0
+        self._stats = {"launched": 0, "recycled": 0, "failed_health_checks": 0, "acquired": 0}
+
+    async def _launch(self) -> AsyncWebDriver:
+        """Запускает новый браузер."""
+        driver = AsyncWebDriver(self._factory, name=self.name)
+        started_at = time.monotonic()
+        await driver.start()
+        try:
+            self._baseline_memory[driver.name] = await driver.call(_memory_usage_mb, timeout=HEALTH_CHECK_TIMEOUT)
+        except BaseException:
+            # Браузер уже запущен: без закрытия процесс Chrome останется висеть
+            try:
+                await driver.quit()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии браузера {driver.name}: {e}")
+            raise
+        self._stats["launched"] += 1
+        logger.info(f"Браузер {driver.name} запущен за {time.monotonic() - started_at:.1f} с")
+        return driver
+
+    async def _discard(self, driver: AsyncWebDriver, reason: str) -> None:
+        """Закрывает браузер, выведенный из пула."""
+        self._baseline_memory.pop(driver.name, None)
+        self._stats["recycled"] += 1
+        logger.info(f"Браузер {driver.name} выведен из пула: {reason}")
+        try:
+            await driver.quit()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии браузера {driver.name}: {e}")
+
+    async def _is_healthy(self, driver: AsyncWebDriver) -> bool:
+        """Проверяет, что браузер отвечает на команды."""
+        if not driver.healthy or not driver.started:
+            return False
+        try:
+            return await driver.execute_script("return 1;", timeout=HEALTH_CHECK_TIMEOUT) == 1
+        except Exception as e:
+            logger.warning(f"Браузер {driver.name} не прошел проверку: {e}")
+            return False
+
+    async def _recycle_reason(self, driver: AsyncWebDriver) -> Optional[str]:
+        """
+        Определяет, нужно ли перезапустить браузер после использования.
+
+        Returns:
+            Причина перезапуска или None, если браузер можно вернуть в пул
+        """
+        if not driver.healthy:
+            return "команда не завершилась вовремя"
+        if driver.navigations >= self.max_navigations:
+            return f"выполнено {driver.navigations} переходов"
+        try:
+            memory = await driver.call(_memory_usage_mb, timeout=HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            return f"не удалось проверить память: {e}"
+        growth = memory - self._baseline_memory.get(driver.name, memory)
+        if growth > self.max_memory_growth_mb:
+            return f"память выросла на {growth:.0f} МБ"
+        return None
+
+    async def _release(self, driver: AsyncWebDriver) -> None:
+        """Возвращает браузер в пул или перезапускает его."""
+        try:
+            reason = await self._recycle_reason(driver)
+            if reason is None:
+                try:
+                    await driver.call(_reset_page, timeout=RESET_TIMEOUT)
+                except Exception as e:
+                    reason = f"не удалось очистить страницу: {e}"
+            if reason is None and not self._closed:
+                self._idle.append(driver)
+            else:
+                await self._discard(driver, reason or "пул закрыт")
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    async def start(self) -> None:
+        """Прогревает пул: запускает браузеры до полного размера."""
+        async def _warm_one() -> None:
+            await self._slots.acquire()
+            try:
+                if len(self._idle) + self._in_use < self.size and not self._closed:
+                    self._idle.append(await self._launch())
+            finally:
+                self._slots.release()
+
+        results = await asyncio.gather(*(_warm_one() for _ in range(self.size)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.error(f"Не удалось запустить {len(errors)} из {self.size} браузеров пула {self.name}: {errors[0]}")
+        else:
+            logger.info(f"Пул {self.name} прогрет: {len(self._idle)} браузеров")
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[AsyncWebDriver]:
+        """
+        Выдает браузер из пула на время блока with.
+
+        Если все браузеры заняты, запрос ждет в очереди не дольше acquire_timeout.
+
+        Yields:
+            AsyncWebDriver с чистой страницей
+        """
+        if self._closed:
+            raise RuntimeError(f"Пул браузеров {self.name} закрыт")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise BrowserPoolTimeoutError(
+                f"Нет свободного браузера в пуле {self.name} за {self.acquire_timeout:.0f} с"
+            )
+        finally:
+            self._waiting -= 1
+        self._in_use += 1
+
+        driver = None
+        try:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if await self._is_healthy(candidate):
+                    driver = candidate
+                    break
+                self._stats["failed_health_checks"] += 1
+                await self._discard(candidate, "не прошел проверку здоровья")
+            if driver is None:
+                driver = await self._launch()
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+        self._stats["acquired"] += 1
+        try:
+            yield driver
+        finally:
+            # Возврат в пул не должен прерываться отменой задачи, которая держала браузер
+            await asyncio.shield(self._release(driver))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние пула.
+
+        Returns:
+            Словарь с размером пула, числом свободных/занятых браузеров и счетчиками
+        """
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            **self._stats,
+        }
+
+    async def close(self) -> None:
+        """Закрывает все свободные браузеры; занятые закроются при возврате."""
+        self._closed = True
+        while self._idle:
+            await self._discard(self._idle.popleft(), "пул закрыт")
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Автоматические выключатели (circuit breakers) для внешних хостов.
+
+Для каждого хоста (search.wb.ru, card.wb.ru, basket-XX.wbbasket.ru, pinterest.com и т.д.)
+ведется скользящее окно результатов запросов. Когда доля ошибок в окне превышает
+порог, выключатель размыкается и запросы к хосту сразу завершаются ошибкой
+CircuitOpenError вместо ожидания полного тайм-аута. По истечении времени
+восстановления выключатель переходит в полуоткрытое состояние и пропускает
+несколько пробных запросов: при их успехе он замыкается, при ошибке — снова размыкается.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+    _TRANSPORT_ERRORS: Tuple[type, ...] = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, OSError)
+except ImportError:
+    _TRANSPORT_ERRORS = (asyncio.TimeoutError, ConnectionError, OSError)
+
+# Состояния выключателя
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Значения по умолчанию (можно переопределить переменными окружения)
+DEFAULT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+DEFAULT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+DEFAULT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", "10"))
+DEFAULT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+DEFAULT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+
+
+class CircuitOpenError(Exception):
+    """Исключение, возникающее при обращении к хосту с разомкнутым выключателем."""
+
+    def __init__(self, host: str, retry_after: float = 0.0):
+        """
+        Args:
+            host: Имя хоста
+            retry_after: Через сколько секунд выключатель перейдет в полуоткрытое состояние
+        """
+        super().__init__(f"Хост {host} временно недоступен (circuit breaker разомкнут), повтор через {retry_after:.0f} с")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def is_failure_status(status: int) -> bool:
+    """
+    Определяет, считается ли HTTP-статус сбоем хоста.
+
+    Ошибки 5xx и 429 говорят о деградации хоста; остальные статусы (в том числе 404,
+    который нормален при подборе корзины изображений Wildberries) — нет.
+
+    Args:
+        status: HTTP-статус ответа
+
+    Returns:
+        True, если статус считается сбоем
+    """
+    return status >= 500 or status == 429
+
+
+def host_from_url(url: str) -> str:
+    """
+    Извлекает имя хоста из URL.
+
+    Args:
+        url: URL запроса
+
+    Returns:
+        Имя хоста в нижнем регистре (или сам аргумент, если это не URL)
+    """
+    host = urlparse(url).hostname if "://" in url else url
+    return (host or url).lower()
+
+
+class _CallOutcome:
+    """Результат одного запроса, отмечаемый внутри CircuitBreaker.protect()."""
+
+    def __init__(self):
+        self.failed: Optional[bool] = None
+
+    def status(self, status: int) -> None:
+        """Отмечает результат по HTTP-статусу ответа."""
+        self.failed = is_failure_status(status)
+
+    def fail(self) -> None:
+        """Отмечает запрос как неудачный."""
+        self.failed = True
+
+
+class CircuitBreaker:
+    """
+    Выключатель для одного хоста со скользящим окном ошибок.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        failure_rate: float = DEFAULT_FAILURE_RATE,
+        min_requests: int = DEFAULT_MIN_REQUESTS,
+        recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT,
+        half_open_probes: int = DEFAULT_HALF_OPEN_PROBES
+    ):
+        """
+        Инициализация выключателя.
+
+        Args:
+            host: Имя хоста
+            window_seconds: Длина скользящего окна (в секундах)
+            failure_rate: Доля ошибок в окне, при которой выключатель размыкается
+            min_requests: Минимальное количество запросов в окне для принятия решения
+            recovery_timeout: Время в разомкнутом состоянии до пробных запросов (в секундах)
+            half_open_probes: Количество успешных пробных запросов для замыкания
+        """
+        self.host = host
+        self.window_seconds = window_seconds
+        self.failure_rate = failure_rate
+        self.min_requests = max(1, min_requests)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        # Скользящее окно: (время, успех)
+        self._window: Deque[Tuple[float, bool]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats = {"rejected": 0, "opened": 0}
+
+    def _trim(self, now: float) -> None:
+        """Удаляет из окна результаты старше window_seconds."""
+        while self._window and now - self._window[0][0] > self.window_seconds:
+            self._window.popleft()
+
+    def _open(self, now: float) -> None:
+        """Размыкает выключатель."""
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats["opened"] += 1
+        logger.warning(f"Circuit breaker для {self.host} разомкнут")
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние с учетом истечения времени восстановления."""
+        with self._lock:
+            if self._state == STATE_OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+                self._state = STATE_HALF_OPEN
+                logger.info(f"Circuit breaker для {self.host} переведен в полуоткрытое состояние")
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Проверяет, можно ли выполнить запрос, и резервирует пробный слот в полуоткрытом состоянии.
+
+        Returns:
+            True, если запрос разрешен
+        """
+        state = self.state
+        with self._lock:
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def check(self) -> None:
+        """
+        Проверяет, можно ли выполнить запрос.
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут
+        """
+        if not self.allow_request():
+            retry_after = max(0.0, self.recovery_timeout - (time.time() - self._opened_at))
+            raise CircuitOpenError(self.host, retry_after)
+
+    def record_success(self) -> None:
+        """Учитывает успешный запрос."""
+        now = time.time()
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    logger.info(f"Circuit breaker для {self.host} замкнут")
+                return
+            self._window.append((now, True))
+            self._trim(now)
+
+    def record_failure(self) -> None:
+        """Учитывает неудачный запрос."""
+        now = time.time()
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._open(now)
+                return
+            if self._state == STATE_OPEN:
+                return
+            self._window.append((now, False))
+            self._trim(now)
+            if len(self._window) >= self.min_requests:
+                failures = sum(1 for _, ok in self._window if not ok)
+                if failures / len(self._window) >= self.failure_rate:
+                    self._open(now)
+
+    def _release(self) -> None:
+        """Освобождает пробный слот запроса без учета результата."""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_status(self, status: int) -> None:
+        """
+        Учитывает запрос по HTTP-статусу ответа.
+
+        Args:
+            status: HTTP-статус ответа
+        """
+        if is_failure_status(status):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    @contextmanager
+    def protect(self) -> Iterator[_CallOutcome]:
+        """
+        Контекстный менеджер для защиты запроса к хосту.
+
+        Транспортные ошибки (соединение, тайм-аут) учитываются как сбой автоматически;
+        HTTP-статус отмечается вызовом outcome.status(response.status).
+
+        Yields:
+            Объект для отметки результата запроса
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут
+        """
+        self.check()
+        outcome = _CallOutcome()
+        try:
+            yield outcome
+        except _TRANSPORT_ERRORS:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Прочие ошибки (в том числе отмена) не говорят о состоянии хоста
+            if outcome.failed is None:
+                self._release()
+            elif outcome.failed:
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        else:
+            if outcome.failed:
+                self.record_failure()
+            else:
+                self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние выключателя для мониторинга.
+
+        Returns:
+            Словарь с состоянием, количеством запросов и ошибок в окне
+        """
+        state = self.state
+        with self._lock:
+            self._trim(time.time())
+            failures = sum(1 for _, ok in self._window if not ok)
+            total = len(self._window)
+            return {
+                "state": state,
+                "requests": total,
+                "failures": failures,
+                "failure_rate": round(failures / total, 3) if total else 0.0,
+                "retry_after": round(max(0.0, self.recovery_timeout - (time.time() - self._opened_at)), 1) if state == STATE_OPEN else 0.0,
+                **self._stats
+            }
+
+
+# Выключатели по хостам для всего приложения
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(url_or_host: str) -> CircuitBreaker:
+    """
+    Возвращает общий для приложения выключатель хоста.
+
+    Args:
+        url_or_host: URL запроса или имя хоста
+
+    Returns:
+        Экземпляр CircuitBreaker
+    """
+    host = host_from_url(url_or_host)
+    with _registry_lock:
+        breaker = _circuit_breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _circuit_breakers[host] = breaker
+        return breaker
+
+
+def get_circuit_breakers_state() -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает состояние всех выключателей (для эндпоинта /health).
+
+    Returns:
+        Словарь хост -> состояние выключателя
+    """
+    with _registry_lock:
+        breakers = list(_circuit_breakers.values())
+    return {breaker.host: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Конкурентный исполнитель поисковых запросов с ограничением нагрузки на хост.
+
+Позволяет одновременно выполнять поиск по нескольким предметам одежды
+(например, на Wildberries), ограничивая количество одновременных запросов
+к одному хосту, с тайм-аутом на каждый предмет и уведомлением о завершении
+каждого предмета (для обновления прогресса задачи).
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Хост поиска Wildberries, используемый как ключ ограничения
+WB_SEARCH_HOST = "search.wb.ru"
+
+# Значения по умолчанию (можно переопределить переменными окружения)
+DEFAULT_MAX_CONCURRENCY_PER_HOST = int(os.getenv("FANOUT_MAX_CONCURRENCY_PER_HOST", "4"))
+DEFAULT_ITEM_TIMEOUT = float(os.getenv("FANOUT_ITEM_TIMEOUT", "20"))
+
+
+class FanOutExecutor:
+    """
+    Исполнитель конкурентных запросов с ограничением одновременных запросов на хост.
+    """
+
+    def __init__(self, max_concurrency_per_host: int = DEFAULT_MAX_CONCURRENCY_PER_HOST,
+                 item_timeout: float = DEFAULT_ITEM_TIMEOUT):
+        """
+        Инициализация исполнителя.
+
+        Args:
+            max_concurrency_per_host: Максимальное количество одновременных запросов к одному хосту
+            item_timeout: Тайм-аут на обработку одного предмета (в секундах)
+        """
+        self.max_concurrency_per_host = max(1, max_concurrency_per_host)
+        self.item_timeout = item_timeout
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_semaphore(self, host: str) -> asyncio.Semaphore:
+        """
+        Возвращает семафор для указанного хоста, создавая его при необходимости.
+
+        Args:
+            host: Имя хоста
+
+        Returns:
+            Семафор хоста
+        """
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+    def host_semaphore(self, host: str = WB_SEARCH_HOST) -> asyncio.Semaphore:
+        """
+        Возвращает общий семафор хоста для запросов, выполняемых не через run
+        (например, стадией конвейера), чтобы они учитывались в том же ограничении.
+
+        Args:
+            host: Имя хоста
+
+        Returns:
+            Семафор хоста
+        """
+        return self._get_semaphore(host)
+
+    async def run(
+        self,
+        items: Sequence[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        host: str = WB_SEARCH_HOST,
+        item_timeout: Optional[float] = None,
+        on_item_done: Optional[Callable[[int, Any, Dict[str, Any], int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполняет worker для каждого предмета конкурентно.
+
+        Тайм-аут или ошибка одного предмета не прерывает остальные: для него
+        возвращается результат с заполненным полем error, а задача получает
+        частичные результаты вместо ожидания самого медленного запроса.
+
+        Args:
+            items: Предметы для обработки
+            worker: Асинхронная функция, выполняющая поиск для одного предмета
+            host: Хост, к которому относится запрос (ключ ограничения)
+            item_timeout: Тайм-аут на предмет (по умолчанию — значение исполнителя)
+            on_item_done: Callback (индекс, предмет, результат, завершено, всего),
+                вызывается по мере завершения каждого предмета
+
+        Returns:
+            Список словарей {"index", "item", "result", "error", "timed_out"} в исходном порядке
+        """
+        total = len(items)
+        if total == 0:
+            return []
+
+        timeout = self.item_timeout if item_timeout is None else item_timeout
+        semaphore = self._get_semaphore(host)
+        results: List[Optional[Dict[str, Any]]] = [None] * total
+        completed = 0
+
+        async def run_one(index: int, item: Any) -> None:
+            nonlocal completed
+            outcome = {"index": index, "item": item, "result": None, "error": None, "timed_out": False}
+            try:
+                async with semaphore:
+                    outcome["result"] = await asyncio.wait_for(worker(item), timeout=timeout)
+            except asyncio.TimeoutError:
+                outcome["timed_out"] = True
+                outcome["error"] = f"Превышен тайм-аут {timeout} с"
+                logger.warning(f"Тайм-аут при обработке предмета {index + 1}/{total} (хост {host})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                outcome["error"] = str(e)
+                logger.error(f"Ошибка при обработке предмета {index + 1}/{total} (хост {host}): {str(e)}")
+
+            results[index] = outcome
+            completed += 1
+            if on_item_done:
+                try:
+                    on_item_done(index, item, outcome, completed, total)
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике завершения предмета: {str(e)}")
+
+        await asyncio.gather(*(run_one(index, item) for index, item in enumerate(items)))
+        return results
+
+
+# Общий исполнитель для всего приложения
+_fanout_executor: Optional[FanOutExecutor] = None
+
+
+def get_fanout_executor() -> FanOutExecutor:
+    """
+    Возвращает общий для приложения экземпляр FanOutExecutor.
+
+    Returns:
+        Экземпляр FanOutExecutor
+    """
+    global _fanout_executor
+    if _fanout_executor is None:
+        _fanout_executor = FanOutExecutor()
+    return _fanout_executor
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Запись и воспроизведение HTTP-ответов внешних сервисов (кассеты).
+
+Ответы Wildberries, OpenRouter и других сервисов постоянно меняются, из-за чего
+результаты бенчмарков «шумят». Слой кассет перехватывает запросы aiohttp.ClientSession
+и requests.Session всех клиентов приложения:
+- в режиме record реальные ответы сохраняются в кассету;
+- в режиме replay ответы отдаются из кассеты без сети — с исходной задержкой,
+  без задержки или с фиксированной синтетической задержкой;
+- в режиме once отсутствующие в кассете запросы выполняются и дописываются.
+
+Кассета — gzip-файл в формате JSON Lines: одна строка на взаимодействие
+(метод, URL, ключ запроса, статус, тип содержимого, тело, время ответа).
+Одинаковые тела хранятся один раз. Запросы сопоставляются по методу, URL
+с упорядоченными параметрами и хешу тела; повторы одного запроса
+воспроизводятся по очереди.
+
+Включение через окружение (до создания клиентов):
+    HTTP_CASSETTE=cassettes/search.jsonl.gz HTTP_CASSETTE_MODE=replay HTTP_CASSETTE_TIMING=none uvicorn api:app
+
+Микробенчмарк поиска по кассете:
+    python http_cassette.py bench --cassette cassettes/search.jsonl.gz --mode record --query "черное платье"
+    python http_cassette.py bench --cassette cassettes/search.jsonl.gz --mode replay --timing none --repeats 20
+"""
+
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+# Режимы работы
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE_ONCE = "once"
+MODES = (MODE_RECORD, MODE_REPLAY, MODE_ONCE)
+
+# Сохраняемые заголовки ответа (остальные не нужны клиентам и раздувают кассету)
+RECORDED_HEADERS = ("content-type", "content-encoding", "retry-after")
+
+
+class CassetteMissError(aiohttp.ClientConnectionError):
+    """Запрос не найден в кассете в режиме replay."""
+
+
+def request_key(method: str, url: str, params: Any = None, body: Any = None) -> str:
+    """
+    Вычисляет ключ сопоставления запроса.
+
+    Args:
+        method: HTTP-метод
+        url: URL запроса
+        params: Дополнительные параметры запроса (как в aiohttp/requests)
+        body: Тело запроса (JSON-совместимый объект, строка или байты)
+
+    Returns:
+        Строка вида "GET https://host/path?a=1&b=2 <хеш тела>"
+    """
+    parts = urlsplit(str(url))
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        query.extend((str(key), str(value)) for key, value in items)
+    normalized_url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(sorted(query)), ""))
+
+    if body is None:
+        body_hash = "-"
+    else:
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False, sort_keys=True)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if not isinstance(body, bytes):
+            # Формы с файлами и потоки не сравниваем по содержимому
+            body = type(body).__name__.encode("utf-8")
+        body_hash = hashlib.sha1(body).hexdigest()[:16]
+    return f"{method.upper()} {normalized_url} {body_hash}"
+
+
+class _ReplayContent:
+    """Имитация aiohttp.StreamReader поверх сохраненного тела ответа."""
+
+    def __init__(self, body: bytes):
+        self._body = body
+        self._position = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        if n < 0:
+            n = len(self._body) - self._position
+        chunk = self._body[self._position:self._position + n]
+        self._position += len(chunk)
+        return chunk
+
+    async def readany(self) -> bytes:
+        return await self.read()
+
+    async def readline(self) -> bytes:
+        end = self._body.find(b"\n", self._position)
+        end = len(self._body) if end < 0 else end + 1
+        line = self._body[self._position:end]
+        self._position = end
+        return line
+
+    async def iter_chunked(self, n: int):
+        while self._position < len(self._body):
+            yield await self.read(n)
+
+    async def iter_any(self):
+        if self._position < len(self._body):
+            yield await self.read()
+
+    def at_eof(self) -> bool:
+        return self._position >= len(self._body)
+
+    def __aiter__(self):
+        return self._iter_lines()
+
+    async def _iter_lines(self):
+        while not self.at_eof():
+            yield await self.readline()
+
+
+class ReplayResponse:
+    """
+    Ответ из кассеты с интерфейсом, достаточным для клиентов приложения (aiohttp.ClientResponse).
+    """
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.reason = "OK" if status < 400 else "Replayed error"
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self._body = body
+        self.content = _ReplayContent(body)
+        self.closed = False
+        self.request_info = aiohttp.RequestInfo(URL(url), method, CIMultiDictProxy(CIMultiDict()), URL(url))
+        self.history = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+
+    @property
+    def charset(self) -> Optional[str]:
+        content_type = self.headers.get("Content-Type", "")
+        if "charset=" in content_type:
+            return content_type.split("charset=")[-1].strip()
+        return None
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = "strict") -> str:
+        return self._body.decode(encoding or self.charset or "utf-8", errors)
+
+    async def json(self, *, encoding: Optional[str] = None, loads=json.loads, content_type: Optional[str] = "application/json") -> Any:
+        if content_type and content_type not in self.content_type:
+            raise aiohttp.ContentTypeError(
+                self.request_info, self.history, status=self.status,
+                message=f"Attempt to decode JSON with unexpected mimetype: {self.content_type}"
+            )
+        return loads(await self.text(encoding))
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise aiohttp.ClientResponseError(self.request_info, self.history, status=self.status, message=self.reason)
+
+    def release(self) -> None:
+        self.closed = True
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def wait_for_close(self) -> None:
+        return None
+
+    async def __aenter__(self) -> "ReplayResponse":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class HttpCassette:
+    """
+    Кассета HTTP-взаимодействий: хранение, поиск и воспроизведение ответов.
+    """
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY, timing: str = "original"):
+        """
+        Args:
+            path: Путь к файлу кассеты (.jsonl.gz)
+            mode: Режим работы (record, replay, once)
+            timing: Задержка при воспроизведении: "original" — как при записи, "none" — без задержки,
+                число — фиксированная задержка в миллисекундах
+        """
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+
+        # Ключ запроса -> очередь взаимодействий (повторы воспроизводятся по порядку)
+        self._interactions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._bodies: Dict[str, str] = {}
+        self._dirty = False
+        self._stats = {"replayed": 0, "recorded": 0, "misses": 0}
+
+        if mode != MODE_RECORD:
+            self._load()
+
+    def _load(self) -> None:
+        """Загружает кассету с диска."""
+        if not os.path.exists(self.path):
+            if self.mode == MODE_REPLAY:
+                logger.warning(f"Кассета {self.path} не найдена, все запросы будут промахами")
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "body":
+                    self._bodies[record["hash"]] = record["data"]
+                else:
+                    self._interactions[record["key"]].append(record)
+        total = sum(len(records) for records in self._interactions.values())
+        logger.info(f"Кассета {self.path} загружена: {total} взаимодействий, {len(self._bodies)} тел ответов")
+
+    def _decode_body(self, record: Dict[str, Any]) -> bytes:
+        """Восстанавливает тело ответа из записи."""
+        data = self._bodies.get(record["body"], "")
+        if record.get("encoding") == "base64":
+            return base64.b64decode(data)
+        return data.encode("utf-8")
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Находит очередное взаимодействие для ключа (повторы — по кругу).
+
+        Args:
+            key: Ключ запроса
+
+        Returns:
+            Запись взаимодействия или None
+        """
+        with self._lock:
+            records = self._interactions.get(key)
+            if not records:
+                self._stats["misses"] += 1
+                return None
+            record = records[self._cursors[key] % len(records)]
+            self._cursors[key] += 1
+            self._stats["replayed"] += 1
+            return record
+
+    def delay_for(self, record: Dict[str, Any]) -> float:
+        """
+        Возвращает задержку воспроизведения в секундах.
+
+        Args:
+            record: Запись взаимодействия
+
+        Returns:
+            Задержка в секундах
+        """
+        if self.timing == "none":
+            return 0.0
+        if self.timing == "original":
+            return float(record.get("elapsed", 0.0))
+        try:
+            return float(self.timing) / 1000
+        except ValueError:
+            return 0.0
+
+    def build_response(self, record: Dict[str, Any]) -> ReplayResponse:
+        """Создает ответ из записи взаимодействия."""
+        return ReplayResponse(record["method"], record["url"], record["status"], record.get("headers", {}),
+                              self._decode_body(record))
+
+    def add(self, key: str, method: str, url: str, status: int, headers: Dict[str, str], body: bytes,
+            elapsed: float) -> None:
+        """
+        Добавляет взаимодействие в кассету.
+
+        Args:
+            key: Ключ запроса
+            method: HTTP-метод
+            url: URL запроса
+            status: HTTP-статус ответа
+            headers: Заголовки ответа
+            body: Тело ответа
+            elapsed: Время ответа в секундах
+        """
+        try:
+            data, encoding = body.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            data, encoding = base64.b64encode(body).decode("ascii"), "base64"
+        body_hash = hashlib.sha1(body).hexdigest()
+
+        record = {
+            "key": key,
+            "method": method.upper(),
+            "url": url,
+            "status": status,
+            "headers": {name: value for name, value in headers.items() if name.lower() in RECORDED_HEADERS},
+            "body": body_hash,
+            "encoding": encoding,
+            "elapsed": round(elapsed, 4)
+        }
+        with self._lock:
+            self._bodies.setdefault(body_hash, data)
+            self._interactions[key].append(record)
+            self._dirty = True
+            self._stats["recorded"] += 1
+
+    def save(self) -> None:
+        """Сохраняет кассету на диск (атомарной заменой файла)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for body_hash, data in self._bodies.items():
+                    f.write(json.dumps({"type": "body", "hash": body_hash, "data": data}, ensure_ascii=False) + "\n")
+                for records in self._interactions.values():
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        logger.info(f"Кассета сохранена: {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику воспроизведения и записи."""
+        return {
+            **self._stats,
+            "interactions": sum(len(records) for records in self._interactions.values()),
+            "mode": self.mode,
+            "timing": self.timing
+        }
+
+
+# Установленная кассета и исходные методы HTTP-клиентов
+_active_cassette: Optional[HttpCassette] = None
+_original_aiohttp_request = None
+_original_requests_request = None
+
+
+def _aiohttp_body(kwargs: Dict[str, Any]) -> Any:
+    """Извлекает тело запроса из аргументов aiohttp."""
+    if kwargs.get("json") is not None:
+        return kwargs["json"]
+    return kwargs.get("data")
+
+
+def install_http_cassette(cassette: Optional[HttpCassette] = None) -> Optional[HttpCassette]:
+    """
+    Подключает кассету к aiohttp.ClientSession и requests.Session.
+
+    Без аргумента кассета создается по переменным окружения HTTP_CASSETTE,
+    HTTP_CASSETTE_MODE (по умолчанию replay) и HTTP_CASSETTE_TIMING (по умолчанию original).
+    Вызывать после install_upstream_override(), чтобы ключи строились по исходным URL.
+
+    Args:
+        cassette: Кассета (если None — из окружения)
+
+    Returns:
+        Подключенная кассета или None, если кассета не настроена
+    """
+    global _active_cassette, _original_aiohttp_request, _original_requests_request
+
+    if cassette is None:
+        path = os.getenv("HTTP_CASSETTE", "").strip()
+        if not path:
+            return None
+        cassette = HttpCassette(
+            path,
+            mode=os.getenv("HTTP_CASSETTE_MODE", MODE_REPLAY).strip().lower(),
+            timing=os.getenv("HTTP_CASSETTE_TIMING", "original").strip().lower()
+        )
+
+    _active_cassette = cassette
+    if _original_aiohttp_request is not None:
+        return cassette
+
+    _original_aiohttp_request = aiohttp.ClientSession._request
+
+    async def _request(self, method, str_or_url, *args, **kwargs):
+        active = _active_cassette
+        if active is None:
+            return await _original_aiohttp_request(self, method, str_or_url, *args, **kwargs)
+
+        url = str(str_or_url)
+        key = request_key(method, url, kwargs.get("params"), _aiohttp_body(kwargs))
+        if active.mode != MODE_RECORD:
+            record = active.find(key)
+            if record is not None:
+                await asyncio.sleep(active.delay_for(record))
+                return active.build_response(record)
+            if active.mode == MODE_REPLAY:
+                raise CassetteMissError(f"Запрос отсутствует в кассете: {key}")
+
+        started = time.perf_counter()
+        response = await _original_aiohttp_request(self, method, str_or_url, *args, **kwargs)
+        try:
+            body = await response.read()
+        finally:
+            response.release()
+        active.add(key, method, url, response.status, dict(response.headers), body, time.perf_counter() - started)
+        # Поток исходного ответа уже прочитан: вызывающий код получает ответ из прочитанного тела,
+        # как в режиме replay (response.content, iter_chunked и т.п. работают одинаково).
+        # Потоковые ответы (SSE) при записи буферизуются целиком, elapsed - время до конца тела
+        return ReplayResponse(method.upper(), url, response.status, response.headers, body)
+
+    aiohttp.ClientSession._request = _request
+
+    try:
+        import requests
+
+        _original_requests_request = requests.Session.request
+
+        def request(self, method, url, *args, **kwargs):
+            active = _active_cassette
+            if active is None:
+                return _original_requests_request(self, method, url, *args, **kwargs)
+
+            body = kwargs.get("json") if kwargs.get("json") is not None else kwargs.get("data")
+            key = request_key(method, str(url), kwargs.get("params"), body)
+            if active.mode != MODE_RECORD:
+                record = active.find(key)
+                if record is not None:
+                    time.sleep(active.delay_for(record))
+                    response = requests.Response()
+                    response.status_code = record["status"]
+                    response.headers.update(record.get("headers", {}))
+                    response._content = active._decode_body(record)
+                    response.url = record["url"]
+                    response.encoding = "utf-8"
+                    return response
+                if active.mode == MODE_REPLAY:
+                    raise requests.exceptions.ConnectionError(f"Запрос отсутствует в кассете: {key}")
+
+            started = time.perf_counter()
+            response = _original_requests_request(self, method, url, *args, **kwargs)
+            active.add(key, method, str(url), response.status_code, dict(response.headers), response.content,
+                       time.perf_counter() - started)
+            return response
+
+        requests.Session.request = request
+    except ImportError:
+        pass
+
+    logger.warning(f"HTTP-кассета подключена: {cassette.path} (режим {cassette.mode}, задержка {cassette.timing})")
+    return cassette
+
+
+def get_active_cassette() -> Optional[HttpCassette]:
+    """Возвращает подключенную кассету (или None)."""
+    return _active_cassette
+
+
+def save_active_cassette() -> None:
+    """Сохраняет подключенную кассету, если в ней есть новые записи."""
+    if _active_cassette is not None and _active_cassette.mode != MODE_REPLAY:
+        _active_cassette.save()
+
+
+async def _bench_search(queries: List[str], limit: int, repeats: int) -> Dict[str, Any]:
+    """
+    Микробенчмарк поиска Wildberries (поиск + детальная информация + нормализация).
+
+    Args:
+        queries: Поисковые запросы
+        limit: Количество товаров на запрос
+        repeats: Количество повторов
+
+    Returns:
+        Сводка с перцентилями длительности (в мс)
+    """
+    from wildberries_async import WildberriesAsyncAPI
+    from load_test import percentile
+
+    durations: List[float] = []
+    errors = 0
+    client = WildberriesAsyncAPI(cache_enabled=False)
+    try:
+        for _ in range(repeats):
+            for query in queries:
+                started = time.perf_counter()
+                try:
+                    await client.search_products_async(query, limit=limit)
+                    durations.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors += 1
+                    logger.error(f"Ошибка бенчмарка для запроса '{query}': {e}")
+    finally:
+        await client.close()
+
+    durations.sort()
+    return {
+        "runs": len(durations) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(durations, 50) * 1000, 2),
+        "p95_ms": round(percentile(durations, 95) * 1000, 2),
+        "max_ms": round(durations[-1] * 1000, 2) if durations else 0.0
+    }
+
+
+def main():
+    """Точка входа: просмотр кассеты и микробенчмарк поиска."""
+    parser = argparse.ArgumentParser(description="Запись и воспроизведение HTTP-ответов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info_parser = subparsers.add_parser("info", help="Показать содержимое кассеты")
+    info_parser.add_argument("--cassette", required=True, help="Путь к кассете")
+
+    bench_parser = subparsers.add_parser("bench", help="Микробенчмарк поиска Wildberries по кассете")
+    bench_parser.add_argument("--cassette", required=True, help="Путь к кассете")
+    bench_parser.add_argument("--mode", choices=MODES, default=MODE_REPLAY, help="Режим кассеты")
+    bench_parser.add_argument("--timing", default="none", help="Задержка: original, none или миллисекунды")
+    bench_parser.add_argument("--query", action="append", help="Поисковый запрос (можно несколько)")
+    bench_parser.add_argument("--limit", type=int, default=10, help="Количество товаров на запрос")
+    bench_parser.add_argument("--repeats", type=int, default=10, help="Количество повторов")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "info":
+        cassette = HttpCassette(args.cassette, mode=MODE_REPLAY)
+        for key, records in sorted(cassette._interactions.items()):
+            statuses = ",".join(str(record["status"]) for record in records)
+            print(f"{len(records):>4}  [{statuses}]  {key}")
+        print(json.dumps(cassette.stats(), ensure_ascii=False))
+        return
+
+    cassette = install_http_cassette(HttpCassette(args.cassette, mode=args.mode, timing=args.timing))
+    queries = args.query or ["черное платье"]
+    # При записи достаточно одного прохода
+    repeats = 1 if args.mode == MODE_RECORD else args.repeats
+    summary = asyncio.run(_bench_search(queries, args.limit, repeats))
+    save_active_cassette()
+    print(json.dumps({**summary, "cassette": cassette.stats()}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
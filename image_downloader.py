@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общий загрузчик изображений для клиентов Pinterest и Wildberries.
+
+Особенности:
+- ограниченное количество одновременных загрузок;
+- хранение по содержимому (имя файла — SHA-256 содержимого), одинаковые
+  изображения с разных URL хранятся один раз;
+- проверка загруженных данных (код ответа, сигнатура формата, ненулевой размер) —
+  пустые и битые файлы не сохраняются;
+- негативный кеш неудачных загрузок с истечением срока;
+- ограничение объема директории (LRU-вытеснение: порядок обращений хранится в памяти,
+  а время изменения файлов сохраняет его между перезапусками);
+- потоковая запись на диск через aiofiles.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import aiofiles
+import aiohttp
+
+from circuit_breaker import CircuitOpenError, get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию (можно переопределить переменными окружения)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("IMAGE_DOWNLOAD_CONCURRENCY", "8"))
+DEFAULT_MAX_DISK_BYTES = int(os.getenv("IMAGE_DISK_BUDGET_BYTES", str(512 * 1024 * 1024)))
+DEFAULT_NEGATIVE_TTL = float(os.getenv("IMAGE_NEGATIVE_TTL", "600"))
+DEFAULT_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "15"))
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Имя файла индекса URL -> файл в директории хранения
+INDEX_FILE_NAME = ".image_index.json"
+INDEX_SAVE_INTERVAL = 5.0
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+}
+
+
+def detect_image_extension(head: bytes) -> Optional[str]:
+    """
+    Определяет формат изображения по сигнатуре первых байт.
+
+    Args:
+        head: Первые байты файла
+
+    Returns:
+        Расширение файла (с точкой) или None, если это не изображение
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis", b"heic", b"mif1"):
+        return ".avif"
+    return None
+
+
+class ImageDownloadError(Exception):
+    """Ошибка загрузки изображения (с HTTP-статусом, если он известен)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageDownloader:
+    """
+    Загрузчик изображений с хранением по содержимому и ограничением объема директории.
+    """
+
+    def __init__(
+        self,
+        storage_dir: str = "photo",
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+        timeout: float = DEFAULT_TIMEOUT
+    ):
+        """
+        Инициализация загрузчика.
+
+        Args:
+            storage_dir: Директория для хранения изображений
+            max_concurrency: Максимальное количество одновременных загрузок
+            max_disk_bytes: Максимальный объем директории в байтах
+            negative_ttl: Время, в течение которого неудачный URL не загружается повторно (в секундах)
+            timeout: Тайм-аут загрузки одного изображения (в секундах)
+        """
+        self.storage_dir = storage_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        os.makedirs(storage_dir, exist_ok=True)
+
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # URL -> имя файла в директории хранения
+        self._index: Dict[str, str] = {}
+        self._index_path = os.path.join(storage_dir, INDEX_FILE_NAME)
+        self._index_dirty = False
+        self._index_saved_at = 0.0
+
+        # Негативный кеш: URL -> время, до которого не пытаемся загружать
+        self._negative: Dict[str, float] = {}
+        # Загрузки, выполняющиеся в данный момент: URL -> future
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Сколько вызовов download ждет каждую из выполняющихся загрузок
+        self._waiters: Dict[str, int] = {}
+
+        # Учет объема директории: имя файла -> размер, от давно не использованных к недавним
+        self._file_sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        self._load_index()
+        self._scan_storage()
+
+    def _load_index(self) -> None:
+        """Загружает индекс URL -> файл."""
+        try:
+            if os.path.exists(self._index_path):
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+                logger.info(f"Загружен индекс изображений: {len(self._index)} записей")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке индекса изображений: {e}")
+            self._index = {}
+
+    def _save_index(self, force: bool = False) -> None:
+        """
+        Сохраняет индекс URL -> файл (не чаще чем раз в INDEX_SAVE_INTERVAL секунд).
+
+        Args:
+            force: Сохранить немедленно
+        """
+        if not self._index_dirty:
+            return
+        now = time.time()
+        if not force and now - self._index_saved_at < INDEX_SAVE_INTERVAL:
+            return
+        try:
+            tmp_path = f"{self._index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+            self._index_dirty = False
+            self._index_saved_at = now
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении индекса изображений: {e}")
+
+    def _scan_storage(self) -> None:
+        """Подсчитывает объем директории и удаляет пустые файлы, оставшиеся от прежних загрузок."""
+        removed = 0
+        files = []
+        for entry in os.scandir(self.storage_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(".download-"):
+                # Временный файл прерванной загрузки
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            if entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            if stat.st_size == 0:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        # Восстанавливаем порядок обращений по времени изменения (get_cached_path его обновляет)
+        for _, name, size in sorted(files):
+            self._file_sizes[name] = size
+            self._total_bytes += size
+
+        # Убираем из индекса записи, файлы которых отсутствуют
+        missing = [url for url, name in self._index.items() if name not in self._file_sizes]
+        for url in missing:
+            del self._index[url]
+        if missing:
+            self._index_dirty = True
+
+        if removed:
+            logger.info(f"Удалено {removed} пустых файлов из {self.storage_dir}")
+        self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        """Удаляет давно неиспользуемые файлы, пока объем директории превышает лимит."""
+        evicted = set()
+        while self._total_bytes > self.max_disk_bytes and self._file_sizes:
+            name, size = self._file_sizes.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.storage_dir, name))
+            except OSError:
+                pass
+            self._total_bytes -= size
+            evicted.add(name)
+
+        if evicted:
+            for url in [url for url, name in self._index.items() if name in evicted]:
+                del self._index[url]
+            self._index_dirty = True
+            logger.info(f"Из {self.storage_dir} вытеснено {len(evicted)} изображений (лимит {self.max_disk_bytes} байт)")
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Получение или создание HTTP-сессии.
+
+        Returns:
+            HTTP-сессия
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def get_cached_path(self, url: str) -> Optional[str]:
+        """
+        Возвращает путь к ранее загруженному изображению.
+
+        Args:
+            url: URL изображения
+
+        Returns:
+            Путь к файлу или None, если изображение не загружалось
+        """
+        name = self._index.get(url)
+        if not name or name not in self._file_sizes:
+            return None
+        path = os.path.join(self.storage_dir, name)
+        try:
+            # Время изменения сохраняет порядок обращений для следующего запуска
+            os.utime(path, None)
+        except OSError:
+            return None
+        self._file_sizes.move_to_end(name)
+        return path
+
+    def is_negative(self, url: str) -> bool:
+        """
+        Проверяет, находится ли URL в негативном кеше.
+
+        Args:
+            url: URL изображения
+
+        Returns:
+            True, если недавняя загрузка по этому URL завершилась ошибкой
+        """
+        expires_at = self._negative.get(url)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            del self._negative[url]
+            return False
+        return True
+
+    def forget_failure(self, url: str) -> None:
+        """
+        Удаляет URL из негативного кеша (например, перед повтором с другими заголовками).
+
+        Args:
+            url: URL изображения
+        """
+        self._negative.pop(url, None)
+
+    async def download(self, url: str, headers: Optional[Dict[str, str]] = None, raise_errors: bool = False) -> Optional[str]:
+        """
+        Загружает изображение (или возвращает ранее загруженное).
+
+        Args:
+            url: URL изображения
+            headers: HTTP-заголовки запроса
+            raise_errors: Пробрасывать ImageDownloadError вместо возврата None
+
+        Returns:
+            Путь к файлу или None при ошибке
+        """
+        if not url:
+            return None
+
+        cached_path = self.get_cached_path(url)
+        if cached_path:
+            return cached_path
+
+        if self.is_negative(url):
+            logger.debug(f"URL изображения в негативном кеше: {url}")
+            if raise_errors:
+                raise ImageDownloadError("URL находится в негативном кеше")
+            return None
+
+        # Объединяем одновременные загрузки одного URL
+        inflight = self._inflight.get(url)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._download(url, headers))
+            self._inflight[url] = inflight
+            inflight.add_done_callback(lambda future: self._on_download_done(url, future))
+
+        self._waiters[url] = self._waiters.get(url, 0) + 1
+        try:
+            return await asyncio.shield(inflight)
+        except ImageDownloadError:
+            if raise_errors:
+                raise
+            return None
+        finally:
+            self._waiters[url] -= 1
+            if not self._waiters[url]:
+                del self._waiters[url]
+
+    def _on_download_done(self, url: str, future: asyncio.Future) -> None:
+        """
+        Убирает завершенную загрузку из списка выполняющихся.
+
+        Args:
+            url: URL изображения
+            future: Завершенная загрузка
+        """
+        self._inflight.pop(url, None)
+        # Помечаем исключение как обработанное, даже если ожидающих не осталось
+        if not future.cancelled():
+            future.exception()
+
+    async def _download(self, url: str, headers: Optional[Dict[str, str]]) -> str:
+        """
+        Выполняет загрузку с потоковой записью во временный файл и проверкой содержимого.
+
+        Args:
+            url: URL изображения
+            headers: HTTP-заголовки запроса
+
+        Returns:
+            Путь к сохраненному файлу
+
+        Raises:
+            ImageDownloadError: При ошибке загрузки или некорректном содержимом
+        """
+        tmp_path = os.path.join(self.storage_dir, f".download-{uuid.uuid4().hex}.tmp")
+        async with self._semaphore:
+            try:
+                session = await self._get_session()
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                with get_circuit_breaker(url).protect() as outcome:
+                    async with session.get(url, headers=headers or DEFAULT_HEADERS, timeout=timeout) as response:
+                        outcome.status(response.status)
+                        if response.status != 200:
+                            raise ImageDownloadError(f"HTTP {response.status}", status=response.status)
+
+                        digest = hashlib.sha256()
+                        size = 0
+                        head = b""
+                        async with aiofiles.open(tmp_path, "wb") as f:
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                if len(head) < 16:
+                                    head += chunk[:16 - len(head)]
+                                size += len(chunk)
+                                if size > MAX_IMAGE_BYTES:
+                                    raise ImageDownloadError(f"Изображение больше {MAX_IMAGE_BYTES} байт")
+                                digest.update(chunk)
+                                await f.write(chunk)
+
+                if size == 0:
+                    raise ImageDownloadError("Пустой ответ")
+                extension = detect_image_extension(head)
+                if extension is None:
+                    raise ImageDownloadError("Содержимое не является изображением")
+
+                name = f"{digest.hexdigest()}{extension}"
+                path = os.path.join(self.storage_dir, name)
+                if name in self._file_sizes:
+                    # Такое изображение уже есть — удаляем временный файл
+                    os.remove(tmp_path)
+                    os.utime(path, None)
+                    self._file_sizes.move_to_end(name)
+                else:
+                    os.replace(tmp_path, path)
+                    self._file_sizes[name] = size
+                    self._total_bytes += size
+
+                self._index[url] = name
+                self._index_dirty = True
+                self._negative.pop(url, None)
+                self._enforce_budget()
+                self._save_index()
+
+                logger.info(f"Изображение сохранено: {path}")
+                return path
+            except asyncio.CancelledError:
+                # Загрузку отменили (например, выиграл другой вариант URL) — только убираем временный файл
+                if os.path.exists(tmp_path):
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                raise
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                # Разомкнутый выключатель хоста — временное состояние, не запоминаем URL как неудачный
+                if not isinstance(e, CircuitOpenError):
+                    self._negative[url] = time.time() + self.negative_ttl
+                if isinstance(e, asyncio.TimeoutError):
+                    e = ImageDownloadError(f"Превышено время ожидания ({self.timeout} с)")
+                elif not isinstance(e, ImageDownloadError):
+                    e = ImageDownloadError(str(e))
+                logger.warning(f"Не удалось загрузить изображение {url}: {e}")
+                raise e
+
+    async def download_many(self, urls: List[str], headers: Optional[Dict[str, str]] = None) -> List[Optional[str]]:
+        """
+        Загружает несколько изображений одновременно.
+
+        Args:
+            urls: Список URL изображений
+            headers: HTTP-заголовки запроса
+
+        Returns:
+            Список путей к файлам (None для неудачных загрузок) в исходном порядке
+        """
+        return list(await asyncio.gather(*(self.download(url, headers) for url in urls)))
+
+    async def download_first(self, urls: List[str], headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """
+        Загружает первый доступный из нескольких вариантов одного изображения.
+
+        Варианты загружаются параллельно; как только один из них сохранен,
+        остальные загрузки, которые больше никто не ждет, отменяются.
+
+        Args:
+            urls: URL вариантов изображения (например, разных размеров)
+            headers: HTTP-заголовки запроса
+
+        Returns:
+            Путь к файлу первого успешно загруженного варианта или None
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        for url in urls:
+            cached_path = self.get_cached_path(url)
+            if cached_path:
+                return cached_path
+
+        started_here = [url for url in urls if url not in self._inflight]
+        waiters = [asyncio.ensure_future(self.download(url, headers)) for url in urls]
+        try:
+            for future in asyncio.as_completed(waiters):
+                path = await future
+                if path:
+                    return path
+            return None
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            # Отменяем загрузки проигравших вариантов, если их не ждут другие запросы
+            for url in started_here:
+                inflight = self._inflight.get(url)
+                if inflight is not None and not inflight.done() and not self._waiters.get(url):
+                    inflight.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику загрузчика.
+
+        Returns:
+            Словарь с количеством файлов, объемом директории и размером негативного кеша
+        """
+        return {
+            "files": len(self._file_sizes),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_disk_bytes,
+            "indexed_urls": len(self._index),
+            "negative_urls": len(self._negative),
+            "inflight": len(self._inflight)
+        }
+
+    async def close(self) -> None:
+        """Сохраняет индекс и закрывает HTTP-сессию."""
+        self._save_index(force=True)
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Загрузчики, общие для всего приложения (по директории хранения)
+_downloaders: Dict[str, ImageDownloader] = {}
+
+
+def get_image_downloader(storage_dir: str = "photo") -> ImageDownloader:
+    """
+    Возвращает общий для приложения загрузчик для указанной директории.
+
+    Args:
+        storage_dir: Директория для хранения изображений
+
+    Returns:
+        Экземпляр ImageDownloader
+    """
+    key = os.path.abspath(str(storage_dir))
+    downloader = _downloaders.get(key)
+    if downloader is None:
+        downloader = ImageDownloader(str(storage_dir))
+        _downloaders[key] = downloader
+    return downloader
+
+
+async def close_image_downloaders() -> None:
+    """Закрывает все общие загрузчики изображений."""
+    for downloader in list(_downloaders.values()):
+        await downloader.close()
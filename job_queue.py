@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Очередь фоновых задач внутри процесса.
+
+Эндпоинты поиска раньше выполняли парсинг прямо в обработчике запроса, и клиент ждал
+весь поиск. Теперь обработчик ставит задачу в очередь и сразу возвращает task_id,
+а задачи выполняет фиксированный пул воркеров:
+
+    queue = get_job_queue()
+    await queue.start()
+    queue.submit(task_id, lambda: process_search(task_id, request),
+                 priority=PRIORITY_HIGH, deadline=120, on_abort=mark_task_aborted)
+    queue.cancel(task_id)   # DELETE /status/{task_id}
+
+Особенности:
+- меньшее значение priority выполняется раньше, при равном - в порядке постановки;
+- deadline отсчитывается от постановки в очередь: задача, не дождавшаяся воркера,
+  не запускается, а выполняющаяся отменяется по истечении срока;
+- отменить можно как ожидающую, так и выполняющуюся задачу;
+- длина очереди ограничена (JobQueueFullError), а stats() отдает глубину очереди,
+  время ожидания и выполнения для /health.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+DEFAULT_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+DEFAULT_DEADLINE = float(os.getenv("JOB_QUEUE_DEFAULT_DEADLINE", "300"))
+# Сколько последних задач учитывается в статистике времени ожидания и выполнения
+STATS_WINDOW = 500
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_EXPIRED = "expired"
+
+_FINAL_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED, JOB_EXPIRED)
+
+
+class JobQueueFullError(RuntimeError):
+    """Очередь задач заполнена."""
+
+
+class Job:
+    """Задача в очереди."""
+
+    __slots__ = (
+        "job_id", "factory", "priority", "sequence", "deadline", "on_abort", "state", "error",
+        "enqueued_at", "started_at", "finished_at", "_task",
+    )
+
+    def __init__(
+        self,
+        job_id: str,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int,
+        sequence: int,
+        deadline: Optional[float],
+        on_abort: Optional[Callable[["Job"], None]]
+    ):
+        self.job_id = job_id
+        self.factory = factory
+        self.priority = priority
+        self.sequence = sequence
+        self.deadline = deadline
+        self.on_abort = on_abort
+        self.state = JOB_QUEUED
+        self.error: Optional[str] = None
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        """Момент (time.monotonic), после которого задача считается просроченной."""
+        return None if self.deadline is None else self.enqueued_at + self.deadline
+
+    @property
+    def wait_time(self) -> float:
+        """Сколько задача ждала воркера (или ждет до сих пор), секунды."""
+        end = self.started_at or self.finished_at or time.monotonic()
+        return end - self.enqueued_at
+
+    def info(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние задачи.
+
+        Returns:
+            Словарь с состоянием, приоритетом и временем ожидания/выполнения
+        """
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "wait_seconds": round(self.wait_time, 3),
+            "run_seconds": round((self.finished_at or time.monotonic()) - self.started_at, 3)
+            if self.started_at is not None else None,
+            "error": self.error,
+        }
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Возвращает перцентиль отсортированного списка (None для пустого)."""
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+
+class JobQueue:
+    """Очередь задач с приоритетами, сроками выполнения и пулом воркеров."""
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        default_deadline: Optional[float] = DEFAULT_DEADLINE,
+        name: str = "jobs"
+    ):
+        """
+        Инициализация очереди.
+
+        Args:
+            workers: Количество воркеров (одновременно выполняемых задач)
+            max_depth: Максимальное количество ожидающих задач (0 - без ограничения)
+            default_deadline: Срок выполнения задачи по умолчанию в секундах (None - без срока)
+            name: Имя очереди для логов
+        """
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.default_deadline = default_deadline
+        self.name = name
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._workers: List[asyncio.Task] = []
+        self._depth = 0
+        self._running = 0
+        self._wait_times: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self._run_times: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self._stats = {
+            "submitted": 0, "rejected": 0, JOB_DONE: 0, JOB_FAILED: 0, JOB_CANCELLED: 0, JOB_EXPIRED: 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        """Запущены ли воркеры."""
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Запускает воркеры (в работающем event loop)."""
+        if self._workers:
+            return
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.create_task(self._worker(index), name=f"{self.name}-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"Очередь задач {self.name} запущена: {self.workers} воркеров")
+
+    def submit(
+        self,
+        job_id: str,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_NORMAL,
+        deadline: Optional[float] = None,
+        on_abort: Optional[Callable[[Job], None]] = None
+    ) -> Job:
+        """
+        Ставит задачу в очередь.
+
+        Args:
+            job_id: Идентификатор задачи (например, task_id API)
+            factory: Функция без аргументов, возвращающая корутину задачи
+            priority: Приоритет (меньше - раньше)
+            deadline: Срок выполнения в секундах от постановки (None - срок по умолчанию)
+            on_abort: Вызывается, если задача отменена, просрочена или упала с необработанной
+                ошибкой (job.state и job.error объясняют причину)
+
+        Returns:
+            Поставленная задача
+        """
+        if self.max_depth and self._depth >= self.max_depth:
+            self._stats["rejected"] += 1
+            raise JobQueueFullError(f"Очередь задач {self.name} заполнена ({self._depth} задач)")
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+
+        deadline = self.default_deadline if deadline is None else deadline
+        job = Job(job_id, factory, priority, next(self._sequence), deadline, on_abort)
+        self._jobs[job_id] = job
+        self._queue.put_nowait((priority, job.sequence, job))
+        self._depth += 1
+        self._stats["submitted"] += 1
+        logger.info(f"Задача {job_id} поставлена в очередь {self.name} (приоритет {priority}, в очереди {self._depth})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Возвращает задачу по идентификатору (если она еще известна очереди)."""
+        return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        Возвращает позицию ожидающей задачи в очереди.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Returns:
+            Число задач впереди (0 - следующая) или None, если задача не ожидает
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.state != JOB_QUEUED:
+            return None
+        key = (job.priority, job.sequence)
+        # В _jobs только ожидающие и выполняющиеся задачи, поэтому перебор короткий
+        return sum(
+            1 for other in self._jobs.values()
+            if other.state == JOB_QUEUED and (other.priority, other.sequence) < key
+        )
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Отменяет задачу.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Returns:
+            True, если задача была в очереди или выполнялась и теперь отменяется
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.state in _FINAL_STATES:
+            return False
+        if job.state == JOB_QUEUED:
+            # Из PriorityQueue элемент не удалить: воркер пропустит его, увидев состояние
+            self._finish(job, JOB_CANCELLED, "отменена")
+            self._depth -= 1
+        elif job._task is not None:
+            job._task.cancel()
+        logger.info(f"Задача {job_id} отменена")
+        return True
+
+    def _finish(self, job: Job, state: str, error: Optional[str] = None) -> None:
+        """Переводит задачу в конечное состояние и обновляет статистику."""
+        job.state = state
+        job.error = error
+        job.finished_at = time.monotonic()
+        self._stats[state] += 1
+        if job.started_at is not None:
+            self._run_times.append(job.finished_at - job.started_at)
+        # Фабрика держит ссылки на данные запроса; после завершения они не нужны
+        job.factory = None
+        if state != JOB_DONE and job.on_abort is not None:
+            try:
+                job.on_abort(job)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике отмены задачи {job.job_id}: {e}")
+        # Завершенные задачи не копятся: их состояние хранит реестр задач API
+        self._jobs.pop(job.job_id, None)
+
+    async def _worker(self, index: int) -> None:
+        """Цикл воркера: берет задачи по приоритету и выполняет их."""
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.state != JOB_QUEUED:
+                    # Отменена, пока ждала в очереди
+                    continue
+                self._depth -= 1
+                now = time.monotonic()
+                expires_at = job.expires_at
+                if expires_at is not None and now >= expires_at:
+                    self._wait_times.append(now - job.enqueued_at)
+                    logger.warning(f"Задача {job.job_id} просрочена в очереди ({now - job.enqueued_at:.1f} с)")
+                    self._finish(job, JOB_EXPIRED, "срок выполнения истек в очереди")
+                    continue
+                await self._run(job, expires_at)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, expires_at: Optional[float]) -> None:
+        """Выполняет задачу с учетом срока и отмены."""
+        job.state = JOB_RUNNING
+        job.started_at = time.monotonic()
+        self._wait_times.append(job.started_at - job.enqueued_at)
+        self._running += 1
+        job._task = asyncio.ensure_future(job.factory())
+        try:
+            timeout = None if expires_at is None else max(0.0, expires_at - job.started_at)
+            await asyncio.wait_for(asyncio.shield(job._task), timeout)
+        except asyncio.TimeoutError:
+            job._task.cancel()
+            await asyncio.gather(job._task, return_exceptions=True)
+            logger.warning(f"Задача {job.job_id} не уложилась в срок {job.deadline:g} с и отменена")
+            self._finish(job, JOB_EXPIRED, f"срок выполнения {job.deadline:g} с истек")
+        except asyncio.CancelledError:
+            if not job._task.done():
+                # Отменяется сам воркер (остановка очереди)
+                job._task.cancel()
+                await asyncio.gather(job._task, return_exceptions=True)
+                self._finish(job, JOB_CANCELLED, "очередь остановлена")
+                raise
+            self._finish(job, JOB_CANCELLED, "отменена")
+        except Exception as e:
+            logger.error(f"Задача {job.job_id} завершилась с ошибкой: {e}")
+            self._finish(job, JOB_FAILED, str(e))
+        else:
+            self._finish(job, JOB_DONE)
+        finally:
+            self._running -= 1
+            job._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние очереди.
+
+        Returns:
+            Словарь с глубиной очереди, числом занятых воркеров, счетчиками
+            и временем ожидания/выполнения последних задач
+        """
+        waits = sorted(self._wait_times)
+        runs = sorted(self._run_times)
+        now = time.monotonic()
+        oldest = max(
+            (now - job.enqueued_at for job in self._jobs.values() if job.state == JOB_QUEUED),
+            default=None
+        )
+        return {
+            "workers": self.workers,
+            "busy": self._running,
+            "depth": self._depth,
+            "max_depth": self.max_depth,
+            "oldest_wait_seconds": round(oldest, 3) if oldest is not None else None,
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 3) if waits else None,
+                "p50": _percentile(waits, 0.5),
+                "p95": _percentile(waits, 0.95),
+                "max": round(waits[-1], 3) if waits else None,
+            },
+            "run_seconds": {
+                "avg": round(sum(runs) / len(runs), 3) if runs else None,
+                "p95": _percentile(runs, 0.95),
+            },
+            **self._stats,
+        }
+
+    async def close(self) -> None:
+        """Останавливает воркеры; выполняющиеся задачи отменяются, ожидающие - тоже."""
+        for job in list(self._jobs.values()):
+            if job.state == JOB_QUEUED:
+                self._finish(job, JOB_CANCELLED, "очередь остановлена")
+                self._depth -= 1
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(f"Очередь задач {self.name} остановлена")
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Возвращает общий для приложения экземпляр JobQueue.
+
+    Returns:
+        Экземпляр JobQueue
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общий классификатор текста по словарям ключевых слов.
+
+Запасные анализаторы (стиль образа по запросу, категории мебели) раньше проверяли
+каждое ключевое слово отдельным `word in text`. Здесь словари один раз, при импорте
+модуля, компилируются в автоматы Ахо — Корасик, и текст размечается всеми метками
+за один проход.
+
+Ключевые слова нормализуются: нижний регистр, «ё» → «е» и отсечение типичных
+окончаний («офисный», «офисная», «офисные» → «офисн»). Поиск идет по подстроке,
+как и прежние проверки `in`, поэтому основа слова находит все его формы.
+Те же правила нормализации использует разбор ответов стилиста (outfit_parser.py),
+который сравнивает основы целых слов (WORD_STEM_LENGTH).
+
+    labels = OUTFIT_STYLE_CLASSIFIER.classify("Летний офисный образ")   # {"office", "summer"}
+    category = FURNITURE_CLASSIFIER.first_label("Диван угловой")      # "Диваны и кресла"
+"""
+
+import logging
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Окончания, отсекаемые при нормализации, сгруппированные по длине (сначала более длинные)
+_ENDINGS = {
+    "ого", "его", "ому", "ему", "ыми", "ими", "ами", "ями",
+    "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ые", "ие", "ую", "юю",
+    "ым", "им", "ом", "ем", "ых", "их", "ам", "ям", "ах", "ях",
+    "а", "я", "ы", "и", "у", "ю", "о", "е", "ь",
+}
+_ENDINGS_BY_LENGTH = [
+    (length, frozenset(ending for ending in _ENDINGS if len(ending) == length))
+    for length in sorted({len(ending) for ending in _ENDINGS}, reverse=True)
+]
+# Основа короче этого не используется: короткие слова («муж», «бра», «лето») остаются целиком
+MIN_STEM_LENGTH = 4
+# При сравнении целых слов, а не поиске подстрок, основа может быть короче:
+# у коротких слов («юбка», «кеды», «белый») окончание тоже отсекается
+WORD_STEM_LENGTH = 3
+
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализует текст для поиска ключевых слов.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Текст в нижнем регистре с заменой «ё» на «е»
+    """
+    return text.lower().replace("ё", "е")
+
+
+def stem_word(word: str, min_length: int = MIN_STEM_LENGTH) -> str:
+    """
+    Отсекает типичное окончание слова.
+
+    Args:
+        word: Нормализованное слово
+        min_length: Минимальная длина основы
+
+    Returns:
+        Основа слова или само слово, если основа получилась бы слишком короткой
+    """
+    for length, endings in _ENDINGS_BY_LENGTH:
+        if len(word) - length >= min_length and word[-length:] in endings:
+            return word[:-length]
+    return word
+
+
+def stem_phrase(phrase: str) -> str:
+    """
+    Нормализует ключевое слово или фразу (каждое слово отдельно).
+
+    Args:
+        phrase: Ключевое слово или фраза
+
+    Returns:
+        Фраза из основ слов
+    """
+    return " ".join(stem_word(word) for word in normalize_text(phrase).split())
+
+
+class KeywordMatch(NamedTuple):
+    """Найденное в тексте ключевое слово."""
+    label: str
+    keyword: str
+    start: int
+    end: int
+
+
+class AhoCorasick:
+    """Автомат Ахо — Корасик для поиска множества подстрок за один проход."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        """
+        Строит автомат.
+
+        Args:
+            patterns: Пары (подстрока, значение), значение возвращается при совпадении
+        """
+        # Бор: переходы, ссылки неудач и выходы для каждой вершины
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[int, object]]] = [[]]
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    outputs.append([])
+                node = next_node
+            outputs[node].append((len(pattern), value))
+
+        # Ссылки неудач в порядке обхода в ширину; сразу достраиваем полную таблицу
+        # переходов, чтобы при поиске на каждый символ был ровно один поиск в словаре
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            outputs[node] = outputs[node] + outputs[fail[node]]
+            delta[node] = dict(delta[fail[node]])
+            for char, child in goto[node].items():
+                delta[node][char] = child
+                fail[child] = delta[fail[node]].get(char, 0) if node else 0
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+        self.size = len(goto)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """
+        Находит все вхождения (в том числе перекрывающиеся).
+
+        Args:
+            text: Текст для поиска
+
+        Yields:
+            Тройки (начало, конец, значение)
+        """
+        delta = self._delta
+        outputs = self._outputs
+        node = 0
+        for position, char in enumerate(text):
+            node = delta[node].get(char, 0)
+            if outputs[node]:
+                end = position + 1
+                for length, value in outputs[node]:
+                    yield end - length, end, value
+
+
+class KeywordClassifier:
+    """Многометочный классификатор текста по словарю {метка: [ключевые слова]}."""
+
+    def __init__(self, lexicon: Dict[str, Sequence[str]], stem: bool = True):
+        """
+        Компилирует словарь в автомат.
+
+        Args:
+            lexicon: Словарь меток и их ключевых слов (порядок меток задает приоритет)
+            stem: Отсекать ли окончания у ключевых слов
+        """
+        self.labels: List[str] = list(lexicon)
+        self._priority = {label: index for index, label in enumerate(self.labels)}
+        patterns = []
+        for label, keywords in lexicon.items():
+            for keyword in keywords:
+                pattern = stem_phrase(keyword) if stem else normalize_text(keyword)
+                patterns.append((pattern, (label, keyword)))
+        self._automaton = AhoCorasick(patterns)
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """
+        Находит все ключевые слова в тексте.
+
+        Args:
+            text: Исходный текст
+
+        Returns:
+            Совпадения в порядке их окончания в тексте
+        """
+        if not text:
+            return []
+        return [
+            KeywordMatch(label, keyword, start, end)
+            for start, end, (label, keyword) in self._automaton.iter_matches(normalize_text(text))
+        ]
+
+    def classify(self, text: str) -> Set[str]:
+        """
+        Возвращает все метки, ключевые слова которых встречаются в тексте.
+
+        Args:
+            text: Исходный текст
+
+        Returns:
+            Множество меток
+        """
+        if not text:
+            return set()
+        return {value[0] for _, _, value in self._automaton.iter_matches(normalize_text(text))}
+
+    def first_label(self, text: str) -> Optional[str]:
+        """
+        Возвращает найденную метку с наивысшим приоритетом (первую в словаре).
+
+        Args:
+            text: Исходный текст
+
+        Returns:
+            Метка или None, если ключевых слов в тексте нет
+        """
+        labels = self.classify(text)
+        if not labels:
+            return None
+        return min(labels, key=self._priority.__getitem__)
+
+
+# Стиль, сезон и пол в запросе образа (запасной анализ изображений ImageAnalyzer).
+# Ключевые слова ищутся как подстроки, как и раньше: «выход» находит и «выходные»
+OUTFIT_STYLE_LEXICON: Dict[str, List[str]] = {
+    "office": ["офисный", "деловой", "формальный", "бизнес", "работа", "офис"],
+    "casual": ["повседневный", "casual", "ежедневный", "обычный"],
+    "sport": ["спортивный", "тренировка", "фитнес", "спорт"],
+    "evening": ["вечерний", "праздничный", "нарядный", "выход"],
+    "summer": ["летний", "лето", "пляж", "жара"],
+    "winter": ["зимний", "зима", "холод", "мороз"],
+    "male": ["мужской", "мужчина", "мужские", "мужское", "мужская", "муж"],
+    "female": ["женский", "женщина", "женские", "женское", "женская", "жен"],
+}
+
+# Стиль в запросе для набора одежды по умолчанию в поиске образов: только прежние
+# слова этой проверки, без «работа», «бизнес», «выход» и т.п. из OUTFIT_STYLE_LEXICON
+OUTFIT_FALLBACK_STYLE_LEXICON: Dict[str, List[str]] = {
+    "office": ["офисный", "деловой"],
+    "casual": ["повседневный", "casual"],
+    "sport": ["спортивный"],
+    "evening": ["вечерний"],
+}
+
+# Типы одежды, упоминаемые в ответах ассистента (в порядке вывода; см. outfit_parser.py)
+CLOTHING_TYPE_LEXICON: Dict[str, List[str]] = {
+    clothing_type: [clothing_type]
+    for clothing_type in [
+        "футболка", "рубашка", "блузка", "джинсы", "брюки", "юбка", "платье",
+        "куртка", "пальто", "свитер", "кофта", "жакет", "пиджак", "шорты",
+        "кроссовки", "туфли", "ботинки", "сапоги", "кеды", "шляпа", "шапка",
+    ]
+}
+
+# Категории мебели по названию товара (порядок задает приоритет)
+FURNITURE_CATEGORY_LEXICON: Dict[str, List[str]] = {
+    "Диваны и кресла": ["диван", "софа", "кресло", "пуф"],
+    "Столы и стулья": ["стол", "стул", "табурет", "стеллаж"],
+    "Шкафы и хранение": ["шкаф", "комод", "полка", "этажерка", "гардероб"],
+    "Кровати": ["кровать", "матрас", "изголовье"],
+    "Освещение": ["светильник", "люстра", "лампа", "бра", "торшер"],
+    "Декор": ["ковер", "подушка", "ваза", "картина", "зеркало", "часы"],
+}
+
+OUTFIT_STYLE_CLASSIFIER = KeywordClassifier(OUTFIT_STYLE_LEXICON)
+OUTFIT_FALLBACK_STYLE_CLASSIFIER = KeywordClassifier(OUTFIT_FALLBACK_STYLE_LEXICON)
+FURNITURE_CLASSIFIER = KeywordClassifier(FURNITURE_CATEGORY_LEXICON)
+
+
+def _generate_benchmark_texts(count: int, seed: int = 42) -> List[str]:
+    """Генерирует тексты для бенчмарка из слов словарей и нейтральных слов."""
+    rnd = random.Random(seed)
+    vocabulary = [word for words in OUTFIT_STYLE_LEXICON.values() for word in words]
+    vocabulary += list(CLOTHING_TYPE_LEXICON) + [w for words in FURNITURE_CATEGORY_LEXICON.values() for w in words]
+    filler = ["стильный", "образ", "для", "на", "каждый", "день", "синий", "белая", "классический", "модный"]
+    return [
+        " ".join(rnd.choice(vocabulary if rnd.random() < 0.3 else filler) for _ in range(rnd.randint(3, 12)))
+        for _ in range(count)
+    ]
+
+
+def _best_time(run: Callable[[], None], repeats: int) -> float:
+    """Возвращает лучшее время выполнения run() из repeats запусков."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark(count: int = 20000, repeats: int = 3) -> Dict[str, float]:
+    """
+    Сравнивает classify() с прежними проверками `any(word in text ...)` по каждому
+    списку на коротких текстах (запросы, названия товаров).
+
+    Разбор ответов ассистента измеряется отдельно: `python outfit_parser.py`.
+
+    Args:
+        count: Количество коротких текстов
+        repeats: Количество повторов (берется лучший результат)
+
+    Returns:
+        Словарь со временем прежнего и нового способа
+    """
+    texts = _generate_benchmark_texts(count)
+    lexicons = [OUTFIT_STYLE_LEXICON, FURNITURE_CATEGORY_LEXICON]
+    classifiers = [OUTFIT_STYLE_CLASSIFIER, FURNITURE_CLASSIFIER]
+
+    def naive_short() -> None:
+        for text in texts:
+            text_lower = text.lower()
+            for lexicon in lexicons:
+                {label for label, words in lexicon.items() if any(word in text_lower for word in words)}
+
+    def automaton_short() -> None:
+        for text in texts:
+            for classifier in classifiers:
+                classifier.classify(text)
+
+    return {
+        "texts": count,
+        "average_length": sum(len(text) for text in texts) / count,
+        "naive_short_seconds": _best_time(naive_short, repeats),
+        "automaton_short_seconds": _best_time(automaton_short, repeats),
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    result = benchmark(count)
+    print(f"Короткие тексты: {result['texts']}, средняя длина {result['average_length']:.0f} символов")
+    print(f"  any(word in text): {result['naive_short_seconds']:.4f} с")
+    print(f"  автомат:           {result['automaton_short_seconds']:.4f} с")
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочное тестирование API шопинг-ассистента.
+
+Генератор нагрузки выполняет сценарии против запущенного api.py
+(как правило, работающего с заглушками из standin_servers.py) и выводит
+пропускную способность и перцентили задержки по каждому сценарию:
+- search — POST /search (Wildberries);
+- analyze-image — POST /analyze-image с загрузкой изображения;
+- assistant — POST /assistant;
+- pinterest-wb — POST /search-pinterest, затем POST /search-wildberries по найденным образам.
+
+Для задач, которые еще выполняются, сценарий опрашивает эндпоинт статуса
+до завершения; задержкой сценария считается время до готового результата.
+
+Пример:
+    python load_test.py --base-url http://127.0.0.1:8000 --scenario all --concurrency 16 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from standin_servers import make_jpeg
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("search", "analyze-image", "assistant", "pinterest-wb")
+
+# Запросы, из которых сценарии выбирают случайный
+QUERIES = ["черное платье", "белые кроссовки", "джинсы мом", "оверсайз худи", "бежевый тренч", "летний сарафан"]
+
+# Статусы завершенных задач
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Вычисляет перцентиль с линейной интерполяцией.
+
+    Args:
+        values: Отсортированный список значений
+        percent: Перцентиль (0–100)
+
+    Returns:
+        Значение перцентиля (0.0 для пустого списка)
+    """
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class ScenarioStats:
+    """
+    Результаты одного сценария: задержки успешных запусков и количество ошибок.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.error_samples: List[str] = []
+
+    def record(self, latency: float, error: Optional[str] = None) -> None:
+        """
+        Учитывает результат запуска сценария.
+
+        Args:
+            latency: Длительность в секундах
+            error: Описание ошибки (None — успешный запуск)
+        """
+        if error is None:
+            self.latencies.append(latency)
+            return
+        self.errors += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(error)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """
+        Формирует сводку по сценарию.
+
+        Args:
+            elapsed: Длительность теста в секундах
+
+        Returns:
+            Словарь с количеством запусков, пропускной способностью и перцентилями (в мс)
+        """
+        latencies = sorted(self.latencies)
+        total = len(latencies) + self.errors
+        return {
+            "scenario": self.name,
+            "runs": total,
+            "ok": len(latencies),
+            "errors": self.errors,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            "error_samples": self.error_samples
+        }
+
+
+class LoadGenerator:
+    """
+    Генератор нагрузки на API с фиксированным числом одновременных клиентов.
+    """
+
+    def __init__(self, base_url: str, poll_interval: float = 0.5, task_timeout: float = 120.0,
+                 image: Optional[bytes] = None):
+        """
+        Args:
+            base_url: Адрес API
+            poll_interval: Интервал опроса статуса задач (в секундах)
+            task_timeout: Максимальное время ожидания результата одного сценария (в секундах)
+            image: Изображение для сценария analyze-image (по умолчанию — синтетический JPEG)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self.image = image or make_jpeg(50000)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._user_counter = 0
+
+    async def _json(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Выполняет запрос к API и возвращает JSON-ответ.
+
+        Raises:
+            RuntimeError: Если API вернул код ошибки
+        """
+        async with self._session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"{method} {path}: HTTP {response.status} {(await response.text())[:200]}")
+            return await response.json(content_type=None)
+
+    async def _wait_task(self, status_path: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Дожидается завершения задачи, опрашивая эндпоинт статуса.
+
+        Args:
+            status_path: Путь эндпоинта статуса (без ID задачи)
+            result: Ответ на запрос создания задачи
+
+        Returns:
+            Финальное состояние задачи
+
+        Raises:
+            RuntimeError: Если задача завершилась с ошибкой
+        """
+        task_id = result.get("task_id")
+        while result.get("status") not in FINAL_STATUSES:
+            if not task_id:
+                raise RuntimeError(f"В ответе нет task_id: {result}")
+            await asyncio.sleep(self.poll_interval)
+            result = await self._json("GET", f"{status_path}/{task_id}")
+        if result.get("status") in ("failed", "cancelled"):
+            raise RuntimeError(f"Задача {task_id} завершилась с ошибкой: {result.get('message')}")
+        return result
+
+    async def scenario_search(self) -> None:
+        """Поиск товаров на Wildberries через /search."""
+        result = await self._json("POST", "/search", json={
+            "query": random.choice(QUERIES),
+            "number_of_photos": 5,
+            "source": "wildberries"
+        })
+        await self._wait_task("/status", result)
+
+    async def scenario_analyze_image(self) -> None:
+        """Анализ загруженного изображения и поиск похожих товаров."""
+        form = aiohttp.FormData()
+        form.add_field("file", self.image, filename="look.jpg", content_type="image/jpeg")
+        await self._json("POST", "/analyze-image", data=form)
+
+    async def scenario_assistant(self) -> None:
+        """Сообщение ассистенту-стилисту."""
+        self._user_counter += 1
+        await self._json("POST", "/assistant", json={
+            "user_id": f"load-test-{self._user_counter}",
+            "role": "стилист",
+            "message": f"Подбери образ: {random.choice(QUERIES)}"
+        })
+
+    async def scenario_pinterest_wb(self) -> None:
+        """Поиск образов в Pinterest и подбор товаров Wildberries по ним."""
+        pinterest = await self._json("POST", "/search-pinterest", json={
+            "query": random.choice(QUERIES),
+            "gender": "женский",
+            "num_results": 3
+        })
+        pinterest = await self._wait_task("/search-pinterest", pinterest)
+        wildberries = await self._json("POST", "/search-wildberries", json={
+            "pinterest_task_id": pinterest["task_id"],
+            "max_products_per_item": 3
+        })
+        await self._wait_task("/search-wildberries", wildberries)
+
+    def _scenario(self, name: str) -> Callable[[], Awaitable[None]]:
+        """Возвращает функцию сценария по имени."""
+        return getattr(self, f"scenario_{name.replace('-', '_')}")
+
+    async def run(self, scenarios: List[str], concurrency: int, duration: Optional[float] = None,
+                  total_runs: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Выполняет сценарии заданным числом одновременных клиентов.
+
+        Клиенты берут сценарии по кругу, пока не истечет duration или не будет выполнено total_runs запусков.
+
+        Args:
+            scenarios: Имена сценариев
+            concurrency: Количество одновременных клиентов
+            duration: Длительность теста в секундах
+            total_runs: Общее количество запусков сценариев
+
+        Returns:
+            Сводка: длительность, общая пропускная способность и результаты по сценариям
+        """
+        stats = {name: ScenarioStats(name) for name in scenarios}
+        started = time.perf_counter()
+        deadline = started + duration if duration else None
+        runs_started = 0
+
+        def next_scenario() -> Optional[str]:
+            nonlocal runs_started
+            if total_runs is not None and runs_started >= total_runs:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            name = scenarios[runs_started % len(scenarios)]
+            runs_started += 1
+            return name
+
+        async def client() -> None:
+            while True:
+                name = next_scenario()
+                if name is None:
+                    return
+                run_started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._scenario(name)(), timeout=self.task_timeout)
+                    stats[name].record(time.perf_counter() - run_started)
+                except asyncio.TimeoutError:
+                    stats[name].record(time.perf_counter() - run_started, f"тайм-аут {self.task_timeout} с")
+                except Exception as e:
+                    stats[name].record(time.perf_counter() - run_started, str(e))
+
+        timeout = aiohttp.ClientTimeout(total=self.task_timeout)
+        connector = aiohttp.TCPConnector(limit=concurrency * 2)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            self._session = session
+            await asyncio.gather(*(client() for _ in range(max(1, concurrency))))
+            self._session = None
+
+        elapsed = time.perf_counter() - started
+        summaries = [stats[name].summary(elapsed) for name in scenarios]
+        return {
+            "base_url": self.base_url,
+            "concurrency": concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(sum(summary["ok"] for summary in summaries) / elapsed, 2) if elapsed > 0 else 0.0,
+            "scenarios": summaries
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Форматирует сводку нагрузочного теста в виде таблицы.
+
+    Args:
+        report: Результат LoadGenerator.run
+
+    Returns:
+        Текст отчета
+    """
+    header = f"{'сценарий':<15}{'запусков':>10}{'ошибок':>8}{'rps':>9}{'p50 мс':>10}{'p90 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}"
+    lines = [
+        f"API: {report['base_url']}, клиентов: {report['concurrency']}, длительность: {report['elapsed_s']} с, "
+        f"общая пропускная способность: {report['throughput_rps']} сценариев/с",
+        header,
+        "-" * len(header)
+    ]
+    for summary in report["scenarios"]:
+        lines.append(
+            f"{summary['scenario']:<15}{summary['runs']:>10}{summary['errors']:>8}{summary['throughput_rps']:>9}"
+            f"{summary['p50_ms']:>10}{summary['p90_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['max_ms']:>10}"
+        )
+        for sample in summary["error_samples"]:
+            lines.append(f"    ошибка: {sample}")
+    return "\n".join(lines)
+
+
+def main():
+    """Точка входа для запуска нагрузочного теста из командной строки."""
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование API шопинг-ассистента")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Адрес API")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS + ("all",),
+                        help="Сценарий (можно указать несколько раз); по умолчанию — all")
+    parser.add_argument("--concurrency", type=int, default=8, help="Количество одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=None, help="Длительность теста в секундах")
+    parser.add_argument("--runs", type=int, default=None, help="Общее количество запусков сценариев")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Интервал опроса статуса задач (с)")
+    parser.add_argument("--task-timeout", type=float, default=120.0, help="Тайм-аут одного сценария (с)")
+    parser.add_argument("--image", help="Изображение для сценария analyze-image")
+    parser.add_argument("--output", help="Файл для сохранения сводки в формате JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    scenarios = list(SCENARIOS) if not args.scenario or "all" in args.scenario else list(dict.fromkeys(args.scenario))
+    if args.duration is None and args.runs is None:
+        args.duration = 30.0
+
+    image = None
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+
+    generator = LoadGenerator(args.base_url, args.poll_interval, args.task_timeout, image)
+    report = asyncio.run(generator.run(scenarios, args.concurrency, args.duration, args.runs))
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Сводка сохранена в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
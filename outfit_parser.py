@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Разбор ответа стилиста в список предметов одежды.
+
+Ответ модели обычно содержит маркированный или нумерованный список («- Белая рубашка
+из хлопка», «2. **Брюки** темно-синие, прямые») и строки-свойства («Цвет: черный»).
+Строки выделяются одним скомпилированным регулярным выражением:
+
+- маркер списка в начале строки открывает новый предмет;
+- слова строки-предмета сопоставляются со словарями предметов одежды, цветов и
+  указаний на пол по основе слова («футболку» → «футболка», «чёрные» → «черн»;
+  правила нормализации общие с keyword_classifier.py); остальной текст строки
+  становится описанием;
+- строка «ключ: значение» после предмета уточняет его тип, цвет, описание или пол;
+- если списка в ответе нет, текст просматривается еще раз: предметы строятся по
+  первому упоминанию каждого типа одежды и слову перед ним.
+
+    items = parse_outfit_items("1. Белая рубашка оверсайз\\n2. Черные брюки", "женский")
+    # [{"type": "рубашка", "color": "белая", "description": "оверсайз", "gender": "женский"}, ...]
+"""
+
+import logging
+import re
+import sys
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from keyword_classifier import (
+    CLOTHING_TYPE_LEXICON, OUTFIT_STYLE_LEXICON, WORD_STEM_LENGTH, normalize_text, stem_word,
+)
+
+logger = logging.getLogger(__name__)
+
+# Предметы одежды, которые распознаются в строках списка помимо CLOTHING_TYPE_LEXICON
+EXTRA_GARMENTS = [
+    "костюм", "толстовка", "худи", "свитшот", "джемпер", "водолазка", "кардиган", "жилет",
+    "топ", "майка", "лонгслив", "тренч", "плащ", "пуховик", "бомбер", "комбинезон",
+    "сарафан", "леггинсы", "лоферы", "мокасины", "босоножки", "сандалии", "балетки",
+    "сумка", "рюкзак", "ремень", "шарф", "платок", "галстук", "перчатки", "берет", "кепка", "очки",
+]
+
+COLOR_WORDS = [
+    "белый", "черный", "серый", "синий", "голубой", "красный", "бордовый", "розовый",
+    "зеленый", "желтый", "оранжевый", "коричневый", "бежевый", "фиолетовый", "сиреневый",
+    "хаки", "бирюзовый", "молочный", "кремовый", "песочный", "графитовый", "изумрудный",
+    "горчичный", "оливковый", "пудровый", "мятный", "лавандовый", "терракотовый",
+    "серебристый", "золотистый", "камельный",
+]
+
+# Ключи строк-свойств («Цвет: черный») и поля предмета, которые они задают
+PROPERTY_KEYS = {
+    "тип": "type", "предмет": "type", "вещь": "type",
+    "цвет": "color", "оттенок": "color",
+    "описание": "description", "особенности": "description", "детали": "description",
+    "пол": "gender",
+}
+
+UNKNOWN_COLOR = "неизвестный"
+
+# Строка ответа: необязательный маркер списка («-», «•», «*», «–» или «1.», «2)») и тело
+_LINE_RE = re.compile(r"^[ \t]*(?P<marker>[-•*–](?=\s)|\d+[.)])?[ \t]*(?P<body>[^\n]*)", re.MULTILINE)
+_WORD_PATTERN = r"[^\W\d_]+(?:-[^\W\d_]+)*"
+_WORD_RE = re.compile(_WORD_PATTERN)
+# Токены тела строки; пробелы токенов не образуют, finditer пропускает их сам
+_TOKEN_RE = re.compile(rf"(?P<word>{_WORD_PATTERN})|(?P<other>\S)")
+# Края, убираемые из описания
+_DESCRIPTION_STRIP = " \t,.;:!—–-()"
+
+
+@lru_cache(maxsize=65536)
+def word_root(word: str) -> str:
+    """
+    Возвращает основу слова для сопоставления со словарями.
+
+    Словарь ответов стилиста небольшой, поэтому основы кешируются.
+
+    Args:
+        word: Слово в любом регистре
+
+    Returns:
+        Нормализованная основа
+    """
+    return stem_word(normalize_text(word), WORD_STEM_LENGTH)
+
+
+def _build_root_index(lexicon: Dict[str, Iterable[str]]) -> Dict[str, str]:
+    """Строит индекс «основа слова → метка» (при совпадении основ побеждает первая метка)."""
+    index: Dict[str, str] = {}
+    for label, words in lexicon.items():
+        for word in words:
+            index.setdefault(word_root(word), label)
+    return index
+
+
+GARMENT_INDEX = _build_root_index({
+    **CLOTHING_TYPE_LEXICON,
+    **{garment: [garment] for garment in EXTRA_GARMENTS},
+})
+COLOR_INDEX = _build_root_index({color: [color] for color in COLOR_WORDS})
+GENDER_INDEX = _build_root_index({
+    "мужской": OUTFIT_STYLE_LEXICON["male"],
+    "женский": OUTFIT_STYLE_LEXICON["female"],
+})
+
+
+def _is_color(root: str) -> bool:
+    """Проверяет, обозначает ли слово цвет (в том числе составной: «темно-синий»)."""
+    if root in COLOR_INDEX:
+        return True
+    if "-" in root:
+        return word_root(root.rsplit("-", 1)[1]) in COLOR_INDEX
+    return False
+
+
+@lru_cache(maxsize=65536)
+def _word_labels(word: str) -> Optional[Tuple[Optional[str], bool, Optional[str]]]:
+    """
+    Сопоставляет слово со словарями предметов одежды, цветов и указаний на пол.
+
+    Результат кешируется по слову в исходном виде, поэтому повторяющиеся слова
+    ответов обходятся одним поиском в кеше.
+
+    Args:
+        word: Слово в любом регистре
+
+    Returns:
+        Кортеж (тип одежды, цвет ли это, пол) или None, если слова нет ни в одном словаре
+    """
+    root = word_root(word)
+    labels = (GARMENT_INDEX.get(root), _is_color(root), GENDER_INDEX.get(root))
+    return labels if labels != (None, False, None) else None
+
+
+@lru_cache(maxsize=65536)
+def _token_words(token: str) -> Tuple[Tuple[int, int, str, Tuple[Optional[str], bool, Optional[str]]], ...]:
+    """
+    Находит в токене (фрагменте строки без пробелов) слова из словарей.
+
+    Слово не пересекает пробелы, поэтому разбор токена совпадает с разбором того же
+    места строки, а повторяющиеся токены («рубашка,», «**Брюки**») берутся из кеша.
+
+    Args:
+        token: Фрагмент строки без пробельных символов
+
+    Returns:
+        Кортежи (начало в токене, конец в токене, слово, метки слова)
+    """
+    words = []
+    for match in _WORD_RE.finditer(token):
+        labels = _word_labels(match.group())
+        if labels is not None:
+            words.append((match.start(), match.end(), match.group(), labels))
+    return tuple(words)
+
+
+def _strip_markup(text: str) -> str:
+    """Убирает из текста символы разметки («*», «_», «#», «`»)."""
+    # Цепочка replace заметно быстрее регулярного выражения на коротких строках
+    return text.replace("*", "").replace("_", "").replace("#", "").replace("`", "")
+
+
+def _clean(text: str) -> str:
+    """Убирает из текста символы разметки и лишние пробелы."""
+    return " ".join(_strip_markup(text).split())
+
+
+def _description(tokens: List[str], skip: List[Tuple[int, int, int, str]]) -> str:
+    """
+    Собирает описание из токенов строки без слов типа и цвета.
+
+    Args:
+        tokens: Токены строки (результат split()); список изменяется на месте
+        skip: Исключаемые слова в виде (номер токена, начало и конец в токене, слово),
+            от последнего к первому
+
+    Returns:
+        Описание без разметки и лишних пробелов
+    """
+    # Вырезаем с конца, чтобы позиции второго слова в том же токене не сдвинулись
+    for index, word_start, word_end, _ in skip:
+        part = tokens[index][:word_start] + tokens[index][word_end:]
+        if part:
+            tokens[index] = part
+        else:
+            del tokens[index]
+    description = " ".join(tokens)
+    stripped = _strip_markup(description)
+    if len(stripped) != len(description):
+        # После удаления разметки могли остаться пустые токены
+        stripped = " ".join(stripped.split())
+    description = stripped
+    # Убираем висящие запятые, оставшиеся на месте вырезанных слов
+    description = description.replace(" ,", ",").strip(_DESCRIPTION_STRIP)
+    return description
+
+
+def _build_item(body: str, gender: str) -> Optional[Dict[str, str]]:
+    """
+    Строит предмет одежды из строки списка.
+
+    Строка делится на токены через split(), и со словарями сопоставляются только
+    слова токенов; слова типа и цвета запоминаются как (номер токена, начало и
+    конец в токене, слово).
+
+    Args:
+        body: Тело строки (после маркера)
+        gender: Пол по умолчанию
+
+    Returns:
+        Предмет одежды или None, если в строке нет слов
+    """
+    tokens = body.split()
+
+    garment = color = None
+    item_type = None
+    item_gender = gender
+    for index, token in enumerate(tokens):
+        for word_start, word_end, word, (garment_label, is_color, gender_label) in _token_words(token):
+            if garment is None and garment_label is not None:
+                garment, item_type = (index, word_start, word_end, word), garment_label
+            elif color is None and is_color:
+                color = (index, word_start, word_end, word)
+            elif gender_label is not None:
+                item_gender = gender_label
+
+    if garment is None:
+        # Предмет не из словаря: как и раньше, первое слово - тип, следующее - цвет
+        rest = [
+            (index, match.start(), match.end(), match.group())
+            for index, token in enumerate(tokens)
+            for match in _WORD_RE.finditer(token)
+        ]
+        rest = [word for word in rest if word != color]
+        if not rest:
+            if color is None:
+                return None
+            rest, color = [color], None
+        garment = rest[0]
+        item_type = garment[3].lower()
+        if color is None and len(rest) > 1:
+            color = rest[1]
+
+    if color is None:
+        return {"type": item_type, "color": UNKNOWN_COLOR, "description": _description(tokens, [garment]), "gender": item_gender}
+    skip = [garment, color] if garment > color else [color, garment]
+    return {"type": item_type, "color": color[3].lower(), "description": _description(tokens, skip), "gender": item_gender}
+
+
+def _apply_property(body: str, colon: int, item: Dict[str, str]) -> None:
+    """Применяет строку «ключ: значение» к последнему предмету."""
+    key = body[:colon].strip().lower()
+    field = PROPERTY_KEYS.get(key)
+    if field is None:
+        # Ключ с разметкой или лишними пробелами («**Цвет**»)
+        field = PROPERTY_KEYS.get(_clean(key))
+    if field is None:
+        return
+    value = _clean(body[colon + 1:])
+    item[field] = value if field == "description" else value.lower()
+
+
+def _find_mentions(response: str) -> Dict[str, str]:
+    """
+    Находит первое упоминание каждого типа одежды вне строк списка и слово перед ним.
+
+    Args:
+        response: Ответ ассистента
+
+    Returns:
+        Словарь «тип одежды → слово перед первым упоминанием» (обычно это цвет)
+    """
+    mentions: Dict[str, str] = {}
+    previous_word: Optional[str] = None
+    for marker, body in _LINE_RE.findall(response):
+        if marker:
+            continue
+        for token in _TOKEN_RE.finditer(body):
+            if token.lastgroup != "word":
+                previous_word = None
+                continue
+            word = token.group()
+            labels = _word_labels(word)
+            label = labels[0] if labels is not None else None
+            if label in CLOTHING_TYPE_LEXICON and label not in mentions:
+                mentions[label] = previous_word.lower() if previous_word else UNKNOWN_COLOR
+            previous_word = word
+    return mentions
+
+
+def parse_outfit_items(response: str, gender: str = "женский") -> List[Dict[str, str]]:
+    """
+    Разбирает ответ стилиста в список предметов одежды.
+
+    Строки списка разбираются по словам; у остальных строк после первого предмета
+    проверяется только наличие двоеточия (строка-свойство). Упоминания типов одежды
+    в тексте ищутся отдельным проходом и только если списка в ответе нет.
+
+    Args:
+        response: Ответ ассистента
+        gender: Пол по умолчанию
+
+    Returns:
+        Список словарей с ключами type, color, description, gender
+        (пустой, если предметов одежды в ответе нет)
+    """
+    items: List[Dict[str, str]] = []
+    # findall отдает пары (маркер, тело строки) без создания объектов re.Match
+    for marker, body in _LINE_RE.findall(response):
+        if not body:
+            continue
+        if marker:
+            item = _build_item(body, gender)
+            if item is not None:
+                items.append(item)
+        elif items:
+            colon = body.find(":")
+            if colon != -1:
+                _apply_property(body, colon, items[-1])
+
+    if items:
+        return items
+
+    # Списка нет: строим предметы по упоминаниям типов одежды
+    mentions = _find_mentions(response)
+    return [
+        {"type": clothing_type, "color": mentions[clothing_type], "description": "", "gender": gender}
+        for clothing_type in CLOTHING_TYPE_LEXICON
+        if clothing_type in mentions
+    ]
+
+
+# Ответы стилиста в форматах, которые встречаются на практике (для бенчмарка)
+SAMPLE_REPLIES = [
+    """Для офиса подойдет сдержанный, но современный образ:
+
+1. Белая рубашка из плотного хлопка, приталенная
+2. **Брюки** темно-синие, прямого кроя со стрелками
+3. Пиджак серый, однобортный
+4. Лоферы черные кожаные
+
+Дополните образ тонким ремнем в тон обуви.""",
+    """Вот капсула на лето для женщины:
+- Льняное платье молочного цвета
+- Сарафан голубой в мелкий цветок
+- Босоножки бежевые на плоской подошве
+- Сумка плетеная
+Цвет: пастельные оттенки
+- Шляпа соломенная с широкими полями""",
+    """Предлагаю такой вариант:
+* Куртка
+Цвет: черный
+Описание: кожаная косуха, свободная посадка
+* Джинсы
+Цвет: синий
+Детали: прямые, с необработанным краем
+* Кеды
+Цвет: белый""",
+    """Для прогулки в прохладную погоду отлично подойдет бежевое пальто, под него серый свитер
+крупной вязки и темные джинсы. Из обуви выбирайте коричневые ботинки, а шапка может быть
+в тон свитеру.""",
+    """1) Мужской костюм графитовый, шерсть
+2) Рубашка голубая с воротником на пуговицах
+3) Галстук бордовый шелковый
+4) Туфли оксфорды черные""",
+]
+
+
+def _generate_benchmark_corpus(count: int) -> List[str]:
+    """Собирает корпус из образцов ответов, склеивая их в ответы разной длины."""
+    corpus = []
+    for index in range(count):
+        size = 1 + index % 8
+        corpus.append("\n\n".join(SAMPLE_REPLIES[(index + offset) % len(SAMPLE_REPLIES)] for offset in range(size)))
+    return corpus
+
+
+def benchmark(count: int = 2000, repeats: int = 5) -> Dict[str, float]:
+    """
+    Измеряет скорость разбора ответов стилиста.
+
+    Args:
+        count: Количество ответов в корпусе (каждый - от 1 до 8 образцов подряд)
+        repeats: Количество повторов (берется лучший результат)
+
+    Returns:
+        Словарь с количеством ответов, лучшим временем, ответами и символами в секунду
+    """
+    corpus = _generate_benchmark_corpus(count)
+    characters = sum(len(reply) for reply in corpus)
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for reply in corpus:
+            parse_outfit_items(reply)
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        "replies": count,
+        "characters": characters,
+        "seconds": best,
+        "replies_per_second": count / best if best > 0 else float("inf"),
+        "characters_per_second": characters / best if best > 0 else float("inf"),
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    result = benchmark(count)
+    print(f"Разобрано {result['replies']} ответов ({result['characters']} символов) за {result['seconds']:.4f} с "
+          f"({result['replies_per_second']:.0f} ответов/с, {result['characters_per_second'] / 1e6:.2f} млн символов/с)")
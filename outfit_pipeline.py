@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Потоковый конвейер «Pinterest → анализ одежды → поиск на Wildberries».
+
+Раньше сценарий подбора образа шел строго по этапам: задача /search-pinterest
+дожидалась загрузки и анализа всех пинов, и только потом клиент запускал
+/search-wildberries, который искал товары для всех предметов одежды. Время до
+результата складывалось из длительностей всех этапов.
+
+Pipeline — небольшой граф асинхронных стадий: элемент передается следующей
+стадии (emit) сразу, как только готов, поэтому стадии перекрываются. Стадия может
+отбрасывать повторяющиеся элементы по ключу, ограничивать число одновременных
+вызовов и время обработки элемента, а on_done вызывается по мере завершения
+каждого элемента (для частичной публикации результатов).
+
+run_outfit_pipeline собирает из него граф подбора образа:
+
+    пины (по мере загрузки) -> analyze (пин -> образ с предметами одежды)
+                                  -> search (уникальный запрос -> товары)
+
+Поиск товаров для предмета начинается, как только проанализирован его пин, а
+одинаковые предметы разных пинов ищутся один раз. Время выполнения приближается
+к самому медленному пути «пин -> анализ -> поиск», а не к сумме этапов.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import (
+    Any, AsyncIterable, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+)
+
+from keyword_classifier import normalize_text
+
+logger = logging.getLogger(__name__)
+
+STAGE_ANALYZE = "analyze"
+STAGE_SEARCH = "search"
+
+# Ключевые слова описания, добавляемые к поисковому запросу предмета
+_DESCRIPTION_WORD_RE = re.compile(r'\b[а-яА-Я]{3,}\b')
+
+
+class _Stage:
+    """Стадия конвейера."""
+
+    __slots__ = ("name", "handler", "key", "semaphore", "timeout", "on_done", "outcomes", "stats")
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        key: Optional[Callable[[Any], Hashable]],
+        semaphore: Optional[asyncio.Semaphore],
+        timeout: Optional[float],
+        on_done: Optional[Callable[[Dict[str, Any]], None]]
+    ):
+        self.name = name
+        self.handler = handler
+        self.key = key
+        self.semaphore = semaphore
+        self.timeout = timeout
+        self.on_done = on_done
+        # Результаты по ключу (для стадий с отбрасыванием повторов)
+        self.outcomes: Dict[Hashable, Optional[Dict[str, Any]]] = {}
+        self.stats = {"started": 0, "done": 0, "failed": 0, "timed_out": 0, "deduplicated": 0, "busy_seconds": 0.0}
+
+
+class Pipeline:
+    """Граф асинхронных стадий, передающих элементы друг другу по мере готовности."""
+
+    def __init__(self, name: str = "pipeline"):
+        """
+        Инициализация конвейера.
+
+        Args:
+            name: Имя конвейера (для логов)
+        """
+        self.name = name
+        self._stages: Dict[str, _Stage] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def add_stage(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        key: Optional[Callable[[Any], Hashable]] = None,
+        concurrency: Optional[int] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        timeout: Optional[float] = None,
+        on_done: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> None:
+        """
+        Добавляет стадию.
+
+        Args:
+            name: Имя стадии
+            handler: Асинхронная обработка элемента; может передавать элементы дальше через emit
+            key: Ключ элемента: элемент с уже встречавшимся ключом не обрабатывается повторно
+            concurrency: Максимум одновременных вызовов handler (None - без ограничения)
+            semaphore: Общий с другими задачами семафор (например, ограничение на хост)
+            timeout: Тайм-аут обработки одного элемента в секундах
+            on_done: Callback с результатом {"key", "item", "result", "error", "timed_out", "elapsed"},
+                вызывается по мере завершения каждого элемента
+        """
+        if semaphore is None and concurrency:
+            semaphore = asyncio.Semaphore(concurrency)
+        self._stages[name] = _Stage(name, handler, key, semaphore, timeout, on_done)
+
+    def emit(self, stage_name: str, item: Any) -> Optional[Hashable]:
+        """
+        Передает элемент стадии; обработка начинается сразу, не дожидаясь других элементов.
+
+        Args:
+            stage_name: Имя стадии
+            item: Элемент
+
+        Returns:
+            Ключ элемента (None, если у стадии нет ключа)
+        """
+        stage = self._stages[stage_name]
+        key = stage.key(item) if stage.key is not None else None
+        if key is not None:
+            if key in stage.outcomes:
+                stage.stats["deduplicated"] += 1
+                return key
+            # Ключ занят сразу, чтобы одновременно пришедшие повторы не запустили второй поиск
+            stage.outcomes[key] = None
+        stage.stats["started"] += 1
+        task = asyncio.ensure_future(self._process(stage, key, item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return key
+
+    def seen(self, stage_name: str, key: Hashable) -> bool:
+        """Передавался ли стадии элемент с таким ключом."""
+        return key in self._stages[stage_name].outcomes
+
+    def outcome(self, stage_name: str, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает результат обработки элемента по ключу.
+
+        Args:
+            stage_name: Имя стадии
+            key: Ключ элемента
+
+        Returns:
+            Результат или None, если элемент еще обрабатывается или не встречался
+        """
+        return self._stages[stage_name].outcomes.get(key)
+
+    async def _process(self, stage: _Stage, key: Optional[Hashable], item: Any) -> None:
+        """Обрабатывает элемент стадией с учетом ограничений и тайм-аута."""
+        outcome = {"key": key, "item": item, "result": None, "error": None, "timed_out": False, "elapsed": 0.0}
+        started_at = None
+        try:
+            if stage.semaphore is not None:
+                await stage.semaphore.acquire()
+            try:
+                started_at = time.perf_counter()
+                if stage.timeout:
+                    outcome["result"] = await asyncio.wait_for(stage.handler(item), timeout=stage.timeout)
+                else:
+                    outcome["result"] = await stage.handler(item)
+            finally:
+                if stage.semaphore is not None:
+                    stage.semaphore.release()
+        except asyncio.TimeoutError:
+            outcome["timed_out"] = True
+            outcome["error"] = f"Превышен тайм-аут {stage.timeout:g} с"
+            stage.stats["timed_out"] += 1
+            logger.warning(f"{self.name}: тайм-аут стадии {stage.name}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            outcome["error"] = str(e)
+            stage.stats["failed"] += 1
+            logger.error(f"{self.name}: ошибка стадии {stage.name}: {str(e)}")
+
+        if started_at is not None:
+            outcome["elapsed"] = time.perf_counter() - started_at
+            stage.stats["busy_seconds"] += outcome["elapsed"]
+        stage.stats["done"] += 1
+        if key is not None:
+            stage.outcomes[key] = outcome
+        if stage.on_done is not None:
+            try:
+                stage.on_done(outcome)
+            except Exception as e:
+                logger.error(f"{self.name}: ошибка в обработчике завершения стадии {stage.name}: {str(e)}")
+
+    async def run(self, source: AsyncIterable[Any], stage_name: str) -> None:
+        """
+        Передает элементы источника стадии по мере поступления и ждет, пока
+        завершится обработка всех элементов на всех стадиях.
+
+        Ошибка источника не отменяет уже начатую обработку: конвейер доделывает
+        то, что успел получить. При отмене отменяются все незавершенные элементы.
+
+        Args:
+            source: Асинхронный источник элементов
+            stage_name: Стадия, которой передаются элементы источника
+        """
+        self._started_at = time.perf_counter()
+        try:
+            try:
+                async for item in source:
+                    self.emit(stage_name, item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.name}: ошибка источника: {str(e)}")
+            # Стадии порождают новые элементы, поэтому ждем, пока не останется ни одного
+            while self._tasks:
+                await asyncio.wait(set(self._tasks))
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            self._finished_at = time.perf_counter()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику конвейера.
+
+        Returns:
+            Словарь со временем выполнения, суммарным временем работы стадий
+            и счетчиками по каждой стадии
+        """
+        stages = {
+            name: {**stage.stats, "busy_seconds": round(stage.stats["busy_seconds"], 3)}
+            for name, stage in self._stages.items()
+        }
+        elapsed = 0.0
+        if self._started_at is not None:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            # При последовательном выполнении время было бы не меньше этой суммы
+            "busy_seconds": round(sum(stage.stats["busy_seconds"] for stage in self._stages.values()), 3),
+            "stages": stages,
+        }
+
+
+def build_item_query(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Формирует поисковый запрос на Wildberries для предмета одежды.
+
+    Args:
+        item: Предмет одежды (type, color, description, gender)
+
+    Returns:
+        {"query", "gender", "item"} или None, если у предмета нет типа
+    """
+    type_name = (item.get("type") or "").strip()
+    if not type_name:
+        return None
+    color = (item.get("color") or "").strip()
+    description = (item.get("description") or "").strip()
+    gender = (item.get("gender") or "женский").strip()
+
+    search_query = type_name
+    if color and color != "неизвестный":
+        search_query += f" {color}"
+    # Добавляем ключевые слова из описания
+    if description:
+        keywords = _DESCRIPTION_WORD_RE.findall(description)
+        if keywords:
+            search_query += f" {' '.join(keywords[:2])}"
+
+    return {"query": search_query, "gender": gender, "item": item}
+
+
+def item_query_key(entry: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Ключ поискового запроса для отбрасывания одинаковых предметов разных образов.
+
+    Args:
+        entry: Результат build_item_query
+
+    Returns:
+        Пара (нормализованный запрос, пол)
+    """
+    return " ".join(normalize_text(entry["query"]).split()), normalize_text(entry["gender"])
+
+
+async def run_outfit_pipeline(
+    pins: AsyncIterable[Any],
+    analyze: Callable[[Any], Awaitable[Dict[str, Any]]],
+    search: Optional[Callable[[Dict[str, Any]], Awaitable[List[Dict[str, Any]]]]] = None,
+    on_outfit: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    on_products: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_search_started: Optional[Callable[[Dict[str, Any]], None]] = None,
+    analyze_concurrency: Optional[int] = None,
+    search_semaphore: Optional[asyncio.Semaphore] = None,
+    search_timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Подбирает образы и товары к ним, перекрывая загрузку пинов, анализ и поиск.
+
+    Args:
+        pins: Пины по мере загрузки (например, PinterestAPI.iter_pins)
+        analyze: Пин -> образ (словарь с ключом "clothingItems")
+        search: Запрос {"query", "gender", "item"} -> товары (None - без поиска товаров)
+        on_outfit: Callback (номер образа, образ) по мере анализа пинов
+        on_products: Callback {"query", "gender", "item", "products"} по завершении каждого поиска
+            (products пуст, если товары не найдены или поиск не удался)
+        on_search_started: Callback с новым уникальным запросом при его постановке в поиск
+        analyze_concurrency: Максимум одновременных анализов пинов
+        search_semaphore: Общее ограничение одновременных запросов к магазину
+        search_timeout: Тайм-аут поиска одного предмета в секундах
+
+    Returns:
+        {"outfits": образы по мере готовности (у каждого "productQueries" - запросы
+        его предметов при поиске товаров), "products": найденные товары по уникальным
+        запросам в порядке постановки, "stats": статистика конвейера}
+    """
+    pipeline = Pipeline("outfit-pipeline")
+    outfits: List[Dict[str, Any]] = []
+    searches: List[Dict[str, Any]] = []
+
+    async def analyze_pin(pin: Any) -> Dict[str, Any]:
+        outfit = await analyze(pin)
+        if search is not None:
+            # Предметы образа сразу уходят в поиск; повторяющиеся запросы отбрасываются
+            queries = []
+            for item in outfit.get("clothingItems") or []:
+                entry = build_item_query(item)
+                if entry is None:
+                    queries.append(None)
+                    continue
+                queries.append(entry["query"])
+                if not pipeline.seen(STAGE_SEARCH, item_query_key(entry)):
+                    searches.append(entry)
+                    if on_search_started is not None:
+                        on_search_started(entry)
+                pipeline.emit(STAGE_SEARCH, entry)
+            outfit["productQueries"] = queries
+        return outfit
+
+    def outfit_done(outcome: Dict[str, Any]) -> None:
+        if outcome["result"] is None:
+            return
+        outfits.append(outcome["result"])
+        if on_outfit is not None:
+            on_outfit(len(outfits) - 1, outcome["result"])
+
+    def products_done(outcome: Dict[str, Any]) -> None:
+        if on_products is not None:
+            entry = outcome["item"]
+            on_products({"query": entry["query"], "gender": entry["gender"], "item": entry["item"], "products": outcome["result"] or []})
+
+    pipeline.add_stage(STAGE_ANALYZE, analyze_pin, concurrency=analyze_concurrency, on_done=outfit_done)
+    if search is not None:
+        pipeline.add_stage(
+            STAGE_SEARCH, search, key=item_query_key, semaphore=search_semaphore,
+            timeout=search_timeout, on_done=products_done
+        )
+
+    await pipeline.run(pins, STAGE_ANALYZE)
+
+    products = []
+    for entry in searches:
+        outcome = pipeline.outcome(STAGE_SEARCH, item_query_key(entry))
+        if outcome is not None and outcome["result"]:
+            products.append({"query": entry["query"], "item": entry["item"], "products": outcome["result"]})
+
+    stats = pipeline.stats()
+    logger.info(
+        f"Конвейер подбора образов: {len(outfits)} образов, {len(products)}/{len(searches)} запросов с товарами "
+        f"за {stats['elapsed_seconds']} с (суммарное время стадий {stats['busy_seconds']} с)"
+    )
+    return {"outfits": outfits, "products": products, "stats": stats}
+
+
+def benchmark(
+    pins: int = 6,
+    pin_delay: float = 0.05,
+    analyze_delay: float = 0.2,
+    search_delay: float = 0.15,
+    search_concurrency: int = 4
+) -> Dict[str, float]:
+    """
+    Сравнивает поэтапную обработку (все пины -> все анализы -> все поиски) с конвейером
+    на имитации с задержками вместо сети.
+
+    Args:
+        pins: Количество пинов (у каждого 3 предмета, один из них общий для всех пинов)
+        pin_delay: Интервал появления пинов в секундах
+        analyze_delay: Время анализа одного пина
+        search_delay: Время поиска одного предмета
+        search_concurrency: Ограничение одновременных запросов поиска (как у FanOutExecutor)
+
+    Returns:
+        Время поэтапной обработки и конвейера в секундах и число запросов поиска
+    """
+    def outfit(index: int) -> Dict[str, Any]:
+        return {"clothingItems": [
+            {"type": "кроссовки", "color": "белые", "gender": "женский"},
+            {"type": "футболка", "color": f"цвет{index}", "gender": "женский"},
+            {"type": "джинсы", "color": f"оттенок{index}", "gender": "женский"},
+        ]}
+
+    async def source():
+        for index in range(pins):
+            await asyncio.sleep(pin_delay)
+            yield index
+
+    async def analyze(index: int) -> Dict[str, Any]:
+        await asyncio.sleep(analyze_delay)
+        return outfit(index)
+
+    search_calls = {"staged": 0, "pipeline": 0}
+
+    def make_search(mode: str):
+        async def search(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+            search_calls[mode] += 1
+            await asyncio.sleep(search_delay)
+            return [{"name": entry["query"]}]
+        return search
+
+    async def staged() -> None:
+        semaphore = asyncio.Semaphore(search_concurrency)
+        search = make_search("staged")
+
+        async def limited_search(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await search(entry)
+
+        found = [index async for index in source()]
+        outfits = await asyncio.gather(*(analyze(index) for index in found))
+        entries = [build_item_query(item) for result in outfits for item in result["clothingItems"]]
+        await asyncio.gather(*(limited_search(entry) for entry in entries))
+
+    async def pipelined() -> None:
+        semaphore = asyncio.Semaphore(search_concurrency)
+        await run_outfit_pipeline(source(), analyze, make_search("pipeline"), search_semaphore=semaphore)
+
+    timings = {}
+    for name, scenario in (("staged", staged), ("pipeline", pipelined)):
+        started_at = time.perf_counter()
+        asyncio.run(scenario())
+        timings[f"{name}_seconds"] = round(time.perf_counter() - started_at, 3)
+    timings["staged_searches"] = search_calls["staged"]
+    timings["pipeline_searches"] = search_calls["pipeline"]
+    return timings
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    logging.basicConfig(level=logging.WARNING)
+    pin_count = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    print(json.dumps(benchmark(pins=pin_count), ensure_ascii=False, indent=2))
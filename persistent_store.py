@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Словарь в памяти с сохранением на диск через журнал упреждающей записи (WAL).
+
+Раньше кеши сохранялись целиком (json.dump всего словаря с отступами) после каждого
+изменения, и при N изменениях подряд на диск записывалось O(N²) байт. PersistentStore
+хранит данные в памяти, а на диск дописывает только изменения:
+
+- {path} — снимок всех данных (компактный JSON-объект);
+- {path}.wal — журнал изменений, по строке JSON на операцию set/delete.
+
+Изменения накапливаются в буфере и дописываются в журнал пачкой: по таймеру
+(flush_interval секунд после первого изменения, если есть работающий event loop) или
+при накоплении batch_size операций. Когда журнал становится заметно длиннее самих
+данных, он сжимается: новый снимок пишется во временный файл и атомарно заменяет
+старый (os.replace), после чего журнал очищается. При сбое в любой момент данные
+восстанавливаются как «снимок + журнал» (повторное применение операций безопасно).
+
+Файл снимка совместим с прежними кешами в формате JSON-объекта, поэтому существующие
+vision_cache.json и products_cache.json подхватываются без миграции.
+
+    store = get_persistent_store("vision_cache/vision_cache.json")
+    store["key"] = {"value": 1}   # запись в журнал произойдет позже, пачкой
+    store.flush()                 # принудительная запись (например, при завершении)
+
+Журнал и снимок принадлежат одному экземпляру: два хранилища на одном пути
+затирали бы изменения друг друга при сжатии, поэтому экземпляры выдает
+get_persistent_store — по одному на путь для всего процесса.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import weakref
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("PERSISTENT_STORE_FLUSH_INTERVAL", "2"))
+DEFAULT_BATCH_SIZE = int(os.getenv("PERSISTENT_STORE_BATCH_SIZE", "100"))
+# Журнал сжимается, когда в нем больше строк, чем записей * COMPACT_RATIO + COMPACT_SLACK
+COMPACT_RATIO = 2
+COMPACT_SLACK = 100
+
+# Все открытые хранилища, чтобы записать буферы при завершении процесса
+_stores: "weakref.WeakValueDictionary[int, PersistentStore]" = weakref.WeakValueDictionary()
+
+
+class PersistentStore(MutableMapping):
+    """Словарь с отложенной записью изменений в журнал и периодическим сжатием."""
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ):
+        """
+        Инициализация хранилища.
+
+        Args:
+            path: Путь к файлу снимка (журнал хранится рядом, с суффиксом .wal)
+            flush_interval: Через сколько секунд после изменения записывать буфер
+            batch_size: При скольких накопленных изменениях записывать буфер сразу
+        """
+        self.path = path
+        self.wal_path = f"{path}.wal"
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+
+        self._data: Dict[str, Any] = {}
+        self._pending: List[str] = []
+        self._wal_lines = 0
+        self._lock = threading.RLock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._stats = {"flushes": 0, "compactions": 0, "written_bytes": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        _stores[id(self)] = self
+
+    def _load(self) -> None:
+        """Восстанавливает данные из снимка и журнала."""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке снимка {self.path}: {e}")
+            self._data = {}
+
+        try:
+            if os.path.exists(self.wal_path):
+                with open(self.wal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        self._wal_lines += 1
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Оборванная при сбое последняя строка
+                            continue
+                        if record.get("op") == "set":
+                            self._data[record["k"]] = record["v"]
+                        elif record.get("op") == "del":
+                            self._data.pop(record["k"], None)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении журнала {self.wal_path}: {e}")
+
+        logger.info(f"Загружено {len(self._data)} записей из {self.path}")
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._data[key] = value
+        self._record({"op": "set", "k": key, "v": value})
+
+    def __delitem__(self, key: str) -> None:
+        del self._data[key]
+        self._record({"op": "del", "k": key})
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def _record(self, operation: Dict[str, Any]) -> None:
+        """Добавляет операцию в буфер и планирует запись."""
+        line = json.dumps(operation, ensure_ascii=False)
+        with self._lock:
+            self._pending.append(line)
+            pending = len(self._pending)
+        if pending >= self.batch_size:
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Планирует запись буфера через flush_interval секунд (если еще не запланирована)."""
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Без event loop буфер запишется при накоплении batch_size или при завершении процесса
+            return
+        self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        """Дописывает накопленные изменения в журнал и при необходимости сжимает его."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        with self._lock:
+            if not self._pending:
+                return
+            lines, self._pending = self._pending, []
+            payload = "\n".join(lines) + "\n"
+            try:
+                with open(self.wal_path, "a", encoding="utf-8") as f:
+                    f.write(payload)
+                self._wal_lines += len(lines)
+                self._stats["flushes"] += 1
+                self._stats["written_bytes"] += len(payload.encode("utf-8"))
+            except Exception as e:
+                # Не теряем изменения: вернем их в буфер для следующей попытки
+                self._pending = lines + self._pending
+                logger.error(f"Ошибка при записи журнала {self.wal_path}: {e}")
+                return
+            if self._wal_lines > len(self._data) * COMPACT_RATIO + COMPACT_SLACK:
+                self.compact()
+
+    def compact(self) -> None:
+        """Записывает снимок всех данных с атомарной заменой файла и очищает журнал."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                # Буфер, не попавший в журнал, уже учтен в снимке
+                self._pending = []
+                # Журнал очищается только после замены снимка: при сбое между шагами
+                # он будет применен к новому снимку повторно, что безопасно
+                open(self.wal_path, "w", encoding="utf-8").close()
+                self._wal_lines = 0
+                self._stats["compactions"] += 1
+                logger.info(f"Журнал {self.wal_path} сжат в снимок ({len(self._data)} записей)")
+            except Exception as e:
+                logger.error(f"Ошибка при сжатии журнала {self.wal_path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику хранилища.
+
+        Returns:
+            Словарь с количеством записей, строк журнала, операций в буфере и счетчиками записи
+        """
+        return {
+            "entries": len(self._data),
+            "wal_lines": self._wal_lines,
+            "pending": len(self._pending),
+            **self._stats,
+        }
+
+
+# Хранилища, общие для всего приложения (по абсолютному пути снимка)
+_shared_stores: Dict[str, PersistentStore] = {}
+_shared_stores_lock = threading.Lock()
+
+
+def get_persistent_store(path: str) -> PersistentStore:
+    """
+    Возвращает общее для приложения хранилище для указанного пути.
+
+    Args:
+        path: Путь к файлу снимка
+
+    Returns:
+        Экземпляр PersistentStore
+    """
+    key = os.path.abspath(str(path))
+    with _shared_stores_lock:
+        store = _shared_stores.get(key)
+        if store is None:
+            store = PersistentStore(str(path))
+            _shared_stores[key] = store
+        return store
+
+
+def flush_all_stores() -> None:
+    """Записывает буферы всех открытых хранилищ."""
+    for store in list(_stores.values()):
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"Ошибка при записи хранилища {store.path}: {e}")
+
+
+atexit.register(flush_all_stores)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кеш результатов поиска Pinterest.
+
+Особенности:
+- ключ строится по нормализованным (запрос, пол) без учета лимита: запись хранит
+  самый длинный из полученных списков пинов, а запросы с меньшим лимитом
+  обслуживаются срезом;
+- записи устаревают через TTL и при следующем запросе загружаются заново;
+- число записей ограничено, вытесняются давно не использованные;
+- на диск пишутся только изменения (через PersistentStore: журнал с отложенной
+  записью пачками и периодическим сжатием в снимок).
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from persistent_store import get_persistent_store
+from search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.getenv("PINTEREST_CACHE_TTL", str(24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("PINTEREST_CACHE_MAX_ENTRIES", "500"))
+
+
+def make_pin_key(query: Optional[str], gender: Optional[str]) -> str:
+    """
+    Формирует ключ кеша пинов.
+
+    Args:
+        query: Поисковый запрос
+        gender: Пол
+
+    Returns:
+        Строковый ключ кеша
+    """
+    return json.dumps([normalize_query(query), (gender or "").strip().lower() or None], ensure_ascii=False)
+
+
+class PinResultCache:
+    """Кеш списков пинов по (запрос, пол) с TTL, ограничением размера и сохранением на диск."""
+
+    def __init__(
+        self,
+        path: str,
+        serialize: Callable[[Any], Dict[str, Any]],
+        deserialize: Callable[[Dict[str, Any]], Any],
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        """
+        Инициализация кеша.
+
+        Args:
+            path: Путь к файлу снимка PersistentStore
+            serialize: Преобразование пина в словарь для записи на диск
+            deserialize: Восстановление пина из словаря
+            ttl: Время жизни записи в секундах
+            max_entries: Максимальное количество записей
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._serialize = serialize
+        self._deserialize = deserialize
+        # ключ -> {"pins": [...], "requested": int, "fetched_at": float}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._store = get_persistent_store(path)
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "short": 0}
+        self._load()
+
+    def _load(self) -> None:
+        """Восстанавливает записи из хранилища, отбрасывая устаревшие."""
+        now = time.time()
+        records = sorted(
+            ((key, record) for key, record in self._store.items() if isinstance(record, dict)),
+            key=lambda item: item[1].get("fetched_at", 0)
+        )
+        for key, record in records:
+            if now - record.get("fetched_at", 0) > self.ttl:
+                continue
+            try:
+                pins = [self._deserialize(pin) for pin in record.get("pins", [])]
+            except Exception as e:
+                logger.warning(f"Пропущена поврежденная запись кеша пинов: {e}")
+                continue
+            self._entries[key] = {
+                "pins": pins,
+                "requested": record.get("requested", len(pins)),
+                "fetched_at": record["fetched_at"],
+            }
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        
+        # Удаляем из хранилища устаревшие и вытесненные записи
+        for key in [key for key in self._store if key not in self._entries]:
+            del self._store[key]
+        logger.info(f"Загружен кеш пинов: {len(self._entries)} запросов")
+
+    def _persist(self, key: str, entry: Dict[str, Any]) -> None:
+        """Сохраняет запись в хранилище."""
+        try:
+            self._store[key] = {
+                "pins": [self._serialize(pin) for pin in entry["pins"]],
+                "requested": entry["requested"],
+                "fetched_at": entry["fetched_at"],
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кеша пинов: {e}")
+
+    def get(self, query: str, gender: Optional[str], limit: int) -> Optional[List[Any]]:
+        """
+        Возвращает закешированные пины для запроса.
+
+        Args:
+            query: Поисковый запрос
+            gender: Пол
+            limit: Нужное количество пинов
+
+        Returns:
+            Не больше limit пинов или None, если записи нет, она устарела
+            или в ней меньше пинов, чем нужно (и источник мог бы дать больше)
+        """
+        key = make_pin_key(query, gender)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            self._stats["expired"] += 1
+            return None
+        # Если прошлый поиск запрашивал не меньше пинов и получил все, что было, больше взять негде
+        if len(entry["pins"]) < limit and entry["requested"] < limit:
+            self._stats["short"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry["pins"][:limit]
+
+    def put(self, query: str, gender: Optional[str], pins: List[Any], requested: int) -> None:
+        """
+        Сохраняет пины для запроса.
+
+        Более короткий список не заменяет свежую запись с большим числом пинов.
+
+        Args:
+            query: Поисковый запрос
+            gender: Пол
+            pins: Найденные пины
+            requested: Сколько пинов запрашивалось при поиске
+        """
+        if not pins:
+            return
+        key = make_pin_key(query, gender)
+        existing = self._entries.get(key)
+        fresh = existing is not None and time.time() - existing["fetched_at"] <= self.ttl
+        if fresh and len(existing["pins"]) > len(pins):
+            return
+        entry = {
+            "pins": list(pins),
+            "requested": max(requested, existing["requested"]) if fresh else requested,
+            "fetched_at": time.time(),
+        }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._persist(key, entry)
+
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._store.pop(evicted_key, None)
+
+    def touch(self, query: str, gender: Optional[str]) -> None:
+        """
+        Записывает на диск изменения пинов записи (например, результаты анализа одежды),
+        не меняя время получения.
+
+        Args:
+            query: Поисковый запрос
+            gender: Пол
+        """
+        key = make_pin_key(query, gender)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._persist(key, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кеша.
+
+        Returns:
+            Словарь с количеством записей и счетчиками попаданий/промахов
+        """
+        return {"entries": len(self._entries), **self._stats, "store": self._store.stats()}
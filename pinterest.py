@@ -5,7 +5,7 @@
 import aiohttp
 import asyncio
 import logging
-from typing import Optional, Dict, List, Any, Union
+from typing import Optional, Dict, List, Any, Union, AsyncIterator, Tuple
 from datetime import datetime
 import json
 from pathlib import Path
@@ -17,20 +17,26 @@ import re
 import hashlib
 import urllib.parse
 import random
+import threading
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 import time
 import requests
 from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
-from selenium.common.exceptions import TimeoutException
 import aiofiles
 
+from image_downloader import get_image_downloader, ImageDownloadError
+from persistent_store import get_persistent_store
+from pin_cache import PinResultCache
+from circuit_breaker import CircuitOpenError, get_circuit_breaker, STATE_OPEN
+from async_webdriver import AsyncWebDriver
+from browser_pool import BrowserPool
+from upstream_override import rewrite_url
+from keyword_classifier import OUTFIT_STYLE_CLASSIFIER
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -42,6 +48,253 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_chromedriver_path: Optional[str] = None
+_chromedriver_lock = threading.Lock()
+
+
+def _get_chromedriver_path() -> str:
+    """
+    Возвращает путь к chromedriver, скачивая его при первом вызове.
+    
+    ChromeDriverManager проверяет версию по сети, поэтому результат запоминается
+    для всех браузеров пула.
+    
+    Returns:
+        Путь к исполняемому файлу chromedriver
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            _chromedriver_path = ChromeDriverManager().install()
+        return _chromedriver_path
+
+# Общий срок ожидания пинов на странице поиска и длительность одного шага прокрутки, секунды
+PIN_WAIT_DEADLINE = float(os.getenv("PINTEREST_PIN_WAIT_DEADLINE", "20"))
+PIN_WAIT_STEP = 1.5
+
+# Скрипт ожидания пинов: считает пины с загруженным изображением и, если их меньше limit,
+# прокручивает ленту и ждет изменений DOM (но не дольше stepMs)
+_WAIT_FOR_PINS_SCRIPT = """
+const limit = arguments[0];
+const stepMs = arguments[1];
+const done = arguments[arguments.length - 1];
+
+function countReady() {
+    let pins = document.querySelectorAll("div[data-test-id='pin']");
+    if (!pins.length) {
+        pins = document.querySelectorAll("div[data-grid-item]");
+    }
+    let ready = 0;
+    for (const pin of pins) {
+        const img = pin.querySelector("img");
+        const src = img && (img.currentSrc || img.src);
+        if (src && src.startsWith("http")) {
+            ready++;
+        }
+    }
+    return ready;
+}
+
+let ready = countReady();
+if (ready >= limit || !document.body) {
+    done(ready);
+    return;
+}
+
+let finished = false;
+let timer = null;
+const observer = new MutationObserver(() => {
+    if (countReady() >= limit) {
+        finish();
+    }
+});
+function finish() {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(countReady());
+}
+observer.observe(document.body, {
+    childList: true,
+    subtree: true,
+    attributes: true,
+    attributeFilter: ["src", "srcset"]
+});
+window.scrollTo(0, document.body.scrollHeight);
+timer = setTimeout(finish, stepMs);
+"""
+
+# Способ получения пинов: auto - сначала без браузера, затем Selenium; light - только без браузера;
+# browser - только Selenium
+PINTEREST_FETCH_MODE = os.getenv("PINTEREST_FETCH_MODE", "auto").lower()
+LIGHT_FETCH_TIMEOUT = 15
+LIGHT_FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+}
+# id тегов script, в которые Pinterest встраивает данные страницы
+EMBEDDED_DATA_SCRIPT_IDS = ("__PWS_DATA__", "__PWS_INITIAL_PROPS__", "initial-state")
+
+
+def _best_embedded_image_url(images: Dict[str, Any]) -> Optional[str]:
+    """
+    Выбирает URL изображения наилучшего качества из поля images пина.
+    
+    Args:
+        images: Словарь вида {"236x": {"url": ..., "width": ...}, "orig": {...}}
+        
+    Returns:
+        URL изображения или None
+    """
+    best_url = None
+    best_width = -1
+    for key, variant in images.items():
+        if not isinstance(variant, dict) or not str(variant.get("url", "")).startswith("http"):
+            continue
+        if key == "orig":
+            return variant["url"]
+        width = variant.get("width") or int("".join(filter(str.isdigit, key)) or 0)
+        if width > best_width:
+            best_url = variant["url"]
+            best_width = width
+    return best_url
+
+
+def parse_embedded_pins(html: str, limit: int) -> List[Dict[str, Optional[str]]]:
+    """
+    Извлекает пины из JSON, встроенного в HTML страницы поиска Pinterest.
+    
+    Обходит все JSON-скрипты страницы и собирает объекты, похожие на пины
+    (есть id и словарь images с URL изображений).
+    
+    Args:
+        html: HTML страницы поиска
+        limit: Максимальное количество пинов
+        
+    Returns:
+        Список словарей с ключами image_url, title, source_url
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    # Сначала известные скрипты с данными страницы, затем остальные JSON-скрипты
+    scripts = [soup.find("script", id=script_id) for script_id in EMBEDDED_DATA_SCRIPT_IDS]
+    scripts += soup.find_all("script", attrs={"type": "application/json"})
+    
+    results = []
+    seen_ids = set()
+    parsed_scripts = set()
+    for script in scripts:
+        if script is None or not script.string or id(script) in parsed_scripts:
+            continue
+        parsed_scripts.add(id(script))
+        try:
+            data = json.loads(script.string)
+        except ValueError:
+            continue
+        
+        stack = [data]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+                continue
+            if not isinstance(node, dict):
+                continue
+            images = node.get("images")
+            pin_id = node.get("id")
+            if isinstance(images, dict) and pin_id and str(pin_id) not in seen_ids:
+                image_url = _best_embedded_image_url(images)
+                if image_url:
+                    seen_ids.add(str(pin_id))
+                    results.append({
+                        "image_url": image_url,
+                        "title": node.get("grid_title") or node.get("title") or None,
+                        "source_url": f"https://www.pinterest.com/pin/{pin_id}/",
+                    })
+                    continue
+            stack.extend(reversed(list(node.values())))
+        if len(results) >= limit:
+            break
+    return results
+
+# Скрипт извлечения пинов: для первых limit пинов с изображением возвращает
+# [{image_url, title, source_url}], выбирая изображение наилучшего качества
+_EXTRACT_PINS_SCRIPT = """
+const limit = arguments[0];
+
+function bestImageUrl(img) {
+    // Оригинальное или большое изображение, если страница их указывает
+    for (const attr of ["data-src-original", "data-big-pin"]) {
+        const value = img.getAttribute(attr);
+        if (value && value.startsWith("http")) {
+            return value;
+        }
+    }
+    // Самый большой вариант из srcset
+    const srcset = img.getAttribute("srcset");
+    if (srcset) {
+        let best = null;
+        let bestSize = -1;
+        for (const part of srcset.split(",")) {
+            const pieces = part.trim().split(/\\s+/);
+            if (pieces.length < 2) {
+                continue;
+            }
+            const size = parseInt(pieces[1].replace(/\\D/g, ""), 10);
+            if (!isNaN(size) && size > bestSize) {
+                best = pieces[0];
+                bestSize = size;
+            }
+        }
+        if (best) {
+            return best;
+        }
+    }
+    // Обычный src с заменой размера на оригинал
+    const src = img.getAttribute("src");
+    if (src && src.startsWith("http")) {
+        return src.replace(/\\/\\d+x\\/|\\/\\d+x\\d+\\//, "/originals/");
+    }
+    return null;
+}
+
+let pins = document.querySelectorAll("div[data-test-id='pin']");
+if (!pins.length) {
+    pins = document.querySelectorAll("div[data-grid-item]");
+}
+
+const results = [];
+for (const pin of pins) {
+    if (results.length >= limit) {
+        break;
+    }
+    const img = pin.querySelector("img");
+    let imageUrl = img ? bestImageUrl(img) : null;
+    if (!imageUrl) {
+        const withSrc = pin.querySelector("[src]");
+        imageUrl = withSrc ? withSrc.getAttribute("src") : null;
+    }
+    if (!imageUrl) {
+        continue;
+    }
+    const titleElement = pin.querySelector("div[title]");
+    const link = pin.querySelector("a");
+    const href = link ? link.href : null;
+    results.push({
+        image_url: imageUrl,
+        title: titleElement ? titleElement.getAttribute("title") : null,
+        source_url: href && href.includes("pinterest.com/pin/") ? href : null
+    });
+}
+return results;
+"""
+
+# Тайм-аут команды открытия страницы: page load timeout драйвера (60 с) плюс запас
+PAGE_LOAD_COMMAND_TIMEOUT = 75
+
 # Класс для определения одежды на изображении
 class ImageAnalyzer:
     """Класс для анализа изображений и определения одежды."""
@@ -181,36 +434,18 @@ class ImageAnalyzer:
         self.openai_client = AsyncOpenAI(api_key=openai_api_key)
         self._cache_dir = Path("vision_cache")
         self._cache_dir.mkdir(exist_ok=True)
-        self._cache = {}
         self._load_cache()
         self._api_available = True  # Флаг доступности API
         
         logger.info("Анализатор изображений инициализирован")
     
     def _load_cache(self) -> None:
-        """Загружает кеш из файла."""
-        try:
-            cache_file = self._cache_dir / "vision_cache.json"
-            if cache_file.exists():
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    self._cache = json.load(f)
-                logger.info(f"Загружен кеш с {len(self._cache)} записями")
-            else:
-                self._cache = {}
-                logger.info("Создан новый кеш для анализа изображений")
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке кеша анализа изображений: {e}")
-            self._cache = {}
+        """Загружает кеш анализа изображений (изменения дописываются в журнал пачками)."""
+        self._cache = get_persistent_store(str(self._cache_dir / "vision_cache.json"))
     
     def _save_cache(self) -> None:
-        """Сохраняет кеш в файл."""
-        try:
-            cache_file = self._cache_dir / "vision_cache.json"
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(self._cache, f, ensure_ascii=False, indent=2)
-            logger.info("Кеш анализа изображений сохранен")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении кеша анализа изображений: {e}")
+        """Немедленно записывает накопленные изменения кеша на диск."""
+        self._cache.flush()
     
     def _get_url_hash(self, url: str) -> str:
         """Генерирует хеш URL."""
@@ -428,21 +663,20 @@ class ImageAnalyzer:
             # Всегда используем локальный метод анализа, вместо OpenAI API
             logger.info(f"Использую локальный метод анализа для {image_url}")
             
-            # Анализируем контекст запроса для определения категории одежды
-            query_lower = query.lower() if query else ""
-            
-            # Определяем ключевые слова в запросе
-            has_office = any(word in query_lower for word in ["офисный", "деловой", "формальный", "бизнес", "работа", "офис"])
-            has_casual = any(word in query_lower for word in ["повседневный", "casual", "ежедневный", "обычный"])
-            has_sport = any(word in query_lower for word in ["спортивный", "тренировка", "фитнес", "спорт"])
-            has_evening = any(word in query_lower for word in ["вечерний", "праздничный", "нарядный", "выход"])
-            has_summer = any(word in query_lower for word in ["летний", "лето", "пляж", "жара"])
-            has_winter = any(word in query_lower for word in ["зимний", "зима", "холод", "мороз"])
+            # Анализируем контекст запроса для определения категории одежды:
+            # все группы ключевых слов (стиль, сезон, пол) размечаются за один проход
+            labels = OUTFIT_STYLE_CLASSIFIER.classify(query)
+            has_office = "office" in labels
+            has_casual = "casual" in labels
+            has_sport = "sport" in labels
+            has_evening = "evening" in labels
+            has_summer = "summer" in labels
+            has_winter = "winter" in labels
             
             # Определяем пол из запроса, если он не был явно указан
             if not gender:
-                has_male = any(word in query_lower for word in ["мужской", "мужчина", "мужские", "мужское", "мужская", "муж"])
-                has_female = any(word in query_lower for word in ["женский", "женщина", "женские", "женское", "женская", "жен"])
+                has_male = "male" in labels
+                has_female = "female" in labels
                 
                 if has_male and not has_female:
                     gender = "мужской"
@@ -481,9 +715,8 @@ class ImageAnalyzer:
             
             result = self._generate_fallback_clothing_items(category or query, gender)
             
-            # Сохраняем результат в кеш
+            # Сохраняем результат в кеш (на диск запишется отложенно, вместе с другими изменениями)
             self._cache[url_hash] = result
-            self._save_cache()
             
             # Определяем количество предметов
             count = len(result)
@@ -546,7 +779,11 @@ class PinterestAPI:
             openai_api_key: API ключ OpenAI для анализа изображений
         """
         self._session: Optional[aiohttp.ClientSession] = None
-        self._driver: Optional[webdriver.Chrome] = None
+        self._pool: Optional[BrowserPool] = None
+        self._fetch_stats: Dict[str, Dict[str, float]] = {
+            path: {"attempts": 0, "successes": 0, "failures": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+            for path in ("light", "browser")
+        }
         self._download_dir = Path(download_dir)
         self._download_dir.mkdir(exist_ok=True)
         self._cache_dir = Path("pinterest_cache")
@@ -559,142 +796,158 @@ class PinterestAPI:
         self._load_cache()
         logger.info("Pinterest API клиент инициализирован")
     
+    @property
+    def photo_dir(self) -> str:
+        """Директория для сохранения изображений."""
+        return str(self._download_dir)
+    
     async def _init_selenium(self):
-        """Инициализация Selenium WebDriver."""
-        if self._driver is None:
-            try:
-                chrome_options = Options()
-                chrome_options.add_argument("--headless=new")
-                chrome_options.add_argument("--no-sandbox")
-                chrome_options.add_argument("--disable-dev-shm-usage")
-                chrome_options.add_argument("--disable-gpu")
-                chrome_options.add_argument("--window-size=1920,1080")
-                chrome_options.add_argument("--remote-debugging-port=9222")
-                chrome_options.add_argument("--disable-extensions")
-                chrome_options.add_argument("--disable-notifications")
-                chrome_options.add_argument("--disable-popup-blocking")
-                chrome_options.add_argument('--ignore-certificate-errors')
-                chrome_options.add_argument('--allow-running-insecure-content')
-                chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-                
-                # Список возможных путей к Chrome
-                chrome_paths = [
-                    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-                    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-                    r"C:\Users\{}\AppData\Local\Google\Chrome\Application\chrome.exe".format(os.getenv('USERNAME')),
-                    r"C:\Program Files\Google\Chrome Beta\Application\chrome.exe",
-                    r"C:\Program Files\Google\Chrome Dev\Application\chrome.exe",
-                ]
-                
-                # Поиск Chrome в системе
-                chrome_binary = None
-                for path in chrome_paths:
-                    if os.path.exists(path):
-                        chrome_binary = path
-                        logger.info(f"Найден Chrome по пути: {path}")
-                        break
-                
-                if not chrome_binary:
-                    # Попытка найти Chrome через реестр Windows
-                    try:
-                        import winreg
-                        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\App Paths\chrome.exe") as key:
-                            chrome_binary = winreg.QueryValue(key, None)
-                            logger.info(f"Найден Chrome через реестр: {chrome_binary}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось найти Chrome через реестр: {e}")
-                
-                if not chrome_binary:
-                    # Попытка автоматической установки Chrome
-                    try:
-                        logger.info("Попытка автоматической установки Chrome...")
-                        import subprocess
-                        import tempfile
-                        import urllib.request
-                        
-                        # URL для скачивания Chrome
-                        chrome_url = "https://dl.google.com/chrome/install/ChromeStandaloneSetup64.exe"
-                        
-                        # Создаем временную директорию
-                        with tempfile.TemporaryDirectory() as temp_dir:
-                            installer_path = os.path.join(temp_dir, "chrome_installer.exe")
-                            
-                            # Скачиваем установщик
-                            logger.info("Скачивание установщика Chrome...")
-                            urllib.request.urlretrieve(chrome_url, installer_path)
-                            
-                            # Запускаем установку
-                            logger.info("Запуск установки Chrome...")
-                            subprocess.run([installer_path, "/silent", "/install"], 
-                                        check=True, 
-                                        capture_output=True)
-                            
-                            logger.info("Chrome успешно установлен")
-                            
-                            # Проверяем стандартный путь установки
-                            chrome_binary = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-                            if not os.path.exists(chrome_binary):
-                                chrome_binary = r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe"
-                            
-                    except Exception as e:
-                        logger.error(f"Ошибка при установке Chrome: {e}")
-                        raise Exception("Не удалось установить Chrome. Пожалуйста, установите его вручную.")
-                
-                if chrome_binary and os.path.exists(chrome_binary):
-                    chrome_options.binary_location = chrome_binary
-                else:
-                    logger.error("Chrome не найден и не может быть установлен")
-                    raise Exception("Chrome не найден и не может быть установлен. Пожалуйста, установите Chrome вручную.")
-                
-                # Создаем сервис с увеличенным таймаутом
-                service = Service(
-                    ChromeDriverManager().install(),
-                    service_args=['--verbose'],
-                    log_path='chromedriver.log'
-                )
-                
-                # Создаем драйвер с увеличенным таймаутом
-                self._driver = webdriver.Chrome(
-                    service=service,
-                    options=chrome_options
-                )
-                
-                # Устанавливаем таймауты
-                self._driver.set_page_load_timeout(60)
-                self._driver.implicitly_wait(20)
-                
-                logger.info("Selenium WebDriver успешно инициализирован")
-            except Exception as e:
-                logger.error(f"Ошибка при инициализации Selenium: {e}")
-                if self._driver:
-                    self._driver.quit()
-                    self._driver = None
-                raise
+        """
+        Создает пул браузеров для Selenium.
+        
+        Сами браузеры запускаются при прогреве (warm_up) или по первому запросу.
+        """
+        if self._pool is None:
+            self._pool = BrowserPool(self._create_chrome_driver, name="pinterest")
     
-    def _load_cache(self) -> None:
-        """Загружает кеш из файла."""
+    async def warm_up(self) -> None:
+        """Заранее запускает браузеры пула, чтобы первый поиск не ждал старта Chrome."""
+        await self._init_selenium()
+        await self._pool.start()
+    
+    def browser_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает состояние пула браузеров.
+        
+        Returns:
+            Словарь со статистикой или None, если пул еще не создан
+        """
+        return self._pool.stats() if self._pool else None
+    
+    def _create_chrome_driver(self) -> webdriver.Chrome:
+        """
+        Создает Chrome WebDriver (блокирующий вызов, выполняется в потоке AsyncWebDriver).
+        
+        Returns:
+            Экземпляр webdriver.Chrome
+        """
+        driver = None
         try:
-            cache_file = self._cache_dir / "pins_cache.json"
-            if cache_file.exists():
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    self._cache = json.load(f)
-                logger.info(f"Загружен кеш с {len(self._cache)} пинами")
+            chrome_options = Options()
+            chrome_options.add_argument("--headless=new")
+            chrome_options.add_argument("--no-sandbox")
+            chrome_options.add_argument("--disable-dev-shm-usage")
+            chrome_options.add_argument("--disable-gpu")
+            chrome_options.add_argument("--window-size=1920,1080")
+            chrome_options.add_argument("--disable-extensions")
+            chrome_options.add_argument("--disable-notifications")
+            chrome_options.add_argument("--disable-popup-blocking")
+            chrome_options.add_argument('--ignore-certificate-errors')
+            chrome_options.add_argument('--allow-running-insecure-content')
+            chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+            
+            # Список возможных путей к Chrome
+            chrome_paths = [
+                r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+                r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+                r"C:\Users\{}\AppData\Local\Google\Chrome\Application\chrome.exe".format(os.getenv('USERNAME')),
+                r"C:\Program Files\Google\Chrome Beta\Application\chrome.exe",
+                r"C:\Program Files\Google\Chrome Dev\Application\chrome.exe",
+            ]
+            
+            # Поиск Chrome в системе
+            chrome_binary = None
+            for path in chrome_paths:
+                if os.path.exists(path):
+                    chrome_binary = path
+                    logger.info(f"Найден Chrome по пути: {path}")
+                    break
+            
+            if not chrome_binary:
+                # Попытка найти Chrome через реестр Windows
+                try:
+                    import winreg
+                    with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\App Paths\chrome.exe") as key:
+                        chrome_binary = winreg.QueryValue(key, None)
+                        logger.info(f"Найден Chrome через реестр: {chrome_binary}")
+                except Exception as e:
+                    logger.warning(f"Не удалось найти Chrome через реестр: {e}")
+            
+            if not chrome_binary:
+                # Попытка автоматической установки Chrome
+                try:
+                    logger.info("Попытка автоматической установки Chrome...")
+                    import subprocess
+                    import tempfile
+                    import urllib.request
+                    
+                    # URL для скачивания Chrome
+                    chrome_url = "https://dl.google.com/chrome/install/ChromeStandaloneSetup64.exe"
+                    
+                    # Создаем временную директорию
+                    with tempfile.TemporaryDirectory() as temp_dir:
+                        installer_path = os.path.join(temp_dir, "chrome_installer.exe")
+                        
+                        # Скачиваем установщик
+                        logger.info("Скачивание установщика Chrome...")
+                        urllib.request.urlretrieve(chrome_url, installer_path)
+                        
+                        # Запускаем установку
+                        logger.info("Запуск установки Chrome...")
+                        subprocess.run([installer_path, "/silent", "/install"], 
+                                    check=True, 
+                                    capture_output=True)
+                        
+                        logger.info("Chrome успешно установлен")
+                        
+                        # Проверяем стандартный путь установки
+                        chrome_binary = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
+                        if not os.path.exists(chrome_binary):
+                            chrome_binary = r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe"
+                        
+                except Exception as e:
+                    logger.error(f"Ошибка при установке Chrome: {e}")
+                    raise Exception("Не удалось установить Chrome. Пожалуйста, установите его вручную.")
+            
+            if chrome_binary and os.path.exists(chrome_binary):
+                chrome_options.binary_location = chrome_binary
             else:
-                self._cache = {}
-                logger.info("Создан новый кеш")
+                logger.error("Chrome не найден и не может быть установлен")
+                raise Exception("Chrome не найден и не может быть установлен. Пожалуйста, установите Chrome вручную.")
+            
+            # Создаем сервис с увеличенным таймаутом
+            service = Service(
+                _get_chromedriver_path(),
+                service_args=['--verbose'],
+                log_path='chromedriver.log'
+            )
+            
+            # Создаем драйвер с увеличенным таймаутом
+            driver = webdriver.Chrome(
+                service=service,
+                options=chrome_options
+            )
+            
+            # Устанавливаем таймауты
+            driver.set_page_load_timeout(60)
+            driver.set_script_timeout(30)
+            driver.implicitly_wait(20)
+            
+            logger.info("Selenium WebDriver успешно инициализирован")
+            return driver
         except Exception as e:
-            logger.error(f"Ошибка при загрузке кеша: {e}")
-            self._cache = {}
+            logger.error(f"Ошибка при создании Chrome WebDriver: {e}")
+            if driver:
+                driver.quit()
+            raise
     
-    def _save_cache(self) -> None:
-        """Сохраняет кеш в файл."""
-        try:
-            cache_file = self._cache_dir / "pins_cache.json"
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(self._cache, f, ensure_ascii=False, indent=2)
-            logger.info("Кеш сохранен")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении кеша: {e}")
+    def _load_cache(self) -> None:
+        """Загружает кеш результатов поиска (pin_results.json, изменения дописываются в журнал пачками)."""
+        self._pin_cache = PinResultCache(
+            str(self._cache_dir / "pin_results.json"),
+            serialize=lambda pin: pin.dict(),
+            deserialize=lambda data: PinInfo(**data)
+        )
     
     def _get_file_hash(self, url: str) -> str:
         """
@@ -716,7 +969,7 @@ class PinterestAPI:
     
     async def _download_image(self, url: str) -> Optional[str]:
         """
-        Скачивает изображение и сохраняет его локально.
+        Скачивает изображение и сохраняет его локально через общий загрузчик изображений.
         
         Args:
             url: URL изображения для скачивания
@@ -724,157 +977,455 @@ class PinterestAPI:
         Returns:
             Путь к сохраненному файлу или None при ошибке
         """
+        downloader = get_image_downloader(str(self._download_dir))
+        
+        # Добавляем случайный User-Agent и Referer для обхода блокировки
+        headers = {
+            'User-Agent': random.choice([
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+                'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
+                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:123.0) Gecko/20100101 Firefox/123.0',
+            ]),
+            'Referer': 'https://www.pinterest.com/',
+            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Sec-Fetch-Dest': 'image',
+            'Sec-Fetch-Mode': 'no-cors',
+            'Sec-Fetch-Site': 'cross-site',
+        }
+        
         try:
-            # Проверяем кеш
-            file_hash = self._get_file_hash(url)
-            cached_path = os.path.join(self._download_dir, f"{file_hash}.jpg")
-            
-            # Если файл уже существует, возвращаем путь
-            if os.path.exists(cached_path):
-                return cached_path
+            return await downloader.download(url, headers=headers, raise_errors=True)
+        except ImageDownloadError as e:
+            if e.status != 403:
+                logger.error(f"Ошибка при скачивании изображения: {e}")
+                return None
+            logger.error(f"Ошибка при скачивании изображения: {e.status}")
+        
+        # При ошибке 403 пробуем тот же пин в других размерах: параллельно, берем первый успешный
+        alt_urls = []
+        for size in ['236x', '474x', '736x', 'orig']:
+            if size in url:
+                alt_urls = [url.replace(size, new_size) for new_size in ['orig', '736x', '564x', '474x', '236x'] if new_size != size]
+                break
+        if alt_urls:
+            logger.info(f"Пробуем {len(alt_urls)} альтернативных размеров изображения: {url}")
+            path = await downloader.download_first(alt_urls, headers=headers)
+            if path:
+                return path
+        
+        # Пробуем с другими заголовками (негативный кеш для исходного URL сбрасываем)
+        alt_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+            'Referer': 'https://www.google.com/',
+        }
+        downloader.forget_failure(url)
+        path = await downloader.download(url, headers=alt_headers)
+        if path:
+            logger.info(f"Изображение сохранено с альтернативными заголовками: {path}")
+        return path
+
+    async def _wait_for_pins(self, driver: AsyncWebDriver, limit: int) -> int:
+        """
+        Ждет появления limit пинов с загруженными изображениями.
+        
+        Каждый шаг прокручивает ленту и ждет изменений DOM через MutationObserver,
+        поэтому ожидание заканчивается сразу, как только пинов достаточно.
+        
+        Args:
+            driver: Браузер, выданный пулом
+            limit: Нужное количество пинов
             
-            # Если сессия не инициализирована, создаем ее
-            if not hasattr(self, '_session') or self._session is None:
-                await self._init_session()
+        Returns:
+            Количество готовых пинов на момент выхода (0, если пинов нет)
+        """
+        deadline = time.monotonic() + PIN_WAIT_DEADLINE
+        ready = 0
+        steps = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            step_ms = int(min(PIN_WAIT_STEP, remaining) * 1000)
+            try:
+                ready = await driver.execute_async_script(
+                    _WAIT_FOR_PINS_SCRIPT, limit, step_ms, timeout=step_ms / 1000 + 10
+                ) or 0
+            except Exception as e:
+                logger.error(f"Ошибка при ожидании пинов: {e}")
+                break
+            steps += 1
+            if ready >= limit:
+                break
+        
+        logger.info(f"Готово пинов: {ready} из {limit} (шагов прокрутки: {steps})")
+        return ready
+    
+    async def _load_search_page(
+        self,
+        driver: AsyncWebDriver,
+        search_url: str,
+        limit: int,
+        breaker: Any
+    ) -> Optional[List[Dict[str, Optional[str]]]]:
+        """
+        Открывает страницу поиска в браузере из пула и извлекает данные пинов.
+        
+        Args:
+            driver: Браузер, выданный пулом
+            search_url: URL страницы поиска
+            limit: Максимальное количество пинов
+            breaker: Circuit breaker хоста Pinterest
             
-            # Создаем каталог, если он не существует
-            os.makedirs(self._download_dir, exist_ok=True)
+        Returns:
+            Список словарей с данными пинов или None, если страницу загрузить не удалось
             
-            # Добавляем случайный User-Agent и Referer для обхода блокировки
-            headers = {
-                'User-Agent': random.choice([
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
-                    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:123.0) Gecko/20100101 Firefox/123.0',
-                ]),
-                'Referer': 'https://www.pinterest.com/',
-                'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Sec-Fetch-Dest': 'image',
-                'Sec-Fetch-Mode': 'no-cors',
-                'Sec-Fetch-Site': 'cross-site',
+        Raises:
+            CircuitOpenError: Если выключатель Pinterest разомкнут
+        """
+        # Загрузка страницы (вместе с повтором) учитывается выключателем как один запрос
+        with breaker.protect() as outcome:
+            # Увеличиваем максимальное время ожидания страницы до 60 секунд
+            try:
+                # Команды Selenium выполняются в потоке драйвера и не блокируют event loop
+                await driver.set_page_load_timeout(60)  # 60 секунд
+                await driver.get(rewrite_url(search_url), timeout=PAGE_LOAD_COMMAND_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке страницы поиска: {e}")
+                # Пробуем еще раз: браузер уже запущен, ждать перед повтором незачем
+                try:
+                    await driver.get(rewrite_url(search_url), timeout=PAGE_LOAD_COMMAND_TIMEOUT)
+                except Exception as e:
+                    logger.error(f"Повторная ошибка при загрузке страницы: {e}")
+                    outcome.fail()
+                    return None
+        
+        # Ждем, пока на странице появятся limit пинов с изображениями, подгружая ленту прокруткой
+        logger.info("Ждем загрузку пинов...")
+        ready = await self._wait_for_pins(driver, limit)
+        if ready == 0:
+            logger.error("Не удалось дождаться пинов с изображениями на странице поиска")
+            return None
+        
+        # Ищем элементы пинов: все данные извлекаются одним скриптом за один запрос к chromedriver
+        logger.info("Ищем изображения на странице")
+        pin_data = await driver.execute_script(_EXTRACT_PINS_SCRIPT, limit) or []
+        logger.info(f"Извлечено {len(pin_data)} пинов с изображениями")
+        return pin_data
+    
+    def _record_fetch(self, path: str, success: bool, started_at: float) -> None:
+        """
+        Учитывает попытку получения пинов одним из способов.
+        
+        Args:
+            path: Способ получения ("light" или "browser")
+            success: Удалось ли получить пины
+            started_at: Время начала попытки (time.monotonic())
+        """
+        stats = self._fetch_stats[path]
+        latency_ms = (time.monotonic() - started_at) * 1000
+        stats["attempts"] += 1
+        stats["successes" if success else "failures"] += 1
+        stats["total_latency_ms"] += latency_ms
+        stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+    
+    def fetch_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Возвращает статистику способов получения пинов.
+        
+        Returns:
+            Для каждого способа: число попыток, успехов, неудач, доля успехов и задержки в мс
+        """
+        result = {}
+        for path, stats in self._fetch_stats.items():
+            attempts = stats["attempts"]
+            result[path] = {
+                "attempts": attempts,
+                "successes": stats["successes"],
+                "failures": stats["failures"],
+                "success_rate": round(stats["successes"] / attempts, 3) if attempts else 0.0,
+                "avg_latency_ms": round(stats["total_latency_ms"] / attempts, 1) if attempts else 0.0,
+                "max_latency_ms": round(stats["max_latency_ms"], 1),
             }
+        return result
+    
+    async def _fetch_pins_light(self, search_url: str, limit: int, breaker: Any) -> Optional[List[Dict[str, Optional[str]]]]:
+        """
+        Получает пины без браузера: из JSON, встроенного в HTML страницы поиска.
+        
+        Args:
+            search_url: URL страницы поиска
+            limit: Максимальное количество пинов
+            breaker: Circuit breaker хоста Pinterest
             
-            # Скачиваем файл
-            async with self._session.get(url, headers=headers, timeout=30) as response:
-                if response.status != 200:
-                    # Если получили ошибку 403, пробуем альтернативный URL
-                    if response.status == 403:
-                        logger.error(f"Ошибка при скачивании изображения: {response.status}")
-                        
-                        # Пробуем модифицированный URL
-                        modified_url = url
-                        # Заменяем параметры размера в URL
-                        for size in ['236x', '474x', '736x', 'orig']:
-                            if size in modified_url:
-                                # Пробуем разные размеры
-                                for new_size in ['orig', '736x', '564x', '474x', '236x']:
-                                    if new_size != size:
-                                        alt_url = modified_url.replace(size, new_size)
-                                        logger.info(f"Пробуем альтернативный URL с размером {new_size}: {alt_url}")
-                                        try:
-                                            async with self._session.get(alt_url, headers=headers, timeout=30) as alt_response:
-                                                if alt_response.status == 200:
-                                                    content = await alt_response.read()
-                                                    async with aiofiles.open(cached_path, 'wb') as f:
-                                                        await f.write(content)
-                                                    logger.info(f"Изображение сохранено: {cached_path}")
-                                                    return cached_path
-                                        except Exception as e:
-                                            logger.error(f"Ошибка при скачивании альтернативного URL: {e}")
-                        
-                        # Пробуем с другими заголовками
-                        try:
-                            alt_headers = {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-                                'Referer': 'https://www.google.com/',
-                            }
-                            async with self._session.get(url, headers=alt_headers, timeout=30) as alt_response:
-                                if alt_response.status == 200:
-                                    content = await alt_response.read()
-                                    async with aiofiles.open(cached_path, 'wb') as f:
-                                        await f.write(content)
-                                    logger.info(f"Изображение сохранено с альтернативными заголовками: {cached_path}")
-                                    return cached_path
-                        except Exception as e:
-                            logger.error(f"Ошибка при скачивании с альтернативными заголовками: {e}")
-                        
-                        return None
-                    else:
-                        logger.error(f"Ошибка при скачивании изображения: {response.status}")
+        Returns:
+            Список словарей с данными пинов или None, если страницу не удалось разобрать
+            
+        Raises:
+            CircuitOpenError: Если выключатель Pinterest разомкнут
+        """
+        await self._init_session()
+        try:
+            with breaker.protect() as outcome:
+                async with self._session.get(
+                    search_url,
+                    headers=LIGHT_FETCH_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=LIGHT_FETCH_TIMEOUT)
+                ) as response:
+                    outcome.status(response.status)
+                    if response.status != 200:
+                        logger.warning(f"Страница поиска Pinterest вернула статус {response.status}")
                         return None
-                
-                content = await response.read()
-                async with aiofiles.open(cached_path, 'wb') as f:
-                    await f.write(content)
-                
-                logger.info(f"Изображение сохранено: {cached_path}")
-                return cached_path
-        
+                    html = await response.text()
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при скачивании изображения: {e}")
+            logger.warning(f"Не удалось загрузить страницу поиска без браузера: {e}")
             return None
-
-    def _get_best_image_url(self, img_element) -> Optional[str]:
+        
+        # Разбор HTML занимает заметное время, выполняем его вне event loop
+        pin_data = await asyncio.to_thread(parse_embedded_pins, html, limit)
+        if not pin_data:
+            logger.info("На странице поиска не найдены встроенные данные пинов")
+            return None
+        return pin_data
+    
+    async def _fetch_pins_browser(self, search_url: str, limit: int, breaker: Any) -> Optional[List[Dict[str, Optional[str]]]]:
         """
-        Получает URL изображения наилучшего качества.
+        Получает пины через браузер из пула.
         
         Args:
-            img_element: Элемент изображения
+            search_url: URL страницы поиска
+            limit: Максимальное количество пинов
+            breaker: Circuit breaker хоста Pinterest
             
         Returns:
-            URL изображения наилучшего качества или None
+            Список словарей с данными пинов или None, если страницу загрузить не удалось
+            
+        Raises:
+            CircuitOpenError: Если выключатель Pinterest разомкнут
         """
-        try:
-            # Пробуем получить оригинальное изображение через data-src-original
-            image_url = img_element.get_attribute('data-src-original')
-            if image_url and image_url.startswith('http'):
-                return image_url
+        await self._init_selenium()
+        async with self._pool.acquire() as driver:
+            return await self._load_search_page(driver, search_url, limit, breaker)
+    
+    async def _fetch_pin_data(self, search_url: str, limit: int, breaker: Any) -> Optional[List[Dict[str, Optional[str]]]]:
+        """
+        Получает данные пинов: сначала без браузера, затем через Selenium.
+        
+        Браузер используется, только если легкий способ не вернул limit пинов
+        (или отключен через PINTEREST_FETCH_MODE).
+        
+        Args:
+            search_url: URL страницы поиска
+            limit: Максимальное количество пинов
+            breaker: Circuit breaker хоста Pinterest
             
-            # Пробуем получить большое изображение через data-big-pin
-            image_url = img_element.get_attribute('data-big-pin')
-            if image_url and image_url.startswith('http'):
-                return image_url
-                
-            # Пробуем получить изображение через srcset
-            srcset = img_element.get_attribute('srcset')
-            if srcset:
-                # Парсим srcset и находим URL с максимальным размером
-                urls_with_sizes = []
-                for part in srcset.split(','):
-                    part = part.strip()
-                    if not part:
-                        continue
-                    
-                    # Разбиваем на URL и размер
-                    parts = part.split(' ')
-                    if len(parts) >= 2:
-                        url = parts[0]
-                        # Извлекаем числовое значение размера
-                        size = ''.join(filter(str.isdigit, parts[1]))
-                        if size:
-                            urls_with_sizes.append((url, int(size)))
-                
-                # Сортируем по размеру и берем самый большой
-                if urls_with_sizes:
-                    urls_with_sizes.sort(key=lambda x: x[1], reverse=True)
-                    return urls_with_sizes[0][0]
+        Returns:
+            Список словарей с данными пинов или None
+        """
+        light_data = None
+        if PINTEREST_FETCH_MODE != "browser":
+            started_at = time.monotonic()
+            try:
+                light_data = await self._fetch_pins_light(search_url, limit, breaker)
+            except CircuitOpenError as e:
+                logger.warning(f"Поиск в Pinterest пропущен: {e}")
+                return None
+            self._record_fetch("light", bool(light_data) and len(light_data) >= limit, started_at)
+            if light_data and len(light_data) >= limit:
+                logger.info(f"Пины получены без браузера: {len(light_data)}")
+                return light_data
+        
+        if PINTEREST_FETCH_MODE == "light":
+            return light_data
+        
+        started_at = time.monotonic()
+        try:
+            browser_data = await self._fetch_pins_browser(search_url, limit, breaker)
+        except CircuitOpenError as e:
+            # Выключатель разомкнулся после неудачи легкого способа: браузер тоже не поможет
+            logger.warning(f"Загрузка Pinterest через браузер пропущена: {e}")
+            return light_data
+        except Exception as e:
+            logger.error(f"Ошибка при получении пинов через браузер: {e}")
+            browser_data = None
+        self._record_fetch("browser", bool(browser_data), started_at)
+        
+        # Если браузер нашел меньше, чем легкий способ, используем результат легкого способа
+        if light_data and len(light_data) > len(browser_data or []):
+            return light_data
+        return browser_data
+    
+    async def _build_pin(self, data: Dict[str, Optional[str]], download: bool) -> PinInfo:
+        """
+        Создает PinInfo по извлеченным данным, при необходимости скачивая изображение.
+        
+        Args:
+            data: Словарь с ключами image_url, title, source_url
+            download: Скачивать ли изображение
             
-            # Пробуем получить через src
-            image_url = img_element.get_attribute('src')
-            if image_url and image_url.startswith('http'):
-                # Пробуем улучшить качество изображения, заменяя параметры размера
-                image_url = re.sub(r'/\d+x/|/\d+x\d+/', '/originals/', image_url)
-                return image_url
+        Returns:
+            Объект PinInfo
+        """
+        img_url = data["image_url"]
+        saved_path = None
+        if download:
+            try:
+                saved_path = await self._download_image(img_url)
+            except Exception as e:
+                logger.error(f"Ошибка при скачивании изображения: {str(e)}")
+        
+        return PinInfo(
+            # Уникальный ID на основе URL изображения
+            id=self._get_file_hash(img_url),
+            title=data.get("title"),
+            description=None,
+            image_url=img_url,
+            source_url=data.get("source_url"),
+            saved_path=saved_path,
+            clothing_items=[]
+        )
+    
+    async def _stream_pins(self, pin_data: List[Dict[str, Optional[str]]], download: bool) -> AsyncIterator[Tuple[int, PinInfo]]:
+        """
+        Отдает пины по мере готовности: изображения скачиваются параллельно
+        (общее ограничение задает загрузчик изображений), и каждый пин
+        возвращается сразу после загрузки своего изображения.
+        
+        Args:
+            pin_data: Извлеченные данные пинов
+            download: Скачивать ли изображения
             
-            return None
+        Yields:
+            Пары (позиция пина на странице, PinInfo) в порядке готовности
+        """
+        async def _build(index: int, data: Dict[str, Optional[str]]) -> Tuple[int, PinInfo]:
+            return index, await self._build_pin(data, download)
+        
+        tasks = [asyncio.ensure_future(_build(index, data)) for index, data in enumerate(pin_data)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    yield await future
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке пина: {str(e)}")
+        finally:
+            # Потребитель мог прекратить чтение раньше — отменяем оставшиеся загрузки
+            # и дожидаемся их, чтобы они не продолжали работу после закрытия генератора
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _iter_fresh_pins(self, query: str, limit: int, download: bool) -> AsyncIterator[Tuple[int, PinInfo]]:
+        """
+        Ищет пины на Pinterest (без кеша) и отдает их по мере готовности.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество пинов
+            download: Скачивать ли изображения
             
+        Yields:
+            Пары (позиция пина на странице, PinInfo) в порядке готовности
+        """
+        # Если Pinterest недавно не отвечал, не ждем тайм-аута загрузки страницы.
+        # Пробный слот выключателя резервирует каждый запрос в protect(), здесь только проверка состояния
+        breaker = get_circuit_breaker(self.SEARCH_URL)
+        if breaker.state == STATE_OPEN:
+            logger.warning(f"Поиск в Pinterest пропущен: circuit breaker для {breaker.host} разомкнут")
+            return
+        
+        search_url = f"{self.SEARCH_URL}/?q={urllib.parse.quote_plus(query)}"
+        logger.info(f"Загружаем страницу поиска: {search_url}")
+        
+        pin_data = await self._fetch_pin_data(search_url, limit, breaker)
+        if not pin_data:
+            return
+        async for item in self._stream_pins(pin_data[:limit], download):
+            yield item
+    
+    async def _analyze_pin(self, pin: PinInfo, gender: Optional[str], query: str) -> None:
+        """
+        Определяет предметы одежды на изображении пина.
+        
+        Args:
+            pin: Пин без списка предметов одежды
+            gender: Пол (мужской/женский)
+            query: Поисковый запрос (контекст для анализа)
+        """
+        logger.info(f"Анализирую изображение для пина {pin.id}")
+        try:
+            pin.clothing_items = await self.image_analyzer.analyze_image(
+                pin.image_url, gender, query
+            )
         except Exception as e:
-            logger.error(f"Ошибка при получении URL изображения: {e}")
-            return None
+            logger.error(f"Ошибка при анализе изображения пина {pin.id}: {str(e)}")
+            # При ошибке добавляем базовый набор предметов
+            pin.clothing_items = [
+                {"type": "одежда", "color": "не определено", "description": "не удалось проанализировать", "gender": gender or "унисекс"}
+            ]
+    
+    async def analyze_pin(self, pin: PinInfo, query: str, gender: Optional[str] = None) -> PinInfo:
+        """
+        Определяет предметы одежды на пине, если они еще не определены.
+        
+        Используется вместе с iter_pins, чтобы анализировать каждый пин сразу после
+        загрузки. Результат анализа сохраняется в кеше пинов запроса.
+        
+        Args:
+            pin: Пин
+            query: Поисковый запрос (контекст для анализа и ключ кеша)
+            gender: Пол (мужской/женский)
+            
+        Returns:
+            Тот же пин с заполненным списком предметов одежды
+        """
+        if not pin.clothing_items:
+            await self._analyze_pin(pin, gender, query)
+            self._pin_cache.touch(query, gender)
+        return pin
+    
+    async def iter_pins(
+        self,
+        query: str,
+        limit: int = 10,
+        download: bool = True,
+        gender: Optional[str] = None
+    ) -> AsyncIterator[PinInfo]:
+        """
+        Поиск пинов с выдачей по одному, по мере готовности.
+        
+        Позволяет начать обработку (анализ одежды, поиск товаров) первого пина,
+        пока остальные изображения еще скачиваются.
         
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов
+            download: Скачивать ли изображения
+            gender: Пол (мужской/женский)
+            
+        Yields:
+            Объекты PinInfo (из кеша - в исходном порядке, новые - в порядке готовности)
+        """
+        cached = self._pin_cache.get(query, gender, limit)
+        if cached is not None:
+            logger.info(f"Использую кеш для запроса '{query}'")
+            for pin in cached:
+                yield pin
+            return
+        
+        found = []
+        async for index, pin in self._iter_fresh_pins(query, limit, download):
+            found.append((index, pin))
+            yield pin
+        
+        if found:
+            # В кеше пины хранятся в порядке выдачи Pinterest
+            self._pin_cache.put(query, gender, [pin for _, pin in sorted(found, key=lambda item: item[0])], limit)
+    
     @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10))
     async def search_pins(
         self,
@@ -897,213 +1448,53 @@ class PinterestAPI:
         Returns:
             Список объектов PinInfo с информацией о найденных пинах
         """
-        # Проверяем кеш
-        cache_key = f"{query}_{limit}_{gender or 'unspecified'}"
-        if cache_key in self._cache:
+        # Проверяем кеш: запись по (запрос, пол) подходит для любого меньшего лимита
+        pins = self._pin_cache.get(query, gender, limit)
+        if pins is not None:
             logger.info(f"Использую кеш для запроса '{query}'")
-            pins = self._cache[cache_key]
             
             # Если нужно проанализировать изображения, делаем это для тех, у которых нет списка предметов
             if analyze_images:
-                for pin in pins:
-                    if not pin.clothing_items:
-                        logger.info(f"Анализирую изображение из кеша для пина {pin.id}")
-                        pin.clothing_items = await self.image_analyzer.analyze_image(
-                            pin.image_url, gender, query
-                        )
-                self._cache[cache_key] = pins
-                self._save_cache()
+                pending = [pin for pin in pins if not pin.clothing_items]
+                await asyncio.gather(*(self._analyze_pin(pin, gender, query) for pin in pending))
+                if pending:
+                    self._pin_cache.touch(query, gender)
                 
             return pins
         
-        # Если кеша нет, выполняем поиск
-        if not self._driver:
-            await self._init_selenium()
-        
-        search_url = f"{self.SEARCH_URL}/?q={urllib.parse.quote_plus(query)}"
-        logger.info(f"Загружаем страницу поиска: {search_url}")
-        
-        # Увеличиваем максимальное время ожидания страницы до 60 секунд
+        found = []
+        analysis_tasks = []
         try:
-            # Selenium WebDriver работает синхронно, не используем await
-            self._driver.set_page_load_timeout(60)  # 60 секунд
-            self._driver.get(search_url)
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке страницы поиска: {e}")
-            # Пробуем еще раз с небольшой задержкой
-            await asyncio.sleep(2)
-            try:
-                self._driver.get(search_url)
-            except Exception as e:
-                logger.error(f"Повторная ошибка при загрузке страницы: {e}")
-                return []
-        
-        # Ожидаем загрузку контента
-        try:
-            logger.info("Ждем загрузку контента...")
-            WebDriverWait(self._driver, 20).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-test-id='pin']"))
-            )
-            logger.info("Найден селектор: div[data-test-id='pin']")
-        except TimeoutException:
-            logger.warning("Тайм-аут ожидания элементов пинов, попробуем найти альтернативные элементы")
-            try:
-                # Пробуем альтернативный селектор
-                WebDriverWait(self._driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-grid-item]"))
-                )
-                logger.info("Найден альтернативный селектор: div[data-grid-item]")
-            except TimeoutException:
-                logger.error("Не удалось найти элементы пинов даже с альтернативным селектором")
-                return []
-        
-        # Прокручиваем страницу, чтобы загрузить больше изображений
-        logger.info("Страница загружена, прокручиваем для загрузки изображений")
-        try:
-            # Прокручиваем страницу несколько раз для загрузки изображений
-            for _ in range(5):
-                self._driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Ошибка при прокрутке страницы: {e}")
-        
-        # Ищем элементы пинов
-        logger.info("Ищем изображения на странице")
-        pins = []
-        try:
-            # Сначала пробуем основной селектор - без await, т.к. Selenium методы синхронные
-            pin_elements = self._driver.find_elements(By.CSS_SELECTOR, "div[data-test-id='pin']")
-            if pin_elements:
-                logger.info("Найдены пины через селектор: div[data-test-id='pin']")
-            else:
-                # Пробуем альтернативный селектор - без await
-                pin_elements = self._driver.find_elements(By.CSS_SELECTOR, "div[data-grid-item]")
-                logger.info("Найдены пины через альтернативный селектор: div[data-grid-item]")
-            
-            logger.info(f"Найдено {len(pin_elements)} потенциальных пинов")
-            
-            # Обрабатываем найденные пины
-            for i, pin_element in enumerate(pin_elements):
-                if i >= limit:
-                    break
-                
-                try:
-                    # Получаем URL изображения из элемента пина
-                    img_url = None
-                    try:
-                        # Пробуем найти изображение внутри пина - без await
-                        img_element = pin_element.find_element(By.TAG_NAME, "img")
-                        img_url = self._get_best_image_url(img_element)
-                    except Exception as e:
-                        logger.warning(f"Не удалось извлечь URL изображения из пина #{i+1}: {str(e)}")
-                        # Пробуем найти через различные селекторы - без await
-                        try:
-                            img_element = pin_element.find_element(By.CSS_SELECTOR, "[src]")
-                            img_url = img_element.get_attribute("src")
-                        except:
-                            logger.warning(f"Не удалось найти изображение через альтернативный метод для пина #{i+1}")
-                    
-                    if not img_url:
-                        logger.warning(f"Пропускаем пин #{i+1} из-за отсутствия URL изображения")
-                        continue
-                    
-                    # Создаем уникальный ID на основе URL изображения
-                    pin_id = self._get_file_hash(img_url)
-                    
-                    # Пробуем получить заголовок и описание - без await
-                    title = None
-                    description = None
-                    try:
-                        title_element = pin_element.find_element(By.CSS_SELECTOR, "div[title]")
-                        title = title_element.get_attribute("title")
-                    except:
-                        logger.debug(f"Не удалось извлечь заголовок для пина {pin_id}")
-                    
-                    # Добавляем ссылку на оригинальный пин - без await
-                    source_url = None
-                    try:
-                        a_element = pin_element.find_element(By.TAG_NAME, "a")
-                        href = a_element.get_attribute("href")
-                        if href and "pinterest.com/pin/" in href:
-                            source_url = href
-                    except:
-                        logger.debug(f"Не удалось извлечь ссылку на пин {pin_id}")
-                    
-                    saved_path = None
-                    if download:
-                        try:
-                            saved_path = await self._download_image(img_url)
-                        except Exception as e:
-                            logger.error(f"Ошибка при скачивании изображения: {str(e)}")
-                            # Пробуем другой URL (если есть другой размер изображения)
-                            try:
-                                # Преобразуем URL, чтобы попробовать получить другой размер
-                                alt_url = img_url.replace("236x", "564x").replace("474x", "736x")
-                                if alt_url != img_url:
-                                    logger.info(f"Пробуем альтернативный URL: {alt_url}")
-                                    saved_path = await self._download_image(alt_url)
-                            except Exception as e2:
-                                logger.error(f"Ошибка при скачивании альтернативного изображения: {str(e2)}")
-                    
-                    # Создаем объект пина
-                    pin_info = PinInfo(
-                        id=pin_id,
-                        title=title,
-                        description=description,
-                        image_url=img_url,
-                        source_url=source_url,
-                        saved_path=saved_path,
-                        clothing_items=[]
-                    )
-                    
-                    pins.append(pin_info)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке пина #{i+1}: {str(e)}")
-                    continue
-            
-            # Сохраняем результаты в кеш
-            if pins:
-                self._cache[cache_key] = pins
-                self._save_cache()
-            
-            logger.info(f"Найдено {len(pins)} пинов по запросу '{query}'")
-            
-            # Анализируем изображения, если нужно
-            if analyze_images:
-                # Новый код - анализ изображений и определение одежды
-                for pin in pins:
-                    # Если у пина нет списка предметов одежды или он пуст, анализируем изображение
-                    if not pin.clothing_items:
-                        logger.info(f"Анализирую изображение для пина {pin.id}")
-                        try:
-                            pin.clothing_items = await self.image_analyzer.analyze_image(
-                                pin.image_url, gender, query
-                            )
-                        except Exception as e:
-                            logger.error(f"Ошибка при анализе изображения пина {pin.id}: {str(e)}")
-                            # При ошибке добавляем базовый набор предметов
-                            pin.clothing_items = [
-                                {"type": "одежда", "color": "не определено", "description": "не удалось проанализировать", "gender": gender or "унисекс"}
-                            ]
-                
-                # Обновляем кеш после анализа
-                self._cache[cache_key] = pins
-                self._save_cache()
-                
-            return pins
-            
+            # Анализ каждого пина начинается сразу после загрузки его изображения
+            async for index, pin in self._iter_fresh_pins(query, limit, download):
+                found.append((index, pin))
+                if analyze_images:
+                    analysis_tasks.append(asyncio.ensure_future(self._analyze_pin(pin, gender, query)))
+            if analysis_tasks:
+                await asyncio.gather(*analysis_tasks)
         except Exception as e:
+            for task in analysis_tasks:
+                task.cancel()
             logger.error(f"Ошибка при поиске пинов: {str(e)}")
             return []
+        
+        # Возвращаем пины в порядке выдачи Pinterest
+        pins = [pin for _, pin in sorted(found, key=lambda item: item[0])]
+        logger.info(f"Найдено {len(pins)} пинов по запросу '{query}'")
+        
+        # Сохраняем результаты в кеш
+        self._pin_cache.put(query, gender, pins, limit)
+        
+        return pins
     
     async def close(self) -> None:
-        """Закрывает все открытые соединения."""
+        """Закрывает все открытые соединения и записывает кеши."""
+        self.image_analyzer._save_cache()
         if self._session and not self._session.closed:
             await self._session.close()
-        if self._driver:
-            self._driver.quit()
-            self._driver = None
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
         logger.info("Все соединения закрыты")
 
 class Pinterest:
@@ -1138,6 +1529,22 @@ class Pinterest:
         limit = limit or self.number_of_photo
         return await self.api.search_pins(query, limit, download, analyze_images, gender)
     
+    async def iter_pins(self, query: str, limit: Optional[int] = None, download: bool = True, gender: Optional[str] = None) -> AsyncIterator[PinInfo]:
+        """
+        Поиск пинов с выдачей по мере готовности.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов (если не указано, используется number_of_photo)
+            download: Скачивать ли изображения
+            gender: Пол (мужской/женский)
+            
+        Yields:
+            Объекты PinInfo
+        """
+        async for pin in self.api.iter_pins(query, limit or self.number_of_photo, download, gender):
+            yield pin
+    
     async def close(self):
         """Закрытие сессий и ресурсов."""
         await self.api.close()
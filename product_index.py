@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Локальный полнотекстовый индекс товаров Wildberries (SQLite FTS5).
+
+Все товары, полученные клиентами WildberriesAPI и WildberriesAsyncAPI,
+сохраняются в индекс в едином формате normalize_products (wb_normalizer), а
+каждый клиент приводит найденные записи к своему формату сам. Название, бренд, категория и цвета приводятся к основам
+слов (упрощенный стеммер Snowball для русского языка), поэтому индекс находит
+товары и по повторным, и по близким запросам («платья черные» -> «черное платье»).
+Поиск поддерживает фильтры по цене и полу и учитывает «свежесть» записей;
+товары с неизвестным полом не попадают в выдачу с явно указанным полом.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from wb_normalizer import coerce_number
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию (можно переопределить переменными окружения)
+DEFAULT_DB_PATH = os.getenv("WB_PRODUCT_INDEX_PATH", os.path.join("wildberries_cache", "product_index.db"))
+DEFAULT_FRESH_TTL = float(os.getenv("WB_PRODUCT_INDEX_TTL", str(6 * 60 * 60)))
+
+# Версия формата хранимых записей: при ее смене старые записи удаляются
+SCHEMA_VERSION = 1
+# Поля, которые есть только в детальной информации: пустые значения не затирают сохраненные
+_DETAIL_FIELDS = ("colors", "sizes", "description", "pics")
+
+# Регулярные выражения упрощенного стеммера Snowball для русского языка
+_RV = re.compile(r"^(.*?[аеиоуыэюя])(.*)$")
+_PERFECTIVE_GERUND = re.compile(r"((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$")
+_REFLEXIVE = re.compile(r"(с[яь])$")
+_ADJECTIVE = re.compile(r"(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$")
+_PARTICIPLE = re.compile(r"((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$")
+_VERB = re.compile(r"((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$")
+_NOUN = re.compile(r"(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$")
+_DERIVATIONAL = re.compile(r".*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$")
+_DERIVATIONAL_SUFFIX = re.compile(r"ость?$")
+_SUPERLATIVE = re.compile(r"(ейше|ейш)$")
+_TOKEN = re.compile(r"[a-zа-я0-9]+")
+
+
+def stem_russian(word: str) -> str:
+    """
+    Возвращает основу русского слова (упрощенный алгоритм Snowball).
+
+    Args:
+        word: Слово в любом регистре
+
+    Returns:
+        Основа слова (для нерусских слов — слово в нижнем регистре)
+    """
+    word = word.lower().replace("ё", "е")
+    match = _RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub("", rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub("", rv, 1)
+        temp = _ADJECTIVE.sub("", rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub("", temp, 1)
+        else:
+            temp = _VERB.sub("", rv, 1)
+            rv = _NOUN.sub("", rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    if _DERIVATIONAL.match(rv):
+        rv = _DERIVATIONAL_SUFFIX.sub("", rv, 1)
+
+    if rv.endswith("ь"):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE.sub("", rv, 1)
+        if rv.endswith("нн"):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Разбивает текст на основы слов.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Список основ (кириллические слова приводятся к основе, остальные — к нижнему регистру)
+    """
+    if not text:
+        return []
+    tokens = []
+    for token in _TOKEN.findall(text.lower().replace("ё", "е")):
+        token = stem_russian(token)
+        if len(token) >= 2:
+            tokens.append(token)
+    return tokens
+
+
+class ProductIndex:
+    """
+    Полнотекстовый индекс товаров на базе SQLite FTS5.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, fresh_ttl: float = DEFAULT_FRESH_TTL):
+        """
+        Инициализация индекса.
+
+        Args:
+            db_path: Путь к файлу базы SQLite
+            fresh_ttl: Время, в течение которого запись считается свежей (в секундах)
+        """
+        self.db_path = db_path
+        self.fresh_ttl = fresh_ttl
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Подписчики, уведомляемые о добавленных товарах (например, движок похожих товаров)
+        self._listeners: List[Callable[[List[Dict[str, Any]]], Any]] = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        logger.info(f"Индекс товаров открыт: {db_path}")
+
+    def _create_schema(self) -> None:
+        """Создает таблицы индекса, если их нет, и удаляет записи устаревшего формата."""
+        with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # Раньше клиенты сохраняли товары каждый в своем формате
+                self._conn.execute("DROP TABLE IF EXISTS products")
+                self._conn.execute("DROP TABLE IF EXISTS products_fts")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    price REAL NOT NULL DEFAULT 0,
+                    sale_price REAL NOT NULL DEFAULT 0,
+                    gender TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_products_updated ON products(updated_at)")
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, brand, category, colors, tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+
+    @staticmethod
+    def _product_text(product: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Готовит текстовые поля товара для индексации (основы слов).
+
+        Args:
+            product: Данные о товаре
+
+        Returns:
+            Словарь с полями name, brand, category, colors
+        """
+        colors = product.get("colors") or []
+        if isinstance(colors, list):
+            colors = " ".join(color.get("name", "") if isinstance(color, dict) else str(color) for color in colors)
+        return {
+            "name": " ".join(tokenize(product.get("name"))),
+            "brand": " ".join(tokenize(product.get("brand"))),
+            "category": " ".join(tokenize(product.get("category") or product.get("entity"))),
+            "colors": " ".join(tokenize(str(colors)))
+        }
+
+    def add_products(self, products: Iterable[Dict[str, Any]], gender: Optional[str] = None) -> int:
+        """
+        Добавляет или обновляет товары в индексе.
+
+        Если товар уже есть в индексе, пустые поля детальной информации (цвета, размеры,
+        описание) и неизвестный пол берутся из сохраненной записи.
+
+        Args:
+            products: Записи в формате normalize_products
+            gender: Пол, для которого выполнялся поиск (None — неизвестен)
+
+        Returns:
+            Количество сохраненных товаров
+        """
+        now = time.time()
+        rows = []
+        for product in products:
+            try:
+                product_id = int(product.get("id"))
+            except (TypeError, ValueError):
+                continue
+            price = coerce_number(product.get("price"))
+            sale_price = coerce_number(product.get("sale_price")) or price
+            rows.append((product_id, dict(product), price, sale_price))
+
+        if not rows:
+            return 0
+
+        gender = (gender or "").strip().lower() or None
+        try:
+            with self._lock, self._conn:
+                placeholders = ", ".join("?" * len(rows))
+                stored = {
+                    row[0]: (json.loads(row[1]), row[2])
+                    for row in self._conn.execute(
+                        f"SELECT id, data, gender FROM products WHERE id IN ({placeholders})",
+                        [product_id for product_id, _, _, _ in rows]
+                    )
+                }
+                for product_id, product, price, sale_price in rows:
+                    stored_product, stored_gender = stored.get(product_id, ({}, None))
+                    for field in _DETAIL_FIELDS:
+                        if not product.get(field) and stored_product.get(field):
+                            product[field] = stored_product[field]
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO products (id, data, price, sale_price, gender, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (product_id, json.dumps(product, ensure_ascii=False, default=str), price, sale_price,
+                         gender or stored_gender, now)
+                    )
+                    text = self._product_text(product)
+                    self._conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+                    self._conn.execute(
+                        "INSERT INTO products_fts (rowid, name, brand, category, colors) VALUES (?, ?, ?, ?, ?)",
+                        (product_id, text["name"], text["brand"], text["category"], text["colors"])
+                    )
+            logger.debug(f"В индекс товаров добавлено {len(rows)} товаров")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при добавлении товаров в индекс: {e}")
+            return 0
+
+        added = [product for _, product, _, _ in rows]
+        for listener in list(self._listeners):
+            try:
+                listener(added)
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике индекса товаров: {str(e)}")
+        return len(rows)
+
+    def subscribe(self, listener: Callable[[List[Dict[str, Any]]], Any]) -> None:
+        """
+        Подписывает обработчик на добавление товаров в индекс.
+
+        Args:
+            listener: Функция, получающая список добавленных товаров
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def iter_products(self, max_age: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Перебирает товары индекса.
+
+        Args:
+            max_age: Максимальный возраст записей в секундах (None — все записи)
+
+        Returns:
+            Итератор по сохраненным товарам
+        """
+        sql = "SELECT data FROM products"
+        params: List[Any] = []
+        if max_age is not None:
+            sql += " WHERE updated_at >= ?"
+            params.append(time.time() - max_age)
+        try:
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении индекса товаров: {e}")
+            return
+        for row in rows:
+            yield json.loads(row[0])
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        gender: Optional[str] = None,
+        max_age: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ищет товары в индексе.
+
+        Фильтрация по цене повторяет поведение API Wildberries:
+        min_price применяется к основной цене, max_price — к скидочной.
+
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество товаров
+            min_price: Минимальная цена (в рублях)
+            max_price: Максимальная цена (в рублях)
+            gender: Пол (подходят товары этого пола и унисекс; товары с неизвестным полом не подходят)
+            max_age: Максимальный возраст записей в секундах (по умолчанию fresh_ttl, float("inf") — без ограничения)
+
+        Returns:
+            Список записей в формате normalize_products
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        # Все основы должны встретиться (AND), допускаем продолжение слова (префиксный поиск)
+        match_expr = " ".join(f'"{token}"*' for token in dict.fromkeys(tokens))
+        sql = [
+            "SELECT p.data FROM products_fts f JOIN products p ON p.id = f.rowid",
+            "WHERE products_fts MATCH ?"
+        ]
+        params: List[Any] = [match_expr]
+        max_age = self.fresh_ttl if max_age is None else max_age
+        if max_age != float("inf"):
+            sql.append("AND p.updated_at >= ?")
+            params.append(time.time() - max_age)
+        if min_price is not None:
+            sql.append("AND p.price >= ?")
+            params.append(float(min_price))
+        if max_price is not None:
+            sql.append("AND p.sale_price <= ?")
+            params.append(float(max_price))
+        if gender:
+            sql.append("AND p.gender IN (?, 'унисекс')")
+            params.append(gender.strip().lower())
+        sql.append("ORDER BY bm25(products_fts) LIMIT ?")
+        params.append(int(limit))
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(" ".join(sql), params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при поиске в индексе товаров: {e}")
+            return []
+        return [json.loads(row[0]) for row in rows]
+
+    async def add_products_async(self, products: Iterable[Dict[str, Any]], gender: Optional[str] = None) -> int:
+        """Асинхронная версия add_products (выполняется в отдельном потоке)."""
+        return await asyncio.to_thread(self.add_products, list(products), gender)
+
+    async def search_async(self, query: str, limit: int = 10, min_price: Optional[float] = None,
+                           max_price: Optional[float] = None, gender: Optional[str] = None,
+                           max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Асинхронная версия search (выполняется в отдельном потоке)."""
+        return await asyncio.to_thread(self.search, query, limit, min_price, max_price, gender, max_age)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику индекса.
+
+        Returns:
+            Словарь с общим количеством товаров и количеством свежих записей
+        """
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            fresh = self._conn.execute(
+                "SELECT COUNT(*) FROM products WHERE updated_at >= ?", (time.time() - self.fresh_ttl,)
+            ).fetchone()[0]
+        return {"products": total, "fresh_products": fresh, "fresh_ttl": self.fresh_ttl}
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+
+# Общий индекс для всего приложения
+_product_index: Optional[ProductIndex] = None
+
+
+def get_product_index() -> ProductIndex:
+    """
+    Возвращает общий для приложения экземпляр ProductIndex.
+
+    Returns:
+        Экземпляр ProductIndex
+    """
+    global _product_index
+    if _product_index is None:
+        _product_index = ProductIndex()
+    return _product_index
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Шина событий о ходе выполнения задач.
+
+Раньше фронтенд узнавал о ходе поиска, опрашивая /status/{task_id} и
+/search-*/{task_id}: много запросов на задачу и задержка опроса на каждом этапе.
+Теперь код задачи публикует события (статус, прогресс, частичные результаты), а
+подписчики получают их через WebSocket или SSE сразу после публикации:
+
+    bus = ProgressBus(final_statuses=("completed", "failed", "cancelled"))
+    bus.publish(task_id, EVENT_STATUS, {"status": "processing", "progress": 10})
+    bus.publish(task_id, EVENT_PARTIAL, {"kind": "pin", "result": {...}})
+
+    async for event in bus.subscribe(task_id, last_event_id=None, heartbeat=15):
+        if event is None:
+            ...   # простой дольше heartbeat секунд - время отправить ping
+        else:
+            ...   # event.to_sse() / event.to_dict()
+
+Особенности:
+- publish не блокирует задачу: у каждого подписчика ограниченная очередь, и
+  медленный подписчик при ее переполнении перестает получать события напрямую,
+  а после разбора очереди догоняет остальных по истории задачи;
+- по каждой задаче хранятся последние history_size событий, поэтому клиент,
+  переподключившийся с last_event_id (заголовок Last-Event-ID в SSE), получает только
+  пропущенные события;
+- если пропущенных событий в истории уже нет (или last_event_id не указан),
+  подписчик получает снимок текущего состояния задачи от snapshot_provider;
+- поток событий задачи завершается событием со статусом из final_statuses, а
+  история завершенной задачи удаляется через finished_ttl секунд.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_SIZE = int(os.getenv("PROGRESS_HISTORY_SIZE", "100"))
+DEFAULT_SUBSCRIBER_QUEUE = int(os.getenv("PROGRESS_SUBSCRIBER_QUEUE", "32"))
+DEFAULT_FINISHED_TTL = float(os.getenv("PROGRESS_FINISHED_TTL", "300"))
+# История задачи без подписчиков и без событий дольше этого срока удаляется, даже если
+# финального события не было (например, процесс задачи упал)
+STREAM_IDLE_TTL = float(os.getenv("PROGRESS_STREAM_IDLE_TTL", "3600"))
+
+EVENT_STATUS = "status"
+EVENT_PARTIAL = "partial"
+EVENT_SNAPSHOT = "snapshot"
+
+
+class ProgressEvent(NamedTuple):
+    """Событие о ходе выполнения задачи."""
+
+    id: int
+    task_id: str
+    type: str
+    data: Dict[str, Any]
+    timestamp: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление события для отправки через WebSocket."""
+        return {"id": self.id, "task_id": self.task_id, "type": self.type, "data": self.data, "timestamp": self.timestamp}
+
+    def to_sse(self) -> str:
+        """Представление события в формате Server-Sent Events."""
+        payload = json.dumps(self.data, ensure_ascii=False, default=str)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class _Subscriber:
+    """Подписчик на события задачи."""
+
+    __slots__ = ("queue", "lagged")
+
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue[ProgressEvent]" = asyncio.Queue(maxsize=maxsize)
+        # Очередь переполнялась: события берутся из истории, а не из очереди
+        self.lagged = False
+
+
+class _Stream:
+    """История событий и подписчики одной задачи."""
+
+    __slots__ = ("history", "subscribers", "start_id", "evicted_id", "last_id", "last_at", "finished_at")
+
+    def __init__(self, history_size: int, start_id: int):
+        self.history: Deque[ProgressEvent] = deque(maxlen=history_size)
+        self.subscribers: Set[_Subscriber] = set()
+        # События с id <= start_id опубликованы до появления потока (например, до перезапуска)
+        self.start_id = start_id
+        # Последнее вытесненное из истории событие: более ранние уже не восстановить
+        self.evicted_id = start_id
+        self.last_id = start_id
+        self.last_at = time.time()
+        self.finished_at: Optional[float] = None
+
+
+class ProgressBus:
+    """Шина событий о ходе выполнения задач с историей для возобновления подписки."""
+
+    def __init__(
+        self,
+        final_statuses: tuple = (),
+        history_size: int = DEFAULT_HISTORY_SIZE,
+        subscriber_queue: int = DEFAULT_SUBSCRIBER_QUEUE,
+        finished_ttl: float = DEFAULT_FINISHED_TTL
+    ):
+        """
+        Инициализация шины.
+
+        Args:
+            final_statuses: Статусы, после которых событий по задаче больше не будет
+            history_size: Сколько последних событий хранить по каждой задаче
+            subscriber_queue: Размер очереди событий каждого подписчика
+            finished_ttl: Сколько секунд хранить историю завершенной задачи
+        """
+        self.final_statuses = tuple(final_statuses)
+        self.history_size = max(1, history_size)
+        self.subscriber_queue = max(1, subscriber_queue)
+        self.finished_ttl = finished_ttl
+        # Функция task_id -> текущее состояние задачи (или None) для событий-снимков
+        self.snapshot_provider: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None
+
+        self._streams: Dict[str, _Stream] = {}
+        # Идентификаторы начинаются с текущего времени в мс, чтобы после перезапуска
+        # процесса Last-Event-ID от старых событий не совпадал с новыми
+        self._last_id = int(time.time() * 1000)
+        self._stats = {"published": 0, "delivered": 0, "lagged": 0, "replayed": 0, "snapshots": 0, "expired": 0}
+
+    def _next_id(self) -> int:
+        self._last_id += 1
+        return self._last_id
+
+    def _stream(self, task_id: str) -> _Stream:
+        stream = self._streams.get(task_id)
+        if stream is None:
+            stream = _Stream(self.history_size, self._last_id)
+            self._streams[task_id] = stream
+        return stream
+
+    def is_final(self, event: ProgressEvent) -> bool:
+        """Завершает ли событие поток задачи."""
+        return event.type in (EVENT_STATUS, EVENT_SNAPSHOT) and event.data.get("status") in self.final_statuses
+
+    # --- публикация ---
+
+    def publish(self, task_id: str, event_type: str, data: Dict[str, Any]) -> ProgressEvent:
+        """
+        Публикует событие задачи. Не блокирует: медленные подписчики догоняют по истории.
+
+        Args:
+            task_id: Идентификатор задачи
+            event_type: Тип события (EVENT_STATUS, EVENT_PARTIAL)
+            data: Данные события (должны сериализоваться в JSON)
+
+        Returns:
+            Опубликованное событие
+        """
+        now = time.time()
+        self._evict(now)
+        stream = self._stream(task_id)
+        event = ProgressEvent(self._next_id(), task_id, event_type, data, now)
+
+        if len(stream.history) == stream.history.maxlen:
+            stream.evicted_id = stream.history[0].id
+        stream.history.append(event)
+        stream.last_id = event.id
+        stream.last_at = now
+        if self.is_final(event):
+            stream.finished_at = now
+        self._stats["published"] += 1
+
+        for subscriber in stream.subscribers:
+            if subscriber.lagged:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+                self._stats["delivered"] += 1
+            except asyncio.QueueFull:
+                # Подписчик не успевает: пропущенные события он возьмет из истории
+                subscriber.lagged = True
+                self._stats["lagged"] += 1
+        return event
+
+    # --- подписка ---
+
+    def snapshot(self, task_id: str) -> Optional[ProgressEvent]:
+        """
+        Формирует событие со снимком текущего состояния задачи (в историю не попадает).
+
+        Args:
+            task_id: Идентификатор задачи
+
+        Returns:
+            Событие EVENT_SNAPSHOT или None, если состояние задачи неизвестно
+        """
+        if self.snapshot_provider is None:
+            return None
+        try:
+            data = self.snapshot_provider(task_id)
+        except Exception as e:
+            logger.error(f"Ошибка при получении состояния задачи {task_id}: {e}")
+            return None
+        if data is None:
+            return None
+        stream = self._streams.get(task_id)
+        # Снимок учитывает все события, опубликованные до него
+        event_id = stream.last_id if stream is not None else self._last_id
+        self._stats["snapshots"] += 1
+        return ProgressEvent(event_id, task_id, EVENT_SNAPSHOT, data, time.time())
+
+    def _catch_up(self, task_id: str, stream: _Stream, last_id: Optional[int]) -> List[ProgressEvent]:
+        """Возвращает события после last_id из истории или снимок, если их не восстановить."""
+        if last_id is not None and stream.evicted_id <= last_id <= stream.last_id:
+            events = [event for event in stream.history if event.id > last_id]
+            self._stats["replayed"] += len(events)
+            return events
+        snapshot = self.snapshot(task_id)
+        if snapshot is not None:
+            return [snapshot]
+        # Без снимка отдаем все, что осталось в истории
+        return [event for event in stream.history if last_id is None or event.id > last_id]
+
+    async def subscribe(
+        self,
+        task_id: str,
+        last_event_id: Optional[int] = None,
+        heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[ProgressEvent]]:
+        """
+        Подписывается на события задачи.
+
+        Args:
+            task_id: Идентификатор задачи
+            last_event_id: Идентификатор последнего полученного клиентом события
+            heartbeat: Через сколько секунд простоя выдавать None (None - не выдавать)
+
+        Yields:
+            События задачи по порядку; None при простое дольше heartbeat.
+            Поток заканчивается после события с финальным статусом.
+        """
+        stream = self._stream(task_id)
+        subscriber = _Subscriber(self.subscriber_queue)
+        stream.subscribers.add(subscriber)
+        last_id = last_event_id
+        try:
+            pending = self._catch_up(task_id, stream, last_id)
+            while True:
+                for event in pending:
+                    if last_id is not None and event.id <= last_id and event.type != EVENT_SNAPSHOT:
+                        continue
+                    last_id = event.id
+                    yield event
+                    if self.is_final(event):
+                        return
+                pending = []
+
+                if subscriber.lagged and subscriber.queue.empty():
+                    # Очередь разобрана: дальше события снова идут через нее, а пропущенные
+                    # берем из истории (дубликаты отсекаются по id)
+                    subscriber.lagged = False
+                    pending = self._catch_up(task_id, stream, last_id)
+                    continue
+
+                try:
+                    if heartbeat is None:
+                        event = await subscriber.queue.get()
+                    else:
+                        event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                pending = [event]
+        finally:
+            stream.subscribers.discard(subscriber)
+            if not stream.subscribers and not stream.history:
+                self._streams.pop(task_id, None)
+
+    # --- обслуживание ---
+
+    def _evict(self, now: float) -> None:
+        """Удаляет историю завершенных задач старше finished_ttl и заброшенных задач без подписчиков."""
+        expired = [
+            task_id for task_id, stream in self._streams.items()
+            if not stream.subscribers and (
+                (stream.finished_at is not None and now - stream.finished_at > self.finished_ttl)
+                or now - stream.last_at > STREAM_IDLE_TTL
+            )
+        ]
+        for task_id in expired:
+            del self._streams[task_id]
+        self._stats["expired"] += len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику шины.
+
+        Returns:
+            Словарь с количеством потоков, подписчиков и счетчиками событий
+        """
+        self._evict(time.time())
+        return {
+            "streams": len(self._streams),
+            "subscribers": sum(len(stream.subscribers) for stream in self._streams.values()),
+            **self._stats,
+        }
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общий для приложения кеш результатов поиска Wildberries.
+
+Особенности:
+- ключ строится по пространству имен клиента и нормализованным параметрам (запрос,
+  диапазон цен, пол, сортировка, страница): клиенты хранят товары в разных форматах;
+- LRU-вытеснение с ограничением по объему в байтах и TTL для записей;
+- устаревшие записи отдаются сразу, а обновление выполняется в фоне (stale-while-revalidate);
+- пустые результаты хранятся в отдельном «негативном» кеше с более коротким TTL
+  (ошибки fetcher не кешируются: он должен пробрасывать их, а не возвращать пустой список);
+- одновременные запросы с одинаковым ключом объединяются в один запрос к API.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию (можно переопределить переменными окружения)
+DEFAULT_MAX_BYTES = int(os.getenv("WB_SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+DEFAULT_TTL = float(os.getenv("WB_SEARCH_CACHE_TTL", "900"))
+DEFAULT_STALE_TTL = float(os.getenv("WB_SEARCH_CACHE_STALE_TTL", "3600"))
+DEFAULT_NEGATIVE_TTL = float(os.getenv("WB_SEARCH_CACHE_NEGATIVE_TTL", "120"))
+MAX_NEGATIVE_ENTRIES = 10000
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """
+    Нормализует поисковый запрос для использования в ключе кеша.
+
+    Args:
+        query: Исходный запрос
+
+    Returns:
+        Запрос в нижнем регистре, без лишних пробелов, с заменой «ё» на «е»
+    """
+    if not query:
+        return ""
+    return re.sub(r"\s+", " ", query.lower().replace("ё", "е")).strip()
+
+
+def make_search_key(
+    namespace: str,
+    query: Optional[str],
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    gender: Optional[str] = None,
+    sort: Optional[str] = "popular",
+    page: int = 1,
+    limit: Optional[int] = None
+) -> str:
+    """
+    Формирует ключ кеша по нормализованным параметрам поиска.
+
+    Args:
+        namespace: Клиент, формирующий записи (у разных клиентов разный формат товаров)
+        query: Поисковый запрос
+        min_price: Минимальная цена (в рублях)
+        max_price: Максимальная цена (в рублях)
+        gender: Пол
+        sort: Способ сортировки
+        page: Номер страницы
+        limit: Размер страницы
+
+    Returns:
+        Строковый ключ кеша
+    """
+    return json.dumps([
+        namespace,
+        normalize_query(query),
+        None if min_price is None else round(float(min_price), 2),
+        None if max_price is None else round(float(max_price), 2),
+        (gender or "").strip().lower() or None,
+        (sort or "popular").strip().lower(),
+        int(page or 1),
+        limit
+    ], ensure_ascii=False)
+
+
+def _estimate_size(value: Any) -> int:
+    """
+    Оценивает объем значения в байтах по его JSON-представлению.
+
+    Args:
+        value: Значение для оценки
+
+    Returns:
+        Размер в байтах
+    """
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(value).encode("utf-8"))
+
+
+class _FetchCancelled(Exception):
+    """Получение значения прервано отменой запроса, который его выполнял."""
+
+
+class SearchResultCache:
+    """
+    LRU-кеш результатов поиска с ограничением по объему, TTL и фоновым обновлением.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+        stale_ttl: float = DEFAULT_STALE_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL
+    ):
+        """
+        Инициализация кеша.
+
+        Args:
+            max_bytes: Максимальный суммарный объем записей в байтах
+            ttl: Время, в течение которого запись считается свежей (в секундах)
+            stale_ttl: Дополнительное время, в течение которого устаревшая запись отдается с фоновым обновлением
+            negative_ttl: Время жизни записи о пустом результате (в секундах)
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+
+        # Ключ -> (значение, время сохранения, размер в байтах)
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        # Негативный кеш: ключ -> время сохранения
+        self._negative: Dict[str, float] = {}
+        self._current_bytes = 0
+
+        # Запросы к API, выполняющиеся в данный момент (для объединения одинаковых запросов)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+        self._stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "refreshes": 0}
+
+    def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """
+        Возвращает значение из кеша и его состояние.
+
+        Args:
+            key: Ключ кеша
+
+        Returns:
+            Кортеж (значение, состояние), где состояние — "fresh", "stale", "negative" или "miss"
+        """
+        now = time.time()
+
+        negative_at = self._negative.get(key)
+        if negative_at is not None:
+            if now - negative_at < self.negative_ttl:
+                return [], "negative"
+            del self._negative[key]
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, "miss"
+
+        value, stored_at, size = entry
+        age = now - stored_at
+        if age < self.ttl:
+            self._entries.move_to_end(key)
+            return value, "fresh"
+        if age < self.ttl + self.stale_ttl:
+            self._entries.move_to_end(key)
+            return value, "stale"
+
+        # Запись полностью устарела
+        self._remove(key)
+        return None, "miss"
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Сохраняет значение в кеш. Пустые результаты попадают в негативный кеш.
+
+        Args:
+            key: Ключ кеша
+            value: Значение (список товаров или ответ API)
+        """
+        if not value:
+            self._remove(key)
+            self._negative[key] = time.time()
+            if len(self._negative) > MAX_NEGATIVE_ENTRIES:
+                self._prune_negative()
+            return
+
+        self._negative.pop(key, None)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Запись кеша поиска ({size} байт) превышает лимит кеша, не сохраняем")
+            return
+
+        self._remove(key)
+        self._entries[key] = (value, time.time(), size)
+        self._current_bytes += size
+
+        # Вытесняем давно неиспользуемые записи, пока не уложимся в лимит
+        while self._current_bytes > self.max_bytes and self._entries:
+            evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._current_bytes -= evicted_size
+            self._stats["evictions"] += 1
+            logger.debug(f"Из кеша поиска вытеснена запись {evicted_key}")
+
+    def _prune_negative(self) -> None:
+        """
+        Удаляет просроченные записи негативного кеша, а при переполнении — самые старые.
+        """
+        now = time.time()
+        self._negative = {key: stored_at for key, stored_at in self._negative.items() if now - stored_at < self.negative_ttl}
+        while len(self._negative) > MAX_NEGATIVE_ENTRIES:
+            del self._negative[next(iter(self._negative))]
+
+    def _remove(self, key: str) -> None:
+        """
+        Удаляет запись из кеша с учетом объема.
+
+        Args:
+            key: Ключ кеша
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._current_bytes -= entry[2]
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """
+        Удаляет запись или очищает кеш полностью.
+
+        Args:
+            key: Ключ кеша (если None — очищается весь кеш)
+        """
+        if key is None:
+            self._entries.clear()
+            self._negative.clear()
+            self._current_bytes = 0
+        else:
+            self._remove(key)
+            self._negative.pop(key, None)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetcher: Callable[[], Awaitable[Any]],
+        background_fetcher: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Возвращает значение из кеша или получает его через fetcher.
+
+        Свежая запись отдается сразу. Устаревшая запись тоже отдается сразу,
+        а в фоне запускается обновление. При промахе одинаковые одновременные
+        запросы объединяются в один вызов fetcher.
+
+        Args:
+            key: Ключ кеша
+            fetcher: Асинхронная функция получения значения
+            background_fetcher: Функция для фонового обновления (по умолчанию — fetcher);
+                нужна, если fetcher использует ресурсы, которые могут быть закрыты к моменту обновления
+
+        Returns:
+            Значение из кеша или полученное от fetcher
+        """
+        value, state = self.get(key)
+
+        if state == "fresh":
+            self._stats["hits"] += 1
+            return value
+        if state == "negative":
+            self._stats["negative_hits"] += 1
+            return value
+        if state == "stale":
+            self._stats["stale_hits"] += 1
+            self._schedule_refresh(key, background_fetcher or fetcher)
+            return value
+
+        self._stats["misses"] += 1
+
+        # Объединяем одновременные запросы с одинаковым ключом
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except _FetchCancelled:
+                # Отменили запрос, выполнявший получение, а не этот: первый из ожидающих
+                # запускает получение заново, остальные присоединяются к нему
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetcher()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Отмена касается только этого запроса: ожидающие получат _FetchCancelled
+            future.set_exception(_FetchCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение будет получено ожидающими запросами; помечаем его как обработанное
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _schedule_refresh(self, key: str, fetcher: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Запускает фоновое обновление записи, если оно еще не выполняется.
+
+        Args:
+            key: Ключ кеша
+            fetcher: Асинхронная функция получения значения
+        """
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await fetcher()
+                self.set(key, value)
+                self._stats["refreshes"] += 1
+                logger.debug(f"Запись кеша поиска {key} обновлена в фоне")
+            except Exception as e:
+                logger.warning(f"Не удалось обновить запись кеша поиска {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кеша.
+
+        Returns:
+            Словарь со счетчиками попаданий, промахов и объемом кеша
+        """
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "negative_entries": len(self._negative),
+            "bytes": self._current_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+# Общий кеш для всего приложения
+_search_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> SearchResultCache:
+    """
+    Возвращает общий для приложения экземпляр SearchResultCache.
+
+    Returns:
+        Экземпляр SearchResultCache
+    """
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchResultCache()
+    return _search_cache
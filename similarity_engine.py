@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Локальный движок поиска похожих товаров.
+
+Товары из локального индекса (product_index.py) представляются разреженными
+векторами символьных n-грамм (HashingVectorizer) с IDF-взвешиванием. Частоты
+n-грамм по документам поддерживаются инкрементально, поэтому новые товары
+добавляются без переобучения и без пересборки матрицы (строки хранятся блоками),
+а запрос top-k по косинусной близости выполняется умножением блоков на вектор.
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+logger = logging.getLogger(__name__)
+
+# Размерность пространства хешированных признаков
+N_FEATURES = 2 ** 18
+# Удаленные (замененные обновлениями) строки убираются, когда их больше живых и не меньше этого числа
+COMPACT_MIN_DEAD = 1000
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """
+    Формирует текстовое представление товара для векторизации.
+
+    Args:
+        product: Данные о товаре
+
+    Returns:
+        Строка из названия, бренда, категории и цветов
+    """
+    colors = product.get("colors") or []
+    if isinstance(colors, list):
+        colors = " ".join(color.get("name", "") if isinstance(color, dict) else str(color) for color in colors)
+    parts = [
+        product.get("name") or "",
+        product.get("brand") or "",
+        product.get("category") or product.get("entity") or "",
+        str(colors or "")
+    ]
+    return " ".join(part for part in parts if part).lower().replace("ё", "е")
+
+
+class ProductSimilarityEngine:
+    """
+    Поиск похожих товаров по косинусной близости TF-IDF векторов символьных n-грамм.
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int] = (3, 5)):
+        """
+        Инициализация движка.
+
+        Args:
+            ngram_range: Диапазон длин символьных n-грамм
+        """
+        self._vectorizer = HashingVectorizer(
+            analyzer="char_wb",
+            ngram_range=ngram_range,
+            n_features=N_FEATURES,
+            alternate_sign=False,
+            norm=None
+        )
+        self._lock = threading.Lock()
+
+        # Товары в порядке добавления; при обновлении товара его прежняя строка
+        # помечается удаленной (None в _ids/_products, False в _alive)
+        self._ids: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+        self._products: List[Optional[Dict[str, Any]]] = []
+        self._alive = np.zeros(0, dtype=bool)
+
+        # Матрица частот n-грамм хранится блоками строк: каждое добавление - новый блок,
+        # небольшие соседние блоки сливаются (как в LSM-дереве), поэтому уже добавленные
+        # строки не копируются при каждом добавлении
+        self._blocks: List[sparse.csr_matrix] = []
+        self._block_starts: List[int] = []
+
+        # Количество документов, содержащих каждую n-грамму (для IDF)
+        self._doc_freq = np.zeros(N_FEATURES, dtype=np.float64)
+
+        # IDF и нормы взвешенных строк, пересчитываются лениво после изменений
+        self._idf: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add_products(self, products: Iterable[Dict[str, Any]]) -> int:
+        """
+        Добавляет или обновляет товары.
+
+        Args:
+            products: Список товаров
+
+        Returns:
+            Количество обработанных товаров
+        """
+        # Из повторов одного товара в пачке берем последний
+        latest = {str(product.get("id")): product for product in products if product.get("id") is not None}
+        if not latest:
+            return 0
+        ids = list(latest)
+        products = list(latest.values())
+
+        counts = self._vectorizer.transform([product_text(product) for product in products]).tocsr()
+        with self._lock:
+            for product_id in ids:
+                position = self._positions.get(product_id)
+                if position is not None:
+                    # Обновление: убираем вклад старого вектора в частоты и помечаем строку удаленной
+                    self._doc_freq[self._row(position).indices] -= 1
+                    self._alive[position] = False
+                    self._ids[position] = None
+                    self._products[position] = None
+
+            start = len(self._ids)
+            for offset, product_id in enumerate(ids):
+                self._positions[product_id] = start + offset
+            self._ids.extend(ids)
+            self._products.extend(products)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            # Индексы в строке CSR уникальны, поэтому bincount дает число документов на n-грамму
+            self._doc_freq += np.bincount(counts.indices, minlength=N_FEATURES)
+
+            self._blocks.append(counts)
+            self._block_starts.append(start)
+            self._merge_blocks()
+            self._idf = None
+            self._norms = None
+        return len(products)
+
+    def _row(self, position: int) -> sparse.csr_matrix:
+        """Возвращает строку частот товара по его позиции (вызывается под блокировкой)."""
+        block = bisect.bisect_right(self._block_starts, position) - 1
+        return self._blocks[block].getrow(position - self._block_starts[block])
+
+    def _merge_blocks(self) -> None:
+        """
+        Сливает последний блок с предыдущими, пока они сопоставимы по размеру, и
+        убирает удаленные строки, когда их становится больше живых.
+        """
+        while len(self._blocks) >= 2 and self._blocks[-2].shape[0] <= 2 * self._blocks[-1].shape[0]:
+            tail = self._blocks.pop()
+            self._block_starts.pop()
+            self._blocks[-1] = sparse.vstack([self._blocks[-1], tail], format="csr")
+
+        dead = len(self._ids) - len(self._positions)
+        if dead <= max(COMPACT_MIN_DEAD, len(self._positions)):
+            return
+        keep = np.flatnonzero(self._alive)
+        matrix = sparse.vstack(self._blocks, format="csr")[keep]
+        self._ids = [self._ids[position] for position in keep]
+        self._products = [self._products[position] for position in keep]
+        self._positions = {product_id: position for position, product_id in enumerate(self._ids)}
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._blocks = [matrix]
+        self._block_starts = [0]
+        logger.debug(f"Движок похожих товаров сжат: удалено {dead} устаревших строк")
+
+    def _ensure_weights(self) -> None:
+        """Пересчитывает IDF и нормы взвешенных строк, если с прошлого расчета были изменения."""
+        if self._norms is not None or not self._positions:
+            return
+        n_docs = len(self._positions)
+        self._idf = np.log((1.0 + n_docs) / (1.0 + self._doc_freq)) + 1.0
+        idf_squared = self._idf ** 2
+        # ||c * idf||^2 = (c^2) @ idf^2: одно умножение на блок вместо пересборки матрицы
+        self._norms = np.sqrt(np.concatenate([block.power(2) @ idf_squared for block in self._blocks]))
+
+    def _top_k(self, vector: sparse.csr_matrix, k: int, exclude: Optional[set] = None,
+               min_score: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Находит k ближайших товаров к вектору запроса.
+
+        Args:
+            vector: Вектор частот n-грамм запроса
+            k: Количество результатов
+            exclude: ID товаров, которые нужно исключить
+            min_score: Минимальная косинусная близость
+
+        Returns:
+            Список пар (товар, близость) по убыванию близости
+        """
+        with self._lock:
+            self._ensure_weights()
+            if self._norms is None:
+                return []
+            weighted = sparse.csr_matrix(vector.multiply(self._idf))
+            query_norm = np.sqrt(weighted.multiply(weighted).sum())
+            if query_norm == 0:
+                return []
+            # Косинус (c * idf) и (q * idf): скалярное произведение c @ (q * idf^2), деленное на нормы
+            query = sparse.csr_matrix(weighted.multiply(self._idf)).T.tocsc()
+            dots = np.concatenate([(block @ query).toarray().ravel() for block in self._blocks])
+            denominators = self._norms * query_norm
+            scores = np.divide(dots, denominators, out=np.zeros_like(dots), where=denominators > 0)
+            scores[~self._alive] = -1.0
+
+            exclude = exclude or set()
+            candidates = min(len(scores), k + len(exclude))
+            if candidates <= 0:
+                return []
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for position in top:
+                score = float(scores[position])
+                if score <= min_score:
+                    break
+                if self._ids[position] in exclude:
+                    continue
+                results.append((self._products[position], score))
+                if len(results) >= k:
+                    break
+            return results
+
+    def similar_to_product(self, product_id: Any, k: int = 10) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Находит товары, похожие на товар из индекса.
+
+        Args:
+            product_id: ID товара
+            k: Количество результатов
+
+        Returns:
+            Список пар (товар, близость); пустой, если товар неизвестен
+        """
+        product_id = str(product_id)
+        with self._lock:
+            position = self._positions.get(product_id)
+            if position is None:
+                return []
+            row = self._row(position)
+        return self._top_k(row, k, exclude={product_id})
+
+    def similar_to_text(self, text: str, k: int = 10, exclude_ids: Optional[Iterable[Any]] = None,
+                        min_score: float = 0.1) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Находит товары, похожие на текстовое описание.
+
+        Args:
+            text: Текст запроса (например, поисковый запрос пользователя)
+            k: Количество результатов
+            exclude_ids: ID товаров, которые нужно исключить
+            min_score: Минимальная косинусная близость
+
+        Returns:
+            Список пар (товар, близость)
+        """
+        if not text:
+            return []
+        vector = self._vectorizer.transform([text.lower().replace("ё", "е")]).tocsr()
+        exclude = {str(product_id) for product_id in (exclude_ids or [])}
+        return self._top_k(vector, k, exclude=exclude, min_score=min_score)
+
+
+# Общий движок для всего приложения (создается из разных потоков через asyncio.to_thread)
+_similarity_engine: Optional[ProductSimilarityEngine] = None
+_similarity_engine_lock = threading.Lock()
+
+
+def get_similarity_engine() -> ProductSimilarityEngine:
+    """
+    Возвращает общий для приложения движок похожих товаров.
+
+    При первом вызове движок заполняется товарами из локального индекса
+    и подписывается на его обновления.
+
+    Returns:
+        Экземпляр ProductSimilarityEngine
+    """
+    global _similarity_engine
+    if _similarity_engine is not None:
+        return _similarity_engine
+    with _similarity_engine_lock:
+        if _similarity_engine is None:
+            engine = ProductSimilarityEngine()
+            try:
+                from product_index import get_product_index
+                index = get_product_index()
+                loaded = engine.add_products(index.iter_products())
+                index.subscribe(engine.add_products)
+                logger.info(f"Движок похожих товаров инициализирован: {loaded} товаров")
+            except Exception as e:
+                logger.error(f"Не удалось загрузить товары из индекса в движок похожих товаров: {str(e)}")
+            _similarity_engine = engine
+    return _similarity_engine
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Локальные заглушки внешних сервисов для нагрузочного тестирования.
+
+Один aiohttp-сервер имитирует:
+- search.wb.ru — поиск товаров (постранично, с фильтром по цене);
+- card.wb.ru — детальную информацию о товарах;
+- similar-products.wildberries.ru — похожие товары;
+- basket-XX.wbbasket.ru, images.wbstatic.net, i.pinimg.com — изображения;
+- openrouter.ai и api.openai.com — chat completions (в том числе потоковые ответы SSE);
+- www.pinterest.com — страницу поиска пинов.
+
+Запросы принимаются в виде /{исходный хост}/{путь} — именно так их переписывает
+upstream_override.py, если приложение запущено с UPSTREAM_OVERRIDE_URL.
+Для каждого хоста настраиваются задержка (логнормальное распределение),
+доля ошибок 503 и доля ответов 429.
+
+Пример:
+    python standin_servers.py --port 8900 --latency-ms 80 --error-rate 0.01
+    UPSTREAM_OVERRIDE_URL=http://127.0.0.1:8900 uvicorn api:app --port 8000
+    python load_test.py --base-url http://127.0.0.1:8000 --scenario all
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Словари для генерации правдоподобных товаров
+PRODUCT_TYPES = ["платье", "футболка", "джинсы", "куртка", "свитер", "рубашка", "юбка", "брюки", "кроссовки", "пальто"]
+BRANDS = ["Zarina", "Befree", "Gloria Jeans", "Love Republic", "O'STIN", "Incity", "Sela", "Concept Club"]
+COLORS = ["черный", "белый", "синий", "бежевый", "серый", "зеленый", "красный", "розовый"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+
+# Ответ модели по умолчанию (JSON с предметами одежды подходит и для анализа изображений)
+DEFAULT_COMPLETION = json.dumps([
+    {"type": "платье", "color": "черный", "description": "платье миди черное", "gender": "женский"},
+    {"type": "кроссовки", "color": "белый", "description": "кроссовки белые кожаные", "gender": "унисекс"}
+], ensure_ascii=False)
+
+
+def _stable_seed(*parts: Any) -> int:
+    """Вычисляет детерминированное зерно генератора по набору значений."""
+    return int(hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def make_jpeg(size: int) -> bytes:
+    """
+    Формирует байты, распознаваемые как JPEG (сигнатура, заголовок JFIF, маркер конца).
+
+    Args:
+        size: Желаемый размер в байтах
+
+    Returns:
+        Содержимое «изображения»
+    """
+    header = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    return header + b"\x00" * max(0, size - len(header) - 2) + b"\xff\xd9"
+
+
+class UpstreamProfile:
+    """
+    Профиль поведения имитируемого хоста: задержка и доля ошибок.
+    """
+
+    def __init__(self, latency_ms: float = 50.0, jitter: float = 0.5, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0):
+        """
+        Args:
+            latency_ms: Медианная задержка ответа (в миллисекундах)
+            jitter: Параметр sigma логнормального распределения задержки (0 — фиксированная задержка)
+            error_rate: Доля ответов 503
+            rate_limit_rate: Доля ответов 429
+        """
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """
+        Возвращает задержку очередного ответа в секундах.
+
+        Args:
+            rng: Генератор случайных чисел
+
+        Returns:
+            Задержка в секундах
+        """
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.jitter <= 0:
+            return self.latency_ms / 1000
+        return rng.lognormvariate(math.log(self.latency_ms), self.jitter) / 1000
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], default: "UpstreamProfile") -> "UpstreamProfile":
+        """Создает профиль из словаря, подставляя недостающие значения из профиля по умолчанию."""
+        return cls(
+            latency_ms=float(data.get("latency_ms", default.latency_ms)),
+            jitter=float(data.get("jitter", default.jitter)),
+            error_rate=float(data.get("error_rate", default.error_rate)),
+            rate_limit_rate=float(data.get("rate_limit_rate", default.rate_limit_rate))
+        )
+
+
+class StandinServers:
+    """
+    Набор заглушек внешних сервисов в одном aiohttp-приложении.
+    """
+
+    def __init__(
+        self,
+        default_profile: Optional[UpstreamProfile] = None,
+        host_profiles: Optional[Dict[str, UpstreamProfile]] = None,
+        catalog_size: int = 1000,
+        pins_per_page: int = 50,
+        image_bytes: int = 20000,
+        stream_chunks: int = 20,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            default_profile: Профиль для хостов без отдельной настройки
+            host_profiles: Профили по хостам; ключ — имя хоста или его суффикс (например, "wbbasket.ru")
+            catalog_size: Количество товаров в выдаче по любому запросу
+            pins_per_page: Количество пинов на странице поиска Pinterest
+            image_bytes: Размер отдаваемых изображений
+            stream_chunks: Количество фрагментов в потоковом ответе chat completions
+            seed: Зерно генератора задержек и ошибок
+        """
+        self.default_profile = default_profile or UpstreamProfile()
+        self.host_profiles = host_profiles or {}
+        self.catalog_size = catalog_size
+        self.pins_per_page = pins_per_page
+        self.image = make_jpeg(image_bytes)
+        self.stream_chunks = max(1, stream_chunks)
+        self._rng = random.Random(seed)
+        self._stats: Counter = Counter()
+
+    def profile_for(self, host: str) -> UpstreamProfile:
+        """
+        Возвращает профиль хоста (точное совпадение имеет приоритет над суффиксом).
+
+        Args:
+            host: Имя хоста
+
+        Returns:
+            Профиль поведения
+        """
+        if host in self.host_profiles:
+            return self.host_profiles[host]
+        for suffix, profile in self.host_profiles.items():
+            if host.endswith("." + suffix):
+                return profile
+        return self.default_profile
+
+    def make_app(self) -> web.Application:
+        """
+        Создает aiohttp-приложение с маршрутами заглушек.
+
+        Returns:
+            Приложение aiohttp
+        """
+        app = web.Application()
+        app.router.add_get("/_stats", self.handle_stats)
+        app.router.add_route("*", "/{host}/{path:.*}", self.dispatch)
+        return app
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """Возвращает количество обработанных запросов по хостам и кодам ответов."""
+        return web.json_response(dict(self._stats))
+
+    async def dispatch(self, request: web.Request) -> web.StreamResponse:
+        """
+        Имитирует задержку и ошибки хоста, затем передает запрос обработчику.
+
+        Args:
+            request: Запрос вида /{host}/{path}
+
+        Returns:
+            Ответ заглушки
+        """
+        host = request.match_info["host"].lower()
+        path = "/" + request.match_info["path"]
+        profile = self.profile_for(host)
+
+        await asyncio.sleep(profile.sample_latency(self._rng))
+
+        roll = self._rng.random()
+        if roll < profile.rate_limit_rate:
+            return self._count(host, web.json_response({"error": "too many requests"}, status=429))
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            return self._count(host, web.json_response({"error": "service unavailable"}, status=503))
+
+        if host == "search.wb.ru":
+            response = self.handle_wb_search(request)
+        elif host == "card.wb.ru":
+            response = self.handle_wb_detail(request)
+        elif host == "similar-products.wildberries.ru":
+            response = self.handle_wb_similar(request)
+        elif host in ("openrouter.ai", "api.openai.com") and path.endswith("/chat/completions"):
+            return self._count(host, await self.handle_chat_completions(request))
+        elif host.endswith("pinterest.com"):
+            response = self.handle_pinterest_search(request)
+        elif path.endswith((".jpg", ".jpeg", ".webp", ".png")):
+            response = web.Response(body=self.image, content_type="image/jpeg")
+        else:
+            response = web.json_response({"error": "not found"}, status=404)
+        return self._count(host, response)
+
+    def _count(self, host: str, response: web.StreamResponse) -> web.StreamResponse:
+        """Учитывает ответ в статистике."""
+        self._stats[f"{host} {response.status}"] += 1
+        return response
+
+    def _make_product(self, product_id: int, query: str = "") -> Dict[str, Any]:
+        """
+        Генерирует товар в формате ответа поиска Wildberries.
+
+        Args:
+            product_id: ID товара
+            query: Поисковый запрос (попадает в название товара)
+
+        Returns:
+            Данные о товаре
+        """
+        rng = random.Random(product_id)
+        price = rng.randrange(500, 20000, 10)
+        sale_price = int(price * rng.uniform(0.4, 1.0))
+        product_type = rng.choice(PRODUCT_TYPES)
+        color = rng.choice(COLORS)
+        return {
+            "id": product_id,
+            "name": f"{product_type.capitalize()} {color} {query}".strip(),
+            "brand": rng.choice(BRANDS),
+            "priceU": price * 100,
+            "salePriceU": sale_price * 100,
+            "rating": rng.randint(1, 5),
+            "reviewRating": round(rng.uniform(3.5, 5.0), 1),
+            "feedbacks": rng.randint(0, 5000),
+            "pics": rng.randint(1, 8),
+            "colors": [{"name": color}],
+            "sizes": [{"name": size, "origName": size} for size in rng.sample(SIZES, 3)],
+            "entity": product_type
+        }
+
+    def _catalog(self, query: str) -> List[int]:
+        """Возвращает ID товаров, «найденных» по запросу (детерминированно)."""
+        base = 100000000 + _stable_seed(query) % 300000000
+        return [base + index * 7 for index in range(self.catalog_size)]
+
+    def handle_wb_search(self, request: web.Request) -> web.Response:
+        """
+        Имитирует поиск Wildberries.
+
+        Поддерживает параметры обоих клиентов: page/priceU (WildberriesAPI)
+        и limit/skip/price_low/price_high (WildberriesAsyncAPI).
+        """
+        query = request.query.get("query", "")
+        limit = int(request.query.get("limit", "100"))
+        page = int(request.query.get("page", "1"))
+        skip = int(request.query.get("skip", str((page - 1) * limit)))
+
+        low, high = 0, float("inf")
+        if "priceU" in request.query:
+            low_value, _, high_value = request.query["priceU"].partition(";")
+            low, high = float(low_value or 0), float(high_value or "inf")
+        if "price_low" in request.query:
+            low = float(request.query["price_low"])
+        if "price_high" in request.query:
+            high = float(request.query["price_high"])
+
+        products = []
+        for product_id in self._catalog(query)[skip:skip + limit]:
+            product = self._make_product(product_id, query)
+            if product["priceU"] >= low and product["salePriceU"] <= high:
+                products.append(product)
+        return web.json_response({"data": {"products": products}})
+
+    def handle_wb_detail(self, request: web.Request) -> web.Response:
+        """Имитирует card.wb.ru: детальная информация по списку ID (параметр nm)."""
+        products = []
+        for value in request.query.get("nm", "").split(";"):
+            if value.strip().isdigit():
+                product = self._make_product(int(value))
+                product["description"] = f"{product['name']} от бренда {product['brand']}. Состав: хлопок 95%, эластан 5%."
+                products.append(product)
+        return web.json_response({"data": {"products": products}})
+
+    def handle_wb_similar(self, request: web.Request) -> web.Response:
+        """Имитирует сервис похожих товаров Wildberries."""
+        product_id = int(request.query.get("nmId", "0") or 0)
+        similar_ids = [product_id + offset * 13 for offset in range(1, 21)]
+        return web.json_response({"data": {"products": [self._make_product(pid) for pid in similar_ids]}})
+
+    def handle_pinterest_search(self, request: web.Request) -> web.Response:
+        """Имитирует страницу поиска пинов Pinterest."""
+        query = request.query.get("q", "")
+        pins = []
+        embedded_pins = {}
+        for index in range(self.pins_per_page):
+            digest = hashlib.md5(f"{query}|{index}".encode("utf-8")).hexdigest()
+            image_path = f"{digest[:2]}/{digest[2:4]}/{digest[4:6]}/{digest}.jpg"
+            pin_id = str(int(digest[:12], 16))
+            embedded_pins[pin_id] = {
+                "id": pin_id,
+                "grid_title": f"{query} образ {index + 1}",
+                "images": {
+                    "236x": {"url": f"https://i.pinimg.com/236x/{image_path}", "width": 236},
+                    "736x": {"url": f"https://i.pinimg.com/736x/{image_path}", "width": 736},
+                },
+            }
+            pins.append(
+                f'<div data-test-id="pin" data-grid-item="true">'
+                f'<a href="https://www.pinterest.com/pin/{int(digest[:12], 16)}/">'
+                f'<div title="{query} образ {index + 1}"></div>'
+                f'<img src="https://i.pinimg.com/236x/{image_path}" '
+                f'srcset="https://i.pinimg.com/236x/{image_path} 1x, https://i.pinimg.com/736x/{image_path} 3x">'
+                f'</a></div>'
+            )
+        pws_data = json.dumps(
+            {"props": {"initialReduxState": {"pins": embedded_pins}}}, ensure_ascii=False
+        ).replace("</", "<\\/")
+        html = (
+            "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+            f"<title>{query} — Pinterest</title></head><body>"
+            f"<div role='list'>{''.join(pins)}</div>"
+            # Данные страницы, как их встраивает Pinterest (используются при загрузке без браузера)
+            f"<script id='__PWS_DATA__' type='application/json'>{pws_data}</script>"
+            "</body></html>"
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_chat_completions(self, request: web.Request) -> web.StreamResponse:
+        """
+        Имитирует chat completions OpenRouter/OpenAI (обычный ответ или поток SSE).
+        """
+        try:
+            payload = await request.json()
+        except Exception:
+            payload = {}
+        model = payload.get("model", "standin-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        content = DEFAULT_COMPLETION
+
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(content) // 4, "total_tokens": 100 + len(content) // 4}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        profile = self.profile_for(request.match_info["host"].lower())
+        chunk_size = max(1, math.ceil(len(content) / self.stream_chunks))
+        for start in range(0, len(content), chunk_size):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            # Межтокенная задержка — доля от задержки хоста
+            await asyncio.sleep(profile.sample_latency(self._rng) / self.stream_chunks)
+        done = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }
+        await response.write(f"data: {json.dumps(done)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def main():
+    """Точка входа для запуска заглушек из командной строки."""
+    parser = argparse.ArgumentParser(description="Локальные заглушки Wildberries, OpenRouter и Pinterest")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=8900, help="Порт")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Медианная задержка ответа (мс)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Разброс задержки (sigma логнормального распределения)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--catalog-size", type=int, default=1000, help="Количество товаров в выдаче по запросу")
+    parser.add_argument("--pins-per-page", type=int, default=50, help="Количество пинов на странице поиска")
+    parser.add_argument("--image-bytes", type=int, default=20000, help="Размер отдаваемых изображений")
+    parser.add_argument("--config", help="JSON-файл с профилями хостов: {\"search.wb.ru\": {\"latency_ms\": 200, \"error_rate\": 0.05}}")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора задержек и ошибок")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    default_profile = UpstreamProfile(args.latency_ms, args.jitter, args.error_rate, args.rate_limit_rate)
+    host_profiles = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            host_profiles = {
+                host: UpstreamProfile.from_dict(data, default_profile) for host, data in json.load(f).items()
+            }
+
+    servers = StandinServers(
+        default_profile=default_profile,
+        host_profiles=host_profiles,
+        catalog_size=args.catalog_size,
+        pins_per_page=args.pins_per_page,
+        image_bytes=args.image_bytes,
+        seed=args.seed
+    )
+    logger.info(f"Заглушки запущены на http://{args.host}:{args.port}; статистика: /_stats")
+    web.run_app(servers.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
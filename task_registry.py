@@ -0,0 +1,581 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Реестр задач API с ограничением памяти и хранением в SQLite.
+
+Раньше задачи жили в глобальном словаре: завершенные задачи со всеми результатами
+никогда не удалялись, GET /tasks сериализовал их все, а второй воркер uvicorn не видел
+задач первого. TaskRegistry заменяет этот словарь (поддерживает `in`, [], get, pop):
+
+- задачи, созданные в этом процессе («свои»), живут в памяти как обычные объекты и
+  меняются на месте, как раньше; раз в sync_interval секунд изменившиеся задачи
+  записываются в SQLite одной транзакцией (снимки задач делаются в event loop, а
+  все обращения к базе из event loop выполняются по очереди в отдельном потоке);
+- чужие задачи (созданные другим воркером или до перезапуска) читаются из SQLite;
+- завершенные задачи удаляются через ttl секунд после завершения, а в памяти держатся
+  только в пределах max_memory_mb (самые давние выгружаются, оставаясь в базе);
+- отмена задачи другого воркера передается через базу: владелец видит флаг при
+  синхронизации и вызывает on_cancel_request;
+- незавершенные задачи процесса, который перестал обновлять heartbeat (упал или был
+  перезапущен), помечаются как проваленные.
+
+Запись в базе - JSON всей задачи плюс служебные колонки для фильтрации и сортировки.
+Если SQLite недоступен, реестр работает только в памяти.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.getenv("TASK_REGISTRY_PATH", "task_registry/tasks.db")
+DEFAULT_TTL = float(os.getenv("TASK_REGISTRY_TTL", str(6 * 3600)))
+DEFAULT_MAX_MEMORY_MB = float(os.getenv("TASK_REGISTRY_MAX_MEMORY_MB", "64"))
+DEFAULT_SYNC_INTERVAL = float(os.getenv("TASK_REGISTRY_SYNC_INTERVAL", "1"))
+# Через сколько секунд без heartbeat незавершенная задача считается брошенной
+STALE_AFTER = float(os.getenv("TASK_REGISTRY_STALE_AFTER", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    source TEXT,
+    query TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    heartbeat REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_created_at ON tasks (created_at);
+CREATE INDEX IF NOT EXISTS tasks_finished_at ON tasks (finished_at);
+CREATE INDEX IF NOT EXISTS tasks_owner_status ON tasks (owner, status);
+"""
+
+_UPSERT_SQL = (
+    "INSERT INTO tasks (task_id, status, source, query, owner, created_at, updated_at, "
+    "finished_at, heartbeat, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(task_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at, "
+    "finished_at = excluded.finished_at, heartbeat = excluded.heartbeat, data = excluded.data"
+)
+
+
+class _Entry:
+    """Задача, принадлежащая этому процессу."""
+
+    __slots__ = ("task", "created_at", "finished_at", "written", "size")
+
+    def __init__(self, task: Any, created_at: float):
+        self.task = task
+        self.created_at = created_at
+        self.finished_at: Optional[float] = None
+        # JSON, записанный в базу последним (для поиска изменений)
+        self.written: Optional[str] = None
+        self.size = 0
+
+
+class TaskRegistry:
+    """Реестр задач: свои задачи в памяти, все задачи - в SQLite."""
+
+    def __init__(
+        self,
+        model: Type[Any],
+        final_statuses: Iterable[str],
+        path: Optional[str] = DEFAULT_PATH,
+        ttl: float = DEFAULT_TTL,
+        max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL
+    ):
+        """
+        Инициализация реестра.
+
+        Args:
+            model: Класс задачи (pydantic-модель с полями task_id, status, source, query)
+            final_statuses: Статусы, после которых задача больше не меняется
+            path: Путь к файлу SQLite (None - только в памяти)
+            ttl: Сколько секунд хранить завершенную задачу
+            max_memory_mb: Сколько памяти могут занимать завершенные задачи процесса
+            sync_interval: Период синхронизации с базой в секундах
+        """
+        self._model = model
+        self.final_statuses = frozenset(final_statuses)
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.sync_interval = sync_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_cancel_request: Optional[Callable[[str], None]] = None
+
+        # Незавершенные свои задачи и завершенные, удерживаемые в памяти (от давних к новым)
+        self._active: Dict[str, _Entry] = {}
+        self._finished: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._memory_bytes = 0
+        # Доступ к соединению SQLite из разных потоков (в event loop не захватывается)
+        self._lock = threading.RLock()
+        # Последняя поставленная операция с базой: операции выполняются по очереди
+        self._db_tail: Optional["asyncio.Future[Any]"] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._stats = {"writes": 0, "expired": 0, "unloaded": 0, "db_reads": 0, "abandoned": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: str) -> None:
+        """Открывает базу и создает схему."""
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL позволяет читать базу из других процессов во время записи
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            logger.info(f"Реестр задач: база {path}, владелец {self.owner}")
+        except Exception as e:
+            logger.error(f"Не удалось открыть базу задач {path}, задачи хранятся только в памяти: {e}")
+            self._conn = None
+
+    # --- доступ как к словарю ---
+    #
+    # Синхронные методы обращаются к базе прямо в вызывающем потоке; в event loop для
+    # задач, которых нет в памяти, используются их асинхронные версии (get_async,
+    # contains_async, request_cancel_async, stats_async), выполняющие запросы в потоке.
+
+    def _local_entry(self, task_id: str) -> Optional[_Entry]:
+        """Возвращает запись своей задачи из памяти."""
+        return self._active.get(task_id) or self._finished.get(task_id)
+
+    def _load(self, task_id: str) -> Optional[Any]:
+        """Читает задачу из базы."""
+        if self._conn is None:
+            return None
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            self._stats["db_reads"] += 1
+            return self._model.model_validate_json(row[0]) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка при чтении задачи {task_id} из базы: {e}")
+            return None
+
+    def get(self, task_id: str, default: Any = None) -> Any:
+        """
+        Возвращает задачу по идентификатору.
+
+        Своя задача возвращается как живой объект; чужая - как копия из базы
+        (ее изменения не сохраняются).
+
+        Args:
+            task_id: Идентификатор задачи
+            default: Значение, если задачи нет
+
+        Returns:
+            Задача или default
+        """
+        entry = self._local_entry(task_id)
+        if entry is not None:
+            return entry.task
+        task = self._load(task_id)
+        return default if task is None else task
+
+    async def get_async(self, task_id: str, default: Any = None) -> Any:
+        """Асинхронная версия get: чужая задача читается из базы в отдельном потоке."""
+        entry = self._local_entry(task_id)
+        if entry is not None:
+            return entry.task
+        task = await asyncio.to_thread(self._load, task_id)
+        return default if task is None else task
+
+    def __getitem__(self, task_id: str) -> Any:
+        task = self.get(task_id)
+        if task is None:
+            raise KeyError(task_id)
+        return task
+
+    def _exists(self, task_id: object) -> bool:
+        """Проверяет наличие задачи в базе."""
+        if self._conn is None:
+            return False
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT 1 FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            return row is not None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке задачи {task_id} в базе: {e}")
+            return False
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._active or task_id in self._finished or self._exists(task_id)
+
+    async def contains_async(self, task_id: str) -> bool:
+        """Асинхронная версия проверки `task_id in registry`."""
+        if task_id in self._active or task_id in self._finished:
+            return True
+        return await asyncio.to_thread(self._exists, task_id)
+
+    def __setitem__(self, task_id: str, task: Any) -> None:
+        """Регистрирует новую задачу этого процесса и сразу ставит ее запись в базу в очередь."""
+        self._drop_local(task_id)
+        entry = _Entry(task, time.time())
+        self._active[task_id] = entry
+        if self._conn is None:
+            return
+        row = self._row(task_id, entry, task.model_dump_json(), entry.created_at)
+        self._submit_db(self._write_task, task_id, entry, row)
+
+    def _write_task(self, task_id: str, entry: _Entry, row: Tuple[Any, ...]) -> None:
+        """Записывает одну задачу в базу."""
+        try:
+            with self._lock:
+                self._conn.execute(_UPSERT_SQL, row)
+            self._stats["writes"] += 1
+        except Exception as e:
+            # Запись повторится при синхронизации
+            entry.written = None
+            logger.error(f"Ошибка при записи задачи {task_id} в базу: {e}")
+
+    def _row(self, task_id: str, entry: _Entry, data: str, now: float) -> Tuple[Any, ...]:
+        """Формирует строку таблицы для задачи."""
+        entry.written = data
+        return (
+            task_id, entry.task.status, getattr(entry.task, "source", None), getattr(entry.task, "query", None),
+            self.owner, entry.created_at, now, entry.finished_at, now, data,
+        )
+
+    def pop(self, task_id: str, default: Any = None) -> Any:
+        """
+        Удаляет задачу из реестра и ставит ее удаление из базы в очередь.
+
+        Args:
+            task_id: Идентификатор задачи
+            default: Значение, если задачи нет
+
+        Returns:
+            Удаленная задача из памяти процесса или default
+        """
+        entry = self._local_entry(task_id)
+        self._drop_local(task_id)
+        if self._conn is not None:
+            self._submit_db(self._delete_task, task_id)
+        return default if entry is None else entry.task
+
+    def _delete_task(self, task_id: str) -> None:
+        """Удаляет задачу из базы."""
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        except Exception as e:
+            logger.error(f"Ошибка при удалении задачи {task_id} из базы: {e}")
+
+    def _drop_local(self, task_id: str) -> None:
+        """Убирает задачу из памяти процесса."""
+        self._active.pop(task_id, None)
+        entry = self._finished.pop(task_id, None)
+        if entry is not None:
+            self._memory_bytes -= entry.size
+
+    def is_local(self, task_id: str) -> bool:
+        """Выполняется ли задача в этом процессе."""
+        return task_id in self._active
+
+    def request_cancel(self, task_id: str) -> bool:
+        """
+        Передает владельцу задачи запрос на отмену через базу.
+
+        Args:
+            task_id: Идентификатор задачи
+
+        Returns:
+            True, если незавершенная задача найдена и флаг установлен
+        """
+        if self._conn is None:
+            return False
+        try:
+            placeholders = ",".join("?" * len(self.final_statuses))
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"UPDATE tasks SET cancel_requested = 1 WHERE task_id = ? AND status NOT IN ({placeholders})",
+                    (task_id, *self.final_statuses)
+                )
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка при запросе отмены задачи {task_id}: {e}")
+            return False
+
+    async def request_cancel_async(self, task_id: str) -> bool:
+        """Асинхронная версия request_cancel (запрос к базе выполняется в отдельном потоке)."""
+        return await asyncio.to_thread(self.request_cancel, task_id)
+
+    # --- синхронизация ---
+
+    def _submit_db(self, func: Callable[..., Any], *args: Any) -> Optional["asyncio.Future[Any]"]:
+        """
+        Выполняет операцию с базой в отдельном потоке, строго после ранее поставленных.
+
+        Порядок важен: более ранняя запись задачи не должна затереть более позднюю.
+        Без работающего event loop операция выполняется сразу.
+
+        Args:
+            func: Блокирующая функция, обращающаяся к базе
+            *args: Аргументы функции
+
+        Returns:
+            Задача asyncio с результатом func или None, если операция уже выполнена
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            func(*args)
+            return None
+
+        previous = self._db_tail
+
+        async def run() -> Any:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            return await asyncio.to_thread(func, *args)
+
+        task = loop.create_task(run())
+        self._db_tail = task
+        return task
+
+    async def start(self) -> None:
+        """Запускает периодическую синхронизацию с базой."""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def _sync_loop(self) -> None:
+        """Периодически синхронизирует реестр с базой."""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync_async()
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации реестра задач: {e}")
+
+    async def sync_async(self) -> None:
+        """
+        Асинхронная версия sync: снимки задач делаются в event loop (между изменениями
+        задачи обработчиком не может произойти переключение), а транзакция SQLite
+        выполняется в отдельном потоке.
+        """
+        now = time.time()
+        rows = self._collect(now)
+        if self._conn is None:
+            return
+        cancel_requests = await self._submit_db(self._commit, rows, now)
+        self._dispatch_cancel_requests(cancel_requests)
+
+    def sync(self) -> None:
+        """
+        Записывает изменившиеся свои задачи, обновляет heartbeat, удаляет устаревшие
+        задачи и обрабатывает запросы отмены от других воркеров.
+        """
+        now = time.time()
+        rows = self._collect(now)
+        if self._conn is None:
+            return
+        self._dispatch_cancel_requests(self._commit(rows, now))
+
+    def _dispatch_cancel_requests(self, cancel_requests: List[str]) -> None:
+        """Вызывает on_cancel_request для своих незавершенных задач."""
+        for task_id in cancel_requests:
+            if task_id in self._active and self.on_cancel_request is not None:
+                logger.info(f"Получен запрос отмены задачи {task_id} от другого воркера")
+                self.on_cancel_request(task_id)
+
+    def _collect(self, now: float) -> List[Tuple[Any, ...]]:
+        """
+        Сериализует изменившиеся свои задачи и переносит завершенные в память завершенных.
+
+        Returns:
+            Строки таблицы для записи
+        """
+        rows: List[Tuple[Any, ...]] = []
+        for task_id, entry in list(self._active.items()):
+            data = entry.task.model_dump_json()
+            finished = entry.task.status in self.final_statuses
+            if finished:
+                entry.finished_at = now
+                entry.size = len(data)
+                del self._active[task_id]
+                self._finished[task_id] = entry
+                self._memory_bytes += entry.size
+            if data != entry.written:
+                rows.append(self._row(task_id, entry, data, now))
+            # Сериализованная копия нужна только для сравнения, пока задача меняется
+            if finished:
+                entry.written = None
+
+        self._evict(now)
+        return rows
+
+    def _commit(self, rows: List[Tuple[Any, ...]], now: float) -> List[str]:
+        """
+        Записывает задачи и обслуживает базу одной транзакцией (может выполняться в отдельном потоке).
+
+        Args:
+            rows: Строки таблицы для записи
+            now: Время синхронизации
+
+        Returns:
+            Идентификаторы своих задач, отмену которых запросили другие воркеры
+        """
+        placeholders = ",".join("?" * len(self.final_statuses))
+        final = tuple(self.final_statuses)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                if rows:
+                    conn.executemany(_UPSERT_SQL, rows)
+                    self._stats["writes"] += len(rows)
+                conn.execute(
+                    f"UPDATE tasks SET heartbeat = ? WHERE owner = ? AND status NOT IN ({placeholders})",
+                    (now, self.owner, *final)
+                )
+                expired = conn.execute(
+                    "DELETE FROM tasks WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.ttl,)
+                ).rowcount
+                self._stats["expired"] += max(0, expired)
+                abandoned = conn.execute(
+                    f"SELECT task_id, data FROM tasks WHERE owner != ? AND heartbeat < ? AND status NOT IN ({placeholders})",
+                    (self.owner, now - STALE_AFTER, *final)
+                ).fetchall()
+                for task_id, data in abandoned:
+                    self._mark_abandoned(conn, task_id, data, now)
+                cancel_requests = [
+                    row[0] for row in conn.execute(
+                        f"SELECT task_id FROM tasks WHERE owner = ? AND cancel_requested = 1 AND status NOT IN ({placeholders})",
+                        (self.owner, *final)
+                    )
+                ]
+                if cancel_requests:
+                    # Запрос обрабатывается один раз
+                    conn.execute("UPDATE tasks SET cancel_requested = 0 WHERE owner = ?", (self.owner,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cancel_requests
+
+    def _mark_abandoned(self, conn: sqlite3.Connection, task_id: str, data: str, now: float) -> None:
+        """Помечает проваленной задачу, владелец которой перестал отвечать."""
+        try:
+            task = self._model.model_validate_json(data)
+            task.status = "failed"
+            task.message = "Задача прервана: обработчик остановлен или перезапущен"
+            conn.execute(
+                "UPDATE tasks SET status = ?, finished_at = ?, updated_at = ?, data = ? WHERE task_id = ?",
+                (task.status, now, now, task.model_dump_json(), task_id)
+            )
+            self._stats["abandoned"] += 1
+            logger.warning(f"Задача {task_id} брошена обработчиком и помечена как проваленная")
+        except Exception as e:
+            logger.error(f"Не удалось пометить брошенную задачу {task_id}: {e}")
+
+    def _evict(self, now: float) -> None:
+        """Выгружает из памяти устаревшие и не помещающиеся в лимит завершенные задачи."""
+        while self._finished:
+            task_id, entry = next(iter(self._finished.items()))
+            expired = now - entry.finished_at > self.ttl
+            if not expired and self._memory_bytes <= self.max_memory_bytes:
+                break
+            del self._finished[task_id]
+            self._memory_bytes -= entry.size
+            # С базой выгруженная задача остается доступной через нее, без базы - удаляется
+            self._stats["expired" if expired else "unloaded"] += 1
+
+    # --- список и статистика ---
+
+    def page(self, offset: int = 0, limit: int = 50, status: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Возвращает страницу задач, начиная с самых новых.
+
+        Своя задача в базе может отставать от объекта в памяти не больше чем на
+        sync_interval, поэтому полная синхронизация перед чтением не выполняется.
+        Метод обращается к базе синхронно: из event loop его вызывают через asyncio.to_thread.
+
+        Args:
+            offset: Сколько задач пропустить
+            limit: Размер страницы
+            status: Фильтр по статусу
+
+        Returns:
+            Словарь с общим числом задач и списком задач страницы
+        """
+        if self._conn is None:
+            entries = sorted(
+                [*self._active.values(), *self._finished.values()], key=lambda entry: entry.created_at, reverse=True
+            )
+            tasks = [entry.task for entry in entries if status is None or entry.task.status == status]
+            return {"total": len(tasks), "tasks": tasks[offset:offset + limit]}
+
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT task_id, data FROM tasks {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        tasks = []
+        for task_id, data in rows:
+            entry = self._active.get(task_id) or self._finished.get(task_id)
+            tasks.append(entry.task if entry is not None else self._model.model_validate_json(data))
+        return {"total": total, "tasks": tasks}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние реестра.
+
+        Returns:
+            Словарь с числом задач в памяти, занятой ими памятью и счетчиками
+        """
+        stored = None
+        if self._conn is not None:
+            try:
+                with self._lock:
+                    stored = self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+            except Exception as e:
+                logger.error(f"Ошибка при подсчете задач в базе: {e}")
+        return {
+            "backend": "sqlite" if self._conn is not None else "memory",
+            "active": len(self._active),
+            "finished_in_memory": len(self._finished),
+            "memory_bytes": self._memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "stored": stored,
+            **self._stats,
+        }
+
+    async def stats_async(self) -> Dict[str, Any]:
+        """Асинхронная версия stats (подсчет задач в базе выполняется в отдельном потоке)."""
+        return await asyncio.to_thread(self.stats)
+
+    async def close(self) -> None:
+        """Останавливает синхронизацию и записывает последние изменения."""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        try:
+            await self.sync_async()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении задач: {e}")
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
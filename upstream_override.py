@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Перенаправление запросов к внешним сервисам на локальные заглушки.
+
+Если задана переменная окружения UPSTREAM_OVERRIDE_URL (например,
+http://127.0.0.1:8900), запросы к Wildberries, OpenRouter, OpenAI и Pinterest
+переписываются в вид {UPSTREAM_OVERRIDE_URL}/{исходный хост}/{путь}?{параметры}.
+Так приложение можно запустить против standin_servers.py и измерять его
+пропускную способность без обращения к реальным сервисам.
+
+Перенаправление включается явно вызовом install_upstream_override() и затрагивает
+aiohttp.ClientSession, requests.Session и клиентов OpenAI (через OPENAI_BASE_URL).
+Ключи circuit breakers и кешей продолжают строиться по исходным URL.
+"""
+
+import logging
+import os
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_OVERRIDE_ENV = "UPSTREAM_OVERRIDE_URL"
+
+# Хосты (и их поддомены), запросы к которым перенаправляются
+OVERRIDDEN_HOST_SUFFIXES = (
+    "wb.ru",
+    "wbbasket.ru",
+    "wbstatic.net",
+    "wildberries.ru",
+    "openrouter.ai",
+    "openai.com",
+    "pinterest.com",
+    "pinimg.com",
+)
+
+_installed = False
+
+
+def get_override_base() -> Optional[str]:
+    """
+    Возвращает базовый URL локальных заглушек.
+
+    Returns:
+        URL без завершающего слеша или None, если перенаправление не настроено
+    """
+    base = os.getenv(UPSTREAM_OVERRIDE_ENV, "").strip()
+    return base.rstrip("/") or None
+
+
+def _is_overridden_host(host: str) -> bool:
+    """Проверяет, относится ли хост к перенаправляемым сервисам."""
+    host = host.lower()
+    return any(host == suffix or host.endswith("." + suffix) for suffix in OVERRIDDEN_HOST_SUFFIXES)
+
+
+def rewrite_url(url: str) -> str:
+    """
+    Переписывает URL внешнего сервиса на адрес локальной заглушки.
+
+    Args:
+        url: Исходный URL
+
+    Returns:
+        URL заглушки или исходный URL, если перенаправление не настроено или хост не из списка
+    """
+    base = get_override_base()
+    if not base:
+        return url
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname or not _is_overridden_host(parts.hostname):
+        return url
+    rewritten = f"{base}/{parts.hostname}{parts.path or '/'}"
+    if parts.query:
+        rewritten += f"?{parts.query}"
+    return rewritten
+
+
+def install_upstream_override() -> bool:
+    """
+    Включает перенаправление HTTP-клиентов на локальные заглушки (если задан UPSTREAM_OVERRIDE_URL).
+
+    Повторные вызовы ничего не делают.
+
+    Returns:
+        True, если перенаправление включено
+    """
+    global _installed
+    base = get_override_base()
+    if not base:
+        return False
+    if _installed:
+        return True
+
+    import aiohttp
+
+    original_aiohttp_request = aiohttp.ClientSession._request
+
+    async def _request(self, method, str_or_url, *args, **kwargs):
+        return await original_aiohttp_request(self, method, rewrite_url(str(str_or_url)), *args, **kwargs)
+
+    aiohttp.ClientSession._request = _request
+
+    try:
+        import requests
+
+        original_requests_request = requests.Session.request
+
+        def request(self, method, url, *args, **kwargs):
+            return original_requests_request(self, method, rewrite_url(str(url)), *args, **kwargs)
+
+        requests.Session.request = request
+    except ImportError:
+        pass
+
+    # Клиенты OpenAI берут базовый URL из окружения при создании
+    os.environ.setdefault("OPENAI_BASE_URL", f"{base}/api.openai.com/v1")
+
+    _installed = True
+    logger.warning(f"Запросы к внешним сервисам перенаправляются на {base}")
+    return True
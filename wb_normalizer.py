@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Единый движок нормализации товаров Wildberries.
+
+Принимает «сырые» ответы поиска (search.wb.ru) и детальной информации (card.wb.ru)
+и за один проход формирует компактные записи о товарах. Детальная информация
+присоединяется через индекс по ID, а цены и скидки считаются векторно
+для всей страницы результатов сразу.
+
+Используется всеми клиентами Wildberries: WildberriesAsyncAPI, WildberriesAPI
+и WildberriesService.
+"""
+
+import logging
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Any, Iterable, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Шаблон ссылки на карточку товара
+PRODUCT_URL_TEMPLATE = "https://www.wildberries.ru/catalog/{id}/detail.aspx"
+
+# Шаблон ссылки на изображение на CDN wbstatic
+WBSTATIC_IMAGE_TEMPLATE = "https://images.wbstatic.net/c516x688/new/{vol}/{id}-{index}.jpg"
+
+# Шаблон ссылки на изображение в корзине wbbasket
+BASKET_IMAGE_TEMPLATE = "https://basket-{bucket:02d}.wbbasket.ru/vol{vol}/part{part}/{id}/images/c516x688/{index}.webp"
+
+
+def coerce_number(value: Any, default: float = 0.0) -> float:
+    """
+    Безопасно преобразует значение из ответа API в число.
+
+    Поддерживает int/float, строки с пробелами и запятой ("1 299,50"),
+    а также None и некорректные значения (возвращается значение по умолчанию).
+
+    Args:
+        value: Исходное значение
+        default: Значение по умолчанию
+
+    Returns:
+        Число с плавающей точкой
+    """
+    if value is None or isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        cleaned = value.replace(" ", "").replace("\xa0", "").replace(",", ".")
+        if not cleaned:
+            return default
+        try:
+            return float(cleaned)
+        except ValueError:
+            return default
+    return default
+
+
+def coerce_product_id(value: Any) -> int:
+    """
+    Безопасно преобразует ID товара в целое число.
+
+    Args:
+        value: Исходный ID (число или строка)
+
+    Returns:
+        ID товара или 0, если преобразование невозможно
+    """
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except (ValueError, TypeError):
+        return 0
+
+
+def compute_price_columns(
+    prices: Iterable[Any],
+    sale_prices: Iterable[Any],
+    divisor: float = 100.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Векторно рассчитывает цены, скидочные цены и процент скидки для всей страницы.
+
+    Правила совпадают с прежней логикой клиентов:
+    - цены переводятся из копеек в рубли делением на divisor;
+    - если скидочная цена равна 0 или больше основной, используется основная цена;
+    - скидка = round(100 - sale_price / price * 100), если price > 0 и sale_price < price.
+
+    Args:
+        prices: Основные цены (priceU или уже в рублях)
+        sale_prices: Скидочные цены (salePriceU или уже в рублях)
+        divisor: Делитель для перевода в рубли (1 — если цены уже в рублях)
+
+    Returns:
+        Кортеж массивов (price, sale_price, discount)
+    """
+    price = np.fromiter((coerce_number(p) for p in prices), dtype=np.float64)
+    sale = np.fromiter((coerce_number(s) for s in sale_prices), dtype=np.float64, count=len(price))
+
+    if divisor and divisor != 1:
+        price /= divisor
+        sale /= divisor
+
+    # Если скидочной цены нет или она больше основной, используем основную цену
+    sale = np.where((sale <= 0) | (sale > price), price, sale)
+
+    # Процент скидки без деления на ноль
+    ratio = np.divide(sale, price, out=np.ones_like(price), where=price > 0)
+    discount = np.where((price > 0) & (sale < price), np.rint(100 - ratio * 100), 0).astype(np.int64)
+
+    return price, sale, discount
+
+
+def extract_products(payload: Union[Dict[str, Any], List[Dict[str, Any]], None]) -> List[Dict[str, Any]]:
+    """
+    Извлекает список товаров из ответа API.
+
+    Args:
+        payload: Ответ API вида {"data": {"products": [...]}} или готовый список
+
+    Returns:
+        Список «сырых» товаров
+    """
+    if not payload:
+        return []
+    if isinstance(payload, list):
+        return payload
+    data = payload.get("data") or {}
+    products = data.get("products") if isinstance(data, dict) else None
+    return products if isinstance(products, list) else []
+
+
+def index_details(details_payload: Union[Dict[str, Any], List[Dict[str, Any]], None]) -> Dict[int, Dict[str, Any]]:
+    """
+    Строит индекс детальной информации по ID товара.
+
+    Args:
+        details_payload: Ответ card.wb.ru/cards/detail
+
+    Returns:
+        Словарь {id товара: детальная информация}
+    """
+    index = {}
+    for detail in extract_products(details_payload):
+        product_id = coerce_product_id(detail.get("id"))
+        if product_id:
+            index[product_id] = detail
+    return index
+
+
+def build_wbstatic_image_urls(product_id: int, pics: Any, max_images: int = 5) -> List[str]:
+    """
+    Формирует ссылки на изображения товара на CDN wbstatic.
+
+    Args:
+        product_id: ID товара
+        pics: Количество изображений (число) или список изображений
+        max_images: Максимальное количество ссылок
+
+    Returns:
+        Список URL изображений
+    """
+    count = pics if isinstance(pics, int) else len(pics or [])
+    vol = str(product_id)[:4]
+    return [
+        WBSTATIC_IMAGE_TEMPLATE.format(vol=vol, id=product_id, index=i)
+        for i in range(1, min(max_images, count) + 1)
+    ]
+
+
+def build_basket_image_urls(product_id: int, bucket: int, count: int = 4) -> List[str]:
+    """
+    Формирует ссылки на изображения товара в корзине wbbasket.
+
+    Args:
+        product_id: ID товара
+        bucket: Номер корзины
+        count: Количество изображений
+
+    Returns:
+        Список URL изображений
+    """
+    product_id_str = str(product_id)
+    vol = product_id_str[:4]
+    part = product_id_str[:6]
+    return [
+        BASKET_IMAGE_TEMPLATE.format(bucket=bucket, vol=vol, part=part, id=product_id, index=i)
+        for i in range(1, count + 1)
+    ]
+
+
+def normalize_products(
+    search_payload: Union[Dict[str, Any], List[Dict[str, Any]], None],
+    details_payload: Union[Dict[str, Any], List[Dict[str, Any]], None] = None,
+    limit: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    price_divisor: float = 100.0
+) -> List[Dict[str, Any]]:
+    """
+    Нормализует страницу результатов поиска за один проход.
+
+    Фильтрация по цене повторяет поведение API Wildberries:
+    min_price применяется к основной цене (price), max_price — к скидочной (sale_price).
+
+    Args:
+        search_payload: Ответ поиска или список «сырых» товаров
+        details_payload: Ответ с детальной информацией (опционально)
+        limit: Максимальное количество товаров
+        min_price: Минимальная цена в рублях
+        max_price: Максимальная цена в рублях
+        price_divisor: Делитель для перевода цен в рубли
+
+    Returns:
+        Список компактных записей о товарах с ключами id, name, brand, price,
+        sale_price, discount, rating, feedbacks, pics, colors, sizes, description, url
+    """
+    raw_products = extract_products(search_payload)
+    if limit is not None:
+        raw_products = raw_products[:limit]
+    if not raw_products:
+        return []
+
+    details_index = index_details(details_payload)
+
+    # Первый проход по данным: только извлечение столбцов для векторного расчета
+    price, sale, discount = compute_price_columns(
+        [item.get("priceU", item.get("price")) for item in raw_products],
+        [item.get("salePriceU", item.get("sale_price")) for item in raw_products],
+        divisor=price_divisor
+    )
+
+    mask = np.ones(len(raw_products), dtype=bool)
+    if min_price is not None:
+        mask &= price >= min_price
+    if max_price is not None:
+        mask &= sale <= max_price
+
+    price_list = price.tolist()
+    sale_list = sale.tolist()
+    discount_list = discount.tolist()
+
+    records = []
+    for position in np.flatnonzero(mask).tolist():
+        item = raw_products[position]
+        product_id = coerce_product_id(item.get("id"))
+        if not product_id:
+            logger.debug(f"Пропущен товар без корректного ID: {item.get('id')!r}")
+            continue
+
+        detail = details_index.get(product_id, item)
+
+        records.append({
+            "id": product_id,
+            "name": item.get("name") or detail.get("name", ""),
+            "brand": item.get("brand") or detail.get("brand", ""),
+            "price": price_list[position],
+            "sale_price": sale_list[position],
+            "discount": discount_list[position],
+            "rating": item.get("rating", item.get("reviewRating", 0)) or 0,
+            "feedbacks": item.get("feedbacks", 0) or 0,
+            "pics": item.get("pics", detail.get("pics", 0)),
+            "colors": [color.get("name", "") for color in detail.get("colors", []) if isinstance(color, dict)],
+            "sizes": [
+                {
+                    "name": size.get("name", ""),
+                    "origName": size.get("origName", ""),
+                    "stocks": [stock.get("qty", 0) for stock in size.get("stocks", [])]
+                }
+                for size in detail.get("sizes", []) if isinstance(size, dict)
+            ],
+            "description": detail.get("description", ""),
+            "url": PRODUCT_URL_TEMPLATE.format(id=product_id)
+        })
+
+    return records
+
+
+def _generate_benchmark_payload(count: int, seed: int = 42) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Генерирует синтетические ответы поиска и детальной информации.
+
+    Args:
+        count: Количество товаров
+        seed: Значение для генератора случайных чисел
+
+    Returns:
+        Кортеж (ответ поиска, ответ детальной информации)
+    """
+    rnd = random.Random(seed)
+    products = []
+    details = []
+    for i in range(count):
+        product_id = 10000000 + i
+        price_u = rnd.randint(100, 50000) * 100
+        products.append({
+            "id": product_id,
+            "name": f"Товар {i}",
+            "brand": f"Бренд {i % 50}",
+            "priceU": price_u,
+            "salePriceU": int(price_u * rnd.uniform(0.4, 1.0)),
+            "rating": rnd.randint(0, 5),
+            "feedbacks": rnd.randint(0, 1000),
+            "pics": rnd.randint(1, 10)
+        })
+        details.append({
+            "id": product_id,
+            "colors": [{"name": "черный"}, {"name": "белый"}],
+            "sizes": [{"name": "M", "origName": "46", "stocks": [{"qty": 3}]}]
+        })
+    # Детали приходят в другом порядке, как и в реальном API
+    rnd.shuffle(details)
+    return {"data": {"products": products}}, {"data": {"products": details}}
+
+
+def benchmark(count: int = 10000, repeats: int = 5) -> Dict[str, float]:
+    """
+    Измеряет пропускную способность движка нормализации.
+
+    Args:
+        count: Количество товаров на странице
+        repeats: Количество повторов (берется лучший результат)
+
+    Returns:
+        Словарь с количеством товаров, лучшим временем и товарами в секунду
+    """
+    search_payload, details_payload = _generate_benchmark_payload(count)
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        normalize_products(search_payload, details_payload)
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        "products": count,
+        "seconds": best,
+        "products_per_second": count / best if best > 0 else float("inf")
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    result = benchmark(count)
+    print(f"Нормализовано {result['products']} товаров за {result['seconds']:.4f} с "
+          f"({result['products_per_second']:.0f} товаров/с, цель — 10000 товаров/с)")
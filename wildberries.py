@@ -5,7 +5,7 @@
 import aiohttp
 import asyncio
 import logging
-from typing import Optional, Dict, List, Any, Union
+from typing import Optional, Dict, List, Any, Union, AsyncIterator
 from datetime import datetime
 import json
 from pathlib import Path
@@ -15,8 +15,14 @@ from retry import retry
 import random
 import time
 import urllib.parse
+import hashlib
 from bs4 import BeautifulSoup
 
+from wb_normalizer import normalize_products
+from product_index import get_product_index
+from circuit_breaker import CircuitOpenError, get_circuit_breaker
+from persistent_store import get_persistent_store
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -28,6 +34,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Адрес поиска Wildberries
+SEARCH_URL = 'https://search.wb.ru/exactmatch/ru/common/v4/search'
+
+# Размер страницы поисковой выдачи Wildberries и ограничение на количество обходимых страниц
+SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_PAGES = int(os.getenv("WB_SEARCH_MAX_PAGES", "5"))
+
 class ProductInfo(BaseModel):
     """Модель для хранения информации о товаре."""
     id: int
@@ -122,80 +135,245 @@ class WildberriesAPI:
               Тесты показывают, что приоритет отдается параметру top_price.
         """
         try:
-            await self._init_session()
+            return await self.fetch_products(query, limit, low_price, top_price, discount, gender)
+        except CircuitOpenError as e:
+            logger.warning(f"Поиск товаров пропущен: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка при поиске товаров: {e}")
+            # Логирование стека исключения для отладки
+            import traceback
+            logger.error(f"Стек исключения: {traceback.format_exc()}")
+            return []
+    
+    async def fetch_products(
+        self,
+        query: str,
+        limit: int = 10,
+        low_price: Optional[int] = None,
+        top_price: Optional[int] = None,
+        discount: Optional[int] = None,
+        gender: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Поиск товаров по запросу без подавления ошибок (параметры - как у search_products).
+        
+        Пустой список означает, что Wildberries ответил и товаров действительно нет;
+        недоступность API, ошибочный статус или некорректный ответ пробрасываются
+        исключением. Поэтому результат можно сохранять в кеш, в том числе пустой.
+        
+        Returns:
+            Список найденных товаров
             
-            # Безопасное преобразование и валидация параметров цены
-            try:
-                # Преобразуем None или строковые значения в целые числа
-                safe_low_price = 1 if low_price is None else int(low_price)
-                safe_top_price = 1000000 if top_price is None else int(top_price)
-                
-                # Проверяем, что цены имеют корректные значения
-                if safe_low_price < 1:
-                    safe_low_price = 1
-                    logger.warning(f"Минимальная цена скорректирована до {safe_low_price}")
-                
-                if safe_top_price < 1:
-                    safe_top_price = 1000000
-                    logger.warning(f"Максимальная цена скорректирована до {safe_top_price}")
-                
-                # Проверка на противоречивые параметры
-                if safe_low_price > safe_top_price:
-                    logger.warning(f"Противоречивые параметры цены: low_price ({safe_low_price}) > top_price ({safe_top_price}). Это может привести к неожиданным результатам.")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Ошибка при обработке параметров цены: {e}. Используются значения по умолчанию.")
+        Raises:
+            CircuitOpenError: Если поиск Wildberries временно недоступен
+            Exception: При ошибке запроса или некорректном ответе API
+        """
+        await self._init_session()
+        
+        # Безопасное преобразование и валидация параметров цены
+        try:
+            # Преобразуем None или строковые значения в целые числа
+            safe_low_price = 1 if low_price is None else int(low_price)
+            safe_top_price = 1000000 if top_price is None else int(top_price)
+        
+            # Проверяем, что цены имеют корректные значения
+            if safe_low_price < 1:
                 safe_low_price = 1
+                logger.warning(f"Минимальная цена скорректирована до {safe_low_price}")
+        
+            if safe_top_price < 1:
                 safe_top_price = 1000000
-            
-            # Логирование параметров запроса
-            logger.info(f"Поиск товаров по запросу '{query}' с параметрами: limit={limit}, low_price={safe_low_price}, top_price={safe_top_price}, discount={discount}, gender={gender}")
-            
-            # Преобразование цен в копейки для API
-            price_min = safe_low_price * 100
-            price_max = safe_top_price * 100
-            
-            # Формируем URL для поиска с учетом преобразованных цен
-            url = (
-                'https://search.wb.ru/exactmatch/ru/common/v4/search'
-                '?appType=1'
-                f'&curr={self.currency}'
-                f'&dest={self.dest}'
-                f'&locale={self.locale}'
-                '&page=1'
-                f'&priceU={price_min};{price_max}'
-                f'&query={urllib.parse.quote(query)}'
-                '&resultset=catalog'
-                '&sort=popular'
-                '&spp=0'
-                '&suppressSpellcheck=false'
+                logger.warning(f"Максимальная цена скорректирована до {safe_top_price}")
+        
+            # Проверка на противоречивые параметры
+            if safe_low_price > safe_top_price:
+                logger.warning(f"Противоречивые параметры цены: low_price ({safe_low_price}) > top_price ({safe_top_price}). Это может привести к неожиданным результатам.")
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ошибка при обработке параметров цены: {e}. Используются значения по умолчанию.")
+            safe_low_price = 1
+            safe_top_price = 1000000
+        
+        # Логирование параметров запроса
+        logger.info(f"Поиск товаров по запросу '{query}' с параметрами: limit={limit}, low_price={safe_low_price}, top_price={safe_top_price}, discount={discount}, gender={gender}")
+        
+        # Добавляем случайную задержку для имитации поведения пользователя
+        await asyncio.sleep(random.uniform(1.0, 3.0))
+        
+        # Обходим страницы выдачи, пока не наберем limit подходящих товаров
+        products = [
+            product async for product in self.iter_search_products(
+                query,
+                limit=limit,
+                low_price=safe_low_price,
+                top_price=safe_top_price,
+                discount=discount,
+                gender=gender
             )
+        ]
+        
+        if products:
+            logger.info(f"Успешно найдено {len(products)} товаров")
+        else:
+            logger.warning(f"Не найдены товары для запроса '{query}'")
+        
+        return products
+    
+    async def iter_search_products(
+        self,
+        query: str,
+        limit: Optional[int] = 10,
+        low_price: int = 1,
+        top_price: int = 1000000,
+        discount: Optional[int] = None,
+        max_pages: int = MAX_SEARCH_PAGES,
+        gender: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Лениво обходит страницы выдачи Wildberries и отдает подходящие товары.
+        
+        Фильтры по цене применяются к каждой странице по мере ее получения.
+        Пока обрабатывается текущая страница, следующая уже загружается.
+        Обход останавливается, как только набрано limit товаров, выдача
+        закончилась или достигнут max_pages.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество товаров (None — без ограничения)
+            low_price: Минимальная цена в рублях (по основной цене)
+            top_price: Максимальная цена в рублях (по скидочной цене)
+            discount: Минимальная скидка в процентах
+            max_pages: Максимальное количество страниц выдачи
+            gender: Пол, с которым товары страниц сохраняются в локальный индекс
             
-            if discount is not None:
-                url += f'&discount={discount}'
-            
-            logger.info(f"Поиск товаров по URL: {url}")
-            
-            # Добавляем необходимые заголовки
-            headers = {
-                **self.headers,
-                'Accept': 'application/json',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Cache-Control': 'no-cache',
-                'Origin': 'https://www.wildberries.ru',
-                'Pragma': 'no-cache',
-                'Referer': 'https://www.wildberries.ru/',
-                'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
-                'sec-ch-ua-mobile': '?0',
-                'sec-ch-ua-platform': '"Windows"',
-                'Sec-Fetch-Dest': 'empty',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Site': 'same-site'
-            }
+        Yields:
+            Товары в формате search_products
+        """
+        await self._init_session()
+        
+        yielded = 0
+        seen_ids = set()
+        next_page_task: Optional[asyncio.Task] = asyncio.create_task(
+            self._fetch_search_page(query, 1, low_price, top_price, discount)
+        )
+        try:
+            for page in range(1, max_pages + 1):
+                try:
+                    data = await next_page_task
+                except Exception as e:
+                    # Ошибка первой страницы пробрасывается, последующих — завершает обход с уже собранным
+                    if page == 1:
+                        raise
+                    logger.warning(f"Не удалось загрузить страницу {page} по запросу '{query}': {e}")
+                    break
+                finally:
+                    next_page_task = None
+                
+                raw_products = data.get('data', {}).get('products', []) if data else []
+                if not raw_products:
+                    logger.info(f"Выдача по запросу '{query}' закончилась на странице {page}")
+                    break
+                
+                # Предзагружаем следующую страницу, пока обрабатываем текущую
+                if page < max_pages and len(raw_products) >= SEARCH_PAGE_SIZE:
+                    next_page_task = asyncio.create_task(
+                        self._fetch_search_page(query, page + 1, low_price, top_price, discount)
+                    )
+                
+                records = normalize_products(data, min_price=low_price, max_price=top_price)
+                logger.info(f"Страница {page}: получено {len(raw_products)} товаров, подходят по цене {len(records)}")
+                
+                # Сохраняем товары страницы в локальный полнотекстовый индекс
+                try:
+                    await get_product_index().add_products_async(records, gender)
+                except Exception as e:
+                    logger.warning(f"Не удалось добавить товары в индекс: {e}")
+                
+                for record in records:
+                    product_id = str(record['id'])
+                    if product_id in seen_ids:
+                        continue
+                    seen_ids.add(product_id)
+                    
+                    yield self.format_record(record)
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+                
+                if next_page_task is None:
+                    break
+        finally:
+            # Отменяем предзагрузку, если потребитель остановился раньше, и дожидаемся ее,
+            # чтобы задача не пережила генератор, а ее ошибка не осталась незамеченной
+            if next_page_task is not None:
+                next_page_task.cancel()
+                await asyncio.gather(next_page_task, return_exceptions=True)
+    
+    async def _fetch_search_page(
+        self,
+        query: str,
+        page: int,
+        low_price: int,
+        top_price: int,
+        discount: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Загружает одну страницу поисковой выдачи.
+        
+        Args:
+            query: Поисковый запрос
+            page: Номер страницы
+            low_price: Минимальная цена в рублях
+            top_price: Максимальная цена в рублях
+            discount: Минимальная скидка в процентах
             
-            # Добавляем случайную задержку для имитации поведения пользователя
-            await asyncio.sleep(random.uniform(1.0, 3.0))
+        Returns:
+            Ответ API
             
+        Raises:
+            Exception: При ошибочном статусе или некорректном ответе API
+        """
+        # Формируем URL для поиска (цены передаются в копейках)
+        url = (
+            f'{SEARCH_URL}'
+            '?appType=1'
+            f'&curr={self.currency}'
+            f'&dest={self.dest}'
+            f'&locale={self.locale}'
+            f'&page={page}'
+            f'&priceU={low_price * 100};{top_price * 100}'
+            f'&query={urllib.parse.quote(query)}'
+            '&resultset=catalog'
+            '&sort=popular'
+            '&spp=0'
+            '&suppressSpellcheck=false'
+        )
+        
+        if discount is not None:
+            url += f'&discount={discount}'
+        
+        logger.info(f"Поиск товаров по URL: {url}")
+        
+        # Добавляем необходимые заголовки
+        headers = {
+            **self.headers,
+            'Accept': 'application/json',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Cache-Control': 'no-cache',
+            'Origin': 'https://www.wildberries.ru',
+            'Pragma': 'no-cache',
+            'Referer': 'https://www.wildberries.ru/',
+            'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
+            'sec-ch-ua-mobile': '?0',
+            'sec-ch-ua-platform': '"Windows"',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'same-site'
+        }
+        
+        with get_circuit_breaker(url).protect() as outcome:
             async with self._session.get(url, headers=headers, timeout=30) as response:
+                outcome.status(response.status)
                 if response.status == 429:
                     logger.warning("Получен статус 429 (слишком много запросов), ждем 10 секунд")
                     await asyncio.sleep(10)
@@ -204,13 +382,12 @@ class WildberriesAPI:
                 if response.status != 200:
                     logger.error(f"Ошибка при поиске товаров: HTTP {response.status}")
                     logger.error(f"Ответ сервера: {await response.text()}")
-                    return []
+                    raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
                 
                 # Сначала получаем текст ответа для отладки
                 text = await response.text()
                 
                 # Логируем хеш ответа для отладки вместо полного текста
-                import hashlib
                 response_hash = hashlib.md5(text.encode()).hexdigest()
                 logger.debug(f"Получен ответ (MD5: {response_hash}), длина: {len(text)} символов")
                 
@@ -218,118 +395,54 @@ class WildberriesAPI:
                     data = json.loads(text)
                 except json.JSONDecodeError as e:
                     logger.error(f"Ошибка декодирования JSON: {e}. Текст ответа: {text[:200]}...")
-                    return []
+                    raise Exception("Wildberries API вернул некорректный JSON")
                 
                 if 'data' not in data or 'products' not in data['data']:
                     logger.warning(f"Некорректный формат ответа API: {text[:200]}...")
-                    return []
-                
-                total_products = len(data['data']['products'])
-                logger.info(f"Всего найдено {total_products} товаров, обрабатываем максимум {limit}")
-                
-                products = []
-                for item in data['data']['products'][:limit]:
-                    try:
-                        # Безопасное получение значений с проверкой типов
-                        product_id = str(item.get('id', ''))
-                        name = item.get('name', 'Без названия')
-                        brand = item.get('brand', '')
-                        
-                        # Безопасное преобразование цен
-                        try:
-                            price = int(item.get('priceU', 0) / 100)
-                        except (ValueError, TypeError):
-                            price = 0
-                            
-                        try:
-                            sale_price = int(item.get('salePriceU', 0) / 100)
-                        except (ValueError, TypeError):
-                            sale_price = price
-                        
-                        # Если sale_price равен 0, используем price
-                        if sale_price == 0:
-                            sale_price = price
-                        
-                        # Проверка соответствия параметрам фильтрации
-                        if price < safe_low_price:
-                            logger.debug(f"Товар '{name}' (ID: {product_id}) не соответствует фильтру low_price: цена {price} < {safe_low_price}")
-                            continue
-                            
-                        if sale_price > safe_top_price:
-                            logger.debug(f"Товар '{name}' (ID: {product_id}) не соответствует фильтру top_price: скидочная цена {sale_price} > {safe_top_price}")
-                            continue
-                        
-                        # Расчет скидки
-                        discount_percent = 0
-                        if price > 0 and sale_price < price:
-                            discount_percent = round(100 - (sale_price / price * 100))
-                        
-                        # Генерируем список возможных URL изображений
-                        image_urls = self._generate_image_urls(product_id)
-                        
-                        # Создаем объект товара
-                        product = {
-                            'id': product_id,
-                            'name': name,
-                            'brand': brand,
-                            'price': price,
-                            'sale_price': sale_price,
-                            'discount': discount_percent,
-                            'rating': item.get('rating', 0),
-                            'url': f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
-                            # Используем первый URL из списка как основной
-                            'image_url': image_urls[0],
-                            # Включаем полный список URL изображений
-                            'image_urls': image_urls
-                        }
-                        
-                        products.append(product)
-                        logger.info(f"Добавлен товар: {name} (Цена: {price} руб., Скидочная цена: {sale_price} руб., Скидка: {discount_percent}%)")
-                        
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке товара: {e}")
-                        continue
-                        
-                if products:
-                    logger.info(f"Успешно найдено {len(products)} товаров")
-                else:
-                    logger.warning(f"Не найдены товары для запроса '{query}'")
+                    raise Exception("Некорректный формат ответа Wildberries API")
                 
-                return products
-        except Exception as e:
-            logger.error(f"Ошибка при поиске товаров: {e}")
-            # Логирование стека исключения для отладки
-            import traceback
-            logger.error(f"Стек исключения: {traceback.format_exc()}")
-            return []
-        finally:
-            # Не закрываем сессию здесь, она может понадобиться для следующих запросов
-            pass
+                return data
+    
+    def format_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Преобразует нормализованную запись товара в формат search_products.
+        
+        Args:
+            record: Запись из normalize_products или локального индекса товаров
+            
+        Returns:
+            Данные о товаре
+        """
+        product_id = str(record['id'])
+        price = int(record['price'])
+        sale_price = int(record['sale_price'])
+        
+        # Генерируем список возможных URL изображений
+        image_urls = self._generate_image_urls(product_id)
+        logger.debug(f"Добавлен товар: {record['name']} (Цена: {price} руб., Скидочная цена: {sale_price} руб., Скидка: {record['discount']}%)")
+        
+        return {
+            'id': product_id,
+            'name': record['name'] or 'Без названия',
+            'brand': record['brand'],
+            'price': price,
+            'sale_price': sale_price,
+            'discount': record['discount'],
+            'rating': record['rating'],
+            'url': record['url'],
+            # Используем первый URL из списка как основной
+            'image_url': image_urls[0],
+            # Включаем полный список URL изображений
+            'image_urls': image_urls
+        }
     
     def _load_cache(self) -> None:
-        """Загружает кеш из файла."""
-        try:
-            cache_file = self._cache_dir / "products_cache.json"
-            if cache_file.exists():
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    self._cache = json.load(f)
-                logger.info(f"Загружен кеш с {len(self._cache)} товарами")
-            else:
-                self._cache = {}
-                logger.info("Создан новый кеш")
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке кеша: {e}")
-            self._cache = {}
+        """Загружает кеш товаров (изменения дописываются в журнал пачками)."""
+        self._cache = get_persistent_store(str(self._cache_dir / "products_cache.json"))
     
     def _save_cache(self) -> None:
-        """Сохраняет кеш в файл."""
-        try:
-            cache_file = self._cache_dir / "products_cache.json"
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(self._cache, f, ensure_ascii=False, indent=2)
-            logger.info("Кеш сохранен")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении кеша: {e}")
+        """Немедленно записывает накопленные изменения кеша на диск."""
+        self._cache.flush()
     
     @retry(tries=3, delay=1, backoff=2)
     async def get_product_details(self, product_id: Union[int, str]) -> Optional[ProductInfo]:
@@ -354,67 +467,69 @@ class WildberriesAPI:
         try:
             session = await self._init_session()
             
-            async with session.get(f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx") as response:
-                if response.status == 404:
-                    logger.warning(f"Товар {product_id} не найден")
+            with get_circuit_breaker("www.wildberries.ru").protect() as outcome:
+                async with session.get(f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx") as response:
+                    outcome.status(response.status)
+                    if response.status == 404:
+                        logger.warning(f"Товар {product_id} не найден")
+                        return None
+                        
+                    response.raise_for_status()
+                    data = await response.json()
+                    
+                    if not data.get("data"):
+                        logger.warning(f"Нет данных для товара {product_id}")
                     return None
                     
-                response.raise_for_status()
-                data = await response.json()
-                
-                if not data.get("data"):
-                    logger.warning(f"Нет данных для товара {product_id}")
-                return None
-                
-                product_data = data["data"]
-                product = ProductInfo(
-                    id=product_id,
-                    name=product_data["name"],
-                    brand=product_data.get("brand", ""),
-                    price=product_data["priceU"] / 100,
-                    sale_price=product_data.get("salePriceU", 0) / 100 if product_data.get("salePriceU") else None,
-                    category=product_data.get("category", ""),
-                    colors=product_data.get("colors", []),
-                    sizes=product_data.get("sizes", []),
-                    rating=product_data.get("rating"),
-                    reviews_count=product_data.get("feedbacks"),
-                    images=product_data.get("pics", []),
-                    url=f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
-                    description=product_data.get("description"),
-                    composition=product_data.get("composition"),
-                    available=product_data.get("available", True)
-                )
-                
-                # Обновляем кеш
-                self._cache[cache_key] = {
-                    "id": product.id,
-                    "name": product.name,
-                    "brand": product.brand,
-                    "price": product.price,
-                    "sale_price": product.sale_price,
-                    "category": product.category,
-                    "colors": product.colors,
-                    "sizes": product.sizes,
-                    "rating": product.rating,
-                    "reviews_count": product.reviews_count,
-                    "images": product.images,
-                    "url": product.url,
-                    "description": product.description,
-                    "composition": product.composition,
-                    "available": product.available,
-                    "last_updated": datetime.now().isoformat()
-                }
-                self._save_cache()
-                
-                logger.info(f"Получена информация о товаре {product_id}")
-                return product
+                    product_data = data["data"]
+                    product = ProductInfo(
+                        id=product_id,
+                        name=product_data["name"],
+                        brand=product_data.get("brand", ""),
+                        price=product_data["priceU"] / 100,
+                        sale_price=product_data.get("salePriceU", 0) / 100 if product_data.get("salePriceU") else None,
+                        category=product_data.get("category", ""),
+                        colors=product_data.get("colors", []),
+                        sizes=product_data.get("sizes", []),
+                        rating=product_data.get("rating"),
+                        reviews_count=product_data.get("feedbacks"),
+                        images=product_data.get("pics", []),
+                        url=f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
+                        description=product_data.get("description"),
+                        composition=product_data.get("composition"),
+                        available=product_data.get("available", True)
+                    )
+                    
+                    # Обновляем кеш
+                    self._cache[cache_key] = {
+                        "id": product.id,
+                        "name": product.name,
+                        "brand": product.brand,
+                        "price": product.price,
+                        "sale_price": product.sale_price,
+                        "category": product.category,
+                        "colors": product.colors,
+                        "sizes": product.sizes,
+                        "rating": product.rating,
+                        "reviews_count": product.reviews_count,
+                        "images": product.images,
+                        "url": product.url,
+                        "description": product.description,
+                        "composition": product.composition,
+                        "available": product.available,
+                        "last_updated": datetime.now().isoformat()
+                    }
+                    
+                    logger.info(f"Получена информация о товаре {product_id}")
+                    return product
                 
         except Exception as e:
             logger.error(f"Ошибка при получении информации о товаре {product_id}: {e}")
             return None
     
     async def close(self) -> None:
-        """Закрывает все открытые соединения."""
+        """Закрывает все открытые соединения и записывает кеш."""
+        self._save_cache()
         if self._session and not self._session.closed:
             await self._session.close()
             logger.info("Сессия закрыта")
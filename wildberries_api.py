@@ -11,6 +11,7 @@ from datetime import datetime
 import aiohttp
 import math
 import os
+import hashlib
 import random
 from dotenv import load_dotenv
 
@@ -18,7 +19,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Импортируем существующий класс WildberriesAPI
-from wildberries import WildberriesAPI, ProductInfo
+from wildberries import WildberriesAPI, ProductInfo, SEARCH_URL
+from wb_normalizer import compute_price_columns, coerce_product_id, build_basket_image_urls
+from search_cache import get_search_cache, make_search_key
+from product_index import get_product_index
+from circuit_breaker import CircuitOpenError, get_circuit_breaker, STATE_OPEN
 
 # Импортируем клиент GigaChat (если он установлен)
 try:
@@ -39,12 +44,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Пространство имен записей этого клиента в общем кеше поиска
+SEARCH_CACHE_NAMESPACE = "wildberries_service"
+
 class WildberriesService:
     """
     Сервисный класс для работы с API Wildberries.
     Предоставляет высокоуровневые методы для поиска товаров.
     """
     
+    # Количество товаров в одном запросе к GigaChat при генерации рекомендаций
+    CARE_BATCH_SIZE = 8
+    
     def __init__(self):
         """
         Инициализация сервиса Wildberries.
@@ -92,9 +103,11 @@ class WildberriesService:
         """
         try:
             session = await self._get_session()
-            async with session.head(url, timeout=1) as response:
-                return response.status == 200
-        except (aiohttp.ClientError, asyncio.TimeoutError):
+            with get_circuit_breaker(url).protect() as outcome:
+                async with session.head(url, timeout=1) as response:
+                    outcome.status(response.status)
+                    return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError):
             return False
     
     async def _find_correct_bucket(self, product_id: int) -> int:
@@ -161,6 +174,265 @@ class WildberriesService:
         self._bucket_cache[product_id] = fallback_bucket
         return fallback_bucket
     
+    async def _resolve_buckets(self, product_ids: List[int]) -> List[int]:
+        """
+        Одновременно определяет номера корзин для списка товаров.
+        
+        Args:
+            product_ids: Список ID товаров (0 — некорректный ID)
+            
+        Returns:
+            Список номеров корзин в том же порядке
+        """
+        async def resolve(product_id: int) -> int:
+            if not product_id:
+                return 1
+            try:
+                return await self._find_correct_bucket(product_id)
+            except Exception as e:
+                logger.warning(f"Не удалось определить корзину для товара {product_id}: {str(e)}")
+                return 1
+        
+        return list(await asyncio.gather(*(resolve(product_id) for product_id in product_ids)))
+    
+    def _care_cache_key(self, product: Dict[str, Any]) -> str:
+        """
+        Формирует стабильный (не зависящий от процесса) ключ кэша рекомендаций.
+        
+        Args:
+            product: Данные о товаре
+            
+        Returns:
+            SHA-1 от нормализованных названия и бренда товара
+        """
+        name = (product.get('name') or '').strip().lower()
+        brand = (product.get('brand') or '').strip().lower()
+        return hashlib.sha1(f"{name}|{brand}".encode('utf-8')).hexdigest()
+    
+    def _load_cached_care(self, product: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Загружает рекомендации по уходу из кэша.
+        
+        Args:
+            product: Данные о товаре
+            
+        Returns:
+            Словарь с рекомендациями или None, если в кэше их нет
+        """
+        cache_file = self._cache_dir / f"recommendations_{self._care_cache_key(product)}.json"
+        if not cache_file.exists():
+            return None
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш рекомендаций {cache_file}: {str(e)}")
+            return None
+    
+    def _save_cached_care(self, product: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        Сохраняет рекомендации по уходу в кэш.
+        
+        Args:
+            product: Данные о товаре
+            result: Словарь с рекомендациями
+        """
+        cache_file = self._cache_dir / f"recommendations_{self._care_cache_key(product)}.json"
+        try:
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кэша рекомендаций: {str(e)}")
+    
+    def _build_care_result(
+        self,
+        daily_care: str = "",
+        weekly_care: str = "",
+        recommendations: str = "",
+        morning_steps: Optional[List[Dict[str, str]]] = None,
+        evening_steps: Optional[List[Dict[str, str]]] = None,
+        beneficial_ingredients: str = "",
+        lifestyle_recommendations: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Формирует структуру рекомендаций по уходу, подставляя значения по умолчанию для пустых полей.
+        
+        Returns:
+            Словарь с рекомендациями
+        """
+        # Если не удалось извлечь данные из ответа, используем значения по умолчанию
+        if not morning_steps:
+            morning_steps = [
+                {"step": "Очищение", "product": "Очищающий гель для умывания"},
+                {"step": "Тонизирование", "product": "Увлажняющий тоник без спирта"},
+                {"step": "Сыворотка", "product": "Сыворотка с гиалуроновой кислотой"},
+                {"step": "Увлажнение", "product": "Увлажняющий крем для лица"},
+                {"step": "Защита", "product": "Солнцезащитный крем SPF 30+"}
+            ]
+        
+        if not evening_steps:
+            evening_steps = [
+                {"step": "Очищение", "product": "Очищающий гель для умывания"},
+                {"step": "Тонизирование", "product": "Увлажняющий тоник без спирта"},
+                {"step": "Сыворотка", "product": "Ночная восстанавливающая сыворотка"},
+                {"step": "Увлажнение", "product": "Ночной питательный крем"},
+                {"step": "Крем для глаз", "product": "Увлажняющий крем для области вокруг глаз"}
+            ]
+        
+        if not daily_care:
+            daily_care = "Используйте продукт ежедневно на очищенную кожу в соответствии с инструкцией."
+            
+        if not weekly_care:
+            weekly_care = "1-2 раза в неделю используйте продукт для более интенсивного ухода."
+            
+        if not recommendations:
+            recommendations = "Для усиления эффекта используйте в комплексе с другими продуктами той же линейки."
+            
+        if not beneficial_ingredients:
+            beneficial_ingredients = "Ищите в составе увлажняющие компоненты, антиоксиданты и активные ингредиенты для вашего типа кожи."
+            
+        if not lifestyle_recommendations:
+            lifestyle_recommendations = "Пейте достаточно воды, защищайте кожу от солнца и соблюдайте здоровое питание для поддержания красоты кожи."
+        
+        # Формируем структурированный результат
+        return {
+            "care_recommendations": {
+                "daily_weekly_recommendations": {
+                    "daily_care": daily_care,
+                    "weekly_care": weekly_care,
+                    "recommendations": recommendations,
+                },
+                "day_night_recommendations": {
+                    "morning_care": {
+                        "title": "Утренний уход",
+                        "steps": morning_steps
+                    },
+                    "evening_care": {
+                        "title": "Вечерний уход",
+                        "steps": evening_steps
+                    }
+                },
+                "additional_recommendations": {
+                    "weekly_care": weekly_care,
+                    "additional_care": "Для достижения максимального эффекта дополните уход масками и сыворотками.",
+                },
+                "lifestyle_ingredients": {
+                    "lifestyle_recommendations": lifestyle_recommendations,
+                    "beneficial_ingredients": beneficial_ingredients,
+                }
+            }
+        }
+    
+    async def _generate_recommendations_batch_with_gigachat(self, products: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Генерирует рекомендации по уходу для нескольких товаров одним запросом к GigaChat.
+        
+        Args:
+            products: Список товаров (не больше CARE_BATCH_SIZE)
+            
+        Returns:
+            Список рекомендаций в порядке товаров (None, если для товара ответ не разобран)
+        """
+        items_text = "\n".join(
+            f"{index}. Название: {product.get('name', '')}; Бренд: {product.get('brand', '')}; "
+            f"Описание: {(product.get('description') or '')[:300]}"
+            for index, product in enumerate(products)
+        )
+        prompt = f"""
+        Ты эксперт в области ухода за кожей. Для каждого продукта из списка сгенерируй рекомендации по применению и уходу.
+        
+        Продукты:
+        {items_text}
+        
+        Ответ дай строго в виде JSON-массива, по одному объекту на продукт, с полями:
+        "index" (номер продукта из списка), "daily_care", "weekly_care", "recommendations",
+        "morning_steps" и "evening_steps" (списки объектов {{"step": ..., "product": ...}}),
+        "beneficial_ingredients", "lifestyle_recommendations".
+        Учитывай тип продукта. Рекомендуй реальные типы продуктов для комплексного ухода.
+        """
+        messages = [
+            {"role": "system", "content": "Ты косметолог-эксперт, который дает профессиональные рекомендации по уходу за кожей."},
+            {"role": "user", "content": prompt}
+        ]
+        
+        # Клиент GigaChat синхронный, поэтому вызываем его в отдельном потоке
+        response = await asyncio.to_thread(self.gigachat.chat, messages)
+        content = response.choices[0].message.content.strip()
+        
+        start, end = content.find('['), content.rfind(']')
+        if start == -1 or end <= start:
+            raise ValueError("Ответ GigaChat не содержит JSON-массив")
+        items = json.loads(content[start:end + 1])
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(products)
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("index"))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(products):
+                results[index] = self._build_care_result(
+                    daily_care=item.get("daily_care") or "",
+                    weekly_care=item.get("weekly_care") or "",
+                    recommendations=item.get("recommendations") or "",
+                    morning_steps=[step for step in item.get("morning_steps") or [] if isinstance(step, dict)],
+                    evening_steps=[step for step in item.get("evening_steps") or [] if isinstance(step, dict)],
+                    beneficial_ingredients=item.get("beneficial_ingredients") or "",
+                    lifestyle_recommendations=item.get("lifestyle_recommendations") or ""
+                )
+        return results
+    
+    async def get_care_recommendations(self, products: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Вычисляет рекомендации по уходу для списка товаров вне пути поиска.
+        
+        Сначала используется кэш (по стабильному ключу название+бренд), затем
+        оставшиеся товары отправляются в GigaChat пакетами по CARE_BATCH_SIZE.
+        Для товаров, по которым GigaChat недоступен или не ответил, используются шаблоны.
+        
+        Args:
+            products: Список товаров (достаточно полей id, name, brand, description)
+            
+        Returns:
+            Словарь {id товара: рекомендации по уходу}
+        """
+        result: Dict[str, Dict[str, Any]] = {}
+        pending: List[Dict[str, Any]] = []
+        
+        for product in products:
+            cached = self._load_cached_care(product)
+            if cached:
+                result[str(product.get('id'))] = cached["care_recommendations"]
+            else:
+                pending.append(product)
+        
+        if pending and self.gigachat:
+            batches = [pending[i:i + self.CARE_BATCH_SIZE] for i in range(0, len(pending), self.CARE_BATCH_SIZE)]
+            outcomes = await asyncio.gather(
+                *(self._generate_recommendations_batch_with_gigachat(batch) for batch in batches),
+                return_exceptions=True
+            )
+            for batch, outcome in zip(batches, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.warning(f"Не удалось сгенерировать пакет рекомендаций с помощью GigaChat: {str(outcome)}")
+                    continue
+                for product, care in zip(batch, outcome):
+                    if care:
+                        self._save_cached_care(product, care)
+                        result[str(product.get('id'))] = care["care_recommendations"]
+            logger.info(f"Рекомендации сгенерированы пакетно для {len(pending)} товаров ({len(batches)} запросов к GigaChat)")
+        
+        # Для оставшихся товаров используем шаблоны
+        for product in pending:
+            product_id = str(product.get('id'))
+            if product_id not in result:
+                care = await self._generate_recommendations_with_templates(product)
+                result[product_id] = care["care_recommendations"]
+        
+        return result
+    
     async def _generate_recommendations_with_gigachat(self, product: Dict[str, Any]) -> Dict[str, Any]:
         """
         Генерирует рекомендации по уходу за кожей с использованием GigaChat.
@@ -177,15 +449,10 @@ class WildberriesService:
         
         try:
             # Кэш для рекомендаций, чтобы снизить количество запросов к API
-            cache_key = f"{product_name}_{product_brand}"
-            cache_file = self._cache_dir / f"recommendations_{hash(cache_key)}.json"
-            
-            # Проверяем наличие кэша
-            if cache_file.exists():
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                    logger.info(f"Рекомендации для '{product_name}' загружены из кэша")
-                    return cached_data
+            cached_data = self._load_cached_care(product)
+            if cached_data:
+                logger.info(f"Рекомендации для '{product_name}' загружены из кэша")
+                return cached_data
                     
             # Если нет GigaChat, используем шаблонные рекомендации с небольшими вариациями
             if not self.gigachat:
@@ -270,72 +537,18 @@ class WildberriesService:
                 elif "Рекомендации по образу жизни" in section:
                     lifestyle_recommendations = section.split("Рекомендации по образу жизни", 1)[-1].strip()
             
-            # Если не удалось извлечь данные из ответа, используем значения по умолчанию
-            if not morning_steps:
-                morning_steps = [
-                    {"step": "Очищение", "product": "Очищающий гель для умывания"},
-                    {"step": "Тонизирование", "product": "Увлажняющий тоник без спирта"},
-                    {"step": "Сыворотка", "product": "Сыворотка с гиалуроновой кислотой"},
-                    {"step": "Увлажнение", "product": "Увлажняющий крем для лица"},
-                    {"step": "Защита", "product": "Солнцезащитный крем SPF 30+"}
-                ]
-            
-            if not evening_steps:
-                evening_steps = [
-                    {"step": "Очищение", "product": "Очищающий гель для умывания"},
-                    {"step": "Тонизирование", "product": "Увлажняющий тоник без спирта"},
-                    {"step": "Сыворотка", "product": "Ночная восстанавливающая сыворотка"},
-                    {"step": "Увлажнение", "product": "Ночной питательный крем"},
-                    {"step": "Крем для глаз", "product": "Увлажняющий крем для области вокруг глаз"}
-                ]
-            
-            if not daily_care:
-                daily_care = "Используйте продукт ежедневно на очищенную кожу в соответствии с инструкцией."
-                
-            if not weekly_care:
-                weekly_care = "1-2 раза в неделю используйте продукт для более интенсивного ухода."
-                
-            if not recommendations:
-                recommendations = "Для усиления эффекта используйте в комплексе с другими продуктами той же линейки."
-                
-            if not beneficial_ingredients:
-                beneficial_ingredients = "Ищите в составе увлажняющие компоненты, антиоксиданты и активные ингредиенты для вашего типа кожи."
-                
-            if not lifestyle_recommendations:
-                lifestyle_recommendations = "Пейте достаточно воды, защищайте кожу от солнца и соблюдайте здоровое питание для поддержания красоты кожи."
-            
-            # Формируем структурированный результат
-            result = {
-                "care_recommendations": {
-                    "daily_weekly_recommendations": {
-                        "daily_care": daily_care,
-                        "weekly_care": weekly_care,
-                        "recommendations": recommendations,
-                    },
-                    "day_night_recommendations": {
-                        "morning_care": {
-                            "title": "Утренний уход",
-                            "steps": morning_steps
-                        },
-                        "evening_care": {
-                            "title": "Вечерний уход",
-                            "steps": evening_steps
-                        }
-                    },
-                    "additional_recommendations": {
-                        "weekly_care": weekly_care,
-                        "additional_care": "Для достижения максимального эффекта дополните уход масками и сыворотками.",
-                    },
-                    "lifestyle_ingredients": {
-                        "lifestyle_recommendations": lifestyle_recommendations,
-                        "beneficial_ingredients": beneficial_ingredients,
-                    }
-                }
-            }
+            result = self._build_care_result(
+                daily_care=daily_care,
+                weekly_care=weekly_care,
+                recommendations=recommendations,
+                morning_steps=morning_steps,
+                evening_steps=evening_steps,
+                beneficial_ingredients=beneficial_ingredients,
+                lifestyle_recommendations=lifestyle_recommendations
+            )
             
             # Сохраняем в кэш
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
+            self._save_cached_care(product, result)
             
             logger.info(f"Рекомендации для '{product_name}' сгенерированы с помощью GigaChat и сохранены в кэш")
             return result
@@ -517,6 +730,113 @@ class WildberriesService:
         # Если не удалось использовать GigaChat или произошла ошибка, используем шаблоны с элементами случайности
         return await self._generate_recommendations_with_templates(product)
 
+    async def _search_raw_products(
+        self,
+        query: str,
+        limit: int,
+        low_price: Optional[int],
+        top_price: Optional[int],
+        gender: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск товаров в WildberriesAPI через общий кеш результатов поиска.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество товаров
+            low_price: Минимальная цена (в рублях)
+            top_price: Максимальная цена (в рублях)
+            gender: Пол
+            
+        Returns:
+            Список товаров в формате WildberriesAPI (пустой и при недоступности API)
+        """
+        cache_key = make_search_key(SEARCH_CACHE_NAMESPACE, query, low_price, top_price, gender=gender, limit=limit)
+        try:
+            # fetch_products пробрасывает ошибки, поэтому в кеш (в том числе негативный)
+            # попадает только настоящий ответ API, а сбой или 429 не кешируются
+            raw_products = await get_search_cache().get_or_fetch(
+                cache_key,
+                lambda: self.api.fetch_products(
+                    query=query,
+                    limit=limit,
+                    low_price=low_price,
+                    top_price=top_price,
+                    gender=gender
+                )
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"Поиск товаров пропущен: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка при поиске товаров в Wildberries API: {str(e)}")
+            return []
+        # Возвращаем копии, чтобы изменения не попадали в кеш
+        return [dict(product) for product in raw_products]
+    
+    async def _search_products_indexed(
+        self,
+        query: str,
+        limit: int,
+        low_price: Optional[int],
+        top_price: Optional[int],
+        gender: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск товаров сначала в локальном индексе, затем (при нехватке) в WildberriesAPI.
+        
+        Если в индексе достаточно свежих подходящих товаров, запрос к Wildberries
+        не выполняется. Иначе товары из индекса дополняются результатами API.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество товаров
+            low_price: Минимальная цена (в рублях)
+            top_price: Максимальная цена (в рублях)
+            gender: Пол
+            
+        Returns:
+            Список товаров в формате WildberriesAPI
+        """
+        try:
+            records = await get_product_index().search_async(query, limit, low_price, top_price, gender)
+            indexed = [self.api.format_record(record) for record in records]
+        except Exception as e:
+            logger.warning(f"Ошибка при поиске в локальном индексе: {str(e)}")
+            indexed = []
+        
+        if len(indexed) >= limit:
+            logger.info(f"Запрос '{query}' обслужен из локального индекса ({len(indexed)} товаров)")
+            return indexed[:limit]
+        
+        # Поиск Wildberries недоступен: не ждем тайм-аутов, отдаем товары из индекса независимо от их возраста
+        if get_circuit_breaker(SEARCH_URL).state == STATE_OPEN:
+            logger.warning(f"Поиск Wildberries временно недоступен, запрос '{query}' обслуживается из локального индекса")
+            try:
+                records = await get_product_index().search_async(
+                    query, limit, low_price, top_price, gender, max_age=float("inf")
+                )
+                return [self.api.format_record(record) for record in records]
+            except Exception as e:
+                logger.warning(f"Ошибка при поиске в локальном индексе: {str(e)}")
+                return indexed
+        
+        upstream = await self._search_raw_products(query, limit, low_price, top_price, gender)
+        
+        # Объединяем результаты без дубликатов: сначала свежие данные API, затем товары из индекса
+        products = []
+        seen = set()
+        for product in upstream + indexed:
+            product_id = str(product.get('id'))
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            products.append(product)
+        
+        if indexed:
+            logger.info(f"Запрос '{query}': {len(indexed)} товаров из индекса дополнены {len(upstream)} товарами из API")
+        return products[:limit]
+    
     async def search_products_async(
         self, 
         query: str, 
@@ -544,71 +864,36 @@ class WildberriesService:
         low_price = int(min_price) if min_price is not None else None
         top_price = int(max_price) if max_price is not None else None
         
-        # Вызываем метод поиска из WildberriesAPI с await
+        # Ищем товары в локальном индексе, при нехватке — в WildberriesAPI через общий кеш
         try:
-            raw_products = await self.api.search_products(
-                query=query,
-                limit=limit,
-                low_price=low_price,
-                top_price=top_price,
-                gender=gender
-            )
+            raw_products = await self._search_products_indexed(query, limit, low_price, top_price, gender)
             
             # Логируем структуру первого элемента для отладки
             if raw_products and len(raw_products) > 0:
                 logger.debug(f"Пример структуры данных товара: {json.dumps(raw_products[0], ensure_ascii=False, default=str)}")
             
+            # Векторно пересчитываем цены и скидки для всей страницы (значения уже в рублях)
+            prices, sale_prices, discounts = compute_price_columns(
+                [product.get('priceU') or product.get('price') for product in raw_products],
+                [product.get('salePriceU') or product.get('sale_price') for product in raw_products],
+                divisor=1
+            )
+            
+            # Номера корзин определяем для всей страницы одновременно
+            product_ids = [coerce_product_id(product.get('id')) for product in raw_products]
+            buckets = await self._resolve_buckets(product_ids)
+            
             # Преобразуем данные в нужный формат
             products = []
-            for product in raw_products:
+            for position, product in enumerate(raw_products):
                 try:
-                    # Получаем и преобразуем цены
-                    price_raw = product.get('priceU') or product.get('price') or 0
-                    sale_price_raw = product.get('salePriceU') or product.get('sale_price') or 0
-                    
-                    # Преобразуем цены в числа
-                    if isinstance(price_raw, str):
-                        price_raw = price_raw.replace(' ', '')
-                    # Без деления на 100, так как значения уже в рублях
-                    price = int(price_raw) if price_raw else 0
-                    
-                    if isinstance(sale_price_raw, str):
-                        sale_price_raw = sale_price_raw.replace(' ', '')
-                    # Без деления на 100, так как значения уже в рублях
-                    sale_price = int(sale_price_raw) if sale_price_raw else 0
-                    
-                    # Если скидочная цена равна 0 или больше основной, используем основную цену
-                    if sale_price == 0 or sale_price >= price:
-                        sale_price = price
-                    
-                    # Рассчитываем скидку, если есть разница между ценами
-                    discount = round((1 - sale_price / price) * 100) if price > 0 and sale_price < price else 0
-                    
-                    # Построение URL изображения на основе ID продукта
-                    try:
-                        product_id = int(product["id"]) if isinstance(product["id"], str) else product["id"]
-                        vol = str(product_id)[:4]  # Первые 4 цифры
-                        part = str(product_id)[:6]  # Первые 6 цифр
-                        
-                        # Определяем номер корзины с проверкой существования изображения
-                        bucket = await self._find_correct_bucket(product_id)
-                        
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Не удалось преобразовать ID товара '{product.get('id')}' в число: {str(e)}")
-                        # Используем значения по умолчанию, чтобы не прерывать обработку
-                        product_id = 0
-                        vol = "0"
-                        part = "0"
-                        bucket = 1
+                    product_id = product_ids[position]
+                    price = int(prices[position])
+                    sale_price = int(sale_prices[position])
+                    discount = int(discounts[position])
                     
-                    # Формируем URL изображения
-                    image_urls = []
-                    for i in range(1, 5):  # Получаем первые 4 изображения
-                        image_url = f"https://basket-{bucket:02d}.wbbasket.ru/vol{vol}/part{part}/{product_id}/images/c516x688/{i}.webp"
-                        image_urls.append(image_url)
-                    
-                    # Генерируем рекомендации по уходу
-                    care_recommendations = await self._generate_skincare_recommendations(product)
+                    # Формируем URL изображений
+                    image_urls = build_basket_image_urls(product_id, buckets[position])
                     
                     # Строим JSON для товара
                     processed_product = {
@@ -629,7 +914,8 @@ class WildberriesService:
                         "description": product.get("description", ""),
                         "gender": gender or "унисекс",
                         "available": product.get("available", True),
-                        "care_recommendations": care_recommendations["care_recommendations"]
+                        # Рекомендации по уходу вычисляются отдельно (см. get_care_recommendations)
+                        "care_recommendations": None
                     }
                     
                     logger.debug(f"Обработан товар: {processed_product['name']} - Цена: {price}, Скидка: {sale_price}, Процент: {discount}%")
@@ -673,83 +959,47 @@ class WildberriesService:
             low_price = int(min_price) if min_price is not None else None
             top_price = int(max_price) if max_price is not None else None
             
-            # Вызываем метод поиска из WildberriesAPI с await
-            raw_products = await self.api.search_products(
-                query=query,
-                limit=limit,
-                low_price=low_price,
-                top_price=top_price,
-                gender=gender
-            )
+            # Ищем товары в локальном индексе, при нехватке — в WildberriesAPI через общий кеш
+            raw_products = await self._search_products_indexed(query, limit, low_price, top_price, gender)
             
             # Логируем структуру первого элемента для отладки
             if raw_products and len(raw_products) > 0:
                 logger.debug(f"Пример структуры данных товара: {json.dumps(raw_products[0], ensure_ascii=False, default=str)}")
             
+            # Векторно пересчитываем цены и скидки для всей страницы (значения уже в рублях)
+            prices, sale_prices, discounts = compute_price_columns(
+                [product.get('priceU') or product.get('price') for product in raw_products],
+                [product.get('salePriceU') or product.get('sale_price') for product in raw_products],
+                divisor=1
+            )
+            
+            # Номера корзин определяем для всей страницы одновременно
+            product_ids = [coerce_product_id(product.get('id')) for product in raw_products]
+            buckets = await self._resolve_buckets(product_ids)
+            
             # Преобразуем данные в нужный формат
             products = []
-            for product in raw_products:
+            for position, product in enumerate(raw_products):
                 try:
-                    # Получаем и преобразуем цены
-                    price_raw = product.get('priceU') or product.get('price') or 0
-                    sale_price_raw = product.get('salePriceU') or product.get('sale_price') or 0
-                    
-                    # Преобразуем цены в числа
-                    if isinstance(price_raw, str):
-                        price_raw = price_raw.replace(' ', '')
-                    # Без деления на 100, так как значения уже в рублях
-                    price = int(price_raw) if price_raw else 0
-                    
-                    if isinstance(sale_price_raw, str):
-                        sale_price_raw = sale_price_raw.replace(' ', '')
-                    # Без деления на 100, так как значения уже в рублях
-                    sale_price = int(sale_price_raw) if sale_price_raw else 0
-                    
-                    # Если скидочная цена равна 0 или больше основной, используем основную цену
-                    if sale_price == 0 or sale_price >= price:
-                        sale_price = price
-                    
-                    # Рассчитываем скидку, если есть разница между ценами
-                    discount = round((1 - sale_price / price) * 100) if price > 0 and sale_price < price else 0
-                    
-                    # Преобразуем id в число для корректного формирования URL
-                    try:
-                        product_id = int(product.get('id')) if isinstance(product.get('id'), str) else product.get('id')
-                        vol = str(product_id)[:4]  # Первые 4 цифры
-                        part = str(product_id)[:6]  # Первые 6 цифр
-                        
-                        # Определяем номер корзины с проверкой существования изображения
-                        bucket = await self._find_correct_bucket(product_id)
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Не удалось преобразовать ID товара '{product.get('id')}' в число: {str(e)}")
-                        # Используем исходное значение
-                        product_id = product.get('id', 0)
-                        vol = "0"
-                        part = "0"
-                        bucket = 1
-                    
-                    # Формируем URL изображения
-                    image_urls = []
-                    for i in range(1, 5):  # Получаем первые 4 изображения
-                        image_url = f"https://basket-{bucket:02d}.wbbasket.ru/vol{vol}/part{part}/{product_id}/images/c516x688/{i}.webp"
-                        image_urls.append(image_url)
+                    product_id = product_ids[position]
                     
-                    # Генерируем рекомендации по уходу
-                    care_recommendations = await self._generate_skincare_recommendations(product)
+                    # Формируем URL изображений
+                    image_urls = build_basket_image_urls(product_id, buckets[position])
                     
                     processed_product = {
                         'id': product_id,
                         'name': product.get('name'),
                         'brand': product.get('brand'),
-                        'price': price,
-                        'sale_price': sale_price,
-                        'discount': discount,
+                        'price': int(prices[position]),
+                        'sale_price': int(sale_prices[position]),
+                        'discount': int(discounts[position]),
                         'rating': product.get('rating', 0),
                         'image_url': image_urls[0] if image_urls else None,
                         'image_urls': image_urls,
                         'product_url': f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
                         'gender': gender or "унисекс",
-                        'care_recommendations': care_recommendations["care_recommendations"]
+                        # Рекомендации по уходу вычисляются отдельно (см. get_care_recommendations)
+                        'care_recommendations': None
                     }
                     products.append(processed_product)
                     
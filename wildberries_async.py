@@ -19,6 +19,18 @@ from functools import wraps
 import time
 from urllib.parse import quote
 
+from wb_normalizer import normalize_products, build_wbstatic_image_urls
+from search_cache import get_search_cache, make_search_key
+from image_downloader import get_image_downloader
+from product_index import get_product_index
+from circuit_breaker import CircuitOpenError, get_circuit_breaker
+
+try:
+    from similarity_engine import get_similarity_engine
+    SIMILARITY_ENGINE_AVAILABLE = True
+except ImportError:
+    SIMILARITY_ENGINE_AVAILABLE = False
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +42,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Пространство имен записей этого клиента в общем кеше поиска
+SEARCH_CACHE_NAMESPACE = "wildberries_async"
+
 # Декоратор для повторных попыток
 def async_retry(max_retries=3, initial_delay=1, backoff_factor=2, exceptions=(Exception,)):
     """
@@ -94,7 +109,8 @@ class WildberriesAsyncAPI:
         os.makedirs(photo_dir, exist_ok=True)
         logger.info(f"Директория для фотографий проверена: {photo_dir}")
         
-        # Кеш для хранения ответов на повторяющиеся запросы
+        # Кеш ответов с детальной информацией и похожими товарами
+        # (результаты поиска хранятся в общем кеше приложения, см. search_cache.py)
         self.response_cache: Dict[str, Any] = {}
         
         # HTTP сессия для асинхронных запросов
@@ -141,28 +157,25 @@ class WildberriesAsyncAPI:
         return cache_key
     
     @async_retry(max_retries=3, exceptions=(aiohttp.ClientError, asyncio.TimeoutError))
-    async def _search_products(self, query: str, limit: int = 100, skip: int = 0, low_price: Optional[int] = None, top_price: Optional[int] = None) -> Dict[str, Any]:
+    async def _search_products(self, query: str, limit: int = 100, skip: int = 0, low_price: Optional[int] = None, top_price: Optional[int] = None, sort: str = "popular") -> Dict[str, Any]:
         """
         Выполняет поиск товаров по запросу.
         
+        Результаты поиска кешируются не здесь, а в общем кеше приложения
+        (см. search_cache.py) на уровне search_products_async.
+        
         Args:
             query: Поисковый запрос
             limit: Максимальное количество результатов
             skip: Количество результатов для пропуска (для пагинации)
             low_price: Минимальная цена (в копейках) для фильтрации по основной цене товаров
             top_price: Максимальная цена (в копейках) для фильтрации по скидочной цене товаров
+            sort: Способ сортировки (popular, priceup, pricedown, newly, rate)
             
         Returns:
             Данные о найденных товарах
         """
-        logger.info(f"Выполнение поиска товаров: запрос='{query}', лимит={limit}, пропуск={skip}, low_price={low_price}, top_price={top_price}")
-        
-        # Проверяем кеш, если кеширование включено
-        if self.cache_enabled:
-            cache_key = self._generate_cache_key("search", query=query, limit=limit, skip=skip, low_price=low_price, top_price=top_price)
-            if cache_key in self.response_cache:
-                logger.info(f"Результаты поиска '{query}' найдены в кеше")
-                return self.response_cache[cache_key]
+        logger.info(f"Выполнение поиска товаров: запрос='{query}', лимит={limit}, пропуск={skip}, low_price={low_price}, top_price={top_price}, sort={sort}")
         
         await self._ensure_session()
         
@@ -180,7 +193,7 @@ class WildberriesAsyncAPI:
             "reg": "0",
             "regions": "68,64,83,4,38,80,33,70,82,86,75,30,69,22,66,31,40,1,48,71",
             "resultset": "catalog",
-            "sort": "popular",
+            "sort": sort or "popular",
             "spp": "0",
             "suppressSpellcheck": "false",  # Преобразуем Boolean в строку
             "limit": str(limit),  # Преобразуем int в строку
@@ -206,53 +219,48 @@ class WildberriesAsyncAPI:
         logger.info(f"Отправка запроса к {self.SEARCH_URL} с параметрами: {params}")
         
         try:
-            async with self.http_session.get(self.SEARCH_URL, params=params, headers=headers, timeout=60) as response:
-                logger.info(f"Получен ответ с кодом статуса: {response.status}")
-                logger.info(f"Тип контента: {response.content_type}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
-                    raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
-                
-                logger.info("Чтение данных ответа...")
-                
-                # Проверяем тип контента и обрабатываем соответственно
-                try:
-                    # Пытаемся прочитать как JSON
-                    result = await response.json()
-                except aiohttp.ContentTypeError:
-                    # Если не удалось прочитать как JSON, читаем как текст
-                    logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
-                    text_result = await response.text()
-                    logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
+            with get_circuit_breaker(self.SEARCH_URL).protect() as outcome:
+                async with self.http_session.get(self.SEARCH_URL, params=params, headers=headers, timeout=60) as response:
+                    outcome.status(response.status)
+                    logger.info(f"Получен ответ с кодом статуса: {response.status}")
+                    logger.info(f"Тип контента: {response.content_type}")
+                    
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
+                        raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
+                    
+                    logger.info("Чтение данных ответа...")
                     
-                    # Пытаемся преобразовать текст в JSON
+                    # Проверяем тип контента и обрабатываем соответственно
                     try:
-                        import json
-                        result = json.loads(text_result)
-                        logger.info("Успешно преобразовано из текста в JSON")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                        # Пытаемся прочитать как JSON
+                        result = await response.json()
+                    except aiohttp.ContentTypeError:
+                        # Если не удалось прочитать как JSON, читаем как текст
+                        logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
+                        text_result = await response.text()
+                        logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
                         
-                        # Возвращаем пустой результат в формате ожидаемой структуры
-                        logger.warning("Возвращаем пустой результат")
-                        result = {"data": {"products": []}}
-                
-                logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
-                
-                # Проверяем структуру ответа
-                if "data" not in result:
-                    logger.warning("Полученный результат не содержит поле 'data', возвращаем пустую структуру")
-                    result = {"data": {"products": []}}
-                
-                # Сохраняем результат в кеш, если кеширование включено
-                if self.cache_enabled:
-                    cache_key = self._generate_cache_key("search", query=query, limit=limit, skip=skip, low_price=low_price, top_price=top_price)
-                    self.response_cache[cache_key] = result
-                    logger.info(f"Результаты сохранены в кеш с ключом: {cache_key}")
-                
-                return result
+                        # Пытаемся преобразовать текст в JSON
+                        try:
+                            import json
+                            result = json.loads(text_result)
+                            logger.info("Успешно преобразовано из текста в JSON")
+                        except json.JSONDecodeError as e:
+                            logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                            
+                            # Некорректный ответ - это сбой, а не пустая выдача (не должен попасть в кеш)
+                            raise Exception("Wildberries API вернул некорректный JSON")
+                    
+                    logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
+                    
+                    # Проверяем структуру ответа
+                    if not isinstance(result, dict) or "data" not in result:
+                        logger.warning("Полученный результат не содержит поле 'data'")
+                        raise Exception("Некорректный формат ответа Wildberries API")
+                    
+                    return result
         except Exception as e:
             logger.error(f"Ошибка при выполнении запроса к API Wildberries: {str(e)}")
             logger.error(f"Трассировка: {traceback.format_exc()}")
@@ -305,53 +313,55 @@ class WildberriesAsyncAPI:
         logger.info(f"Отправка запроса к {self.DETAIL_URL} с параметрами: {params}")
         
         try:
-            async with self.http_session.get(self.DETAIL_URL, params=params, headers=headers, timeout=60) as response:
-                logger.info(f"Получен ответ с кодом статуса: {response.status}")
-                logger.info(f"Тип контента: {response.content_type}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
-                    raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
-                
-                logger.info("Чтение данных ответа...")
-                
-                # Проверяем тип контента и обрабатываем соответственно
-                try:
-                    # Пытаемся прочитать как JSON
-                    result = await response.json()
-                except aiohttp.ContentTypeError:
-                    # Если не удалось прочитать как JSON, читаем как текст
-                    logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
-                    text_result = await response.text()
-                    logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
+            with get_circuit_breaker(self.DETAIL_URL).protect() as outcome:
+                async with self.http_session.get(self.DETAIL_URL, params=params, headers=headers, timeout=60) as response:
+                    outcome.status(response.status)
+                    logger.info(f"Получен ответ с кодом статуса: {response.status}")
+                    logger.info(f"Тип контента: {response.content_type}")
+                    
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
+                        raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
+                    
+                    logger.info("Чтение данных ответа...")
                     
-                    # Пытаемся преобразовать текст в JSON
+                    # Проверяем тип контента и обрабатываем соответственно
                     try:
-                        import json
-                        result = json.loads(text_result)
-                        logger.info("Успешно преобразовано из текста в JSON")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                        # Пытаемся прочитать как JSON
+                        result = await response.json()
+                    except aiohttp.ContentTypeError:
+                        # Если не удалось прочитать как JSON, читаем как текст
+                        logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
+                        text_result = await response.text()
+                        logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
                         
-                        # Возвращаем пустой результат в формате ожидаемой структуры
-                        logger.warning("Возвращаем пустой результат")
+                        # Пытаемся преобразовать текст в JSON
+                        try:
+                            import json
+                            result = json.loads(text_result)
+                            logger.info("Успешно преобразовано из текста в JSON")
+                        except json.JSONDecodeError as e:
+                            logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                            
+                            # Возвращаем пустой результат в формате ожидаемой структуры
+                            logger.warning("Возвращаем пустой результат")
+                            result = {"data": {"products": []}}
+                    
+                    logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
+                    
+                    # Проверяем структуру ответа
+                    if "data" not in result:
+                        logger.warning("Полученный результат не содержит поле 'data', возвращаем пустую структуру")
                         result = {"data": {"products": []}}
-                
-                logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
-                
-                # Проверяем структуру ответа
-                if "data" not in result:
-                    logger.warning("Полученный результат не содержит поле 'data', возвращаем пустую структуру")
-                    result = {"data": {"products": []}}
-                
-                # Сохраняем результат в кеш, если кеширование включено
-                if self.cache_enabled:
-                    cache_key = self._generate_cache_key("details", product_ids=product_ids)
-                    self.response_cache[cache_key] = result
-                    logger.info(f"Результаты сохранены в кеш с ключом: {cache_key}")
-                
-                return result
+                    
+                    # Сохраняем результат в кеш, если кеширование включено
+                    if self.cache_enabled:
+                        cache_key = self._generate_cache_key("details", product_ids=product_ids)
+                        self.response_cache[cache_key] = result
+                        logger.info(f"Результаты сохранены в кеш с ключом: {cache_key}")
+                    
+                    return result
         except Exception as e:
             logger.error(f"Ошибка при получении детальной информации: {str(e)}")
             logger.error(f"Трассировка: {traceback.format_exc()}")
@@ -393,122 +403,85 @@ class WildberriesAsyncAPI:
         
         try:
             url = f"{self.SIMILAR_URL}?nmId={str(product_id)}"
-            async with self.http_session.get(url, headers=headers, timeout=60) as response:
-                logger.info(f"Получен ответ с кодом статуса: {response.status}")
-                logger.info(f"Тип контента: {response.content_type}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
-                    raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
-                
-                logger.info("Чтение данных ответа...")
-                
-                # Проверяем тип контента и обрабатываем соответственно
-                try:
-                    # Пытаемся прочитать как JSON
-                    result = await response.json()
-                except aiohttp.ContentTypeError:
-                    # Если не удалось прочитать как JSON, читаем как текст
-                    logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
-                    text_result = await response.text()
-                    logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
+            with get_circuit_breaker(url).protect() as outcome:
+                async with self.http_session.get(url, headers=headers, timeout=60) as response:
+                    outcome.status(response.status)
+                    logger.info(f"Получен ответ с кодом статуса: {response.status}")
+                    logger.info(f"Тип контента: {response.content_type}")
+                    
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Ошибка API Wildberries: {response.status} - {error_text}")
+                        raise Exception(f"Wildberries API вернул код ошибки: {response.status}")
+                    
+                    logger.info("Чтение данных ответа...")
                     
-                    # Пытаемся преобразовать текст в JSON
+                    # Проверяем тип контента и обрабатываем соответственно
                     try:
-                        import json
-                        result = json.loads(text_result)
-                        logger.info("Успешно преобразовано из текста в JSON")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                        # Пытаемся прочитать как JSON
+                        result = await response.json()
+                    except aiohttp.ContentTypeError:
+                        # Если не удалось прочитать как JSON, читаем как текст
+                        logger.warning("Не удалось прочитать ответ как JSON, попытка чтения как текста")
+                        text_result = await response.text()
+                        logger.info(f"Получен текстовый ответ длиной {len(text_result)} символов")
                         
-                        # Возвращаем пустой результат в формате ожидаемой структуры
-                        logger.warning("Возвращаем пустой результат")
+                        # Пытаемся преобразовать текст в JSON
+                        try:
+                            import json
+                            result = json.loads(text_result)
+                            logger.info("Успешно преобразовано из текста в JSON")
+                        except json.JSONDecodeError as e:
+                            logger.error(f"Не удалось преобразовать текстовый ответ в JSON: {str(e)}")
+                            
+                            # Возвращаем пустой результат в формате ожидаемой структуры
+                            logger.warning("Возвращаем пустой результат")
+                            result = {"data": {"products": []}}
+                    
+                    logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
+                    
+                    # Проверяем структуру ответа
+                    if not isinstance(result, dict) or "data" not in result:
+                        logger.warning("Неверная структура ответа, создаем пустую структуру")
                         result = {"data": {"products": []}}
-                
-                logger.info(f"Данные получены успешно, длина ответа: {len(str(result))}")
-                
-                # Проверяем структуру ответа
-                if not isinstance(result, dict) or "data" not in result:
-                    logger.warning("Неверная структура ответа, создаем пустую структуру")
-                    result = {"data": {"products": []}}
-                
-                # Сохраняем результат в кеш, если кеширование включено
-                if self.cache_enabled:
-                    cache_key = self._generate_cache_key("similar", product_id=product_id)
-                    self.response_cache[cache_key] = result
-                    logger.info(f"Результаты сохранены в кеш с ключом: {cache_key}")
-                
-                return result
+                    
+                    # Сохраняем результат в кеш, если кеширование включено
+                    if self.cache_enabled:
+                        cache_key = self._generate_cache_key("similar", product_id=product_id)
+                        self.response_cache[cache_key] = result
+                        logger.info(f"Результаты сохранены в кеш с ключом: {cache_key}")
+                    
+                    return result
         except Exception as e:
             logger.error(f"Ошибка при поиске похожих товаров: {str(e)}")
             logger.error(f"Трассировка: {traceback.format_exc()}")
             raise
     
     @async_retry(max_retries=3, exceptions=(aiohttp.ClientError, asyncio.TimeoutError))
-    async def _download_image(self, image_url: str, file_name: str) -> str:
+    async def _download_image(self, image_url: str, file_name: Optional[str] = None) -> Optional[str]:
         """
-        Загружает изображение по URL и сохраняет его в указанную директорию.
+        Загружает изображение по URL через общий загрузчик изображений.
+        
+        Файлы хранятся по содержимому (см. image_downloader.py), поэтому имя файла
+        определяется загрузчиком; параметр file_name сохранен для совместимости.
         
         Args:
             image_url: URL изображения
-            file_name: Имя файла для сохранения
+            file_name: Не используется
             
         Returns:
-            Путь к сохраненному файлу
+            Путь к сохраненному файлу или None при ошибке
         """
-        await self._ensure_session()
-        
-        # Формируем полный путь к файлу
-        file_path = os.path.join(self.photo_dir, file_name)
-        
-        # Проверяем, существует ли файл
-        if os.path.exists(file_path):
-            logger.info(f"Изображение уже существует: {file_path}")
-            return file_path
-        
-        try:
-            # Добавляем заголовки для имитации браузера
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-                "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-                "Referer": "https://www.wildberries.ru/",
-                "Connection": "keep-alive"
-            }
-            
-            logger.info(f"Загрузка изображения: {image_url}")
-            
-            # Загружаем изображение с таймаутом 10 секунд
-            async with self.http_session.get(image_url, headers=headers, timeout=10) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка при загрузке изображения: {response.status} - {error_text}")
-                    raise Exception(f"Ошибка при загрузке изображения: {response.status}")
-                
-                # Сохраняем изображение
-                with open(file_path, "wb") as f:
-                    # Читаем данные с таймаутом
-                    data = await asyncio.wait_for(response.read(), timeout=5)
-                    f.write(data)
-                
-                logger.info(f"Изображение успешно загружено: {file_path}")
-                return file_path
-        except asyncio.TimeoutError:
-            logger.error(f"Превышено время ожидания при загрузке изображения: {image_url}")
-            # Создаем пустой файл, чтобы не пытаться загрузить его снова
-            with open(file_path, "wb") as f:
-                f.write(b"")
-            return file_path
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке изображения {image_url}: {str(e)}")
-            logger.error(f"Трассировка: {traceback.format_exc()}")
-            # Создаем пустой файл, чтобы не пытаться загрузить его снова
-            with open(file_path, "wb") as f:
-                f.write(b"")
-            return file_path
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+            "Referer": "https://www.wildberries.ru/",
+            "Connection": "keep-alive"
+        }
+        return await get_image_downloader(self.photo_dir).download(image_url, headers=headers)
     
-    async def search_products_async(self, query: str, limit: int = 10, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[Dict[str, Any]]:
+    async def search_products_async(self, query: str, limit: int = 10, min_price: Optional[float] = None, max_price: Optional[float] = None, sort: str = "popular") -> List[Dict[str, Any]]:
         """
         Асинхронно выполняет поиск товаров по запросу и возвращает форматированные данные.
         
@@ -533,18 +506,63 @@ class WildberriesAsyncAPI:
             limit: Максимальное количество результатов
             min_price: Минимальная цена (в рублях) для фильтрации по основной цене товаров
             max_price: Максимальная цена (в рублях) для фильтрации по скидочной цене товаров
+            sort: Способ сортировки (popular, priceup, pricedown, newly, rate)
             
         Returns:
             Список товаров с детальной информацией
         """
-        logger.info(f"Поиск товаров по запросу: '{query}', лимит: {limit}, min_price: {min_price}, max_price: {max_price}")
+        logger.info(f"Поиск товаров по запросу: '{query}', лимит: {limit}, min_price: {min_price}, max_price: {max_price}, sort: {sort}")
+        
+        if not self.cache_enabled:
+            return await self._fetch_formatted_products(query, limit, min_price, max_price, sort)
+        
+        async def refresh() -> List[Dict[str, Any]]:
+            # Фоновое обновление выполняется отдельным клиентом, так как текущий может быть уже закрыт
+            client = WildberriesAsyncAPI(photo_dir=self.photo_dir, max_retries=self.max_retries, cache_enabled=False)
+            try:
+                return await client._fetch_formatted_products(query, limit, min_price, max_price, sort)
+            finally:
+                await client.close()
+        
+        # Используем общий кеш приложения, чтобы результаты переживали отдельные запросы
+        cache_key = make_search_key(SEARCH_CACHE_NAMESPACE, query, min_price, max_price, sort=sort, limit=limit)
+        try:
+            products = await get_search_cache().get_or_fetch(
+                cache_key,
+                lambda: self._fetch_formatted_products(query, limit, min_price, max_price, sort),
+                background_fetcher=refresh
+            )
+        except CircuitOpenError as e:
+            # Поиск Wildberries недоступен: отдаем товары из локального индекса независимо от их возраста
+            logger.warning(f"{str(e)}. Используем локальный индекс товаров")
+            records = await get_product_index().search_async(
+                query, limit, min_price, max_price, max_age=float("inf")
+            )
+            products = [self.format_record(record) for record in records]
+        
+        # Возвращаем копии, чтобы изменения у вызывающего кода не попадали в кеш
+        return [dict(product) for product in products]
+    
+    async def _fetch_formatted_products(self, query: str, limit: int, min_price: Optional[float], max_price: Optional[float], sort: str = "popular") -> List[Dict[str, Any]]:
+        """
+        Выполняет поиск товаров в API и форматирует результаты (без использования кеша).
         
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов
+            min_price: Минимальная цена (в рублях)
+            max_price: Максимальная цена (в рублях)
+            sort: Способ сортировки
+            
+        Returns:
+            Список товаров с детальной информацией
+        """
         # Преобразуем параметры цены в копейки для API и обрабатываем None значения
         low_price = None if min_price is None else int(min_price * 100)
         top_price = None if max_price is None else int(max_price * 100)
         
         # Выполняем поиск товаров с учетом параметров цены
-        search_results = await self._search_products(query, limit=limit, low_price=low_price, top_price=top_price)
+        search_results = await self._search_products(query, limit=limit, low_price=low_price, top_price=top_price, sort=sort)
         
         # Проверяем наличие результатов
         products = search_results.get("data", {}).get("products", [])
@@ -558,74 +576,51 @@ class WildberriesAsyncAPI:
         # Получаем ID товаров для запроса детальной информации
         product_ids = [product.get("id", 0) for product in products]
         
-        # Получаем детальную информацию о товарах
-        details_results = await self._get_product_details(product_ids)
+        # Получаем детальную информацию о товарах (при недоступности card.wb.ru обходимся данными поиска)
+        try:
+            details_results = await self._get_product_details(product_ids)
+        except CircuitOpenError as e:
+            logger.warning(f"{str(e)}. Товары будут возвращены без детальной информации")
+            details_results = None
         
-        # Преобразуем результаты в удобный формат
-        formatted_products = []
+        # Нормализуем страницу за один проход: детали присоединяются по индексу ID
+        records = normalize_products(products, details_results)
         
-        for product in products:
-            product_id = product.get("id", 0)
-            
-            # Формируем базовую информацию о товаре
-            product_info = {
-                "id": product_id,
-                "name": product.get("name", ""),
-                "brand": product.get("brand", ""),
-                "price": product.get("priceU", 0) / 100,  # Цена в копейках, переводим в рубли
-                "sale_price": product.get("salePriceU", 0) / 100,
-                "rating": product.get("rating", 0),
-                "feedbacks": product.get("feedbacks", 0),
-                "colors": [],
-                "sizes": [],
-                "images": [],
-                "url": f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx"
-            }
-            
-            # Добавляем изображения
-            if "pics" in product:
-                base_url = f"https://images.wbstatic.net/c516x688/new/{str(product_id)[:4]}/{product_id}-"
-                pics = product.get("pics", [])
-                
-                # Обработка случая, когда pics может быть числом, а не списком
-                if isinstance(pics, int):
-                    logger.warning(f"Поле 'pics' для товара {product_id} является числом ({pics}), а не списком. Создаем изображения на основе этого числа.")
-                    # Если pics - это число, создаем список из этого числа изображений
-                    product_info["images"] = [f"{base_url}{i}.jpg" for i in range(1, min(6, pics + 1))]
-                else:
-                    # Если pics - это список, как и ожидалось
-                    product_info["images"] = [f"{base_url}{i}.jpg" for i in range(1, min(6, len(pics) + 1))]
-            
-            # Дополняем информацию из детального запроса
-            if "data" in details_results and "products" in details_results["data"]:
-                for detail_product in details_results["data"]["products"]:
-                    if detail_product.get("id") == product_id:
-                        # Добавляем цвета
-                        if "colors" in detail_product:
-                            product_info["colors"] = [color.get("name", "") for color in detail_product.get("colors", [])]
-                        
-                        # Добавляем размеры
-                        if "sizes" in detail_product:
-                            product_info["sizes"] = [
-                                {
-                                    "name": size.get("name", ""),
-                                    "origName": size.get("origName", ""),
-                                    "stocks": [stock.get("qty", 0) for stock in size.get("stocks", [])]
-                                }
-                                for size in detail_product.get("sizes", [])
-                            ]
-                        
-                        # Добавляем описание
-                        if "description" in detail_product:
-                            product_info["description"] = detail_product.get("description", "")
-                        
-                        break
-            
-            formatted_products.append(product_info)
+        # Сохраняем товары в локальный полнотекстовый индекс
+        try:
+            await get_product_index().add_products_async(records)
+        except Exception as e:
+            logger.warning(f"Не удалось добавить товары в индекс: {str(e)}")
         
+        formatted_products = [self.format_record(record) for record in records]
         logger.info(f"Найдено {len(formatted_products)} товаров по запросу '{query}'")
         return formatted_products
     
+    def format_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Преобразует нормализованную запись товара в формат search_products_async.
+        
+        Args:
+            record: Запись из normalize_products или локального индекса товаров
+            
+        Returns:
+            Данные о товаре
+        """
+        return {
+            "id": record["id"],
+            "name": record["name"],
+            "brand": record["brand"],
+            "price": record["price"],
+            "sale_price": record["sale_price"],
+            "rating": record["rating"],
+            "feedbacks": record["feedbacks"],
+            "colors": record["colors"],
+            "sizes": record["sizes"],
+            "images": build_wbstatic_image_urls(record["id"], record["pics"]),
+            "url": record["url"],
+            "description": record["description"]
+        }
+    
     async def get_similar_products_async(self, product_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Асинхронно получает список похожих товаров для указанного ID товара.
@@ -638,36 +633,61 @@ class WildberriesAsyncAPI:
             Список похожих товаров
         """
         logger.info(f"Поиск похожих товаров для товара с ID: {product_id}, лимит: {limit}")
-        
+
+        # Сначала пробуем локальный движок по уже закешированным товарам
+        local_products = await self._get_local_similar_products(product_id, limit)
+        if len(local_products) >= limit:
+            logger.info(f"Похожие товары для {product_id} найдены локально: {len(local_products)}")
+            return local_products
+
         try:
-            # Пытаемся получить похожие товары
             similar_results = await self._get_similar_products(product_id)
-            
+
             # Проверяем наличие результатов
             similar_products = similar_results.get("data", {}).get("products", [])
             if not similar_products:
                 logger.warning(f"Для товара с ID {product_id} не найдено похожих товаров")
-                return []
-            
-            # Ограничиваем количество результатов
+                return local_products
+
             similar_products = similar_products[:limit]
-            
-            # Получаем ID товаров для запроса детальной информации
+
+            # Получаем детальную информацию и приводим товары к формату search_products_async
             product_ids = [product.get("id", 0) for product in similar_products]
-            
-            # Получаем детальную информацию о товарах
             details_results = await self._get_product_details(product_ids)
-            
-            # Преобразуем результаты в удобный формат (аналогично методу search_products_async)
-            # ...код для форматирования результатов, аналогичный методу search_products_async...
-            
-            # Временно возвращаем исходные данные
-            return similar_products
+            records = normalize_products(similar_results, details_results, limit=limit)
+
+            try:
+                await get_product_index().add_products_async(records)
+            except Exception as e:
+                logger.warning(f"Не удалось добавить товары в индекс: {str(e)}")
+            return [self.format_record(record) for record in records]
         except Exception as e:
             logger.error(f"Ошибка при получении похожих товаров: {str(e)}")
-            logger.warning("Возвращаем пустой список похожих товаров")
+            logger.warning(f"Возвращаем локально найденные похожие товары: {len(local_products)}")
+            return local_products
+
+    async def _get_local_similar_products(self, product_id: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Находит похожие товары локально по индексу закешированных товаров.
+
+        Args:
+            product_id: ID товара
+            limit: Максимальное количество результатов
+
+        Returns:
+            Список похожих товаров с полем similarity (пустой, если движок недоступен)
+        """
+        if not SIMILARITY_ENGINE_AVAILABLE:
             return []
-    
+        try:
+            engine = get_similarity_engine()
+            matches = await asyncio.to_thread(engine.similar_to_product, product_id, limit)
+            # Движок хранит записи индекса товаров, приводим их к формату search_products_async
+            return [{**self.format_record(product), "similarity": round(score, 4)} for product, score in matches]
+        except Exception as e:
+            logger.error(f"Ошибка локального поиска похожих товаров: {str(e)}")
+            return []
+
     async def download_product_images_async(self, product: Dict[str, Any], max_images: int = 3) -> List[str]:
         """
         Асинхронно загружает изображения для указанного товара.
@@ -690,39 +710,9 @@ class WildberriesAsyncAPI:
         # Ограничиваем количество изображений
         images = images[:max_images]
         
-        # Создаем список для хранения путей к загруженным изображениям
-        downloaded_images = []
-        
-        # Загружаем изображения последовательно с коротким таймаутом
-        for i, image_url in enumerate(images):
-            try:
-                file_name = f"{product.get('id', 0)}_{i + 1}.jpg"
-                file_path = os.path.join(self.photo_dir, file_name)
-                
-                # Проверяем, существует ли файл
-                if os.path.exists(file_path):
-                    logger.info(f"Изображение уже существует: {file_path}")
-                    downloaded_images.append(file_path)
-                    continue
-                
-                # Загружаем изображение с коротким таймаутом
-                try:
-                    path = await asyncio.wait_for(
-                        self._download_image(image_url, file_name),
-                        timeout=5  # Короткий таймаут для каждого изображения
-                    )
-                    downloaded_images.append(path)
-                except asyncio.TimeoutError:
-                    logger.error(f"Превышено время ожидания при загрузке изображения: {image_url}")
-                    # Создаем пустой файл, чтобы не пытаться загрузить его снова
-                    with open(file_path, "wb") as f:
-                        f.write(b"")
-                    downloaded_images.append(file_path)
-            except Exception as e:
-                logger.error(f"Ошибка при загрузке изображения {image_url}: {str(e)}")
-                logger.error(f"Трассировка: {traceback.format_exc()}")
-                # Продолжаем загрузку следующих изображений
-                continue
+        # Загружаем изображения одновременно; неудачные загрузки не сохраняются на диск
+        paths = await asyncio.gather(*(self._download_image(image_url) for image_url in images))
+        downloaded_images = [path for path in paths if path]
         
         logger.info(f"Загружено {len(downloaded_images)} изображений для товара")
         return downloaded_images